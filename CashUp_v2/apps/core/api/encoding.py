@@ -0,0 +1,139 @@
+"""
+批量行情/报表数据的二进制响应编码（内容协商）
+函数集注释：
+- negotiate: 按 format 查询参数（json/msgpack/arrow）或 Accept 头选择编码；对应依赖未安装时回退 json
+- columnar_response: 列式数据（列名 -> NumPy 数组）编码为 MessagePack 或 Arrow IPC 流响应
+- rows_to_columns: 字典列表转为列式数组（数据来源本身是逐行结果的回退路径与报表接口使用）
+- respond: 路由统一出口：json 时为 {"code","message","data"}，否则为列式二进制（message 放入元数据）
+MessagePack 载荷：{"columns": [...], "dtypes": {列名: NumPy dtype 字符串}, "length": n, "data": {列名: 小端字节 | 字符串列表}}，
+数值/时间列按 dtype 用 np.frombuffer 零拷贝还原；时间列为 datetime64[ms]（Arrow 中为 timestamp[ms]）。
+msgpack / pyarrow 为可选依赖（pip install msgpack pyarrow），默认 JSON 响应不受影响。
+"""
+
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+from fastapi import Query, Request
+from fastapi.responses import Response
+
+try:
+    import msgpack
+except ImportError:  # 可选依赖
+    msgpack = None
+
+try:
+    import pyarrow as pa
+except ImportError:  # 可选依赖
+    pa = None
+
+JSON = "json"
+MSGPACK = "msgpack"
+ARROW = "arrow"
+
+MEDIA_TYPES = {
+    MSGPACK: "application/msgpack",
+    ARROW: "application/vnd.apache.arrow.stream",
+}
+# 路由的 format 查询参数
+FORMAT_QUERY = Query(default=None, alias="format", description="json / msgpack / arrow（也可通过 Accept 头协商）")
+
+_ACCEPT = {
+    "application/msgpack": MSGPACK,
+    "application/x-msgpack": MSGPACK,
+    "application/vnd.apache.arrow.stream": ARROW,
+    "application/vnd.apache.arrow.file": ARROW,
+}
+
+
+def _available(fmt: str) -> bool:
+    return (fmt == MSGPACK and msgpack is not None) or (fmt == ARROW and pa is not None)
+
+
+def negotiate(request: Request, fmt: Optional[str] = None) -> str:
+    """显式 format 参数优先，其次按 Accept 头的先后顺序；不可用时返回 json"""
+    wanted: List[str] = []
+    if fmt:
+        wanted.append(fmt.lower())
+    for part in (request.headers.get("accept") or "").split(","):
+        media = part.split(";")[0].strip().lower()
+        if media in _ACCEPT:
+            wanted.append(_ACCEPT[media])
+    for w in wanted:
+        if w == JSON:
+            return JSON
+        if _available(w):
+            return w
+    return JSON
+
+
+def _is_binary(arr: np.ndarray) -> bool:
+    return arr.dtype.kind in "biufM"
+
+
+def _encode_msgpack(columns: Dict[str, np.ndarray], meta: Optional[Dict[str, Any]]) -> bytes:
+    data: Dict[str, Any] = {}
+    dtypes: Dict[str, str] = {}
+    for name, arr in columns.items():
+        if _is_binary(arr):
+            arr = arr.astype(arr.dtype.newbyteorder("<"), copy=False)
+            dtypes[name] = arr.dtype.str
+            data[name] = np.ascontiguousarray(arr).tobytes()
+        else:
+            dtypes[name] = "str"
+            data[name] = [None if v is None else str(v) for v in arr.tolist()]
+    length = len(next(iter(columns.values()))) if columns else 0
+    payload = {"columns": list(columns), "dtypes": dtypes, "length": length, "data": data}
+    if meta:
+        payload["meta"] = meta
+    return msgpack.packb(payload, use_bin_type=True)
+
+
+def _encode_arrow(columns: Dict[str, np.ndarray], meta: Optional[Dict[str, Any]]) -> bytes:
+    arrays = [pa.array(arr) if _is_binary(arr) else pa.array(arr.tolist(), type=pa.string()) for arr in columns.values()]
+    schema_meta = {str(k): str(v) for k, v in (meta or {}).items()}
+    batch = pa.RecordBatch.from_arrays(arrays, names=list(columns))
+    if schema_meta:
+        batch = batch.replace_schema_metadata(schema_meta)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, batch.schema) as writer:
+        writer.write_batch(batch)
+    return sink.getvalue().to_pybytes()
+
+
+def columnar_response(columns: Dict[str, np.ndarray], fmt: str, meta: Optional[Dict[str, Any]] = None) -> Response:
+    body = _encode_arrow(columns, meta) if fmt == ARROW else _encode_msgpack(columns, meta)
+    length = len(next(iter(columns.values()))) if columns else 0
+    return Response(content=body, media_type=MEDIA_TYPES[fmt], headers={"X-Row-Count": str(length)})
+
+
+def _column(values: List[Any]) -> np.ndarray:
+    sample = next((v for v in values if v is not None), None)
+    if isinstance(sample, bool):
+        return np.array(values, dtype=bool)
+    if isinstance(sample, (int, float)):
+        if all(v is None or isinstance(v, int) for v in values) and None not in values:
+            return np.array(values, dtype=np.int64)
+        return np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+    if isinstance(sample, datetime):
+        return np.array([np.datetime64("NaT") if v is None else v for v in values], dtype="datetime64[ms]")
+    if isinstance(sample, str) and len(sample) >= 19 and sample[4] == "-" and sample[10] == "T":
+        # ISO 时间字符串转为时间列
+        try:
+            return np.array([np.datetime64("NaT") if v is None else v for v in values], dtype="datetime64[ms]")
+        except ValueError:
+            pass
+    return np.array(values, dtype=object)
+
+
+def rows_to_columns(rows: Iterable[Dict[str, Any]], names: Optional[List[str]] = None) -> Dict[str, np.ndarray]:
+    rows = list(rows)
+    names = names or (list(rows[0]) if rows else [])
+    return {name: _column([r.get(name) for r in rows]) for name in names}
+
+
+def respond(enc: str, data, message: str = "success"):
+    """data 为字典列表或列式数组字典"""
+    if enc == JSON:
+        return {"code": 0, "message": message, "data": data}
+    return columnar_response(data if isinstance(data, dict) else rows_to_columns(data), enc, {"message": message})
@@ -6,6 +6,7 @@ import json
 from typing import Optional
 
 from database.connection import get_db
+from services.config_cache import system_config_cache
 
 router = APIRouter()
 
@@ -39,6 +40,8 @@ async def set_config_item(key: str, payload: dict = Body(...), db: AsyncSession
     stmt = stmt.bindparams(bindparam("value", type_=JSON))
     await db.execute(stmt, {"key": key, "value": value_obj})
     await db.commit()
+    # 通知所有进程刷新该键（本进程立即生效）
+    await system_config_cache.publish(key)
     advice = _apply_advice(key)
     return {"code": 0, "message": "saved", "apply": advice}
 
@@ -2,6 +2,8 @@ from fastapi import APIRouter
 import os
 import yaml
 
+from app.adapters.exchanges.http_sessions import http_sessions
+
 router = APIRouter()
 
 @router.get("/api/v1/exchanges")
@@ -13,4 +15,9 @@ async def list_exchanges():
     except Exception:
         cfg = {}
     names = [k for k in cfg.keys() if k not in ("common", "risk_control", "monitoring")]
-    return {"code": 0, "message": "success", "data": names}
\ No newline at end of file
+    return {"code": 0, "message": "success", "data": names}
+
+@router.get("/api/v1/exchanges/http/stats")
+async def exchange_http_stats():
+    """本进程交易所 HTTP 会话池：各主机请求数、新建/复用连接数与复用率"""
+    return {"code": 0, "message": "success", "data": http_sessions.stats()}
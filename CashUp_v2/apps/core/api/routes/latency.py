@@ -0,0 +1,16 @@
+from fastapi import APIRouter, Query
+from typing import Optional
+
+from utils.latency import latency_registry, STAGES
+
+router = APIRouter()
+
+@router.get("/api/v1/metrics/latency")
+async def latency_metrics(strategy_id: Optional[str] = Query(default=None)):
+    """信号链路延迟分位数（自K线收盘起，单位毫秒）"""
+    return {"code": 0, "message": "success", "data": {"stages": list(STAGES), "strategies": latency_registry.snapshot(strategy_id)}}
+
+@router.post("/api/v1/metrics/latency/reset")
+async def latency_reset(strategy_id: Optional[str] = Query(default=None)):
+    latency_registry.reset(strategy_id)
+    return {"code": 0, "message": "reset"}
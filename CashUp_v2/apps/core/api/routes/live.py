@@ -0,0 +1,23 @@
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+
+from services.live import TOPIC_KINDS, live_hub
+
+router = APIRouter()
+
+@router.websocket("/ws/live")
+async def live_ws(websocket: WebSocket):
+    """实时推送：订阅 kline / ticker / signal / order 主题，订阅后先收到快照再收到增量"""
+    await websocket.accept()
+    try:
+        await live_hub.serve(websocket)
+    except WebSocketDisconnect:
+        pass
+
+@router.get("/api/v1/live/stats")
+async def live_stats():
+    return {"code": 0, "message": "success", "data": {
+        "topics": len(live_hub.subs),
+        "connections": live_hub.connections(),
+        "kinds": list(TOPIC_KINDS),
+        **live_hub.stats,
+    }}
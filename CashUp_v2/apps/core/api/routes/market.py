@@ -1,18 +1,42 @@
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Depends, Query, Request
+from fastapi.responses import StreamingResponse
 from typing import Optional
 from datetime import datetime
+import asyncio
+import time
 
 from api.deps import get_exchanges
-from app.adapters.exchanges.base import ExchangeAdapter
+from api.encoding import FORMAT_QUERY, JSON, negotiate, respond
+from app.adapters.exchanges.base import ExchangeAdapter, model_dict
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import text
-from database.connection import get_db
+from database.connection import get_db, open_session
 from database.redis import get_redis
+from modules.market.services import export as kline_export
+from modules.market.services.derivatives import funding_history, open_interest_history
+from modules.market.services.gaps import queue_status, series_report
+from modules.market.services.ingest import upsert_klines
+from modules.market.services.kline_cache import KlineSeriesCache, answers_request, bar_span
+from modules.market.services.l2_book import local_order_books
+from modules.market.services.orderbook_store import reconstruct, replay_frames
+from modules.market.services.quality import list_quarantine, quality_scores
+from modules.market.services.trades import recent_trades, trade_metrics
+from services.config_cache import system_config_cache
+from utils.singleflight import singleflight
 
 router = APIRouter()
 
+# K线缓存尾部 TTL（market.cache.ttl，默认 30 秒），从进程内配置缓存读取
+async def _cache_ttl() -> int:
+    try:
+        v = await system_config_cache.get('market.cache.ttl')
+        return int(str(v).strip('"')) if v else 30
+    except Exception:
+        return 30
+
 @router.get("/api/v1/market/klines")
 async def get_klines(
+    request: Request,
     exchange: str = Query(...),
     symbol: str = Query(...),
     timeframe: str = Query(...),
@@ -20,26 +44,49 @@ async def get_klines(
     end_time: Optional[int] = Query(default=None),
     limit: int = Query(default=100, ge=1, le=1000),
     persist: bool = Query(default=False),
+    fmt: Optional[str] = FORMAT_QUERY,
     exchanges = Depends(get_exchanges),
     db: AsyncSession = Depends(get_db),
 ):
     mgr = exchanges
-    # 缓存读取
+    enc = negotiate(request, fmt)
+    columnar = enc != JSON
+    # 序列区间缓存：任意 limit / 时间窗口共用一份缓存，只向数据库查询未覆盖的缺口段
+    cache = None
     try:
         r = await get_redis()
-        ck = f"klines:{exchange}:{symbol}:{timeframe}:{limit}"
-        cached = await r.get(ck)
-        if cached:
-            import json
-            return {"code": 0, "message": "cache", "data": json.loads(cached)}
+        cache = KlineSeriesCache(r, exchange, symbol, timeframe, await _cache_ttl())
+
+        async def read():
+            # 共享计算使用独立会话：首个请求被取消时其请求级会话会被关闭，而合并等待的请求仍依赖本次计算
+            async with open_session() as session:
+                if start_time or end_time:
+                    data = await cache.range(session, (start_time or 0) * 1000, (end_time or int(time.time())) * 1000, limit, columnar)
+                else:
+                    data = await cache.latest(session, limit, columnar)
+            # 响应消息随结果一起共享：合并等待的请求自己的 cache 对象没有执行查询，不能据此判断是否命中
+            return data, "cache" if cache.db_queries == 0 else "success"
+
+        # 同一进程内相同参数的并发请求只读一次（尾部刷新的跨进程互斥由序列缓存自身的锁保证）
+        data, message = await singleflight.do(f"klines:{exchange}:{symbol}:{timeframe}:{start_time}:{end_time}:{limit}:{columnar}", read)
+        span = bar_span(data, columnar)
+        start_ms = (start_time or 0) * 1000 if start_time or end_time else None
+        end_ms = (end_time or int(time.time())) * 1000
+        # 数据库只覆盖采集中的序列：最新一根已落后一个周期以上或区间未覆盖时改向交易所取数（persist 才有机会写库）
+        if span[2] and (answers_request(span, timeframe, start_ms, end_ms, limit) or mgr.get_exchange(exchange) is None):
+            return respond(enc, data, message)
     except Exception:
-        pass
+        cache = None
+        try:
+            await db.rollback()
+        except Exception:
+            pass
     adapter: ExchangeAdapter | None = mgr.get_exchange(exchange)
     if adapter is None:
         # 回退到数据库历史
         rows = (await db.execute(text("SELECT open_time, open, high, low, close, volume FROM kline_data WHERE exchange=:ex AND symbol=:sym AND timeframe=:tf ORDER BY open_time DESC LIMIT :limit").bindparams(limit=limit), {"ex": exchange, "sym": symbol, "tf": timeframe})).fetchall()
         data = [{"open_time": r.open_time.isoformat() if hasattr(r.open_time, 'isoformat') else r.open_time, "open": float(r.open or 0), "high": float(r.high or 0), "low": float(r.low or 0), "close": float(r.close or 0), "volume": float(r.volume or 0)} for r in rows]
-        return {"code": 0, "message": "success", "data": data}
+        return respond(enc, data)
     try:
         data = await adapter.get_klines(
             symbol=symbol,
@@ -48,7 +95,7 @@ async def get_klines(
             end_time=datetime.fromtimestamp(end_time) if end_time else None,
             limit=limit,
         )
-        payload = [k.__dict__ for k in data]
+        payload = [model_dict(k) for k in data]
         if persist and payload:
             try:
                 rows = [
@@ -65,46 +112,72 @@ async def get_klines(
                     }
                     for k in data
                 ]
-                await db.execute(
-                    text(
-                        """
-                        INSERT INTO kline_data (exchange, symbol, timeframe, open_time, open, high, low, close, volume)
-                        VALUES (:ex, :sym, :tf, :ot, :o, :h, :l, :c, :v)
-                        ON CONFLICT (exchange, symbol, timeframe, open_time)
-                        DO UPDATE SET open=:o, high=:h, low=:l, close=:c, volume=:v
-                        """
-                    ),
-                    rows,
-                )
-                await db.commit()
+                # 与采集同一入库路径：质量校验、保留期外丢弃、按需建月分区
+                await upsert_klines(db, rows)
+                if cache is not None:
+                    await cache.reset()
             except Exception as e:
+                try:
+                    await db.rollback()
+                except Exception:
+                    pass
                 try:
                     r2 = await get_redis()
                     await r2.set("market:persist:error:last", str(e))
                 except Exception:
                     pass
-        try:
-            r = await get_redis()
-            import json
-            ck = f"klines:{exchange}:{symbol}:{timeframe}:{limit}"
-            # 缓存 TTL 读取自 system_configs，默认 30
-            ttl = 30
-            try:
-                res = await db.execute(text("SELECT config_value FROM system_configs WHERE config_key='market.cache.ttl'"))
-                rv = res.first()
-                if rv and rv.config_value:
-                    ttl = int(str(rv.config_value).strip('"'))
-            except Exception:
-                ttl = 30
-            await r.setex(ck, ttl, json.dumps(payload))
-        except Exception:
-            pass
-        return {"code": 0, "message": "success", "data": payload}
+        return respond(enc, payload)
     except Exception as e:
         # 二级回退：数据库历史
         rows = (await db.execute(text("SELECT open_time, open, high, low, close, volume FROM kline_data WHERE exchange=:ex AND symbol=:sym AND timeframe=:tf ORDER BY open_time DESC LIMIT :limit").bindparams(limit=limit), {"ex": exchange, "sym": symbol, "tf": timeframe})).fetchall()
         data = [{"open_time": r.open_time.isoformat() if hasattr(r.open_time, 'isoformat') else r.open_time, "open": float(r.open or 0), "high": float(r.high or 0), "low": float(r.low or 0), "close": float(r.close or 0), "volume": float(r.volume or 0)} for r in rows]
-        return {"code": 0, "message": "fallback", "data": data}
+        return respond(enc, data, "fallback")
+
+@router.get("/api/v1/market/export")
+async def export_klines(
+    exchange: str = Query(...),
+    symbols: str = Query(..., description="逗号分隔，如 BTC/USDT,ETH/USDT"),
+    timeframe: str = Query(...),
+    start_time: int = Query(..., description="秒级时间戳（含）"),
+    end_time: Optional[int] = Query(default=None, description="秒级时间戳（不含），默认当前；实际使用值见响应头 X-Export-End"),
+    fmt: str = Query(default="csv", alias="format", description="csv / ndjson（gzip）/ parquet"),
+    after_symbol: Optional[str] = Query(default=None, description="续传游标：已收到的最后一行 symbol"),
+    after_time: Optional[int] = Query(default=None, description="续传游标：已收到的最后一行 open_time（毫秒）"),
+    offset: int = Query(default=0, ge=0, description="按字节续传：跳过已下载的前 offset 字节（须同时给出首次导出的 end_time）"),
+):
+    """流式导出整段K线（服务端游标读取，内存占用恒定）；按字节或 (symbol, open_time) 游标续传"""
+    from database.connection import AsyncSessionLocal
+
+    sym_list = [s.strip() for s in symbols.split(",") if s.strip()]
+    if not sym_list:
+        return {"code": 1001, "message": "symbols 不能为空"}
+    if not kline_export.available(fmt):
+        return {"code": 1001, "message": f"不支持的导出格式或缺少依赖: {fmt}"}
+    if (after_symbol is None) != (after_time is None):
+        return {"code": 1001, "message": "after_symbol 与 after_time 须同时给出"}
+    if AsyncSessionLocal is None:
+        return {"code": 1002, "message": "数据库未初始化"}
+    if offset and (end_time is None or end_time > time.time()):
+        # 按字节续传要求两次请求输出逐字节一致：结束时间须显式给出且已过去，否则区间随时间变化、后续字节整体偏移
+        return {"code": 1001, "message": "按字节续传（offset > 0）须给出不晚于当前时间的 end_time（取首次响应的 X-Export-End）"}
+    start = datetime.fromtimestamp(start_time)
+    end_ts = end_time if end_time else int(time.time())
+    end = datetime.fromtimestamp(end_ts)
+    after = (after_symbol, after_time) if after_symbol is not None else None
+
+    async def body():
+        # 流式响应在路由返回后才消费，使用独立会话而不是请求级依赖
+        async with AsyncSessionLocal() as session:
+            async for chunk in kline_export.export_stream(session, exchange, sym_list, timeframe, start, end,
+                                                          fmt, after, offset):
+                yield chunk
+
+    filename = f"klines_{exchange}_{timeframe}_{start_time}.{kline_export.EXTENSIONS[fmt]}"
+    return StreamingResponse(body(), media_type=kline_export.MEDIA_TYPES[fmt], headers={
+        "Content-Disposition": f'attachment; filename="{filename}"',
+        "X-Export-Offset": str(offset),
+        "X-Export-End": str(end_ts),
+    })
 
 @router.get("/api/v1/market/orderbook")
 async def get_orderbook(
@@ -117,8 +190,200 @@ async def get_orderbook(
     adapter: ExchangeAdapter | None = mgr.get_exchange(exchange)
     if adapter is None:
         return {"code": 1003, "message": f"交易所未配置: {exchange}"}
+    # 本地订单簿已同步且档位足够时直接从内存返回；未跟踪的交易对在启用时开始订阅，本次仍走 REST
+    book = local_order_books.get(exchange, symbol)
+    if book is not None and limit <= local_order_books.depth:
+        data = book.top(limit)
+        data.update({"id": book.last_id, "timestamp": book.updated_ms})
+        return {"code": 0, "message": "local", "data": data}
+    if local_order_books.enabled and not local_order_books.tracking(exchange, symbol):
+        asyncio.get_running_loop().create_task(local_order_books.track(mgr, exchange, symbol))
     try:
         ob = await adapter.exchange.get_order_book(symbol, limit)
         return {"code": 0, "message": "success", "data": ob}
     except Exception as e:
-        return {"code": 1002, "message": f"获取订单簿失败: {str(e)}", "data": {}}
\ No newline at end of file
+        return {"code": 1002, "message": f"获取订单簿失败: {str(e)}", "data": {}}
+
+@router.get("/api/v1/market/orderbook/metrics")
+async def get_orderbook_metrics(
+    exchange: str = Query(...),
+    symbol: str = Query(...),
+    depth: int = Query(default=10, ge=1, le=200),
+):
+    """本地订单簿的最优价、中间价、价差与前 depth 档买卖量失衡"""
+    book = local_order_books.get(exchange, symbol)
+    if book is None:
+        return {"code": 1004, "message": f"本地订单簿未同步: {exchange}:{symbol}", "data": {}}
+    return {"code": 0, "message": "success", "data": book.metrics(depth)}
+
+@router.get("/api/v1/market/orderbook/local/stats")
+async def local_orderbook_stats():
+    return {"code": 0, "message": "success", "data": local_order_books.summary()}
+
+# 行情快照：新鲜 2 秒，过期后 30 秒内先返回旧值，由一个请求向交易所重取
+TICKER_TTL = 2
+TICKER_STALE_TTL = 30
+
+@router.get("/api/v1/market/ticker")
+async def get_ticker(
+    exchange: str = Query(...),
+    symbol: str = Query(...),
+    exchanges = Depends(get_exchanges),
+):
+    adapter: ExchangeAdapter | None = exchanges.get_exchange(exchange)
+    if adapter is None:
+        return {"code": 1003, "message": f"交易所未配置: {exchange}"}
+
+    async def fetch():
+        t = await adapter.get_ticker(symbol)
+        data = model_dict(t)
+        if hasattr(data.get("timestamp"), "isoformat"):
+            data["timestamp"] = data["timestamp"].isoformat()
+        return data
+
+    try:
+        data = await singleflight.cached(f"market:ticker:{exchange}:{symbol}", fetch, TICKER_TTL, TICKER_STALE_TTL)
+        return {"code": 0, "message": "success", "data": data}
+    except Exception as e:
+        return {"code": 1002, "message": f"获取行情失败: {str(e)}", "data": {}}
+
+@router.get("/api/v1/market/orderbook/replay")
+async def replay_orderbook(
+    exchange: str = Query(...),
+    symbol: str = Query(...),
+    at: int = Query(..., description="毫秒时间戳"),
+    until: Optional[int] = Query(default=None, description="毫秒时间戳；给出时按 step_ms 返回帧序列"),
+    step_ms: int = Query(default=1000, ge=10),
+    depth: int = Query(default=20, ge=1, le=200),
+    db: AsyncSession = Depends(get_db),
+):
+    """重建历史订单簿：从 at 之前最近的快照起应用增量"""
+    try:
+        start = datetime.fromtimestamp(at / 1000)
+        if until is None:
+            book = await reconstruct(db, exchange, symbol, start, depth)
+            if book is None:
+                return {"code": 1004, "message": "该时间点之前没有订单簿快照", "data": {}}
+            return {"code": 0, "message": "success", "data": book}
+        if until < at:
+            return {"code": 1001, "message": "until 必须不早于 at", "data": []}
+        frames = await replay_frames(db, exchange, symbol, start, datetime.fromtimestamp(until / 1000), step_ms, depth)
+        return {"code": 0, "message": "success", "data": frames}
+    except Exception as e:
+        return {"code": 1002, "message": f"订单簿回放失败: {str(e)}", "data": {}}
+
+@router.get("/api/v1/market/gaps")
+async def get_kline_gaps(
+    exchange: str = Query(...),
+    symbol: str = Query(...),
+    timeframe: str = Query(...),
+    days: int = Query(default=30, ge=1, le=365),
+    db: AsyncSession = Depends(get_db),
+):
+    """单序列K线缺口报告"""
+    try:
+        report = await series_report(db, exchange, symbol, timeframe, days)
+        return {"code": 0, "message": "success", "data": report}
+    except Exception as e:
+        return {"code": 1002, "message": f"缺口扫描失败: {str(e)}", "data": {}}
+
+@router.get("/api/v1/market/quality")
+async def get_kline_quality(days: int = Query(default=7, ge=1, le=7)):
+    """各交易所K线质量得分（近 days 天：1 - 隔离数/校验数）与隔离原因分布"""
+    try:
+        return {"code": 0, "message": "success", "data": await quality_scores(days)}
+    except Exception as e:
+        return {"code": 1002, "message": f"读取质量得分失败: {str(e)}", "data": {}}
+
+@router.get("/api/v1/market/quality/quarantine")
+async def get_kline_quarantine(
+    exchange: Optional[str] = Query(default=None),
+    symbol: Optional[str] = Query(default=None),
+    limit: int = Query(default=100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_db),
+):
+    """被隔离的可疑K线（按最近出现时间倒序）"""
+    try:
+        return {"code": 0, "message": "success", "data": await list_quarantine(db, exchange, symbol, limit)}
+    except Exception as e:
+        return {"code": 1002, "message": f"读取隔离记录失败: {str(e)}", "data": []}
+
+@router.get("/api/v1/market/backfill/queue")
+async def get_backfill_queue(limit: int = Query(default=20, ge=1, le=200)):
+    """回补队列状态（按优先级降序）"""
+    try:
+        return {"code": 0, "message": "success", "data": await queue_status(limit)}
+    except Exception as e:
+        return {"code": 1002, "message": f"读取回补队列失败: {str(e)}", "data": {}}
+
+@router.post("/api/v1/market/gaps/scan")
+async def trigger_gap_scan():
+    """立即触发一次缺口扫描"""
+    try:
+        from celery_app import celery_app
+        celery_app.send_task('tasks.market.gap_scan')
+        return {"code": 0, "message": "queued"}
+    except Exception as e:
+        return {"code": 1002, "message": f"任务提交失败: {str(e)}"}
+
+@router.get("/api/v1/market/trades")
+async def get_market_trades(
+    request: Request,
+    exchange: str = Query(...),
+    symbol: str = Query(...),
+    limit: int = Query(default=100, ge=1, le=1000),
+    fmt: Optional[str] = FORMAT_QUERY,
+    db: AsyncSession = Depends(get_db),
+):
+    """最近逐笔成交（来自 market_trades）"""
+    try:
+        enc = negotiate(request, fmt)
+        return respond(enc, await recent_trades(db, exchange, symbol, limit, columnar=enc != JSON))
+    except Exception as e:
+        return {"code": 1002, "message": f"读取成交失败: {str(e)}", "data": []}
+
+@router.get("/api/v1/market/funding")
+async def get_funding_rates(
+    request: Request,
+    exchange: str = Query(...),
+    symbol: str = Query(...),
+    start_time: Optional[int] = Query(default=None, description="毫秒时间戳"),
+    end_time: Optional[int] = Query(default=None, description="毫秒时间戳"),
+    limit: int = Query(default=500, ge=1, le=5000),
+    fmt: Optional[str] = FORMAT_QUERY,
+    db: AsyncSession = Depends(get_db),
+):
+    """资金费率结算历史（来自 funding_rates，按时间升序）"""
+    try:
+        start = datetime.fromtimestamp(start_time / 1000) if start_time else None
+        end = datetime.fromtimestamp(end_time / 1000) if end_time else None
+        return respond(negotiate(request, fmt), await funding_history(db, exchange, symbol, start, end, limit))
+    except Exception as e:
+        return {"code": 1002, "message": f"读取资金费率失败: {str(e)}", "data": []}
+
+@router.get("/api/v1/market/open-interest")
+async def get_open_interest(
+    request: Request,
+    exchange: str = Query(...),
+    symbol: str = Query(...),
+    start_time: Optional[int] = Query(default=None, description="毫秒时间戳"),
+    end_time: Optional[int] = Query(default=None, description="毫秒时间戳"),
+    limit: int = Query(default=500, ge=1, le=5000),
+    fmt: Optional[str] = FORMAT_QUERY,
+    db: AsyncSession = Depends(get_db),
+):
+    """未平仓量与标记/指数价格、预测资金费率采样（来自 open_interest，按时间升序）"""
+    try:
+        start = datetime.fromtimestamp(start_time / 1000) if start_time else None
+        end = datetime.fromtimestamp(end_time / 1000) if end_time else None
+        return respond(negotiate(request, fmt), await open_interest_history(db, exchange, symbol, start, end, limit))
+    except Exception as e:
+        return {"code": 1002, "message": f"读取未平仓量失败: {str(e)}", "data": []}
+
+@router.get("/api/v1/market/trades/metrics")
+async def get_trade_metrics(gap_limit: int = Query(default=50, ge=1, le=1000)):
+    """逐笔成交采集指标：各交易对成交速率（笔/秒）、去重/缺口/乱序计数与最近序列缺口"""
+    try:
+        return {"code": 0, "message": "success", "data": await trade_metrics(gap_limit)}
+    except Exception as e:
+        return {"code": 1002, "message": f"读取成交指标失败: {str(e)}", "data": {}}
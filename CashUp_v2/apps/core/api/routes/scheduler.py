@@ -1,18 +1,16 @@
 from fastapi import APIRouter, Depends, Body, Query
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import text
 from database.connection import get_db
 from database.redis import get_redis
 from celery_app import celery_app
+from services.config_cache import system_config_cache
 
 router = APIRouter()
 
 @router.get("/api/v1/scheduler/status")
 async def scheduler_status(granularity: str = Query(default="hour"), task: str = Query(default=None), feed_id: str = Query(default=None), db: AsyncSession = Depends(get_db)):
     try:
-        res = await db.execute(text("SELECT config_key, config_value FROM system_configs WHERE config_key LIKE '%%.interval'"))
-        rows = res.fetchall()
-        intervals = {r.config_key: r.config_value for r in rows}
+        intervals = await system_config_cache.get_matching('.interval')
     except Exception:
         intervals = {}
     last = {}
@@ -20,7 +18,7 @@ async def scheduler_status(granularity: str = Query(default="hour"), task: str =
     task_trend = {}
     try:
         r = await get_redis()
-        for k in ['rss.fetch', 'rss.analyze', 'rss.correlation', 'trading.sync', 'market.collect']:
+        for k in ['rss.fetch', 'rss.analyze', 'rss.correlation', 'trading.sync', 'market.collect', 'market.gaps', 'market.backfill', 'market.rollup.reconcile', 'market.partitions', 'market.derivatives']:
             v = await r.get(f"sched:last:{k}")
             last[k] = int(v) if v else None
         hist = await r.lrange('sched:history', 0, 199)
@@ -90,11 +88,9 @@ async def scheduler_status(granularity: str = Query(default="hour"), task: str =
         errors = {"total": 0, "last": None, "per_feed": {}, "market_last": None, "market_trend": {}}
     fallback = []
     try:
-        r2 = await db.execute(text("SELECT config_value FROM system_configs WHERE config_key='rss.fallback.feeds'"))
-        row2 = r2.first()
-        if row2 and row2.config_value:
-            if isinstance(row2.config_value, list):
-                fallback = row2.config_value
+        value = await system_config_cache.get('rss.fallback.feeds')
+        if isinstance(value, list):
+            fallback = value
     except Exception:
         fallback = []
     # series 结构化输出
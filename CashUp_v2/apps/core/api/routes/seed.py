@@ -5,6 +5,7 @@ import os
 import yaml
 
 from database.connection import get_db
+from services.config_cache import system_config_cache
 
 router = APIRouter()
 
@@ -85,4 +86,6 @@ async def seed_system_configs(db: AsyncSession = Depends(get_db)):
             obj = v
         await db.execute(stmt, {"k": k, "v": obj})
     await db.commit()
+    # 通知所有进程整体重载配置缓存（本进程立即生效）
+    await system_config_cache.publish("*")
     return {"code": 0, "message": "seeded"}
\ No newline at end of file
@@ -122,5 +122,5 @@ async def backtest(body: dict, db: AsyncSession = Depends(get_db)):
     if not factors:
         factors = [RSIFactor(), MAFactor()]
     composite = CompositeStrategy(name, factors)
-    result = await run_backtest(db, composite, exchange, symbol, timeframe, start, end)
+    result = await run_backtest(db, composite, exchange, symbol, timeframe, start, end, include_funding=bool(body.get("include_funding", False)))
     return {"code": 0, "message": "success", "data": result}
\ No newline at end of file
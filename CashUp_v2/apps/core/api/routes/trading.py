@@ -8,6 +8,7 @@ from sqlalchemy import text
 from database.connection import get_db
 from events.notifications import publish
 from events.rabbitmq import publish_event
+from services.live import order_topic, publish_live
 
 router = APIRouter()
 
@@ -54,6 +55,11 @@ async def create_order(
         "filled": order.filled_quantity,
         "status": order.status.value,
     })
+    await publish_live(order_topic(exchange), {
+        "event": "created", "exchange": exchange, "symbol": symbol, "order_id": order.id,
+        "client_order_id": client_order_id or order.client_order_id, "type": order.type.value, "side": order.side.value,
+        "price": order.price or 0, "quantity": order.quantity, "filled_quantity": order.filled_quantity, "status": order.status.value,
+    })
     await publish("order.created", {"symbol": symbol, "side": side, "quantity": quantity})
     await publish_event("order.created", {"symbol": symbol, "side": side, "quantity": quantity})
     if order.status.value in ("filled", "partially_filled"):
@@ -106,4 +112,6 @@ async def cancel_order(exchange: str, symbol: str, order_id: Optional[str] = Non
     if adapter is None:
         return {"code": 1003, "message": f"交易所未配置: {exchange}"}
     ok = await adapter.cancel_order(CancelOrderRequest(symbol=symbol, order_id=order_id, client_order_id=client_order_id))
+    if ok:
+        await publish_live(order_topic(exchange), {"event": "canceled", "exchange": exchange, "symbol": symbol, "order_id": order_id, "client_order_id": client_order_id})
     return {"code": 0 if ok else 1005, "message": "success" if ok else "取消失败"}
\ No newline at end of file
@@ -1,13 +1,17 @@
 """
 交易所抽象层 - 统一的交易所接口定义
+行情热路径模型（Ticker / Trade / Kline / OrderBook）使用 __slots__ 数据类，转字典用 model_dict；
+KlineBatch 为列式K线批次（NumPy 数组），交易所原始K线数组直接按列解析，不逐行构造中间字典
 """
 
 from abc import ABC, abstractmethod
-from typing import Dict, List, Optional, Any, Union
+from typing import Dict, List, Optional, Any, Sequence, Union
 from datetime import datetime, timedelta
-from dataclasses import dataclass
+from dataclasses import dataclass, fields
 from enum import Enum
 
+import numpy as np
+
 class OrderSide(Enum):
     """订单方向"""
     BUY = "buy"
@@ -52,7 +56,7 @@ class TimeInForce(Enum):
     FOK = "fill_or_kill"         # 全部成交或撤销
     DAY = "day"                  # 当日有效
 
-@dataclass
+@dataclass(slots=True)
 class Ticker:
     """行情信息"""
     symbol: str
@@ -97,7 +101,7 @@ class Order:
     updated_at: datetime
     exchange: str
 
-@dataclass
+@dataclass(slots=True)
 class Trade:
     """成交信息"""
     id: str
@@ -111,7 +115,7 @@ class Trade:
     timestamp: datetime
     exchange: str
 
-@dataclass
+@dataclass(slots=True)
 class Kline:
     """K线数据"""
     symbol: str
@@ -128,6 +132,116 @@ class Kline:
     taker_buy_volume: float
     taker_buy_quote_volume: float
 
+def model_dict(obj) -> Dict[str, Any]:
+    """数据类转字典（浅拷贝；__slots__ 模型没有 __dict__）"""
+    return {f.name: getattr(obj, f.name) for f in fields(obj)}
+
+class KlineBatch:
+    """列式K线批次：open_time 为毫秒 int64，价格/成交量为 float64"""
+
+    __slots__ = ("symbol", "interval", "interval_ms", "open_time", "open", "high", "low", "close", "volume", "quote_volume")
+
+    def __init__(self, symbol: str, interval: str, interval_ms: int, open_time: np.ndarray, open: np.ndarray,
+                 high: np.ndarray, low: np.ndarray, close: np.ndarray, volume: np.ndarray, quote_volume: np.ndarray):
+        self.symbol = symbol
+        self.interval = interval
+        self.interval_ms = interval_ms
+        self.open_time = open_time
+        self.open = open
+        self.high = high
+        self.low = low
+        self.close = close
+        self.volume = volume
+        self.quote_volume = quote_volume
+
+    @classmethod
+    def from_rows(cls, symbol: str, interval: str, interval_ms: int, rows: Sequence[Sequence[Any]],
+                  index: Dict[str, int], time_unit_ms: int = 1) -> "KlineBatch":
+        """交易所返回的数组形式K线按列转置后整列转换；index 为各字段在行内的位置（open_time/open/high/low/close/volume/quote_volume）"""
+        if not rows:
+            empty = np.empty(0, dtype=np.float64)
+            return cls(symbol, interval, interval_ms, np.empty(0, dtype=np.int64), empty, empty, empty, empty, empty, empty)
+        cols = list(zip(*rows))
+
+        def num(name: str) -> np.ndarray:
+            i = index.get(name)
+            return np.asarray(cols[i], dtype=np.float64) if i is not None and i < len(cols) else np.zeros(len(rows))
+
+        open_time = np.asarray(cols[index["open_time"]], dtype=np.int64) * time_unit_ms
+        return cls(symbol, interval, interval_ms, open_time, num("open"), num("high"), num("low"), num("close"),
+                   num("volume"), num("quote_volume"))
+
+    @classmethod
+    def from_klines(cls, symbol: str, interval: str, interval_ms: int, klines: Sequence["Kline"]) -> "KlineBatch":
+        return cls(
+            symbol, interval, interval_ms,
+            np.array([int(k.open_time.timestamp() * 1000) for k in klines], dtype=np.int64),
+            np.array([k.open_price for k in klines], dtype=np.float64),
+            np.array([k.high_price for k in klines], dtype=np.float64),
+            np.array([k.low_price for k in klines], dtype=np.float64),
+            np.array([k.close_price for k in klines], dtype=np.float64),
+            np.array([k.volume for k in klines], dtype=np.float64),
+            np.array([k.quote_volume for k in klines], dtype=np.float64),
+        )
+
+    @classmethod
+    def concat(cls, batches: Sequence["KlineBatch"]) -> "KlineBatch":
+        """同一序列的多个批次按到达顺序拼接"""
+        first = batches[0]
+        if len(batches) == 1:
+            return first
+        return cls(first.symbol, first.interval, first.interval_ms,
+                   *(np.concatenate([getattr(b, name) for b in batches]) for name in cls.__slots__[3:]))
+
+    def __len__(self) -> int:
+        return len(self.open_time)
+
+    def take(self, index) -> "KlineBatch":
+        """按布尔掩码或下标数组取子批次"""
+        return KlineBatch(self.symbol, self.interval, self.interval_ms,
+                          *(getattr(self, name)[index] for name in self.__slots__[3:]))
+
+    def open_times(self) -> List[datetime]:
+        """本地时间（与 Kline.open_time 一致）"""
+        return [datetime.fromtimestamp(t / 1000) for t in self.open_time.tolist()]
+
+    def first_open_time(self) -> datetime:
+        return datetime.fromtimestamp(int(self.open_time.min()) / 1000)
+
+    def last_open_time(self) -> datetime:
+        return datetime.fromtimestamp(int(self.open_time.max()) / 1000)
+
+    def kline(self, i: int) -> "Kline":
+        t = int(self.open_time[i])
+        return Kline(
+            symbol=self.symbol, interval=self.interval,
+            open_time=datetime.fromtimestamp(t / 1000), close_time=datetime.fromtimestamp((t + self.interval_ms) / 1000),
+            open_price=float(self.open[i]), high_price=float(self.high[i]), low_price=float(self.low[i]),
+            close_price=float(self.close[i]), volume=float(self.volume[i]), quote_volume=float(self.quote_volume[i]),
+            trades_count=0, taker_buy_volume=0.0, taker_buy_quote_volume=0.0,
+        )
+
+    def latest(self) -> "Kline":
+        return self.kline(int(self.open_time.argmax()))
+
+    def to_klines(self) -> List["Kline"]:
+        step = self.interval_ms / 1000
+        return [
+            Kline(symbol=self.symbol, interval=self.interval, open_time=datetime.fromtimestamp(t / 1000),
+                  close_time=datetime.fromtimestamp(t / 1000 + step), open_price=o, high_price=h, low_price=l,
+                  close_price=c, volume=v, quote_volume=q, trades_count=0, taker_buy_volume=0.0, taker_buy_quote_volume=0.0)
+            for t, o, h, l, c, v, q in zip(self.open_time.tolist(), self.open.tolist(), self.high.tolist(), self.low.tolist(),
+                                           self.close.tolist(), self.volume.tolist(), self.quote_volume.tolist())
+        ]
+
+    def rows(self, exchange: str, symbol: str, timeframe: str) -> List[Dict[str, Any]]:
+        """入库参数行（upsert_klines 的输入格式）"""
+        return [
+            {"ex": exchange, "sym": symbol, "tf": timeframe, "ot": ot, "o": o, "h": h, "l": l, "c": c, "v": v}
+            for ot, o, h, l, c, v in zip(self.open_times(), self.open.tolist(), self.high.tolist(), self.low.tolist(),
+                                         self.close.tolist(), self.volume.tolist())
+        ]
+
 @dataclass
 class Position:
     """持仓信息"""
@@ -155,6 +269,25 @@ class FundingRate:
     index_price: float
     timestamp: datetime
     exchange: str
+    predicted_funding_rate: Optional[float] = None
+
+@dataclass
+class OpenInterest:
+    """未平仓合约量"""
+    symbol: str
+    open_interest: float
+    open_interest_value: Optional[float]
+    timestamp: datetime
+    exchange: str
+    mark_price: Optional[float] = None
+
+@dataclass(slots=True)
+class OrderBook:
+    """订单簿快照"""
+    symbol: str
+    asks: List[Dict[str, float]]
+    bids: List[Dict[str, float]]
+    timestamp: datetime
 
 @dataclass
 class OrderRequest:
@@ -181,7 +314,10 @@ class CancelOrderRequest:
 
 class ExchangeBase(ABC):
     """交易所基类"""
-    
+
+    # subscribe_trades 是否真正推送成交（未实现推送的适配器保持 False）
+    supports_trade_stream = False
+
     def __init__(self, config: Dict[str, Any]):
         self.config = config
         self.name = config.get('name', 'Unknown')
@@ -203,6 +339,14 @@ class ExchangeBase(ABC):
                         limit: int = 100) -> List[Kline]:
         """获取K线数据"""
         pass
+
+    async def get_kline_batch(self, symbol: str, interval: str,
+                              start_time: Optional[datetime] = None,
+                              end_time: Optional[datetime] = None,
+                              limit: int = 100) -> KlineBatch:
+        """获取列式K线批次（默认由 get_klines 转换，子类可直接按列解析原始数组）"""
+        klines = await self.get_klines(symbol, interval, start_time, end_time, limit)
+        return KlineBatch.from_klines(symbol, interval, self.get_interval_minutes(interval) * 60000, klines)
     
     @abstractmethod
     async def get_order_book(self, symbol: str, limit: int = 100) -> Dict[str, Any]:
@@ -287,6 +431,13 @@ class ExchangeBase(ABC):
         """获取资金费率历史"""
         pass
 
+    async def get_open_interest_history(self, symbol: str, period: str = "5m",
+                                        start_time: Optional[datetime] = None,
+                                        end_time: Optional[datetime] = None,
+                                        limit: int = 100) -> List[OpenInterest]:
+        """获取未平仓合约量历史（未实现的交易所返回空列表）"""
+        return []
+
     @abstractmethod
     async def set_leverage(self, symbol: str, leverage: int) -> bool:
         """设置杠杆"""
@@ -443,6 +594,31 @@ class ExchangeAdapter:
                         limit: int = 100) -> List[Kline]:
         """获取K线数据"""
         return await self.exchange.get_klines(symbol, interval, start_time, end_time, limit)
+
+    async def get_kline_batch(self, symbol: str, interval: str,
+                              start_time: Optional[datetime] = None,
+                              end_time: Optional[datetime] = None,
+                              limit: int = 100) -> KlineBatch:
+        """获取列式K线批次"""
+        return await self.exchange.get_kline_batch(symbol, interval, start_time, end_time, limit)
+
+    async def get_funding_rate(self, symbol: str) -> FundingRate:
+        """获取当前资金费率（含预测费率、标记/指数价格）"""
+        return await self.exchange.get_funding_rate(symbol)
+
+    async def get_funding_rate_history(self, symbol: str,
+                                       start_time: Optional[datetime] = None,
+                                       end_time: Optional[datetime] = None,
+                                       limit: int = 100) -> List[FundingRate]:
+        """获取资金费率结算历史"""
+        return await self.exchange.get_funding_rate_history(symbol, start_time, end_time, limit)
+
+    async def get_open_interest_history(self, symbol: str, period: str = "5m",
+                                        start_time: Optional[datetime] = None,
+                                        end_time: Optional[datetime] = None,
+                                        limit: int = 100) -> List[OpenInterest]:
+        """获取未平仓合约量历史"""
+        return await self.exchange.get_open_interest_history(symbol, period, start_time, end_time, limit)
     
     async def get_balance(self) -> Dict[str, Balance]:
         """获取账户余额"""
@@ -545,7 +721,17 @@ class ExchangeManager:
             results[name] = await adapter.test_connection()
         
         return results
-    
+
+    async def close(self):
+        """关闭所有交易所客户端持有的WebSocket连接（HTTP 会话属于进程级会话池，不随管理器关闭）"""
+        for adapter in self.exchanges.values():
+            ws_manager = getattr(adapter.exchange, 'ws_manager', None)
+            if ws_manager is not None:
+                try:
+                    await ws_manager.disconnect()
+                except Exception:
+                    pass
+
     def get_exchange_summary(self) -> List[Dict[str, Any]]:
         """获取交易所摘要信息"""
         summary = []
@@ -3,7 +3,6 @@ Binance交易所客户端 - 支持现货和永续合约交易
 """
 
 import asyncio
-import aiohttp
 import hmac
 import hashlib
 import time
@@ -15,26 +14,32 @@ from .base import (
     ExchangeBase, ExchangeAdapter, ExchangeManager,
     Ticker, Balance, Order, Trade, Kline, OrderRequest, CancelOrderRequest,
     OrderSide, OrderType, OrderStatus, TimeInForce, ContractType, PositionSide,
-    Position, FundingRate
+    Position, FundingRate, OpenInterest
 )
+from .binance_ws import BinanceTradeStream
+from .fastjson import response_json
+from .http_sessions import http_sessions
 
 class BinanceExchange(ExchangeBase):
     """Binance交易所客户端"""
 
+    supports_trade_stream = True
+
     def __init__(self, config: Dict[str, Any]):
         super().__init__(config)
         self.base_url = "https://api.binance.com" if not self.sandbox else "https://testnet.binance.vision"
         self.stream_url = "wss://stream.binance.com:9443" if not self.sandbox else "wss://testnet.binance.vision"
-        self.session = None
+        self.futures_url = "https://fapi.binance.com" if not self.sandbox else "https://testnet.binancefuture.com"
         self.rate_limiter = asyncio.Semaphore(self.rate_limit)
+        # 目前仅实现逐笔成交推送；ExchangeManager.close 时经 ws_manager.disconnect 关闭
+        self.ws_manager: Optional[BinanceTradeStream] = None
 
     async def __aenter__(self):
-        self.session = aiohttp.ClientSession()
         return self
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
-        if self.session:
-            await self.session.close()
+        # HTTP 会话由进程级会话池持有，随应用生命周期关闭
+        pass
 
     def _generate_signature(self, params: Dict[str, Any]) -> str:
         """生成API签名"""
@@ -47,10 +52,11 @@ class BinanceExchange(ExchangeBase):
 
     async def _request(self, method: str, endpoint: str,
                       params: Optional[Dict[str, Any]] = None,
-                      signed: bool = False) -> Dict[str, Any]:
+                      signed: bool = False, use_futures: bool = False) -> Dict[str, Any]:
         """发送HTTP请求"""
         async with self.rate_limiter:
-            url = f"{self.base_url}{endpoint}"
+            url = f"{self.futures_url if use_futures else self.base_url}{endpoint}"
+            session = http_sessions.get(url)
 
             if params is None:
                 params = {}
@@ -65,14 +71,14 @@ class BinanceExchange(ExchangeBase):
             if method == 'GET':
                 if params:
                     url += '?' + '&'.join([f"{key}={value}" for key, value in params.items()])
-                async with self.session.get(url, headers=headers) as response:
-                    return await response.json()
+                async with session.get(url, headers=headers) as response:
+                    return await response_json(response)
             elif method == 'POST':
-                async with self.session.post(url, json=params, headers=headers) as response:
-                    return await response.json()
+                async with session.post(url, json=params, headers=headers) as response:
+                    return await response_json(response)
             elif method == 'DELETE':
-                async with self.session.delete(url, params=params, headers=headers) as response:
-                    return await response.json()
+                async with session.delete(url, params=params, headers=headers) as response:
+                    return await response_json(response)
 
     async def get_ticker(self, symbol: str) -> Ticker:
         """获取24小时行情"""
@@ -402,9 +408,10 @@ class BinanceExchange(ExchangeBase):
         pass
 
     async def subscribe_trades(self, symbol: str, callback):
-        """订阅成交推送"""
-        # TODO: 实现WebSocket订阅
-        pass
+        """订阅成交推送（<symbol>@trade，成交ID在交易对内连续递增）"""
+        if self.ws_manager is None:
+            self.ws_manager = BinanceTradeStream(self.stream_url)
+        await self.ws_manager.subscribe(symbol, callback)
 
     async def subscribe_user_data(self, callback):
         """订阅用户数据推送"""
@@ -423,9 +430,23 @@ class BinanceExchange(ExchangeBase):
         pass
 
     async def get_funding_rate(self, symbol: str) -> FundingRate:
-        """获取资金费率信息"""
-        # TODO: 实现资金费率查询
-        pass
+        """获取资金费率信息（premiumIndex：最近费率、标记/指数价格、下次结算时间）"""
+        params = {'symbol': self._futures_symbol(symbol)}
+        item = await self._request('GET', '/fapi/v1/premiumIndex', params, use_futures=True)
+        if not item or 'lastFundingRate' not in item:
+            raise ValueError(f"获取不到 {symbol} 的资金费率数据")
+        rate = float(item['lastFundingRate'])
+        return FundingRate(
+            symbol=symbol,
+            funding_rate=rate,
+            funding_rate_8h=rate,
+            next_funding_time=datetime.fromtimestamp(int(item['nextFundingTime']) / 1000),
+            mark_price=float(item['markPrice']),
+            index_price=float(item['indexPrice']),
+            timestamp=datetime.fromtimestamp(int(item['time']) / 1000),
+            exchange='binance',
+            predicted_funding_rate=rate
+        )
 
     async def set_leverage(self, symbol: str, leverage: int) -> bool:
         """设置杠杆"""
@@ -441,9 +462,58 @@ class BinanceExchange(ExchangeBase):
                                      start_time: Optional[datetime] = None,
                                      end_time: Optional[datetime] = None,
                                      limit: int = 100) -> List[FundingRate]:
-        """获取资金费率历史"""
-        # TODO: 实现资金费率历史查询
-        return []
+        """获取资金费率结算历史"""
+        params = {'symbol': self._futures_symbol(symbol), 'limit': min(limit, 1000)}
+        if start_time:
+            params['startTime'] = int(start_time.timestamp() * 1000)
+        if end_time:
+            params['endTime'] = int(end_time.timestamp() * 1000)
+
+        data = await self._request('GET', '/fapi/v1/fundingRate', params, use_futures=True)
+
+        funding_rates = []
+        for item in data or []:
+            ts = datetime.fromtimestamp(int(item['fundingTime']) / 1000)
+            rate = float(item['fundingRate'])
+            mark = item.get('markPrice')
+            funding_rates.append(FundingRate(
+                symbol=symbol,
+                funding_rate=rate,
+                funding_rate_8h=rate,
+                next_funding_time=ts,
+                mark_price=float(mark) if mark not in (None, '') else 0.0,
+                index_price=0.0,
+                timestamp=ts,
+                exchange='binance'
+            ))
+        return funding_rates
+
+    async def get_open_interest_history(self, symbol: str, period: str = "5m",
+                                        start_time: Optional[datetime] = None,
+                                        end_time: Optional[datetime] = None,
+                                        limit: int = 100) -> List[OpenInterest]:
+        """获取未平仓合约量历史（交易所只保留最近 30 天）"""
+        params = {'symbol': self._futures_symbol(symbol), 'period': period, 'limit': min(limit, 500)}
+        if start_time:
+            params['startTime'] = int(start_time.timestamp() * 1000)
+        if end_time:
+            params['endTime'] = int(end_time.timestamp() * 1000)
+
+        data = await self._request('GET', '/futures/data/openInterestHist', params, use_futures=True)
+
+        return [
+            OpenInterest(
+                symbol=symbol,
+                open_interest=float(item['sumOpenInterest']),
+                open_interest_value=float(item['sumOpenInterestValue']) if item.get('sumOpenInterestValue') is not None else None,
+                timestamp=datetime.fromtimestamp(int(item['timestamp']) / 1000),
+                exchange='binance'
+            )
+            for item in data or []
+        ]
+
+    def _futures_symbol(self, symbol: str) -> str:
+        return symbol.replace('/', '').replace('_', '').upper()
 
     async def subscribe_funding_rate(self, symbol: str, callback):
         """订阅资金费率推送"""
@@ -0,0 +1,143 @@
+"""
+Binance WebSocket 成交流
+函数集注释：
+- BinanceTradeStream: 单条连接承载全部 <symbol>@trade 订阅（SUBSCRIBE 方法，单连接上限 1024 个流）；
+  断线后指数退避（带抖动）重连并重发全部订阅；推送解析为 Trade（成交ID为交易对内连续递增的 t）
+- BinanceTradeStream.parse_trade: 单条 trade 事件 -> Trade（m 为 true 表示买方为挂单方，即主动卖出）
+"""
+
+import asyncio
+import json
+import logging
+import random
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+import websockets
+
+from .base import Trade
+from .fastjson import DecodeError, loads
+
+logger = logging.getLogger(__name__)
+
+RECONNECT_MAX_DELAY = 60.0
+
+
+class BinanceTradeStream:
+    """Binance 现货逐笔成交推送"""
+
+    def __init__(self, stream_url: str):
+        self.url = f"{stream_url}/ws"
+        # 流名（btcusdt@trade）-> 标准交易对 / 回调
+        self.symbols: Dict[str, str] = {}
+        self.callbacks: Dict[str, List[Callable]] = {}
+        self.ws = None
+        self.task: Optional[asyncio.Task] = None
+        self.is_running = False
+        self.reconnects = 0
+        self._next_id = 0
+
+    @staticmethod
+    def stream_name(symbol: str) -> str:
+        return f"{symbol.replace('/', '').replace('_', '').lower()}@trade"
+
+    @staticmethod
+    def parse_trade(data: Dict[str, Any], symbol: str) -> Trade:
+        return Trade(
+            id=str(data.get('t', '')),
+            order_id='',
+            symbol=symbol,
+            side='sell' if data.get('m') else 'buy',
+            quantity=float(data.get('q', 0)),
+            price=float(data.get('p', 0)),
+            commission=0.0,
+            commission_asset='',
+            timestamp=datetime.fromtimestamp(int(data.get('T', 0)) / 1000),
+            exchange='binance'
+        )
+
+    async def _send(self, method: str, streams: List[str]) -> None:
+        ws = self.ws
+        if ws is None or not streams:
+            return
+        self._next_id += 1
+        try:
+            await ws.send(json.dumps({"method": method, "params": streams, "id": self._next_id}))
+        except Exception as e:
+            logger.warning(f"Binance WebSocket发送失败: {e}")
+
+    async def subscribe(self, symbol: str, callback: Callable) -> None:
+        stream = self.stream_name(symbol)
+        self.callbacks.setdefault(stream, []).append(callback)
+        if stream not in self.symbols:
+            self.symbols[stream] = symbol.replace('_', '/')
+            await self._send("SUBSCRIBE", [stream])
+        self.is_running = True
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._run(), name="binance-trades")
+
+    async def unsubscribe(self, symbol: str) -> None:
+        stream = self.stream_name(symbol)
+        self.callbacks.pop(stream, None)
+        if self.symbols.pop(stream, None) is not None:
+            await self._send("UNSUBSCRIBE", [stream])
+
+    async def _dispatch(self, message) -> None:
+        try:
+            data = loads(message)
+        except DecodeError:
+            return
+        # 订阅回包 {"result": null, "id": n} 不是数据推送
+        if not isinstance(data, dict) or data.get('e') != 'trade':
+            return
+        stream = f"{str(data.get('s', '')).lower()}@trade"
+        symbol = self.symbols.get(stream)
+        if symbol is None:
+            return
+        trade = self.parse_trade(data, symbol)
+        for cb in list(self.callbacks.get(stream, [])):
+            try:
+                await cb([trade])
+            except Exception as e:
+                logger.error(f"成交回调失败 {stream}: {e}")
+
+    async def _run(self) -> None:
+        attempt = 0
+        while self.is_running and self.symbols:
+            try:
+                async with websockets.connect(self.url, ping_interval=20, ping_timeout=20) as ws:
+                    self.ws = ws
+                    attempt = 0
+                    await self._send("SUBSCRIBE", list(self.symbols))
+                    logger.info(f"Binance成交流已连接，订阅 {len(self.symbols)} 个交易对")
+                    async for message in ws:
+                        if not self.is_running:
+                            break
+                        await self._dispatch(message)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Binance成交流中断: {e}")
+            finally:
+                self.ws = None
+            if not (self.is_running and self.symbols):
+                break
+            attempt += 1
+            self.reconnects += 1
+            await asyncio.sleep(min(2 ** attempt, RECONNECT_MAX_DELAY) * (0.5 + random.random() / 2))
+
+    async def disconnect(self) -> None:
+        self.is_running = False
+        task, self.task = self.task, None
+        ws = self.ws
+        if ws is not None:
+            try:
+                await ws.close()
+            except Exception:
+                pass
+        if task is not None and not task.done():
+            task.cancel()
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
+                pass
@@ -0,0 +1,43 @@
+"""
+交易所响应/推送 JSON 解码
+函数集注释：
+- loads: 按可用性依次使用 orjson、msgspec，均未安装时回退标准库 json（pip install orjson 即可启用快速路径）
+- response_json: 读取 aiohttp 响应体字节直接解码（不按 Content-Type 校验，不经过 str 中间值）
+- BACKEND: 当前使用的解码库名称；DecodeError: 解码失败时可能抛出的异常类型
+"""
+
+import json
+from typing import Any, Union
+
+try:
+    import orjson
+except ImportError:  # 可选依赖
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:  # 可选依赖
+    msgspec = None
+
+if orjson is not None:
+    BACKEND = "orjson"
+    _decode = orjson.loads
+elif msgspec is not None:
+    BACKEND = "msgspec"
+    _decode = msgspec.json.Decoder().decode
+else:
+    BACKEND = "json"
+    _decode = json.loads
+
+# 解码失败时可能抛出的异常（orjson 的异常为 ValueError 子类）
+DecodeError = (ValueError, TypeError) + ((msgspec.DecodeError,) if msgspec is not None else ())
+
+
+def loads(data: Union[bytes, bytearray, str]) -> Any:
+    if BACKEND == "msgspec" and isinstance(data, str):
+        data = data.encode()
+    return _decode(data)
+
+
+async def response_json(response) -> Any:
+    return loads(await response.read())
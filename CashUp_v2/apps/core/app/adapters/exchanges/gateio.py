@@ -16,12 +16,19 @@ from .base import (
     ExchangeBase, ExchangeAdapter, ExchangeManager,
     Ticker, Balance, Order, Trade, Kline, OrderRequest, CancelOrderRequest,
     OrderSide, OrderType, OrderStatus, TimeInForce, ContractType, PositionSide,
-    Position, FundingRate
+    Position, FundingRate, OpenInterest, KlineBatch
 )
+from .fastjson import loads, response_json
+from .http_sessions import http_sessions
+
+# 现货K线数组各字段位置
+_CANDLE_INDEX = {'open_time': 0, 'volume': 1, 'close': 2, 'high': 3, 'low': 4, 'open': 5, 'quote_volume': 6}
 
 class GateIOExchange(ExchangeBase):
     """Gate.io交易所客户端"""
 
+    supports_trade_stream = True
+
     def __init__(self, config: Dict[str, Any]):
         super().__init__(config)
 
@@ -36,6 +43,9 @@ class GateIOExchange(ExchangeBase):
             self.futures_base_url = "https://fx-api-testnet.gateio.ws/api/v4"
             self.ws_base_url = "wss://fx-ws-testnet.gateio.ws"
 
+        # 永续合约结算币种（USDT 本位）
+        self.settle = str(config.get('settle', 'usdt')).lower()
+
         # 从配置或环境变量获取API密钥
         self.api_key = config.get('api_key', '')
         self.api_secret = config.get('api_secret', '')
@@ -58,17 +68,15 @@ class GateIOExchange(ExchangeBase):
                 if not self.api_secret:
                     self.api_secret = os.getenv('GATE_IO_SECRET_KEY', '')
 
-        self.session = aiohttp.ClientSession()
         self.ws_manager = None
         self.rate_limiter = asyncio.Semaphore(self.rate_limit)
 
     async def __aenter__(self):
-        self.session = aiohttp.ClientSession()
         return self
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
-        if self.session:
-            await self.session.close()
+        # HTTP 会话由进程级会话池持有，随应用生命周期关闭
+        pass
 
     def _generate_signature(self, method: str, endpoint: str, params: Dict[str, Any] = None) -> str:
         """生成API签名"""
@@ -85,11 +93,10 @@ class GateIOExchange(ExchangeBase):
     async def _request(self, method: str, endpoint: str, params: Dict[str, Any] = None,
                       signed: bool = False, use_futures: bool = False) -> Dict[str, Any]:
         """HTTP请求（带UA/超时/重试）"""
-        if self.session is None:
-            self.session = aiohttp.ClientSession()
         async with self.rate_limiter:
             base_url = self.futures_base_url if use_futures else self.spot_base_url
             url = f"{base_url}{endpoint}"
+            session = http_sessions.get(url)
 
             headers = {
                 'Content-Type': 'application/json',
@@ -109,25 +116,21 @@ class GateIOExchange(ExchangeBase):
                 try:
                     timeout = aiohttp.ClientTimeout(total=30)
                     if method == 'GET':
-                        async with self.session.get(url, params=params or {}, headers=headers, timeout=timeout) as response:
-                            ct = response.headers.get('Content-Type', '')
-                            if 'application/json' in ct:
-                                return await response.json()
-                            text = await response.text()
+                        async with session.get(url, params=params or {}, headers=headers, timeout=timeout) as response:
+                            body = await response.read()
                             try:
-                                import json as _json
-                                return _json.loads(text)
+                                return loads(body)
                             except Exception:
-                                raise ValueError(f"Unexpected content-type: {ct}")
+                                raise ValueError(f"Unexpected content-type: {response.headers.get('Content-Type', '')}")
                     elif method == 'POST':
-                        async with self.session.post(url, json=params or {}, headers=headers, timeout=timeout) as response:
-                            return await response.json()
+                        async with session.post(url, json=params or {}, headers=headers, timeout=timeout) as response:
+                            return await response_json(response)
                     elif method == 'DELETE':
-                        async with self.session.delete(url, json=params or {}, headers=headers, timeout=timeout) as response:
-                            return await response.json()
+                        async with session.delete(url, json=params or {}, headers=headers, timeout=timeout) as response:
+                            return await response_json(response)
                     else:
-                        async with self.session.request(method, url, json=params or {}, headers=headers, timeout=timeout) as response:
-                            return await response.json()
+                        async with session.request(method, url, json=params or {}, headers=headers, timeout=timeout) as response:
+                            return await response_json(response)
                 except Exception as e:
                     last_exc = e
                     tries += 1
@@ -167,6 +170,14 @@ class GateIOExchange(ExchangeBase):
                         end_time: Optional[datetime] = None,
                         limit: int = 100) -> List[Kline]:
         """获取K线数据"""
+        batch = await self.get_kline_batch(symbol, interval, start_time, end_time, limit)
+        return batch.to_klines()
+
+    async def get_kline_batch(self, symbol: str, interval: str,
+                              start_time: Optional[datetime] = None,
+                              end_time: Optional[datetime] = None,
+                              limit: int = 100) -> KlineBatch:
+        """获取列式K线批次"""
         gate_symbol = symbol.replace('/', '_')
         endpoint = f"/api/v4/spot/candlesticks"
 
@@ -190,35 +201,16 @@ class GateIOExchange(ExchangeBase):
             params['to'] = int(end_time.timestamp())
 
         data = await self._request('GET', endpoint, params)
-
-        klines: List[Kline] = []
-        for item in data:
-            # Gate.io candlesticks: [t, volume, close, high, low, open, quote_volume]
-            ts = int(item[0])
-            kline = Kline(
-                symbol=symbol,
-                interval=interval,
-                open_time=datetime.fromtimestamp(ts),
-                close_time=datetime.fromtimestamp(ts + self.get_interval_minutes(interval) * 60),
-                open_price=float(item[5]),
-                high_price=float(item[3]),
-                low_price=float(item[4]),
-                close_price=float(item[2]),
-                volume=float(item[1]),
-                quote_volume=float(item[6]),
-                trades_count=0,
-                taker_buy_volume=0.0,
-                taker_buy_quote_volume=0.0
-            )
-            klines.append(kline)
-
-        return klines
+        # Gate.io candlesticks: [t, volume, close, high, low, open, quote_volume, ...]，整列转换
+        return KlineBatch.from_rows(symbol, interval, self.get_interval_minutes(interval) * 60000, data,
+                                    _CANDLE_INDEX, time_unit_ms=1000)
 
     async def get_order_book(self, symbol: str, limit: int = 100) -> Dict[str, Any]:
         """获取订单簿"""
         gate_symbol = symbol.replace('/', '_')
         endpoint = f"/api/v4/spot/order_book"
-        params = {'currency_pair': gate_symbol, 'limit': limit}
+        # with_id 返回快照对应的更新 ID，本地订单簿据此衔接增量推送
+        params = {'currency_pair': gate_symbol, 'limit': limit, 'with_id': 'true'}
 
         return await self._request('GET', endpoint, params)
 
@@ -376,24 +368,24 @@ class GateIOExchange(ExchangeBase):
         return positions
 
     async def get_funding_rate(self, symbol: str) -> FundingRate:
-        """获取资金费率"""
+        """获取资金费率（合约详情：当前/预测费率、标记/指数价格、下次结算时间）"""
         gate_symbol = symbol.replace('/', '_')
-        endpoint = f"/api/v4/futures/funding_rate"
-        params = {'contract': gate_symbol}
+        endpoint = f"/futures/{self.settle}/contracts/{gate_symbol}"
 
-        data = await self._request('GET', endpoint, params, use_futures=True)
+        item = await self._request('GET', endpoint, use_futures=True)
 
-        if data and len(data) > 0:
-            item = data[0]
+        if item and 'funding_rate' in item:
+            rate = float(item['funding_rate'])
             return FundingRate(
                 symbol=symbol,
-                funding_rate=float(item['funding_rate']),
-                funding_rate_8h=float(item['funding_rate_8h']),
-                next_funding_time=datetime.fromtimestamp(item['next_funding_time']),
+                funding_rate=rate,
+                funding_rate_8h=rate * 28800 / float(item.get('funding_interval') or 28800),
+                next_funding_time=datetime.fromtimestamp(int(item.get('funding_next_apply') or 0)),
                 mark_price=float(item['mark_price']),
                 index_price=float(item['index_price']),
                 timestamp=datetime.now(),
-                exchange='gateio'
+                exchange='gateio',
+                predicted_funding_rate=float(item['funding_rate_indicative']) if item.get('funding_rate_indicative') is not None else None
             )
         else:
             raise ValueError(f"获取不到 {symbol} 的资金费率数据")
@@ -449,6 +441,13 @@ class GateIOExchange(ExchangeBase):
 
         await self.ws_manager.subscribe('order_book', symbol, callback)
 
+    async def subscribe_order_book_update(self, symbol: str, callback):
+        """订阅订单簿增量推送（本地订单簿维护用）"""
+        if self.ws_manager is None:
+            await self.init_websocket_manager()
+
+        await self.ws_manager.subscribe('order_book_update', symbol, callback)
+
     async def subscribe_trades(self, symbol: str, callback):
         """订阅成交推送"""
         if self.ws_manager is None:
@@ -712,10 +711,10 @@ class GateIOExchange(ExchangeBase):
                                      start_time: Optional[datetime] = None,
                                      end_time: Optional[datetime] = None,
                                      limit: int = 100) -> List[FundingRate]:
-        """获取资金费率历史"""
+        """获取资金费率结算历史（接口只返回结算时间与费率，按时间升序返回）"""
         gate_symbol = symbol.replace('/', '_')
-        endpoint = f"/api/v4/futures/funding_rate"
-        params = {'contract': gate_symbol, 'limit': limit}
+        endpoint = f"/futures/{self.settle}/funding_rate"
+        params = {'contract': gate_symbol, 'limit': min(limit, 1000)}
 
         if start_time:
             params['from'] = int(start_time.timestamp())
@@ -725,17 +724,49 @@ class GateIOExchange(ExchangeBase):
         data = await self._request('GET', endpoint, params, use_futures=True)
 
         funding_rates = []
-        for item in data:
-            funding_rate = FundingRate(
+        for item in data or []:
+            ts = datetime.fromtimestamp(int(item['t']))
+            rate = float(item['r'])
+            funding_rates.append(FundingRate(
                 symbol=symbol,
-                funding_rate=float(item['funding_rate']),
-                funding_rate_8h=float(item['funding_rate_8h']),
-                next_funding_time=datetime.fromtimestamp(item['next_funding_time']),
-                mark_price=float(item['mark_price']),
-                index_price=float(item['index_price']),
-                timestamp=datetime.fromtimestamp(item['create_time']),
+                funding_rate=rate,
+                funding_rate_8h=rate,
+                next_funding_time=ts,
+                mark_price=0.0,
+                index_price=0.0,
+                timestamp=ts,
                 exchange='gateio'
-            )
-            funding_rates.append(funding_rate)
+            ))
+        funding_rates.sort(key=lambda f: f.timestamp)
+        return funding_rates
+
+    async def get_open_interest_history(self, symbol: str, period: str = "5m",
+                                        start_time: Optional[datetime] = None,
+                                        end_time: Optional[datetime] = None,
+                                        limit: int = 100) -> List[OpenInterest]:
+        """获取未平仓合约量历史（合约统计接口，open_interest 为张数，open_interest_usd 为名义价值）"""
+        gate_symbol = symbol.replace('/', '_')
+        endpoint = f"/futures/{self.settle}/contract_stats"
+        params = {'contract': gate_symbol, 'interval': period, 'limit': min(limit, 2000)}
+
+        if start_time:
+            params['from'] = int(start_time.timestamp())
 
-        return funding_rates
\ No newline at end of file
+        data = await self._request('GET', endpoint, params, use_futures=True)
+
+        out = []
+        end_ts = end_time.timestamp() if end_time else None
+        for item in data or []:
+            t = int(item['time'])
+            if end_ts is not None and t > end_ts:
+                continue
+            out.append(OpenInterest(
+                symbol=symbol,
+                open_interest=float(item.get('open_interest') or 0),
+                open_interest_value=float(item['open_interest_usd']) if item.get('open_interest_usd') is not None else None,
+                timestamp=datetime.fromtimestamp(t),
+                exchange='gateio',
+                mark_price=float(item['mark_price']) if item.get('mark_price') is not None else None
+            ))
+        out.sort(key=lambda o: o.timestamp)
+        return out
\ No newline at end of file
@@ -1,66 +1,158 @@
 """
 Gate.io WebSocket管理器 - 处理实时数据订阅
+函数集注释：
+- GateIOWSManager: 订阅入口（subscribe / unsubscribe / disconnect 与各频道解析），订阅多路复用在少量连接上：
+  每条连接最多承载 max_subscriptions_per_connection 个 频道-交易对 订阅，满了再开新连接（不超过 max_connections）
+- _MuxConnection: 单条连接：收到的消息按 (频道, 交易对) 路由到订阅方；断线后指数退避（带抖动）重连并重发本连接的全部订阅；
+  保活使用 WebSocket 协议层 ping，不再为每个订阅单独运行心跳
 """
 
 import asyncio
 import json
+import random
 import websockets
-from typing import Dict, List, Optional, Callable, Any
+from typing import Dict, List, Optional, Callable, Any, Set
 from datetime import datetime
 import logging
 
 from .base import Ticker, Kline, OrderBook, Trade, FundingRate, Position, Order
+from .fastjson import DecodeError, loads
 
 logger = logging.getLogger(__name__)
 
+# 单连接订阅上限与连接数上限（可由交易所配置 ws_max_subscriptions_per_connection / ws_max_connections 覆盖）
+MAX_SUBSCRIPTIONS_PER_CONNECTION = 100
+MAX_CONNECTIONS = 20
+RECONNECT_MAX_DELAY = 60.0
+
+
+class _MuxConnection:
+    """单条 WebSocket 连接上的多路订阅"""
+
+    def __init__(self, manager: "GateIOWSManager", index: int):
+        self.manager = manager
+        self.index = index
+        self.ws = None
+        self.channel_ids: Set[str] = set()
+        # 推送频道 -> {交易对: channel_id}
+        self.routes: Dict[str, Dict[str, str]] = {}
+        self.task: Optional[asyncio.Task] = None
+        self.reconnects = 0
+        self.messages = 0
+
+    def add(self, channel_id: str, message: Dict[str, Any]) -> None:
+        self.channel_ids.add(channel_id)
+        self.routes.setdefault(message["channel"], {})[self.manager._route_symbol(message)] = channel_id
+
+    def remove(self, channel_id: str, message: Dict[str, Any]) -> None:
+        self.channel_ids.discard(channel_id)
+        by_sym = self.routes.get(message["channel"], {})
+        by_sym.pop(self.manager._route_symbol(message), None)
+        if not by_sym:
+            self.routes.pop(message["channel"], None)
+
+    def start(self) -> None:
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._run(), name=f"gateio-ws-{self.index}")
+
+    async def send(self, message: Dict[str, Any]) -> None:
+        """未连接时不发送：连接建立（或重连）后会重发全部订阅"""
+        ws = self.ws
+        if ws is None:
+            return
+        try:
+            await ws.send(json.dumps(message))
+        except Exception as e:
+            logger.warning(f"WebSocket发送失败（连接 {self.index}）: {e}")
+
+    async def _run(self) -> None:
+        attempt = 0
+        while self.manager.is_running and self.channel_ids:
+            try:
+                async with websockets.connect(self.manager.base_url, ping_interval=20, ping_timeout=20) as ws:
+                    self.ws = ws
+                    attempt = 0
+                    for channel_id in list(self.channel_ids):
+                        await self.send(self.manager._subscribe_messages[channel_id])
+                    logger.info(f"Gate.io WebSocket连接 {self.index} 已建立，订阅 {len(self.channel_ids)} 个频道")
+                    async for message in ws:
+                        if not self.manager.is_running:
+                            break
+                        self.messages += 1
+                        await self.manager._route(self, message)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Gate.io WebSocket连接 {self.index} 中断: {e}")
+            finally:
+                self.ws = None
+            if not (self.manager.is_running and self.channel_ids):
+                break
+            attempt += 1
+            self.reconnects += 1
+            delay = min(2 ** attempt, RECONNECT_MAX_DELAY) * (0.5 + random.random() / 2)
+            logger.info(f"将在 {delay:.1f} 秒后重连 Gate.io WebSocket连接 {self.index}")
+            await asyncio.sleep(delay)
+
+    async def close(self) -> None:
+        task, self.task = self.task, None
+        ws = self.ws
+        if ws is not None:
+            try:
+                await ws.close()
+            except Exception:
+                pass
+        if task is not None and not task.done():
+            task.cancel()
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
+                pass
+
+
 class GateIOWSManager:
     """Gate.io WebSocket管理器"""
 
+    # order_book_update 须排在 order_book 之前（按前缀匹配频道名）
+    CHANNELS = ('ticker', 'kline', 'order_book_update', 'order_book', 'trades', 'funding_rate')
+
     def __init__(self, config: Dict[str, Any]):
         self.config = config
-        self.base_url = "wss://ws.gate.io" if not config.get('sandbox', False) else "wss://fx-ws-testnet.gateio.ws"
-        self.connections: Dict[str, websockets.WebSocketClientProtocol] = {}
+        self.base_url = "wss://api.gateio.ws/ws/v4/" if not config.get('sandbox', False) else "wss://fx-ws-testnet.gateio.ws"
         self.subscriptions: Dict[str, List[Callable]] = {}
         self.is_running = False
-        self.reconnect_attempts = {}
-        self.max_reconnect_attempts = 5
+        self.max_subscriptions_per_connection = int(config.get('ws_max_subscriptions_per_connection', MAX_SUBSCRIPTIONS_PER_CONNECTION))
+        self.max_connections = int(config.get('ws_max_connections', MAX_CONNECTIONS))
+        self.pool: List[_MuxConnection] = []
+        # channel_id -> 所在连接 / 订阅消息（重连时重发）
+        self._owners: Dict[str, _MuxConnection] = {}
+        self._subscribe_messages: Dict[str, Dict[str, Any]] = {}
+        self.unrouted = 0
 
     async def connect(self) -> bool:
-        """连接到Gate.io WebSocket"""
-        try:
-            # 首先建立基础连接
-            self.ws = await websockets.connect(self.base_url)
-            self.is_running = True
-            logger.info("成功连接到Gate.io WebSocket")
-
-            # 启动心跳
-            asyncio.create_task(self._heartbeat())
-            return True
-
-        except Exception as e:
-            logger.error(f"连接Gate.io WebSocket失败: {e}")
-            return False
+        """启用管理器；连接在首次订阅时按需建立"""
+        self.is_running = True
+        return True
 
     async def disconnect(self):
         """断开连接"""
         self.is_running = False
-
-        # 关闭所有订阅
-        for channel_name, connection in self.connections.items():
-            try:
-                await connection.close()
-            except:
-                pass
-
-        # 关闭主连接
-        if hasattr(self, 'ws'):
-            try:
-                await self.ws.close()
-            except:
-                pass
-
+        pool, self.pool = self.pool, []
+        for conn in pool:
+            await conn.close()
+        self._owners.clear()
         logger.info("已断开Gate.io WebSocket连接")
 
+    def _assign(self) -> _MuxConnection:
+        for conn in self.pool:
+            if len(conn.channel_ids) < self.max_subscriptions_per_connection:
+                return conn
+        if len(self.pool) >= self.max_connections:
+            raise RuntimeError(f"WebSocket订阅数已达上限 {self.max_connections * self.max_subscriptions_per_connection}")
+        conn = _MuxConnection(self, len(self.pool))
+        self.pool.append(conn)
+        return conn
+
     async def subscribe(self, channel: str, symbol: str, callback: Callable):
         """订阅频道"""
         if not self.is_running:
@@ -73,9 +165,16 @@ class GateIOWSManager:
             self.subscriptions[channel_id] = []
         self.subscriptions[channel_id].append(callback)
 
-        # 如果连接不存在，建立连接
-        if channel_id not in self.connections:
-            await self._create_channel_connection(channel, symbol)
+        # 同一频道-交易对只订阅一次，多个回调共享
+        if channel_id not in self._owners:
+            message = self._create_subscribe_message(channel, symbol)
+            conn = self._assign()
+            self._subscribe_messages[channel_id] = message
+            self._owners[channel_id] = conn
+            conn.add(channel_id, message)
+            if conn.ws is not None:
+                await conn.send(message)
+            conn.start()
 
         logger.info(f"订阅频道: {channel_id}")
 
@@ -86,44 +185,17 @@ class GateIOWSManager:
         if channel_id in self.subscriptions:
             del self.subscriptions[channel_id]
 
-        if channel_id in self.connections:
-            try:
-                await self.connections[channel_id].close()
-                del self.connections[channel_id]
-            except:
-                pass
+        conn = self._owners.pop(channel_id, None)
+        message = self._subscribe_messages.pop(channel_id, None)
+        if conn is not None and message is not None:
+            conn.remove(channel_id, message)
+            await conn.send({**message, "time": int(datetime.now().timestamp()), "event": "unsubscribe"})
+            if not conn.channel_ids:
+                # 空连接关闭；保留在池中的位置，下次订阅时重新使用
+                await conn.close()
 
         logger.info(f"取消订阅频道: {channel_id}")
 
-    async def _create_channel_connection(self, channel: str, symbol: str):
-        """为特定频道创建WebSocket连接"""
-        channel_id = f"{channel}_{symbol}"
-
-        try:
-            # 为每个频道创建独立的连接
-            ws = await websockets.connect(self.base_url)
-            self.connections[channel_id] = ws
-
-            # 订阅频道
-            subscribe_msg = self._create_subscribe_message(channel, symbol)
-            await ws.send(json.dumps(subscribe_msg))
-
-            # 启动消息处理
-            asyncio.create_task(self._handle_channel_messages(channel_id, ws))
-
-        except Exception as e:
-            logger.error(f"创建频道连接失败 {channel_id}: {e}")
-
-            # 重连逻辑
-            if channel_id not in self.reconnect_attempts:
-                self.reconnect_attempts[channel_id] = 0
-
-            if self.reconnect_attempts[channel_id] < self.max_reconnect_attempts:
-                self.reconnect_attempts[channel_id] += 1
-                delay = min(2 ** self.reconnect_attempts[channel_id], 30)
-                logger.info(f"将在 {delay} 秒后重连 {channel_id}")
-                asyncio.create_task(self._reconnect_later(channel, symbol, delay))
-
     def _create_subscribe_message(self, channel: str, symbol: str) -> Dict[str, Any]:
         """创建订阅消息"""
         # 转换符号格式
@@ -132,31 +204,40 @@ class GateIOWSManager:
         if channel == 'ticker':
             return {
                 "time": int(datetime.now().timestamp()),
-                "channel": f"spot.{gate_symbol}.ticker",
+                "channel": "spot.tickers",
                 "event": "subscribe",
-                "payload": [f"spot.{gate_symbol}.ticker"]
+                "payload": [gate_symbol]
             }
         elif channel == 'kline':
             # 默认订阅1分钟K线
             return {
                 "time": int(datetime.now().timestamp()),
-                "channel": f"spot.{gate_symbol}.candlesticks",
+                "channel": "spot.candlesticks",
                 "event": "subscribe",
-                "payload": [f"spot.{gate_symbol}.candlesticks_1m"]
+                "payload": ["1m", gate_symbol]
             }
         elif channel == 'order_book':
+            # 有限档位全量快照推送（20档，100ms）
             return {
                 "time": int(datetime.now().timestamp()),
-                "channel": f"spot.{gate_symbol}.depth",
+                "channel": "spot.order_book",
                 "event": "subscribe",
-                "payload": [f"spot.{gate_symbol}.depth"]
+                "payload": [gate_symbol, "20", "100ms"]
+            }
+        elif channel == 'order_book_update':
+            # 深度增量推送（带 U/u 更新 ID，100ms）
+            return {
+                "time": int(datetime.now().timestamp()),
+                "channel": "spot.order_book_update",
+                "event": "subscribe",
+                "payload": [gate_symbol, "100ms"]
             }
         elif channel == 'trades':
             return {
                 "time": int(datetime.now().timestamp()),
-                "channel": f"spot.{gate_symbol}.trades",
+                "channel": "spot.trades",
                 "event": "subscribe",
-                "payload": [f"spot.{gate_symbol}.trades"]
+                "payload": [gate_symbol]
             }
         elif channel == 'funding_rate':
             # 永续合约资金费率
@@ -169,39 +250,80 @@ class GateIOWSManager:
         else:
             raise ValueError(f"不支持的频道类型: {channel}")
 
-    async def _handle_channel_messages(self, channel_id: str, ws: websockets.WebSocketClientProtocol):
-        """处理频道消息"""
+    @staticmethod
+    def _route_symbol(message: Dict[str, Any]) -> str:
+        """订阅消息中的交易对（candlesticks 的 payload 为 [间隔, 交易对]）"""
+        payload = message.get("payload") or []
+        if message.get("channel") == "spot.candlesticks" and len(payload) > 1:
+            return str(payload[1])
+        return str(payload[0]) if payload else ""
+
+    @staticmethod
+    def _message_symbol(channel: str, result: Any) -> Optional[str]:
+        """推送消息中的交易对：tickers/trades 为 currency_pair，order_book(_update) 为 s，candlesticks 的 n 为 1m_BTC_USDT"""
+        if isinstance(result, list):
+            result = result[0] if result else {}
+        if not isinstance(result, dict):
+            return None
+        if channel == "spot.candlesticks":
+            n = result.get("n")
+            return n.split("_", 1)[1] if isinstance(n, str) and "_" in n else None
+        sym = result.get("currency_pair") or result.get("s") or result.get("contract")
+        return str(sym) if sym else None
+
+    async def _route(self, conn: _MuxConnection, message) -> None:
+        """按 (频道, 交易对) 找到订阅并交给原有的解析与回调"""
         try:
-            async for message in ws:
-                if not self.is_running:
-                    break
-
-                try:
-                    data = json.loads(message)
-                    await self._process_message(channel_id, data)
-                except json.JSONDecodeError:
-                    logger.warning(f"无法解析JSON消息: {message}")
-                except Exception as e:
-                    logger.error(f"处理消息失败 {channel_id}: {e}")
-
-        except websockets.exceptions.ConnectionClosed:
-            logger.warning(f"频道连接已关闭: {channel_id}")
+            data = loads(message)
+        except DecodeError:
+            logger.warning(f"无法解析JSON消息: {message}")
+            return
+        event = data.get('event')
+        if event == 'subscribe' and data.get('error'):
+            logger.error(f"订阅失败 {data.get('channel')}: {data.get('error')}")
+            return
+        if event not in ('update', 'all'):
+            return
+        by_sym = conn.routes.get(data.get('channel'))
+        if not by_sym:
+            self.unrouted += 1
+            return
+        sym = self._message_symbol(data.get('channel'), data.get('result'))
+        channel_id = by_sym.get(sym) if sym else None
+        if channel_id is None and len(by_sym) == 1:
+            # 推送不带交易对字段的频道：该连接上只有一个订阅时直接归属
+            channel_id = next(iter(by_sym.values()))
+        if channel_id is None:
+            self.unrouted += 1
+            return
+        try:
+            await self._process_message(channel_id, data)
         except Exception as e:
-            logger.error(f"频道消息处理异常 {channel_id}: {e}")
-        finally:
-            if channel_id in self.connections:
-                del self.connections[channel_id]
+            logger.error(f"处理消息失败 {channel_id}: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "connections": [{"index": c.index, "connected": c.ws is not None, "subscriptions": len(c.channel_ids),
+                             "messages": c.messages, "reconnects": c.reconnects} for c in self.pool],
+            "subscriptions": len(self._owners),
+            "unrouted": self.unrouted,
+        }
 
     async def _process_message(self, channel_id: str, data: Dict[str, Any]):
         """处理接收到的消息"""
-        channel_name = channel_id.split('_')[0]
-        symbol = '_'.join(channel_id.split('_')[1:])
+        # 频道名本身可能含下划线（order_book / funding_rate），按已知频道前缀拆分
+        channel_name = next((c for c in self.CHANNELS if channel_id.startswith(c + '_')), channel_id.split('_')[0])
+        symbol = channel_id[len(channel_name) + 1:]
 
         # 转换回标准符号格式
         symbol = symbol.replace('_', '/')
 
         callbacks = self.subscriptions.get(channel_id, [])
 
+        # 订阅确认/心跳回包不是数据推送
+        if data.get('event') not in (None, 'update', 'all'):
+            return
+
         try:
             if channel_name == 'ticker':
                 ticker_data = self._parse_ticker(data, symbol)
@@ -218,6 +340,11 @@ class GateIOWSManager:
                 for callback in callbacks:
                     await callback(orderbook_data)
 
+            elif channel_name == 'order_book_update':
+                update_data = self._parse_orderbook_update(data, symbol)
+                for callback in callbacks:
+                    await callback(update_data)
+
             elif channel_name == 'trades':
                 trades_data = self._parse_trades(data, symbol)
                 for callback in callbacks:
@@ -254,8 +381,13 @@ class GateIOWSManager:
         """解析K线数据"""
         result = data.get('result', {})
 
-        # K线数据格式: [time, open, high, low, close, volume, quote_volume]
-        kline_data = result.get('data', [])[0] if result.get('data') else [0, 0, 0, 0, 0, 0, 0]
+        # v4 spot.candlesticks 推送为对象 {t, o, h, l, c, v(计价量), a(基础量), n: "1m_BTC_USDT"}；
+        # 兼容旧格式 {data: [[time, open, high, low, close, volume, quote_volume]]}
+        if isinstance(result, dict) and 't' in result:
+            kline_data = [int(result['t']), result.get('o', 0), result.get('h', 0), result.get('l', 0),
+                          result.get('c', 0), result.get('a', 0), result.get('v', 0)]
+        else:
+            kline_data = result.get('data', [])[0] if result.get('data') else [0, 0, 0, 0, 0, 0, 0]
 
         return Kline(
             symbol=symbol,
@@ -279,21 +411,42 @@ class GateIOWSManager:
 
         asks = result.get('asks', [])
         bids = result.get('bids', [])
+        ts = result.get('t')
 
         return OrderBook(
             symbol=symbol,
             asks=[{'price': float(ask[0]), 'quantity': float(ask[1])} for ask in asks],
             bids=[{'price': float(bid[0]), 'quantity': float(bid[1])} for bid in bids],
-            timestamp=datetime.now()
+            timestamp=datetime.fromtimestamp(ts / 1000) if ts else datetime.now()
         )
 
+    def _parse_orderbook_update(self, data: Dict[str, Any], symbol: str) -> Dict[str, Any]:
+        """解析深度增量：价格/数量保留原始字符串，数量为 0 表示删除该档"""
+        result = data.get('result', {})
+
+        return {
+            'symbol': symbol,
+            'first_id': int(result.get('U', 0)),
+            'last_id': int(result.get('u', 0)),
+            'bids': result.get('b', []),
+            'asks': result.get('a', []),
+            'timestamp': result.get('t'),
+        }
+
     def _parse_trades(self, data: Dict[str, Any], symbol: str) -> List[Trade]:
-        """解析成交数据"""
+        """解析成交数据（v4 spot.trades 每条推送一笔成交；兼容列表形式）"""
         result = data.get('result', {})
-        trades_data = result.get('data', [])
+        if isinstance(result, list):
+            trades_data = result
+        elif isinstance(result, dict) and 'data' in result:
+            trades_data = result.get('data', [])
+        else:
+            trades_data = [result] if result and result.get('id') is not None else []
 
         trades = []
         for trade_data in trades_data:
+            create_time = trade_data.get('create_time_ms')
+            create_time = float(create_time) / 1000 if create_time else float(trade_data.get('create_time', 0))
             trade = Trade(
                 id=str(trade_data.get('id', '')),
                 order_id='',
@@ -303,7 +456,7 @@ class GateIOWSManager:
                 price=float(trade_data.get('price', 0)),
                 commission=float(trade_data.get('fee', 0)),
                 commission_asset='',
-                timestamp=datetime.fromtimestamp(trade_data.get('create_time', 0)),
+                timestamp=datetime.fromtimestamp(create_time),
                 exchange='gateio'
             )
             trades.append(trade)
@@ -327,31 +480,6 @@ class GateIOWSManager:
             exchange='gateio'
         )
 
-    async def _heartbeat(self):
-        """心跳保持"""
-        if not hasattr(self, 'ws'):
-            return
-
-        while self.is_running:
-            try:
-                heartbeat_msg = {
-                    "time": int(datetime.now().timestamp()),
-                    "event": "ping"
-                }
-                await self.ws.send(json.dumps(heartbeat_msg))
-                await asyncio.sleep(30)  # 30秒心跳
-            except Exception as e:
-                logger.error(f"心跳发送失败: {e}")
-                break
-
-    async def _reconnect_later(self, channel: str, symbol: str, delay: int):
-        """延迟重连"""
-        await asyncio.sleep(delay)
-
-        if self.is_running and f"{channel}_{symbol}" in self.subscriptions:
-            logger.info(f"重连频道: {channel}_{symbol}")
-            await self._create_channel_connection(channel, symbol)
-
     async def _subscribe_perpetual_data(self, symbol: str, callback: Callable):
         """订阅永续合约数据"""
         # 订阅多个频道
@@ -0,0 +1,128 @@
+"""
+交易所 HTTP 会话池 - 进程内按主机共享 aiohttp 会话
+函数集注释：
+- HttpSessionRegistry.get: 按 URL 主机返回共享会话（每个事件循环、每个主机一个；所有适配器实例与账户共用，签名按请求计算）
+  连接器参数：keep-alive、DNS 缓存、总连接数/单主机连接数上限；会话默认超时
+- HttpSessionRegistry.close: 关闭当前事件循环内的全部会话（API 生命周期结束、任务运行时释放资源时调用）
+- HttpSessionRegistry.reset: fork 后丢弃父进程会话（不关闭，连接属于父进程）
+- HttpSessionRegistry.stats: 各主机的请求数、新建/复用连接数、复用率、DNS 缓存命中与异常数（由 TraceConfig 回调统计）
+- http_sessions: 进程级实例
+"""
+
+import asyncio
+import logging
+import weakref
+from typing import Any, Dict
+from urllib.parse import urlsplit
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+# 连接器默认参数
+CONNECTION_LIMIT = 200
+CONNECTION_LIMIT_PER_HOST = 50
+KEEPALIVE_SECONDS = 30
+DNS_CACHE_SECONDS = 300
+TOTAL_TIMEOUT_SECONDS = 30
+CONNECT_TIMEOUT_SECONDS = 10
+
+_COUNTERS = ("requests", "new_connections", "reused_connections", "dns_cache_hits", "dns_cache_misses", "errors")
+
+
+def _host(url: str) -> str:
+    parts = urlsplit(url)
+    return parts.netloc or parts.path or url
+
+
+class HttpSessionRegistry:
+    """每个事件循环一组会话；aiohttp 会话绑定创建时的循环，API 循环与任务运行时循环互不共用"""
+
+    def __init__(self):
+        self._sessions: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, aiohttp.ClientSession]]" = weakref.WeakKeyDictionary()
+        self._metrics: Dict[str, Dict[str, int]] = {}
+        self.sessions_created = 0
+
+    # ---- 指标 ----
+    def _count(self, host: str, name: str) -> None:
+        m = self._metrics.get(host)
+        if m is None:
+            m = self._metrics.setdefault(host, dict.fromkeys(_COUNTERS, 0))
+        m[name] += 1
+
+    def _build_trace(self, host: str) -> aiohttp.TraceConfig:
+        """每个主机一个会话，回调直接按绑定的主机计数"""
+        trace = aiohttp.TraceConfig()
+
+        def counter(name: str):
+            async def _on(session, ctx, params):
+                self._count(host, name)
+            return _on
+
+        trace.on_request_start.append(counter("requests"))
+        trace.on_connection_create_end.append(counter("new_connections"))
+        trace.on_connection_reuseconn.append(counter("reused_connections"))
+        trace.on_dns_cache_hit.append(counter("dns_cache_hits"))
+        trace.on_dns_cache_miss.append(counter("dns_cache_misses"))
+        trace.on_request_exception.append(counter("errors"))
+        return trace
+
+    # ---- 会话 ----
+    def _new_session(self, host: str) -> aiohttp.ClientSession:
+        connector = aiohttp.TCPConnector(
+            limit=CONNECTION_LIMIT,
+            limit_per_host=CONNECTION_LIMIT_PER_HOST,
+            ttl_dns_cache=DNS_CACHE_SECONDS,
+            keepalive_timeout=KEEPALIVE_SECONDS,
+            enable_cleanup_closed=True,
+        )
+        self.sessions_created += 1
+        return aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=TOTAL_TIMEOUT_SECONDS, connect=CONNECT_TIMEOUT_SECONDS),
+            trace_configs=[self._build_trace(host)],
+        )
+
+    def get(self, url: str) -> aiohttp.ClientSession:
+        """须在事件循环内调用"""
+        loop = asyncio.get_running_loop()
+        host = _host(url)
+        sessions = self._sessions.get(loop)
+        if sessions is None:
+            sessions = self._sessions.setdefault(loop, {})
+        session = sessions.get(host)
+        if session is None or session.closed:
+            session = sessions[host] = self._new_session(host)
+        return session
+
+    async def close(self) -> None:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        sessions = self._sessions.pop(loop, {})
+        for session in sessions.values():
+            try:
+                await session.close()
+            except Exception:
+                pass
+        if sessions:
+            logger.info(f"已关闭 {len(sessions)} 个交易所 HTTP 会话")
+
+    def reset(self) -> None:
+        self._sessions = weakref.WeakKeyDictionary()
+
+    def stats(self) -> Dict[str, Any]:
+        hosts = {}
+        for host, m in self._metrics.items():
+            opened = m["new_connections"] + m["reused_connections"]
+            hosts[host] = {**m, "reuse_ratio": round(m["reused_connections"] / opened, 4) if opened else None}
+        return {
+            "sessions_open": sum(1 for s in self._sessions.values() for x in s.values() if not x.closed),
+            "sessions_created": self.sessions_created,
+            "hosts": hosts,
+        }
+
+
+# 进程级实例
+http_sessions = HttpSessionRegistry()
@@ -3,7 +3,6 @@ Kraken交易所客户端 - 只读适配器（行情/订单簿/K线）
 """
 
 import asyncio
-import aiohttp
 from datetime import datetime
 from typing import Dict, List, Optional, Any
 
@@ -20,6 +19,8 @@ from .base import (
     Position,
     FundingRate,
 )
+from .fastjson import response_json
+from .http_sessions import http_sessions
 
 
 class KrakenExchange(ExchangeBase):
@@ -30,18 +31,15 @@ class KrakenExchange(ExchangeBase):
         super().__init__(config)
         self.base_url = config.get("base_url", "https://api.kraken.com")
         self.stream_url = config.get("stream_url", "wss://ws.kraken.com")
-        self.session: Optional[aiohttp.ClientSession] = None
         self.rate_limiter = asyncio.Semaphore(self.rate_limit)
 
     async def __aenter__(self):
         """进入异步上下文"""
-        self.session = aiohttp.ClientSession()
         return self
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
-        """退出异步上下文"""
-        if self.session:
-            await self.session.close()
+        """退出异步上下文（HTTP 会话由进程级会话池持有，随应用生命周期关闭）"""
+        pass
 
     async def _request(self, method: str, endpoint: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """发送HTTP请求"""
@@ -49,17 +47,16 @@ class KrakenExchange(ExchangeBase):
             url = f"{self.base_url}{endpoint}"
             params = params or {}
             headers = {}
-            if not self.session:
-                self.session = aiohttp.ClientSession()
+            session = http_sessions.get(url)
             if method == "GET":
-                async with self.session.get(url, params=params, headers=headers) as resp:
-                    return await resp.json()
+                async with session.get(url, params=params, headers=headers) as resp:
+                    return await response_json(resp)
             elif method == "POST":
-                async with self.session.post(url, json=params, headers=headers) as resp:
-                    return await resp.json()
+                async with session.post(url, json=params, headers=headers) as resp:
+                    return await response_json(resp)
             else:
-                async with self.session.request(method, url, json=params, headers=headers) as resp:
-                    return await resp.json()
+                async with session.request(method, url, json=params, headers=headers) as resp:
+                    return await response_json(resp)
 
     def _map_symbol(self, symbol: str) -> str:
         """转换通用交易对到Kraken的pair标识"""
@@ -51,6 +51,12 @@ celery_app.conf.update(
     include=[
         "tasks.scheduler",
         "tasks.market_collector",
+        "tasks.market_gaps",
+        "tasks.market_rollup",
+        "tasks.market_partitions",
+        "tasks.market_derivatives",
         "tasks.rss",
+        "tasks.news_correlation",
+        "tasks.sync",
     ],
 )
\ No newline at end of file
@@ -4,6 +4,7 @@
 - Database: 异步数据库引擎与会话管理
 - get_database: 获取全局数据库实例
 - get_db: FastAPI依赖，返回会话或测试替身
+- open_session: 独立会话（或测试替身）的上下文；请求合并（singleflight）的共享计算使用，生命周期不依附于任何单个请求
 - FakeSession/FakeResult: 测试环境下的最小化会话实现
 """
 
@@ -105,6 +106,16 @@ async def get_db():
         yield session
 
 
+@asynccontextmanager
+async def open_session():
+    """不随请求依赖清理关闭的独立会话：发起请求被取消时，共享计算仍可继续使用"""
+    if USE_FAKE_DB:
+        yield FakeSession()
+        return
+    async with AsyncSessionLocal() as session:
+        yield session
+
+
 class FakeResult:
     def __init__(self):
         self._rows = []
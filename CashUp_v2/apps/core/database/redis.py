@@ -3,12 +3,13 @@ Redis连接管理
 函数集注释：
 - RedisManager: 管理Redis连接的获取与关闭
 - get_redis: FastAPI依赖函数，返回Redis客户端
+- RedisBatch: 非事务管道批量写，累积写命令后一次往返发送
 - FakeRedis: 测试环境回退实现，提供最小化接口以避免外部依赖
 """
 
 import os
 import redis.asyncio as redis
-from typing import Optional
+from typing import Any, List, Optional, Tuple
 from config.settings import settings
 from utils.logger import get_logger
 
@@ -44,6 +45,63 @@ async def get_redis() -> redis.Redis:
     return await redis_manager.get_redis_client()
 
 
+class RedisBatch:
+    """Redis 写命令批量器
+
+    写命令只在内存中排队，flush 时通过 pipeline(transaction=False) 一次往返发送；
+    达到 max_ops 时 flush(force=False) 才真正发送，保证单次运行的往返次数有上界。
+    """
+
+    def __init__(self, client, max_ops: int = 2000):
+        self.client = client
+        self.max_ops = max_ops
+        self.round_trips = 0
+        self._ops: List[Tuple[str, tuple, dict]] = []
+
+    def _add(self, name: str, *args: Any, **kwargs: Any) -> None:
+        self._ops.append((name, args, kwargs))
+
+    def set(self, key, value) -> None:
+        self._add("set", key, value)
+
+    def setex(self, key, ttl, value) -> None:
+        self._add("setex", key, ttl, value)
+
+    def hset(self, key, mapping) -> None:
+        self._add("hset", key, mapping=mapping)
+
+    def hdel(self, key, *fields) -> None:
+        self._add("hdel", key, *fields)
+
+    def lpush(self, key, *values) -> None:
+        self._add("lpush", key, *values)
+
+    def ltrim(self, key, start, end) -> None:
+        self._add("ltrim", key, start, end)
+
+    def publish(self, channel, message) -> None:
+        self._add("publish", channel, message)
+
+    def __len__(self) -> int:
+        return len(self._ops)
+
+    async def flush(self, force: bool = True) -> int:
+        if not self._ops or (not force and len(self._ops) < self.max_ops):
+            return 0
+        ops, self._ops = self._ops, []
+        if self.client is None:
+            return 0
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for name, args, kwargs in ops:
+                getattr(pipe, name)(*args, **kwargs)
+            await pipe.execute()
+            self.round_trips += 1
+        except Exception as e:
+            logger.error(f"Redis 批量写入失败: {e}")
+        return len(ops)
+
+
 class FakeRedis:
     """测试用轻量Redis客户端
     函数集注释：
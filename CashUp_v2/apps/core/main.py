@@ -34,7 +34,15 @@ from api.routes import seed as seed_routes
 from api.routes import exchanges as exchanges_routes
 from api.routes import scheduler as scheduler_routes
 from api.routes import rss as rss_routes
+from api.routes import latency as latency_routes
+from api.routes import live as live_routes
+from api.deps import get_exchanges
+from app.adapters.exchanges.http_sessions import http_sessions
 from database.redis import get_redis
+from modules.market.services.l2_book import local_order_books
+from services.config_cache import system_config_cache
+from services.live import live_hub
+from utils.latency import latency_registry
 
 # 设置日志
 logger = setup_logger(__name__)
@@ -51,6 +59,18 @@ async def lifespan(app: FastAPI):
         if str(os.getenv("TEST_SKIP_DB", "")).lower() not in ("1", "true", "yes"):
             db = get_database()
             await db.connect()
+            # 进程内配置缓存：启动时整体加载，之后由失效频道消息刷新
+            try:
+                await system_config_cache.load()
+                system_config_cache.start_listener()
+            except Exception as e:
+                logger.warning(f"⚠️ 系统配置缓存加载失败，首次读取时重试: {e}")
+            # 本地订单簿（market.orderbook.local.enabled）：订阅深度增量，订单簿接口从内存读取
+            try:
+                async for mgr in get_exchanges():
+                    await local_order_books.start(mgr)
+            except Exception as e:
+                logger.warning(f"⚠️ 本地订单簿启动失败: {e}")
         logger.info("✅ 数据库连接成功")
         
         logger.info(f"🌍 调试模式: {settings.DEBUG}")
@@ -66,6 +86,10 @@ async def lifespan(app: FastAPI):
     
     try:
         # 清理资源
+        await system_config_cache.stop_listener()
+        await live_hub.stop()
+        await local_order_books.stop()
+        await http_sessions.close()
         if str(os.getenv("TEST_SKIP_DB", "")).lower() not in ("1", "true", "yes"):
             db = get_database()
             await db.disconnect()
@@ -116,6 +140,8 @@ app.include_router(exchanges_routes.router, tags=["交易所"])
 app.include_router(scheduler_routes.router, tags=["调度"])
 app.include_router(rss_routes.router, tags=["RSS"])
 app.include_router(reporting.router, tags=["报表"])
+app.include_router(latency_routes.router, tags=["监控"])
+app.include_router(live_routes.router, tags=["实时推送"])
 
 @app.get("/")
 async def root():
@@ -208,6 +234,7 @@ async def metrics():
         lines.append("# HELP cashup_sched_history_len Scheduler history list length")
         lines.append("# TYPE cashup_sched_history_len gauge")
         lines.append(f"cashup_sched_history_len {int(sched_hist_len or 0)}")
+        lines.extend(latency_registry.prometheus_lines())
         from fastapi import Response
         return Response("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4; charset=utf-8")
     except Exception:
@@ -0,0 +1,225 @@
+"""
+永续合约资金费率与未平仓量
+函数集注释：
+- load_watermarks: 一次分组查询取回全部序列的资金费率/未平仓量水位（最后结算时间、最后采样时间）
+- write_funding / write_open_interest: 批量写入 funding_rates / open_interest（executemany ON CONFLICT）；同一采样桶的历史行与实时快照按列合并
+  （两表由 init_database_v2.sql 创建，旧库先执行 scripts/migrate_market_schema.sql）
+- collect_symbol: 单个 交易所×交易对：从水位起分页拉取资金费率结算历史与未平仓量历史，并记录当前快照（预测费率、标记/指数价格）
+- funding_history / open_interest_history: 读取区间数据（API 与回测加载使用）
+- align_asof: 按K线时间对齐稀疏序列（取不晚于该K线时间的最近值）
+- sum_between: 按K线区间累计事件值（上一根K线之后、本根K线及之前结算的资金费率之和）
+"""
+
+import bisect
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+PERIOD_SECONDS = {"5m": 300, "15m": 900, "30m": 1800, "1h": 3600, "2h": 7200, "4h": 14400, "6h": 21600, "12h": 43200, "1d": 86400}
+
+# 单序列单次运行最多翻页数（首次回补时分多轮完成）
+MAX_PAGES = 20
+
+
+def _norm_symbol(symbol: str) -> str:
+    return str(symbol).replace('/', '_')
+
+
+def _num(v):
+    if v is None or isinstance(v, Decimal):
+        return v
+    return Decimal(str(v))
+
+
+def _f(v) -> Optional[float]:
+    return float(v) if v is not None else None
+
+
+def _bucket(ts: datetime, period: str) -> datetime:
+    step = PERIOD_SECONDS.get(period, 300)
+    return datetime.fromtimestamp(int(ts.timestamp()) // step * step)
+
+
+async def load_watermarks(session: AsyncSession) -> Dict[str, datetime]:
+    marks: Dict[str, datetime] = {}
+    res = await session.execute(text("SELECT exchange, symbol, MAX(funding_time) AS last_time FROM funding_rates GROUP BY exchange, symbol"))
+    for r in res.fetchall():
+        marks[f"funding:{r.exchange}:{r.symbol}"] = r.last_time
+    # 只有实时快照（未平仓量为空）的采样桶不推进水位，历史拉取仍会补上
+    res = await session.execute(text("SELECT exchange, symbol, MAX(timestamp) AS last_time FROM open_interest WHERE open_interest IS NOT NULL GROUP BY exchange, symbol"))
+    for r in res.fetchall():
+        marks[f"oi:{r.exchange}:{r.symbol}"] = r.last_time
+    return marks
+
+
+async def write_funding(session: AsyncSession, rows: List[Dict[str, Any]]) -> int:
+    if not rows:
+        return 0
+    await session.execute(text(
+        """
+        INSERT INTO funding_rates (exchange, symbol, funding_time, funding_rate, mark_price)
+        VALUES (:ex, :sym, :t, :r, :mp)
+        ON CONFLICT (exchange, symbol, funding_time) DO UPDATE SET
+            funding_rate = EXCLUDED.funding_rate,
+            mark_price = COALESCE(EXCLUDED.mark_price, funding_rates.mark_price)
+        """
+    ), [{**r, "r": _num(r["r"]), "mp": _num(r.get("mp"))} for r in rows])
+    return len(rows)
+
+
+async def write_open_interest(session: AsyncSession, rows: List[Dict[str, Any]]) -> int:
+    if not rows:
+        return 0
+    cols = ("oi", "oiv", "mp", "ip", "pfr")
+    await session.execute(text(
+        """
+        INSERT INTO open_interest (exchange, symbol, timestamp, open_interest, open_interest_value, mark_price, index_price, predicted_funding_rate, next_funding_time)
+        VALUES (:ex, :sym, :t, :oi, :oiv, :mp, :ip, :pfr, :nft)
+        ON CONFLICT (exchange, symbol, timestamp) DO UPDATE SET
+            open_interest = COALESCE(EXCLUDED.open_interest, open_interest.open_interest),
+            open_interest_value = COALESCE(EXCLUDED.open_interest_value, open_interest.open_interest_value),
+            mark_price = COALESCE(EXCLUDED.mark_price, open_interest.mark_price),
+            index_price = COALESCE(EXCLUDED.index_price, open_interest.index_price),
+            predicted_funding_rate = COALESCE(EXCLUDED.predicted_funding_rate, open_interest.predicted_funding_rate),
+            next_funding_time = COALESCE(EXCLUDED.next_funding_time, open_interest.next_funding_time)
+        """
+    ), [{"nft": None, **{c: None for c in cols}, **r, **{c: _num(r.get(c)) for c in cols}} for r in rows])
+    return len(rows)
+
+
+async def _page_forward(fetch, since: datetime, key, limit: int) -> List[Any]:
+    """从 since 起按时间向后翻页，直到无新数据或达到页数上限"""
+    out: List[Any] = []
+    cursor = since
+    for _ in range(MAX_PAGES):
+        page = [x for x in await fetch(cursor, limit) if key(x) > cursor]
+        if not page:
+            break
+        out.extend(page)
+        cursor = max(key(x) for x in page)
+        if len(page) < limit // 2:
+            break
+    return out
+
+
+async def collect_symbol(adapter, exchange: str, symbol: str, marks: Dict[str, datetime],
+                         period: str = "5m", backfill_days: int = 30) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]], Dict[str, int]]:
+    """返回 (资金费率行, 未平仓量行, 计数)；各部分独立失败，不影响其余部分"""
+    sym = _norm_symbol(symbol)
+    floor = datetime.now() - timedelta(days=backfill_days)
+    counts = {"funding": 0, "open_interest": 0, "errors": 0}
+    funding_rows: List[Dict[str, Any]] = []
+    oi_rows: List[Dict[str, Any]] = []
+
+    try:
+        since = marks.get(f"funding:{exchange}:{sym}") or floor
+        items = await _page_forward(
+            lambda cur, lim: adapter.get_funding_rate_history(symbol, start_time=cur, limit=lim),
+            since, lambda f: f.timestamp, 1000)
+        funding_rows = [{"ex": exchange, "sym": sym, "t": f.timestamp, "r": f.funding_rate,
+                         "mp": f.mark_price or None} for f in items]
+        counts["funding"] = len(funding_rows)
+    except Exception as e:
+        counts["errors"] += 1
+        logger.warning(f"资金费率历史拉取失败 {exchange}:{sym}: {e}")
+
+    try:
+        since = marks.get(f"oi:{exchange}:{sym}") or floor
+        items = await _page_forward(
+            lambda cur, lim: adapter.get_open_interest_history(symbol, period, start_time=cur, limit=lim),
+            since, lambda o: o.timestamp, 500)
+        oi_rows = [{"ex": exchange, "sym": sym, "t": o.timestamp, "oi": o.open_interest,
+                    "oiv": o.open_interest_value, "mp": o.mark_price} for o in items]
+        counts["open_interest"] = len(oi_rows)
+    except Exception as e:
+        counts["errors"] += 1
+        logger.warning(f"未平仓量历史拉取失败 {exchange}:{sym}: {e}")
+
+    try:
+        cur = await adapter.get_funding_rate(symbol)
+        if cur is not None:
+            oi_rows.append({"ex": exchange, "sym": sym, "t": _bucket(cur.timestamp, period),
+                            "mp": cur.mark_price or None, "ip": cur.index_price or None,
+                            "pfr": cur.predicted_funding_rate, "nft": cur.next_funding_time})
+    except Exception as e:
+        counts["errors"] += 1
+        logger.warning(f"资金费率快照拉取失败 {exchange}:{sym}: {e}")
+
+    return funding_rows, oi_rows, counts
+
+
+async def funding_history(session: AsyncSession, exchange: str, symbol: str,
+                          start: Optional[datetime] = None, end: Optional[datetime] = None,
+                          limit: int = 1000) -> List[Dict[str, Any]]:
+    res = await session.execute(text(
+        """
+        SELECT funding_time, funding_rate, mark_price FROM (
+            SELECT funding_time, funding_rate, mark_price FROM funding_rates
+            WHERE exchange = :ex AND symbol = :sym
+              AND (CAST(:s AS TIMESTAMP) IS NULL OR funding_time >= :s)
+              AND (CAST(:e AS TIMESTAMP) IS NULL OR funding_time <= :e)
+            ORDER BY funding_time DESC
+            LIMIT :lim
+        ) t ORDER BY funding_time
+        """
+    ), {"ex": exchange, "sym": _norm_symbol(symbol), "s": start, "e": end, "lim": limit})
+    return [
+        {"funding_time": r.funding_time.isoformat(), "funding_rate": _f(r.funding_rate), "mark_price": _f(r.mark_price)}
+        for r in res.fetchall()
+    ]
+
+
+async def open_interest_history(session: AsyncSession, exchange: str, symbol: str,
+                                start: Optional[datetime] = None, end: Optional[datetime] = None,
+                                limit: int = 1000) -> List[Dict[str, Any]]:
+    res = await session.execute(text(
+        """
+        SELECT * FROM (
+            SELECT timestamp, open_interest, open_interest_value, mark_price, index_price, predicted_funding_rate, next_funding_time
+            FROM open_interest
+            WHERE exchange = :ex AND symbol = :sym
+              AND (CAST(:s AS TIMESTAMP) IS NULL OR timestamp >= :s)
+              AND (CAST(:e AS TIMESTAMP) IS NULL OR timestamp <= :e)
+            ORDER BY timestamp DESC
+            LIMIT :lim
+        ) t ORDER BY timestamp
+        """
+    ), {"ex": exchange, "sym": _norm_symbol(symbol), "s": start, "e": end, "lim": limit})
+    return [
+        {"timestamp": r.timestamp.isoformat(), "open_interest": _f(r.open_interest),
+         "open_interest_value": _f(r.open_interest_value), "mark_price": _f(r.mark_price),
+         "index_price": _f(r.index_price), "predicted_funding_rate": _f(r.predicted_funding_rate),
+         "next_funding_time": r.next_funding_time.isoformat() if r.next_funding_time else None}
+        for r in res.fetchall()
+    ]
+
+
+def align_asof(bar_times: Sequence[datetime], points: Sequence[Tuple[datetime, Optional[float]]]) -> List[Optional[float]]:
+    """points 按时间升序；每根K线取时间不晚于它的最近一个非空值，之前没有数据时为 None"""
+    pts = [(t, v) for t, v in points if v is not None]
+    times = [t for t, _ in pts]
+    out: List[Optional[float]] = []
+    for bt in bar_times:
+        i = bisect.bisect_right(times, bt)
+        out.append(pts[i - 1][1] if i else None)
+    return out
+
+
+def sum_between(bar_times: Sequence[datetime], events: Sequence[Tuple[datetime, float]]) -> List[float]:
+    """events 按时间升序；第 i 根K线累计 (bar_times[i-1], bar_times[i]] 内的事件值，第一根只取与其同刻的事件"""
+    times = [t for t, _ in events]
+    out: List[float] = []
+    prev = None
+    for bt in bar_times:
+        lo = bisect.bisect_right(times, prev) if prev is not None else bisect.bisect_left(times, bt)
+        hi = bisect.bisect_right(times, bt)
+        out.append(sum((v for _, v in events[lo:hi]), 0.0))
+        prev = bt
+    return out
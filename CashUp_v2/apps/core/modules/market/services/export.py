@@ -0,0 +1,194 @@
+"""
+历史K线批量导出（流式）
+函数集注释：
+- iter_kline_chunks: 服务端游标（AsyncSession.stream + yield_per）按 (symbol, open_time) 顺序分块读取 kline_data，
+  内存占用只与块大小有关；after=(交易对, open_time 毫秒) 从该行之后续传
+- CsvEncoder / NdjsonGzipEncoder / ParquetEncoder: 分块编码器，header() / write(块) / close() 均返回字节
+- export_stream: 读取 + 编码；offset 跳过已下载的前 N 字节（相同参数且数据未变时输出逐字节一致，可按字节续传）
+- EXPORT_FORMATS / MEDIA_TYPES / available: 支持的格式；parquet 需要可选依赖 pyarrow
+每行列：symbol, open_time（毫秒）, open, high, low, close, volume, quote_volume, trade_count；
+ndjson.gz 每块以 Z_SYNC_FLUSH 结束，中断的下载也可解压到最后一个完整块，取最后一行的 symbol/open_time 即为续传游标
+"""
+
+import io
+import json
+import zlib
+from datetime import datetime
+from typing import Any, AsyncIterator, List, Optional, Sequence, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # 可选依赖
+    pa = None
+    pq = None
+
+COLUMNS = ["symbol", "open_time", "open", "high", "low", "close", "volume", "quote_volume", "trade_count"]
+EXPORT_FORMATS = ("csv", "ndjson", "parquet")
+MEDIA_TYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/gzip",
+    "parquet": "application/vnd.apache.parquet",
+}
+EXTENSIONS = {"csv": "csv", "ndjson": "ndjson.gz", "parquet": "parquet"}
+CHUNK_ROWS = 5000
+
+Row = Tuple[Any, ...]
+
+
+def available(fmt: str) -> bool:
+    return fmt in EXPORT_FORMATS and (fmt != "parquet" or pq is not None)
+
+
+def _ms(ts: datetime) -> int:
+    return int(ts.timestamp() * 1000)
+
+
+def _num(v) -> Optional[float]:
+    return None if v is None else float(v)
+
+
+async def iter_kline_chunks(session: AsyncSession, exchange: str, symbols: Sequence[str], timeframe: str,
+                            start: datetime, end: datetime, after: Optional[Tuple[str, int]] = None,
+                            chunk_rows: int = CHUNK_ROWS) -> AsyncIterator[List[Row]]:
+    """按 (symbol, open_time) 升序分块产出行（open_time 已转为毫秒、数值已转为 float）"""
+    params = {"ex": exchange, "syms": list(symbols), "tf": timeframe, "s": start, "e": end}
+    cond = ""
+    if after is not None:
+        cond = "AND (symbol, open_time) > (:after_sym, :after_t)"
+        params.update({"after_sym": after[0], "after_t": datetime.fromtimestamp(after[1] / 1000)})
+    stmt = text(
+        f"""
+        SELECT symbol, open_time, open, high, low, close, volume, quote_volume, trade_count
+        FROM kline_data
+        WHERE exchange = :ex AND symbol = ANY(:syms) AND timeframe = :tf
+          AND open_time >= :s AND open_time < :e {cond}
+        ORDER BY symbol, open_time
+        """
+    ).execution_options(yield_per=chunk_rows)
+    result = await session.stream(stmt, params)
+    async for part in result.partitions(chunk_rows):
+        yield [(r[0], _ms(r[1]), _num(r[2]), _num(r[3]), _num(r[4]), _num(r[5]), _num(r[6]), _num(r[7]),
+                None if r[8] is None else int(r[8])) for r in part]
+
+
+class CsvEncoder:
+    def header(self) -> bytes:
+        return (",".join(COLUMNS) + "\n").encode()
+
+    def write(self, rows: List[Row]) -> bytes:
+        return "".join(",".join("" if v is None else str(v) for v in r) + "\n" for r in rows).encode()
+
+    def close(self) -> bytes:
+        return b""
+
+
+class NdjsonGzipEncoder:
+    def __init__(self, level: int = 6):
+        # wbits=31：gzip 封装，头部 mtime 固定为 0，输出可重复
+        self._z = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def header(self) -> bytes:
+        return b""
+
+    def write(self, rows: List[Row]) -> bytes:
+        body = "".join(json.dumps(dict(zip(COLUMNS, r)), separators=(",", ":")) + "\n" for r in rows).encode()
+        return self._z.compress(body) + self._z.flush(zlib.Z_SYNC_FLUSH)
+
+    def close(self) -> bytes:
+        return self._z.flush(zlib.Z_FINISH)
+
+
+class _Sink(io.RawIOBase):
+    """ParquetWriter 的输出端：按写入顺序累积字节，每块写完后取走"""
+
+    def __init__(self):
+        super().__init__()
+        self._buf = bytearray()
+        self._pos = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        n = len(b)
+        self._buf += b
+        self._pos += n
+        return n
+
+    def tell(self) -> int:
+        return self._pos
+
+    def drain(self) -> bytes:
+        out = bytes(self._buf)
+        self._buf.clear()
+        return out
+
+
+class ParquetEncoder:
+    """每块写为一个 row group；文件尾（元数据）在 close 时输出"""
+
+    def __init__(self):
+        if pq is None:
+            raise RuntimeError("parquet 导出需要安装 pyarrow")
+        self._schema = pa.schema([
+            ("symbol", pa.string()), ("open_time", pa.int64()),
+            ("open", pa.float64()), ("high", pa.float64()), ("low", pa.float64()), ("close", pa.float64()),
+            ("volume", pa.float64()), ("quote_volume", pa.float64()), ("trade_count", pa.int64()),
+        ])
+        self._sink = _Sink()
+        self._writer = pq.ParquetWriter(self._sink, self._schema, compression="zstd")
+
+    def header(self) -> bytes:
+        return self._sink.drain()
+
+    def write(self, rows: List[Row]) -> bytes:
+        cols = list(zip(*rows))
+        table = pa.Table.from_arrays([pa.array(c, type=f.type) for c, f in zip(cols, self._schema)], schema=self._schema)
+        self._writer.write_table(table)
+        return self._sink.drain()
+
+    def close(self) -> bytes:
+        self._writer.close()
+        return self._sink.drain()
+
+
+def encoder_for(fmt: str):
+    if fmt == "csv":
+        return CsvEncoder()
+    if fmt == "ndjson":
+        return NdjsonGzipEncoder()
+    if fmt == "parquet":
+        return ParquetEncoder()
+    raise ValueError(f"不支持的导出格式: {fmt}")
+
+
+async def export_stream(session: AsyncSession, exchange: str, symbols: Sequence[str], timeframe: str,
+                        start: datetime, end: datetime, fmt: str = "csv", after: Optional[Tuple[str, int]] = None,
+                        offset: int = 0, chunk_rows: int = CHUNK_ROWS) -> AsyncIterator[bytes]:
+    enc = encoder_for(fmt)
+    skip = max(0, int(offset))
+
+    def _cut(b: bytes) -> bytes:
+        nonlocal skip
+        if skip:
+            n = min(skip, len(b))
+            skip -= n
+            b = b[n:]
+        return b
+
+    head = _cut(enc.header())
+    if head:
+        yield head
+    async for rows in iter_kline_chunks(session, exchange, symbols, timeframe, start, end, after, chunk_rows):
+        if not rows:
+            continue
+        out = _cut(enc.write(rows))
+        if out:
+            yield out
+    tail = _cut(enc.close())
+    if tail:
+        yield tail
@@ -0,0 +1,235 @@
+"""
+K线缺口检测与回补规划
+函数集注释：
+- scan_gaps: 以 LAG 窗口函数按序列比较相邻 open_time（kline_data 与 kline_quarantine 合并），找出超过一个时间框步长的缺口
+- series_report: 单序列缺口报告（缺口列表、缺失根数、隔离根数、覆盖率）
+- gap_priority: 回补优先级（缺口越新、交易对正被策略使用、缺口越大优先级越高）
+- enqueue_gaps: 写入 Redis 有序集合 market:backfill:queue（分数为优先级）
+- run_backfill: 按优先级取出缺口，在每交易所请求预算内回补，未完成的剩余区间重新入队（单项失败或本轮异常退出时也不丢失已取出的缺口）
+"""
+
+import json
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.redis import get_redis
+from modules.market.services.ingest import upsert_klines
+from modules.market.services.timeframes import TIMEFRAME_SECONDS
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+BACKFILL_QUEUE_KEY = "market:backfill:queue"
+BACKFILL_PAGE_LIMIT = 1000
+
+
+def _decode(v) -> str:
+    return v.decode() if isinstance(v, (bytes, bytearray)) else str(v)
+
+
+async def scan_gaps(session: AsyncSession, exchange: Optional[str] = None, symbol: Optional[str] = None,
+                    timeframe: Optional[str] = None, lookback_days: int = 30) -> List[Dict[str, Any]]:
+    tfs = [timeframe] if timeframe else list(TIMEFRAME_SECONDS)
+    tfs = [tf for tf in tfs if tf in TIMEFRAME_SECONDS]
+    if not tfs:
+        return []
+    # 时间框与步长来自常量表，可安全拼接为 VALUES 列表
+    values = ", ".join(f"('{tf}', {TIMEFRAME_SECONDS[tf]})" for tf in tfs)
+    conds = ["k.open_time >= :since"]
+    params: Dict[str, Any] = {"since": datetime.now() - timedelta(days=lookback_days)}
+    if exchange:
+        conds.append("k.exchange = :ex")
+        params["ex"] = exchange
+    if symbol:
+        conds.append("k.symbol = :sym")
+        params["sym"] = symbol
+    # 已隔离的 open_time 视为已覆盖：交易所对该根返回的始终是坏数据，回补只会再次隔离并消耗请求预算
+    res = await session.execute(text(
+        f"""
+        SELECT exchange, symbol, timeframe, prev_ot, open_time, secs FROM (
+            SELECT k.exchange, k.symbol, k.timeframe, k.open_time, tfs.secs,
+                   LAG(k.open_time) OVER (PARTITION BY k.exchange, k.symbol, k.timeframe ORDER BY k.open_time) AS prev_ot
+            FROM (
+                SELECT exchange, symbol, timeframe, open_time FROM kline_data
+                UNION ALL
+                SELECT exchange, symbol, timeframe, open_time FROM kline_quarantine
+            ) k
+            JOIN (VALUES {values}) AS tfs(tf, secs) ON k.timeframe = tfs.tf
+            WHERE {' AND '.join(conds)}
+        ) t
+        WHERE prev_ot IS NOT NULL AND EXTRACT(EPOCH FROM (open_time - prev_ot)) > secs
+        ORDER BY exchange, symbol, timeframe, prev_ot
+        """
+    ), params)
+    gaps = []
+    for r in res.fetchall():
+        step = timedelta(seconds=int(r.secs))
+        span = (r.open_time - r.prev_ot).total_seconds()
+        gaps.append({
+            "exchange": r.exchange,
+            "symbol": r.symbol,
+            "timeframe": r.timeframe,
+            "start": r.prev_ot + step,
+            "end": r.open_time - step,
+            "missing": int(span // int(r.secs)) - 1,
+        })
+    return gaps
+
+
+async def series_report(session: AsyncSession, exchange: str, symbol: str, timeframe: str,
+                        lookback_days: int = 30) -> Dict[str, Any]:
+    gaps = await scan_gaps(session, exchange, symbol, timeframe, lookback_days)
+    res = await session.execute(text(
+        "SELECT COUNT(*) AS n, MIN(open_time) AS first_ot, MAX(open_time) AS last_ot FROM kline_data WHERE exchange=:ex AND symbol=:sym AND timeframe=:tf AND open_time >= :since"
+    ), {"ex": exchange, "sym": symbol, "tf": timeframe, "since": datetime.now() - timedelta(days=lookback_days)})
+    row = res.first()
+    bars = int(row.n or 0) if row else 0
+    # 隔离后又被正常数据覆盖的不计入
+    res = await session.execute(text(
+        """
+        SELECT COUNT(*) FROM kline_quarantine q
+        WHERE q.exchange=:ex AND q.symbol=:sym AND q.timeframe=:tf AND q.open_time >= :since
+          AND NOT EXISTS (SELECT 1 FROM kline_data k WHERE k.exchange=q.exchange AND k.symbol=q.symbol
+                          AND k.timeframe=q.timeframe AND k.open_time=q.open_time)
+        """
+    ), {"ex": exchange, "sym": symbol, "tf": timeframe, "since": datetime.now() - timedelta(days=lookback_days)})
+    quarantined = int(res.scalar() or 0)
+    missing = sum(g["missing"] for g in gaps)
+    return {
+        "exchange": exchange,
+        "symbol": symbol,
+        "timeframe": timeframe,
+        "lookback_days": lookback_days,
+        "first_open_time": row.first_ot.isoformat() if row and row.first_ot else None,
+        "last_open_time": row.last_ot.isoformat() if row and row.last_ot else None,
+        "bars": bars,
+        "quarantined_bars": quarantined,
+        "missing_bars": missing,
+        "coverage": round(bars / (bars + quarantined + missing), 6) if bars + quarantined + missing else 0.0,
+        "gaps": [{**g, "start": g["start"].isoformat(), "end": g["end"].isoformat()} for g in gaps],
+    }
+
+
+async def active_series(session: AsyncSession) -> Set[Tuple[str, str]]:
+    """正在运行的策略实例所用的 (交易所, 交易对)"""
+    try:
+        res = await session.execute(text("SELECT DISTINCT exchange, symbol FROM strategy_instances WHERE status='running'"))
+        return {(r.exchange, r.symbol) for r in res.fetchall()}
+    except Exception:
+        return set()
+
+
+def gap_priority(gap: Dict[str, Any], active: Set[Tuple[str, str]], now: Optional[datetime] = None) -> float:
+    now = now or datetime.now()
+    age_days = max((now - gap["end"]).total_seconds(), 0) / 86400
+    score = 1000.0 / (1.0 + age_days)
+    if (gap["exchange"], gap["symbol"]) in active:
+        score += 500.0
+    score += min(gap["missing"], 1000) / 20.0
+    return round(score, 3)
+
+
+def _member(exchange: str, symbol: str, timeframe: str, start: datetime, end: datetime) -> str:
+    return json.dumps({"ex": exchange, "sym": symbol, "tf": timeframe, "start": start.isoformat(), "end": end.isoformat()}, sort_keys=True)
+
+
+async def enqueue_gaps(gaps: Iterable[Dict[str, Any]], active: Set[Tuple[str, str]]) -> int:
+    mapping = {
+        _member(g["exchange"], g["symbol"], g["timeframe"], g["start"], g["end"]): gap_priority(g, active)
+        for g in gaps
+    }
+    if not mapping:
+        return 0
+    r = await get_redis()
+    await r.zadd(BACKFILL_QUEUE_KEY, mapping)
+    return len(mapping)
+
+
+async def queue_status(limit: int = 20) -> Dict[str, Any]:
+    r = await get_redis()
+    size = await r.zcard(BACKFILL_QUEUE_KEY)
+    top = await r.zrevrange(BACKFILL_QUEUE_KEY, 0, max(limit - 1, 0), withscores=True)
+    return {
+        "size": int(size or 0),
+        "top": [{**json.loads(_decode(m)), "priority": float(s)} for m, s in (top or [])],
+    }
+
+
+async def run_backfill(session: AsyncSession, mgr, budget_per_exchange: int = 20, max_items: int = 200) -> Dict[str, Any]:
+    """按优先级回补缺口；每交易所本轮最多发起 budget_per_exchange 次 REST 请求
+
+    单个缺口写库失败时回滚并把剩余区间重新入队；本轮异常退出（含取消）时，已取出但未处理的缺口原样放回队列
+    """
+    stats = {"items": 0, "completed": 0, "requeued": 0, "dropped": 0, "failed": 0, "requests": 0,
+             "bars_written": 0, "bars_quarantined": 0}
+    r = await get_redis()
+    pending = list(await r.zpopmax(BACKFILL_QUEUE_KEY, max_items) or [])
+    pending.reverse()
+    used: Dict[str, int] = {}
+    requeue: Dict[str, float] = {}
+    try:
+        while pending:
+            raw, score = pending[-1]
+            stats["items"] += 1
+            try:
+                g = json.loads(_decode(raw))
+            except Exception:
+                stats["dropped"] += 1
+                pending.pop()
+                continue
+            ex, sym, tf = g["ex"], g["sym"], g["tf"]
+            adapter = mgr.get_exchange(ex)
+            step_secs = TIMEFRAME_SECONDS.get(tf)
+            if adapter is None or step_secs is None:
+                stats["dropped"] += 1
+                pending.pop()
+                continue
+            step = timedelta(seconds=step_secs)
+            cursor = datetime.fromisoformat(g["start"])
+            end = datetime.fromisoformat(g["end"])
+            try:
+                while cursor <= end and used.get(ex, 0) < budget_per_exchange:
+                    used[ex] = used.get(ex, 0) + 1
+                    stats["requests"] += 1
+                    try:
+                        data = await adapter.get_klines(symbol=sym, interval=tf, start_time=cursor, end_time=end, limit=BACKFILL_PAGE_LIMIT)
+                    except Exception:
+                        break
+                    data = [k for k in data if cursor <= k.open_time <= end]
+                    if not data:
+                        # 交易所本身无数据（停牌/维护），视为已回补
+                        cursor = end + step
+                        break
+                    rows = [
+                        {"ex": ex, "sym": sym, "tf": tf, "ot": k.open_time, "o": k.open_price, "h": k.high_price,
+                         "l": k.low_price, "c": k.close_price, "v": k.volume}
+                        for k in data
+                    ]
+                    ingest = await upsert_klines(session, rows)
+                    stats["bars_written"] += ingest["rows"]
+                    stats["bars_quarantined"] += ingest["quarantined"]
+                    cursor = max(k.open_time for k in data) + step
+            except Exception as e:
+                stats["failed"] += 1
+                logger.warning(f"缺口回补写库失败 {ex}:{sym}:{tf} {cursor}~{end}: {e}")
+                try:
+                    await session.rollback()
+                except Exception:
+                    pass
+            if cursor <= end:
+                requeue[_member(ex, sym, tf, cursor, end)] = float(score)
+            else:
+                stats["completed"] += 1
+            pending.pop()
+    finally:
+        # 未处理及正在处理的缺口按原成员与优先级放回（正在处理者已写入的部分下轮会重复拉取，写入为幂等）
+        for raw, score in pending:
+            requeue.setdefault(_decode(raw), float(score))
+        if requeue:
+            await r.zadd(BACKFILL_QUEUE_KEY, requeue)
+            stats["requeued"] = len(requeue)
+    stats["requests_by_exchange"] = used
+    return stats
@@ -0,0 +1,226 @@
+"""
+K线入库
+函数集注释：
+- upsert_klines: 写库前拒收时间框不在 LIST 子分区内、丢弃所在子分区已超出保留期的K线（分区表）并为批次涉及的月份建分区，经数据质量校验（可疑K线转入 kline_quarantine），
+  按批量大小自动选择入库路径，返回行数、隔离数、拒收数、过期丢弃数、耗时与 rows/sec
+- upsert_batches: 同一流程的列式版本（采集任务使用）：KlineBatch 的列直接用于分区过滤、质量校验与 COPY，
+  只有小批量 executemany 路径才构造行字典
+- _executemany_upsert: 小批量路径，executemany INSERT ... ON CONFLICT
+- _copy_upsert: 大批量路径，asyncpg COPY 写入 UNLOGGED 暂存表 kline_staging，再以一条集合语句合并进 kline_data
+  （暂存表由 init_database_v2.sql / scripts/migrate_market_schema.sql 创建）
+"""
+
+import time
+import uuid
+from datetime import datetime
+from decimal import Decimal
+from itertools import repeat
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.adapters.exchanges.base import KlineBatch
+from database.redis import get_redis
+from modules.market.services.partitions import (
+    ensure_row_partitions, ensure_span_partitions, expiry_cutoff, has_partition, kline_partitioned, load_retention_policy,
+    split_expired, split_unpartitioned,
+)
+from modules.market.services.quality import (
+    load_history, load_series_history, quarantine_rows, record_quality, validate_batches, validate_rows,
+)
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# 超过该行数走 COPY 路径；回补数月 1m 数据时单批可达数十万行
+COPY_THRESHOLD_ROWS = 2000
+
+STAGING_COLUMNS = ["batch_id", "exchange", "symbol", "timeframe", "open_time", "open", "high", "low", "close", "volume"]
+
+
+def _num(v):
+    if v is None or isinstance(v, Decimal):
+        return v
+    return Decimal(str(v))
+
+
+def _ms(ts: datetime) -> int:
+    return int(ts.timestamp() * 1000)
+
+
+def _warn_rejected(timeframes: Iterable[str], count: int) -> None:
+    if count:
+        logger.warning(f"拒收 {count} 根K线：时间框 {sorted(set(timeframes))} 无对应分区")
+
+
+async def _executemany_upsert(session: AsyncSession, rows: List[Dict[str, Any]], coverage: str) -> None:
+    if coverage == "write_new":
+        await session.execute(
+            text(
+                """
+                INSERT INTO kline_data (exchange, symbol, timeframe, open_time, open, high, low, close, volume)
+                VALUES (:ex, :sym, :tf, :ot, :o, :h, :l, :c, :v)
+                ON CONFLICT DO NOTHING
+                """
+            ),
+            rows,
+        )
+    else:
+        await session.execute(
+            text(
+                """
+                INSERT INTO kline_data (exchange, symbol, timeframe, open_time, open, high, low, close, volume)
+                VALUES (:ex, :sym, :tf, :ot, :o, :h, :l, :c, :v)
+                ON CONFLICT (exchange, symbol, timeframe, open_time)
+                DO UPDATE SET open=:o, high=:h, low=:l, close=:c, volume=:v, source='exchange'
+                """
+            ),
+            rows,
+        )
+
+
+async def _copy_upsert(session: AsyncSession, rows: List[Dict[str, Any]], coverage: str) -> None:
+    batch_id = uuid.uuid4()
+    records = [
+        (batch_id, r["ex"], r["sym"], r["tf"], r["ot"], _num(r["o"]), _num(r["h"]), _num(r["l"]), _num(r["c"]), _num(r["v"]))
+        for r in rows
+    ]
+    await _copy_merge(session, batch_id, records, coverage)
+
+
+def _batch_records(batch_id: uuid.UUID, items: List[Tuple[str, str, str, Any]]) -> Iterator[tuple]:
+    """列式批次逐列转为 COPY 记录（open_time 转本地时间，与 KlineBatch.open_times 一致）"""
+    for ex, sym, tf, b in items:
+        yield from zip(repeat(batch_id), repeat(ex), repeat(sym), repeat(tf), b.open_times(), b.open.tolist(),
+                       b.high.tolist(), b.low.tolist(), b.close.tolist(), b.volume.tolist())
+
+
+async def _copy_merge(session: AsyncSession, batch_id: uuid.UUID, records: Iterable[tuple], coverage: str) -> None:
+    conn = await session.connection()
+    raw = await conn.get_raw_connection()
+    await raw.driver_connection.copy_records_to_table("kline_staging", records=records, columns=STAGING_COLUMNS)
+    # DISTINCT ON：同批内重复的 open_time 只保留一行，避免 ON CONFLICT 重复更新同一行报错
+    conflict = "DO NOTHING" if coverage == "write_new" else (
+        "DO UPDATE SET open=EXCLUDED.open, high=EXCLUDED.high, low=EXCLUDED.low, close=EXCLUDED.close, volume=EXCLUDED.volume, source='exchange'"
+    )
+    await session.execute(text(
+        f"""
+        INSERT INTO kline_data (exchange, symbol, timeframe, open_time, open, high, low, close, volume)
+        SELECT DISTINCT ON (exchange, symbol, timeframe, open_time)
+               exchange, symbol, timeframe, open_time, open, high, low, close, volume
+        FROM kline_staging WHERE batch_id = :b
+        ORDER BY exchange, symbol, timeframe, open_time
+        ON CONFLICT (exchange, symbol, timeframe, open_time) {conflict}
+        """
+    ), {"b": batch_id})
+    await session.execute(text("DELETE FROM kline_staging WHERE batch_id = :b"), {"b": batch_id})
+
+
+async def upsert_klines(session: AsyncSession, rows: List[Dict[str, Any]], coverage: str = "upsert",
+                        copy_threshold: int = COPY_THRESHOLD_ROWS, validate: bool = True) -> Dict[str, Any]:
+    """写入K线并提交；rows 字段为 ex/sym/tf/ot/o/h/l/c/v；validate 为 False 时跳过质量校验（调用方已确认的数据）"""
+    started = time.monotonic()
+    rejected, expired = [], []
+    if rows:
+        # 时间框没有对应子分区的写入会整批失败，先拒收；已归档删除（或即将删除）的子分区不再接收写入；
+        # 其余月份若不在预建窗口内则先建分区，不落入默认分区
+        if await kline_partitioned(session):
+            rows, rejected = split_unpartitioned(rows)
+            _warn_rejected((r["tf"] for r in rejected), len(rejected))
+            rows, expired = split_expired(rows, await load_retention_policy())
+            await ensure_row_partitions(session, rows)
+    quarantined = []
+    if rows and validate:
+        try:
+            history = await load_history(session, rows)
+        except Exception:
+            await session.rollback()
+            history = {}
+        rows, quarantined, quality = validate_rows(rows, history)
+        await quarantine_rows(session, quarantined)
+        await record_quality(quality)
+    path = "copy" if len(rows) >= copy_threshold else "executemany"
+    if rows:
+        if path == "copy":
+            await _copy_upsert(session, rows, coverage)
+        else:
+            await _executemany_upsert(session, rows, coverage)
+        await session.commit()
+    elif quarantined:
+        await session.commit()
+    return await _finish(path, len(rows), len(quarantined), len(rejected), len(expired), started)
+
+
+async def upsert_batches(session: AsyncSession, items: List[Tuple[str, str, str, Any]], coverage: str = "upsert",
+                         copy_threshold: int = COPY_THRESHOLD_ROWS, validate: bool = True) -> Dict[str, Any]:
+    """列式写入：items 为 (交易所, 交易对, 时间框, KlineBatch)；与 upsert_klines 同一流程与返回值，
+    分区过滤、质量校验与 COPY 记录都直接在列上进行，只有 executemany 路径才构造逐行参数字典"""
+    started = time.monotonic()
+    groups: Dict[Tuple[str, str, str], List[Any]] = {}
+    for ex, sym, tf, b in items:
+        if len(b):
+            groups.setdefault((ex, sym, tf), []).append(b)
+    items = [(ex, sym, tf, KlineBatch.concat(bs)) for (ex, sym, tf), bs in groups.items()]
+    rejected, expired = 0, 0
+    if items and await kline_partitioned(session):
+        policy = await load_retention_policy()
+        kept, rejected_tfs = [], set()
+        for ex, sym, tf, b in items:
+            if not has_partition(tf):
+                rejected += len(b)
+                rejected_tfs.add(tf)
+                continue
+            cutoff = expiry_cutoff(tf, policy)
+            if cutoff is not None:
+                live = b.open_time >= _ms(cutoff)
+                if not live.all():
+                    expired += int(np.count_nonzero(~live))
+                    b = b.take(live)
+            if len(b):
+                kept.append((ex, sym, tf, b))
+        items = kept
+        _warn_rejected(rejected_tfs, rejected)
+        await ensure_span_partitions(session, [(b.first_open_time(), b.last_open_time()) for _, _, _, b in items])
+    quarantined = []
+    if items and validate:
+        try:
+            history = await load_series_history(session, {(ex, sym, tf): b.first_open_time() for ex, sym, tf, b in items})
+        except Exception:
+            await session.rollback()
+            history = {}
+        items, quarantined, quality = validate_batches(items, history)
+        await quarantine_rows(session, quarantined)
+        await record_quality(quality)
+    count = sum(len(b) for _, _, _, b in items)
+    path = "copy" if count >= copy_threshold else "executemany"
+    if count:
+        if path == "copy":
+            batch_id = uuid.uuid4()
+            await _copy_merge(session, batch_id, _batch_records(batch_id, items), coverage)
+        else:
+            await _executemany_upsert(session, [r for ex, sym, tf, b in items for r in b.rows(ex, sym, tf)], coverage)
+        await session.commit()
+    elif quarantined:
+        await session.commit()
+    return await _finish(path, count, len(quarantined), rejected, expired, started)
+
+
+async def _finish(path: str, rows: int, quarantined: int, rejected: int, expired: int, started: float) -> Dict[str, Any]:
+    seconds = time.monotonic() - started
+    result = {
+        "path": path,
+        "rows": rows,
+        "quarantined": quarantined,
+        "rejected": rejected,
+        "expired": expired,
+        "seconds": round(seconds, 4),
+        "rows_per_sec": int(rows / seconds) if seconds > 0 else 0,
+    }
+    try:
+        r = await get_redis()
+        await r.hset(f"market:ingest:last:{path}", mapping={k: str(v) for k, v in result.items()})
+    except Exception:
+        pass
+    return result
@@ -0,0 +1,332 @@
+"""
+K线序列缓存（每个 交易所×交易对×时间框 一个 Redis 有序集合）
+函数集注释：
+- pack_bar / unpack_bar: 单根K线的定长二进制成员（open_time 毫秒 + OHLCV），分值为 open_time 毫秒
+- merge_intervals / missing_intervals: 已覆盖区间的合并与缺口计算（闭区间，毫秒）
+- KlineSeriesCache.latest: 最近 N 根：刷新尾部后从缓存取，不足时只向数据库补查更早的一段
+- KlineSeriesCache.range: 时间区间：按顺序遍历已覆盖段与缺口段，只查询缺口段，凑够 limit 根即停止
+- KlineSeriesCache.reset: 删除整个序列缓存（直接从交易所写入数据库后调用）
+- invalidate_tail: 采集写入后清除尾部刷新时间，下一次读取时重新查询最后一根及之后的K线
+- bars_to_columns: 成员字节 / K线元组直接转为列式 NumPy 数组（二进制响应编码用，不构造逐行字典）
+- bar_span / answers_request: 读取结果的首末 open_time 与根数；判断结果是否覆盖到请求末端（否则调用方改向交易所取数）
+尾部刷新由跨进程锁串行化：未抢到锁的请求不等待，直接返回缓存中的K线（最迟落后一次刷新）
+覆盖区间记录在 meta 哈希中，以区分"尚未缓存"与"数据库中本就没有"；任意 limit 与 start/end 共用同一份缓存
+"""
+
+import json
+import struct
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from modules.market.services.timeframes import timeframe_seconds
+from utils.singleflight import acquire_lock, release_lock
+
+_BAR = struct.Struct("<q5d")
+# 与 _BAR 内存布局一致的结构化类型：成员字节拼接后可直接 frombuffer
+BAR_DTYPE = np.dtype([("open_time", "<i8"), ("open_price", "<f8"), ("high_price", "<f8"),
+                      ("low_price", "<f8"), ("close_price", "<f8"), ("volume", "<f8")])
+
+# 单序列缓存上限（超出时淘汰最早的K线并收缩覆盖区间）
+MAX_BARS = 20000
+# 序列缓存自建立起的最长生存时间；到期后整体重建，回补写入的历史K线最迟在此之后可见
+SERIES_TTL_SECONDS = 3600
+# 尾部刷新锁的最长持有时间（持有者异常退出时自动释放）
+TAIL_LOCK_MS = 5000
+
+Interval = Tuple[int, int]
+
+
+def series_keys(exchange: str, symbol: str, timeframe: str) -> Tuple[str, str]:
+    sid = f"{exchange}:{symbol}:{timeframe}"
+    return f"klines:z:{sid}", f"klines:z:meta:{sid}"
+
+
+def pack_bar(ms: int, o: float, h: float, l: float, c: float, v: float) -> bytes:
+    return _BAR.pack(ms, o, h, l, c, v)
+
+
+def unpack_bar(buf: bytes) -> Tuple[int, float, float, float, float, float]:
+    return _BAR.unpack(bytes(buf))
+
+
+def merge_intervals(intervals: List[Interval]) -> List[Interval]:
+    out: List[List[int]] = []
+    for a, b in sorted(intervals):
+        if out and a <= out[-1][1] + 1:
+            out[-1][1] = max(out[-1][1], b)
+        else:
+            out.append([a, b])
+    return [(a, b) for a, b in out]
+
+
+def missing_intervals(covered: List[Interval], start: int, end: int) -> List[Interval]:
+    gaps: List[Interval] = []
+    cur = start
+    for a, b in merge_intervals(covered):
+        if b < cur:
+            continue
+        if a > end:
+            break
+        if a > cur:
+            gaps.append((cur, a - 1))
+        cur = max(cur, b + 1)
+        if cur > end:
+            break
+    if cur <= end:
+        gaps.append((cur, end))
+    return gaps
+
+
+def _segments(covered: List[Interval], start: int, end: int) -> List[Tuple[int, int, bool]]:
+    """[start, end] 按时间顺序拆成 (lo, hi, 是否已覆盖) 段"""
+    segs = [(a, b, False) for a, b in missing_intervals(covered, start, end)]
+    for a, b in merge_intervals(covered):
+        lo, hi = max(a, start), min(b, end)
+        if lo <= hi:
+            segs.append((lo, hi, True))
+    return sorted(segs)
+
+
+def _ms(ts: datetime) -> int:
+    return int(ts.timestamp() * 1000)
+
+
+def _step_seconds(timeframe: str) -> int:
+    # 月线长度不固定，与 ExchangeBase.get_interval_minutes 一致按 30 天计
+    return timeframe_seconds(timeframe) or (2592000 if timeframe == '1M' else 0)
+
+
+def _to_dict(symbol: str, timeframe: str, bar) -> Dict[str, Any]:
+    """与交易所直取路径（model_dict(Kline)）字段一致；缓存不保存的字段取适配器的默认值"""
+    ms, o, h, l, c, v = bar
+    step = _step_seconds(timeframe)
+    return {
+        "symbol": symbol, "interval": timeframe,
+        "open_time": datetime.fromtimestamp(ms / 1000).isoformat(),
+        "close_time": datetime.fromtimestamp((ms + step * 1000) / 1000).isoformat(),
+        "open_price": o, "high_price": h, "low_price": l, "close_price": c, "volume": v,
+        "quote_volume": 0.0, "trades_count": 0, "taker_buy_volume": 0.0, "taker_buy_quote_volume": 0.0,
+    }
+
+
+def bars_to_columns(bars) -> Dict[str, np.ndarray]:
+    """bars: 成员字节列表或 (ms, o, h, l, c, v) 元组列表；open_time 为 datetime64[ms]"""
+    if bars and isinstance(bars[0], (bytes, bytearray)):
+        arr = np.frombuffer(b"".join(bars), dtype=BAR_DTYPE)
+    else:
+        arr = np.array(bars, dtype=BAR_DTYPE)
+    cols = {name: arr[name] for name in BAR_DTYPE.names}
+    cols["open_time"] = cols["open_time"].astype("datetime64[ms]")
+    return cols
+
+
+def bar_span(data, columnar: bool) -> Tuple[int, int, int]:
+    """latest/range 的返回值 -> (首根 open_time 毫秒, 末根 open_time 毫秒, 根数)；空结果为 (0, 0, 0)"""
+    if columnar:
+        times = data["open_time"]
+        if not len(times):
+            return 0, 0, 0
+        return int(times[0].astype("int64")), int(times[-1].astype("int64")), len(times)
+    if not data:
+        return 0, 0, 0
+    first, last = (int(datetime.fromisoformat(data[i]["open_time"]).timestamp() * 1000) for i in (0, -1))
+    return first, last, len(data)
+
+
+def answers_request(span: Tuple[int, int, int], timeframe: str, start: Optional[int], end: int, limit: int) -> bool:
+    """缓存结果能否直接作答（毫秒）：数据库只含采集过的序列，未采集或已停采的序列最新一根会停在过去
+
+    最新一根收盘距 end 超过一个周期即视为未覆盖；区间请求取满 limit 根即已覆盖，未取满时首根还须贴近 start
+    """
+    first, last, count = span
+    if not count:
+        return False
+    step = _step_seconds(timeframe) * 1000
+    if not step:
+        return True
+    if start is not None:
+        if count >= limit:
+            return True
+        if first - step > start:
+            return False
+    return last + 2 * step >= end
+
+
+class KlineSeriesCache:
+    """单个序列的区间缓存；数据库（kline_data）为数据来源"""
+
+    def __init__(self, redis_client, exchange: str, symbol: str, timeframe: str, tail_ttl: int = 30):
+        self.r = redis_client
+        self.exchange = exchange
+        self.symbol = symbol
+        self.timeframe = timeframe
+        self.tail_ttl = tail_ttl
+        self.zkey, self.mkey = series_keys(exchange, symbol, timeframe)
+        self.db_queries = 0
+        self._cov: List[Interval] = []
+        self._floor = 0
+        self._tail_token: Optional[str] = None
+
+    # ---- 元数据 ----
+    async def _load_meta(self) -> Optional[int]:
+        meta = await self.r.hgetall(self.mkey) or {}
+        meta = {(k.decode() if isinstance(k, bytes) else k): v for k, v in meta.items()}
+        raw = meta.get("cov")
+        self._cov = [tuple(x) for x in json.loads(raw)] if raw else []
+        tail_at = meta.get("tail_at")
+        return int(tail_at) if tail_at is not None else None
+
+    async def _save_meta(self, tail_at: Optional[int] = None) -> None:
+        # 淘汰过的K线不再视为已覆盖
+        cov = [(max(a, self._floor), b) for a, b in merge_intervals(self._cov) if b >= self._floor]
+        mapping = {"cov": json.dumps(cov)}
+        if tail_at is not None:
+            mapping["tail_at"] = str(tail_at)
+        pipe = self.r.pipeline(transaction=False)
+        pipe.hset(self.mkey, mapping=mapping)
+        pipe.expire(self.mkey, SERIES_TTL_SECONDS, nx=True)
+        pipe.expire(self.zkey, SERIES_TTL_SECONDS, nx=True)
+        await pipe.execute()
+        if self._tail_token is not None:
+            await release_lock(self.r, f"{self.mkey}:lock", self._tail_token)
+            self._tail_token = None
+
+    # ---- 数据库与写入 ----
+    async def _query(self, session: AsyncSession, lo: int, hi: int, limit: Optional[int] = None, desc: bool = False) -> List[tuple]:
+        self.db_queries += 1
+        sql = (
+            "SELECT open_time, open, high, low, close, volume FROM kline_data "
+            "WHERE exchange=:ex AND symbol=:sym AND timeframe=:tf AND open_time BETWEEN :lo AND :hi "
+            f"ORDER BY open_time {'DESC' if desc else 'ASC'}"
+        )
+        params = {"ex": self.exchange, "sym": self.symbol, "tf": self.timeframe,
+                  "lo": datetime.fromtimestamp(lo / 1000), "hi": datetime.fromtimestamp(hi / 1000)}
+        if limit is not None:
+            sql += " LIMIT :lim"
+            params["lim"] = limit
+        rows = (await session.execute(text(sql), params)).fetchall()
+        return [(_ms(r.open_time), float(r.open or 0), float(r.high or 0), float(r.low or 0),
+                 float(r.close or 0), float(r.volume or 0)) for r in rows]
+
+    async def _store(self, bars: List[tuple]) -> None:
+        if not bars:
+            return
+        pipe = self.r.pipeline(transaction=False)
+        # 同一 open_time 的旧成员（未收盘K线的旧值）先删除再写入
+        for b in bars:
+            pipe.zremrangebyscore(self.zkey, b[0], b[0])
+        pipe.zadd(self.zkey, {pack_bar(*b): b[0] for b in bars})
+        pipe.zcard(self.zkey)
+        res = await pipe.execute()
+        if res[-1] > MAX_BARS:
+            await self.r.zremrangebyrank(self.zkey, 0, res[-1] - MAX_BARS - 1)
+            oldest = await self.r.zrange(self.zkey, 0, 0, withscores=True)
+            self._floor = max(self._floor, int(oldest[0][1]) if oldest else 0)
+
+    async def _raw_members(self, lo: int, hi: int, limit: Optional[int] = None, desc: bool = False) -> List[bytes]:
+        if desc:
+            raw = await self.r.zrevrangebyscore(self.zkey, hi, lo, start=0 if limit else None, num=limit)
+        else:
+            raw = await self.r.zrangebyscore(self.zkey, lo, hi, start=0 if limit else None, num=limit)
+        return raw or []
+
+    async def _members(self, lo: int, hi: int, limit: Optional[int] = None, desc: bool = False) -> List[tuple]:
+        return [unpack_bar(m) for m in await self._raw_members(lo, hi, limit, desc)]
+
+    def _format(self, bars: List[tuple], columnar: bool):
+        if columnar:
+            return bars_to_columns(bars)
+        return [_to_dict(self.symbol, self.timeframe, b) for b in bars]
+
+    def _live(self, now: int) -> Optional[Interval]:
+        """末端接近当前时间的覆盖区间（由截至"当前"的查询建立）；更早的区间只来自历史区间请求"""
+        if self._cov and self._cov[-1][1] >= now - SERIES_TTL_SECONDS * 1000:
+            return self._cov[-1]
+        return None
+
+    async def _refresh_tail(self, session: AsyncSession, tail_at: Optional[int], now: int) -> bool:
+        """尾部（最后一根及之后）超过 tail_ttl 未刷新或被采集任务标记过期时重新查询；返回是否查询了数据库"""
+        live = self._live(now)
+        if live is None or (tail_at is not None and now - tail_at < self.tail_ttl * 1000):
+            return False
+        try:
+            self._tail_token = await acquire_lock(self.r, f"{self.mkey}:lock", TAIL_LOCK_MS)
+        except Exception:
+            self._tail_token = None
+        else:
+            if self._tail_token is None:
+                # 其他请求/进程正在刷新尾部
+                return False
+        a, b = live
+        last = await self.r.zrevrangebyscore(self.zkey, b, a, start=0, num=1, withscores=True)
+        since = int(last[0][1]) if last else b
+        await self._store(await self._query(session, since, now))
+        self._cov.append((since, now))
+        self._cov = merge_intervals(self._cov)
+        return True
+
+    # ---- 读取 ----
+    async def latest(self, session: AsyncSession, limit: int, columnar: bool = False):
+        """最近 limit 根（时间升序）；columnar=True 时返回列式数组"""
+        now = int(time.time() * 1000)
+        tail_at = await self._load_meta()
+        refreshed = await self._refresh_tail(session, tail_at, now)
+        live = self._live(now)
+        if live is None:
+            bars = await self._query(session, 0, now, limit, desc=True)
+            await self._store(bars)
+            self._cov.append((bars[-1][0] if len(bars) == limit else 0, now))
+            self._cov = merge_intervals(self._cov)
+            await self._save_meta(now)
+            return self._format(bars[::-1], columnar)
+        a, b = live
+        bars = await self._members(a, b, limit, desc=True)
+        if len(bars) < limit and a > 0:
+            need = limit - len(bars)
+            older = await self._query(session, 0, a - 1, need, desc=True)
+            await self._store(older)
+            self._cov.append((older[-1][0] if len(older) == need else 0, a - 1))
+            self._cov = merge_intervals(self._cov)
+            bars += older
+        if self.db_queries:
+            await self._save_meta(now if refreshed else tail_at)
+        return self._format(bars[::-1], columnar)
+
+    async def range(self, session: AsyncSession, start: int, end: int, limit: int, columnar: bool = False):
+        """[start, end]（毫秒）内最多 limit 根；columnar=True 时返回列式数组"""
+        now = int(time.time() * 1000)
+        end = min(end, now)
+        tail_at = await self._load_meta()
+        refreshed = await self._refresh_tail(session, tail_at, now)
+        collected = 0
+        for lo, hi, covered in _segments(self._cov, start, end):
+            if collected >= limit:
+                break
+            if covered:
+                collected += await self.r.zcount(self.zkey, lo, hi)
+                continue
+            need = limit - collected
+            bars = await self._query(session, lo, hi, need)
+            await self._store(bars)
+            # 未取满说明缺口段已全部取回；取满时只记录到最后一根
+            self._cov.append((lo, hi if len(bars) < need else bars[-1][0]))
+            collected += len(bars)
+        self._cov = merge_intervals(self._cov)
+        if self.db_queries:
+            await self._save_meta(now if refreshed else tail_at)
+        if columnar:
+            return bars_to_columns(await self._raw_members(start, end, limit))
+        return self._format(await self._members(start, end, limit), False)
+
+    async def reset(self) -> None:
+        await self.r.delete(self.zkey, self.mkey)
+
+
+def invalidate_tail(batch, exchange: str, symbol: str, timeframe: str) -> None:
+    """并入调用方的 RedisBatch：下一次读取该序列时重新查询尾部"""
+    batch.hdel(series_keys(exchange, symbol, timeframe)[1], "tail_at")
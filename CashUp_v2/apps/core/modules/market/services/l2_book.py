@@ -0,0 +1,368 @@
+"""
+本地 L2 订单簿（由交易所深度增量推送维护）
+函数集注释：
+- L2Book: 单个交易对的内存订单簿（SortedDict 按价格有序），按更新 ID 校验连续性，可选 CRC32 校验和；
+  读取 top / best / mid / spread / imbalance 均为内存操作，不访问交易所
+- interleaved_crc32: 通用校验和（买卖档位交错拼接 "价:量" 后取 CRC32，按交易所原始字符串计算）
+- LocalOrderBookManager: 订阅增量流，首次与出现缺口/校验失败时从 REST 快照重建：
+    重建期间的增量先缓存，快照到达后丢弃 last_id <= 快照 ID 的增量，要求第一条满足 first_id <= 快照 ID + 1，
+    之后每条须满足 first_id == 上一条 last_id + 1，否则判定缺口并重新同步
+- normalize_snapshot: 适配器 REST 订单簿（Gate.io id / Binance lastUpdateId）转为 (ID, bids, asks)
+- local_order_books: 进程级实例（API 进程内启动，由 /api/v1/market/orderbook 读取）
+配置：market.orderbook.local.enabled、market.orderbook.local.symbols（默认沿用 market.collect.symbols）、market.orderbook.local.depth
+"""
+
+import asyncio
+import time
+import zlib
+from itertools import islice
+from operator import neg
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from sortedcontainers import SortedDict
+
+from services.config_cache import system_config_cache
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+APPLIED = "applied"
+STALE = "stale"
+GAP = "gap"
+CHECKSUM = "checksum"
+
+# (first_id, last_id, bids, asks, ts_ms, checksum)
+Update = Tuple[int, int, List[Any], List[Any], int, Optional[int]]
+
+
+def _norm_symbol(symbol: str) -> str:
+    return str(symbol).replace('/', '_')
+
+
+def _pq(row) -> Tuple[Any, Any]:
+    if isinstance(row, dict):
+        return row.get('price', row.get('p')), row.get('quantity', row.get('amount', row.get('s')))
+    return row[0], row[1]
+
+
+class L2Book:
+    """内存订单簿；bids 以负价格为键排序，两侧第一项即最优价"""
+
+    __slots__ = ("symbol", "bids", "asks", "_text", "last_id", "synced", "updated_ms", "checksum_fn")
+
+    def __init__(self, symbol: str, checksum_fn: Optional[Callable[["L2Book"], int]] = None):
+        self.symbol = symbol
+        self.bids: SortedDict = SortedDict(neg)
+        self.asks: SortedDict = SortedDict()
+        # 校验和须按交易所原始字符串计算，仅在启用校验时保存
+        self._text: Optional[Dict[Tuple[int, float], Tuple[str, str]]] = {} if checksum_fn else None
+        self.last_id = 0
+        self.synced = False
+        self.updated_ms = 0
+        self.checksum_fn = checksum_fn
+
+    def _set(self, side: SortedDict, is_bid: bool, rows: Iterable[Any]) -> None:
+        for row in rows or []:
+            p, q = _pq(row)
+            price, qty = float(p), float(q)
+            if qty > 0:
+                side[price] = qty
+                if self._text is not None:
+                    self._text[(is_bid, price)] = (str(p), str(q))
+            else:
+                side.pop(price, None)
+                if self._text is not None:
+                    self._text.pop((is_bid, price), None)
+
+    def apply_snapshot(self, last_id: int, bids: Iterable[Any], asks: Iterable[Any], ts_ms: Optional[int] = None) -> None:
+        self.bids.clear()
+        self.asks.clear()
+        if self._text is not None:
+            self._text.clear()
+        self._set(self.bids, True, bids)
+        self._set(self.asks, False, asks)
+        self.last_id = int(last_id)
+        self.synced = True
+        self.updated_ms = ts_ms or int(time.time() * 1000)
+
+    def apply_update(self, first_id: int, last_id: int, bids: Iterable[Any], asks: Iterable[Any],
+                     ts_ms: Optional[int] = None, checksum: Optional[int] = None) -> str:
+        """返回 applied / stale（已包含在簿中）/ gap / checksum；后两者将簿标记为未同步"""
+        if last_id <= self.last_id:
+            return STALE
+        if first_id > self.last_id + 1:
+            self.synced = False
+            return GAP
+        self._set(self.bids, True, bids)
+        self._set(self.asks, False, asks)
+        self.last_id = int(last_id)
+        self.updated_ms = ts_ms or int(time.time() * 1000)
+        if checksum is not None and self.checksum_fn is not None and self.checksum_fn(self) != int(checksum):
+            self.synced = False
+            return CHECKSUM
+        return APPLIED
+
+    # ---- 读取 ----
+    def top(self, n: int = 20) -> Dict[str, List[List[float]]]:
+        return {
+            "bids": [[p, q] for p, q in islice(self.bids.items(), n)],
+            "asks": [[p, q] for p, q in islice(self.asks.items(), n)],
+        }
+
+    def text_levels(self, is_bid: bool, n: int) -> List[Tuple[str, str]]:
+        side = self.bids if is_bid else self.asks
+        return [self._text[(is_bid, p)] for p in islice(side.keys(), n)] if self._text is not None else []
+
+    def best_bid(self) -> Optional[Tuple[float, float]]:
+        return self.bids.peekitem(0) if self.bids else None
+
+    def best_ask(self) -> Optional[Tuple[float, float]]:
+        return self.asks.peekitem(0) if self.asks else None
+
+    def mid(self) -> Optional[float]:
+        if not self.bids or not self.asks:
+            return None
+        return (self.bids.peekitem(0)[0] + self.asks.peekitem(0)[0]) / 2
+
+    def spread(self) -> Optional[float]:
+        if not self.bids or not self.asks:
+            return None
+        return self.asks.peekitem(0)[0] - self.bids.peekitem(0)[0]
+
+    def imbalance(self, n: int = 10) -> Optional[float]:
+        """前 n 档 (买量 - 卖量) / (买量 + 卖量)，取值 [-1, 1]"""
+        b = sum(islice(self.bids.values(), n))
+        a = sum(islice(self.asks.values(), n))
+        return (b - a) / (b + a) if b + a > 0 else None
+
+    def metrics(self, n: int = 10) -> Dict[str, Any]:
+        mid, spread = self.mid(), self.spread()
+        return {
+            "symbol": self.symbol,
+            "best_bid": self.best_bid(),
+            "best_ask": self.best_ask(),
+            "mid": mid,
+            "spread": spread,
+            "spread_bps": spread / mid * 10000 if mid else None,
+            "imbalance": self.imbalance(n),
+            "depth": [len(self.bids), len(self.asks)],
+            "last_id": self.last_id,
+            "updated_ms": self.updated_ms,
+        }
+
+
+def interleaved_crc32(book: L2Book, depth: int = 25) -> int:
+    """买1:量:卖1:量:买2:... 交错拼接后的有符号 CRC32（OKX/Kraken 类校验方式）"""
+    bids, asks = book.text_levels(True, depth), book.text_levels(False, depth)
+    parts: List[str] = []
+    for i in range(max(len(bids), len(asks))):
+        if i < len(bids):
+            parts.extend(bids[i])
+        if i < len(asks):
+            parts.extend(asks[i])
+    crc = zlib.crc32(":".join(parts).encode())
+    return crc - (1 << 32) if crc >= (1 << 31) else crc
+
+
+def normalize_snapshot(data: Dict[str, Any]) -> Tuple[Optional[int], List[Any], List[Any]]:
+    last_id = data.get('id', data.get('lastUpdateId'))
+    return (int(last_id) if last_id is not None else None), data.get('bids') or [], data.get('asks') or []
+
+
+class _Feed:
+    __slots__ = ("book", "buffer", "task", "fetch")
+
+    def __init__(self, book: L2Book, fetch: Callable[[str, int], Any]):
+        self.book = book
+        self.buffer: List[Update] = []
+        self.task: Optional[asyncio.Task] = None
+        self.fetch = fetch
+
+
+class LocalOrderBookManager:
+    """按 (交易所, 交易对) 维护本地订单簿"""
+
+    def __init__(self, depth: int = 100, max_books: int = 50, max_buffer: int = 5000,
+                 max_age: float = 30.0, retry_delay: float = 1.0):
+        self.depth = depth
+        self.max_books = max_books
+        self.max_buffer = max_buffer
+        self.max_age = max_age
+        self.retry_delay = retry_delay
+        self.enabled = False
+        self.feeds: Dict[Tuple[str, str], _Feed] = {}
+        self.stats: Dict[str, int] = {"updates": 0, "stale": 0, "gaps": 0, "checksum_failures": 0,
+                                      "resyncs": 0, "resync_errors": 0, "buffer_overflows": 0}
+
+    # ---- 读取 ----
+    def get(self, exchange: str, symbol: str) -> Optional[L2Book]:
+        """已同步且未停更的簿；否则 None（调用方回退 REST）"""
+        feed = self.feeds.get((exchange, _norm_symbol(symbol)))
+        if feed is None or not feed.book.synced:
+            return None
+        if time.time() * 1000 - feed.book.updated_ms > self.max_age * 1000:
+            return None
+        return feed.book
+
+    def tracking(self, exchange: str, symbol: str) -> bool:
+        return (exchange, _norm_symbol(symbol)) in self.feeds
+
+    # ---- 增量 ----
+    def add(self, exchange: str, symbol: str, fetch: Callable[[str, int], Any],
+            checksum_fn: Optional[Callable[[L2Book], int]] = None) -> Optional[_Feed]:
+        """登记交易对；fetch(symbol, limit) 返回 REST 订单簿"""
+        key = (exchange, _norm_symbol(symbol))
+        feed = self.feeds.get(key)
+        if feed is None:
+            if len(self.feeds) >= self.max_books:
+                return None
+            feed = self.feeds[key] = _Feed(L2Book(key[1], checksum_fn), fetch)
+        return feed
+
+    def on_update(self, exchange: str, symbol: str, first_id: int, last_id: int, bids: List[Any], asks: List[Any],
+                  ts_ms: Optional[int] = None, checksum: Optional[int] = None) -> str:
+        feed = self.feeds.get((exchange, _norm_symbol(symbol)))
+        if feed is None:
+            return STALE
+        self.stats["updates"] += 1
+        upd: Update = (int(first_id), int(last_id), bids, asks, ts_ms or int(time.time() * 1000), checksum)
+        if not feed.book.synced:
+            self._buffer(exchange, feed, upd)
+            return GAP
+        status = feed.book.apply_update(*upd)
+        if status == STALE:
+            self.stats["stale"] += 1
+        elif status in (GAP, CHECKSUM):
+            self.stats["gaps" if status == GAP else "checksum_failures"] += 1
+            logger.warning(f"订单簿{'缺口' if status == GAP else '校验失败'}，重新同步 {exchange}:{feed.book.symbol} "
+                           f"last={feed.book.last_id} U={first_id} u={last_id}")
+            # 校验失败时本条已应用，重建后按 ID 丢弃即可；缺口时本条保留待重放
+            feed.buffer = [upd] if status == GAP else []
+            self._schedule(exchange, feed)
+        return status
+
+    def _buffer(self, exchange: str, feed: _Feed, upd: Update) -> None:
+        if len(feed.buffer) >= self.max_buffer:
+            # 快照迟迟拿不到：丢弃积压，之后的快照必然晚于剩余增量的起点
+            self.stats["buffer_overflows"] += 1
+            feed.buffer.clear()
+        feed.buffer.append(upd)
+        self._schedule(exchange, feed)
+
+    def _schedule(self, exchange: str, feed: _Feed) -> None:
+        if feed.task is None or feed.task.done():
+            feed.task = asyncio.ensure_future(self._resync(exchange, feed))
+
+    # ---- 快照重建 ----
+    def _replay(self, feed: _Feed, snap_id: int) -> bool:
+        """快照之后重放缓存的增量；返回 False 表示快照早于缓存起点之前的缺口，需要再取一次"""
+        book = feed.book
+        pending = [u for u in feed.buffer if u[1] > snap_id]
+        if pending and pending[0][0] > snap_id + 1:
+            book.synced = False
+            return False
+        for upd in pending:
+            if book.apply_update(*upd) not in (APPLIED, STALE):
+                book.synced = False
+                return False
+        feed.buffer = []
+        return True
+
+    async def _resync(self, exchange: str, feed: _Feed) -> None:
+        while self.feeds.get((exchange, feed.book.symbol)) is feed:
+            self.stats["resyncs"] += 1
+            try:
+                data = await feed.fetch(feed.book.symbol.replace('_', '/'), self.depth)
+                snap_id, bids, asks = normalize_snapshot(data or {})
+                if snap_id is None:
+                    raise ValueError("REST 订单簿缺少更新 ID")
+                feed.book.apply_snapshot(snap_id, bids, asks)
+                if self._replay(feed, snap_id):
+                    logger.info(f"本地订单簿已同步 {exchange}:{feed.book.symbol} id={feed.book.last_id}")
+                    return
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats["resync_errors"] += 1
+                logger.warning(f"订单簿快照获取失败 {exchange}:{feed.book.symbol}: {e}")
+            await asyncio.sleep(self.retry_delay)
+
+    # ---- 订阅 ----
+    def callback_for(self, exchange: str):
+        async def _on_update(u: Dict[str, Any]):
+            self.on_update(exchange, u['symbol'], u['first_id'], u['last_id'], u['bids'], u['asks'],
+                           u.get('timestamp'), u.get('checksum'))
+        return _on_update
+
+    async def track(self, mgr, exchange: str, symbol: str) -> bool:
+        """订阅交易所增量流并开始同步；适配器不支持增量推送时返回 False"""
+        if self.tracking(exchange, symbol):
+            return True
+        adapter = mgr.get_exchange(exchange) if mgr is not None else None
+        client = getattr(adapter, "exchange", None)
+        sub = getattr(client, "subscribe_order_book_update", None)
+        if sub is None:
+            return False
+        feed = self.add(exchange, symbol, client.get_order_book, getattr(client, "order_book_checksum", None))
+        if feed is None:
+            return False
+        try:
+            await sub(str(symbol).replace('_', '/'), self.callback_for(exchange))
+        except Exception as e:
+            self.feeds.pop((exchange, feed.book.symbol), None)
+            logger.error(f"订阅订单簿增量失败 {exchange}:{symbol}: {e}")
+            return False
+        self._schedule(exchange, feed)
+        return True
+
+    async def start(self, mgr) -> List[str]:
+        """按配置启用并订阅；未启用时只记录状态"""
+        symbols: List[str] = []
+        try:
+            m = await system_config_cache.get_many(['market.orderbook.local.enabled', 'market.orderbook.local.symbols',
+                                                    'market.collect.symbols', 'market.orderbook.local.depth'])
+            if m.get('market.orderbook.local.enabled') is not None:
+                self.enabled = str(m['market.orderbook.local.enabled']).strip('"').lower() in ('1', 'true', 'yes')
+            if isinstance(m.get('market.orderbook.local.symbols'), list):
+                symbols = [str(s) for s in m['market.orderbook.local.symbols']]
+            elif isinstance(m.get('market.collect.symbols'), list):
+                symbols = [str(s) for s in m['market.collect.symbols']]
+            if m.get('market.orderbook.local.depth'):
+                self.depth = int(str(m['market.orderbook.local.depth']).strip('"'))
+        except Exception:
+            pass
+        tracked: List[str] = []
+        if not self.enabled or mgr is None:
+            return tracked
+        for name in mgr.get_exchange_names():
+            for sym in symbols:
+                if await self.track(mgr, name, sym):
+                    tracked.append(f"{name}:{_norm_symbol(sym)}")
+        logger.info(f"本地订单簿订阅: {tracked}")
+        return tracked
+
+    async def stop(self) -> None:
+        tasks = [f.task for f in self.feeds.values() if f.task is not None and not f.task.done()]
+        for t in tasks:
+            t.cancel()
+        for t in tasks:
+            try:
+                await t
+            except (asyncio.CancelledError, Exception):
+                pass
+        self.feeds.clear()
+
+    def summary(self) -> Dict[str, Any]:
+        now_ms = time.time() * 1000
+        return {
+            "enabled": self.enabled,
+            "books": {f"{ex}:{sym}": {"synced": f.book.synced, "last_id": f.book.last_id,
+                                       "age_ms": int(now_ms - f.book.updated_ms) if f.book.updated_ms else None,
+                                       "buffered": len(f.buffer), "levels": [len(f.book.bids), len(f.book.asks)]}
+                      for (ex, sym), f in self.feeds.items()},
+            **self.stats,
+        }
+
+
+# 进程级实例
+local_order_books = LocalOrderBookManager()
@@ -0,0 +1,318 @@
+"""
+订单簿快照 + 增量存储与回放
+函数集注释：
+- encode_deltas / decode_deltas: 增量块二进制编解码（头部 + zlib 压缩的定长记录：毫秒偏移、方向、价格、数量；数量 0 表示删除该档）
+- diff_books: 比较两个档位字典，生成增量（只推送全量快照的行情源据此得到增量）
+- OrderBookRecorder: 按 交易所×交易对 维护当前簿，增量按块缓冲定期写入 orderbook_deltas（旧库先执行 scripts/migrate_market_schema.sql 建表），按间隔写全量快照到 orderbook_snapshots
+- reconstruct: 定位时间点之前最近的快照并顺序应用其后的增量，重建任意时刻的订单簿
+- replay_frames: 在时间区间内按步长输出订单簿序列（一次加载，逐帧推进）
+- prune_orderbook: 删除超出保留期的快照与增量
+"""
+
+import asyncio
+import json
+import struct
+import time
+import zlib
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+MAGIC = b"OBD1"
+_HEADER = struct.Struct("<4sqI")
+_RECORD = struct.Struct("<IBdd")
+
+BID = 0
+ASK = 1
+
+# (epoch_ms, side, price, qty)
+Delta = Tuple[int, int, float, float]
+Levels = Dict[float, float]
+
+
+def _ms(ts: datetime) -> int:
+    # 适配器返回的 naive 时间为本地时间（datetime.fromtimestamp），timestamp() 按本地时区换算
+    return int(ts.timestamp() * 1000)
+
+
+def _dt(ms: int) -> datetime:
+    return datetime.fromtimestamp(ms / 1000)
+
+
+def _norm_symbol(symbol: str) -> str:
+    return str(symbol).replace('/', '_')
+
+
+def encode_deltas(deltas: List[Delta]) -> bytes:
+    base = deltas[0][0] if deltas else 0
+    body = b"".join(_RECORD.pack(ms - base, side, price, qty) for ms, side, price, qty in deltas)
+    return _HEADER.pack(MAGIC, base, len(deltas)) + zlib.compress(body, 6)
+
+
+def decode_deltas(blob: bytes) -> List[Delta]:
+    magic, base, count = _HEADER.unpack_from(blob, 0)
+    if magic != MAGIC:
+        raise ValueError("不是订单簿增量块")
+    body = zlib.decompress(blob[_HEADER.size:])
+    return [(base + off, side, price, qty) for off, side, price, qty in _RECORD.iter_unpack(body)][:count]
+
+
+def _levels(rows: Iterable[Any]) -> Levels:
+    """[[price, qty], ...] 或 [{'price':, 'quantity':}, ...] -> {price: qty}"""
+    out: Levels = {}
+    for r in rows or []:
+        if isinstance(r, dict):
+            p, q = r.get('price'), r.get('quantity', r.get('amount'))
+        else:
+            p, q = r[0], r[1]
+        q = float(q)
+        if q > 0:
+            out[float(p)] = q
+    return out
+
+
+def diff_books(ms: int, old_bids: Levels, old_asks: Levels, bids: Levels, asks: Levels) -> List[Delta]:
+    out: List[Delta] = []
+    for side, old, new in ((BID, old_bids, bids), (ASK, old_asks, asks)):
+        for p, q in new.items():
+            if old.get(p) != q:
+                out.append((ms, side, p, q))
+        for p in old:
+            if p not in new:
+                out.append((ms, side, p, 0.0))
+    return out
+
+
+def apply_deltas(bids: Levels, asks: Levels, deltas: Iterable[Delta]) -> None:
+    for _, side, p, q in deltas:
+        book = bids if side == BID else asks
+        if q > 0:
+            book[p] = q
+        else:
+            book.pop(p, None)
+
+
+def _top(bids: Levels, asks: Levels, depth: int) -> Dict[str, List[List[float]]]:
+    return {
+        "bids": [[p, bids[p]] for p in sorted(bids, reverse=True)[:depth]],
+        "asks": [[p, asks[p]] for p in sorted(asks)[:depth]],
+    }
+
+
+class _BookState:
+    __slots__ = ("bids", "asks", "pending", "last_snapshot_ms", "last_ms")
+
+    def __init__(self):
+        self.bids: Levels = {}
+        self.asks: Levels = {}
+        self.pending: List[Delta] = []
+        self.last_snapshot_ms = 0
+        self.last_ms = 0
+
+
+class OrderBookRecorder:
+    """订单簿记录器
+
+    行情回调只更新内存并追加增量；flush 将每个交易对的待写增量编码为一个块写入，
+    距上次快照超过 snapshot_interval 秒时在同一事务内写入全量快照（快照时刻即块末尾，回放时从此处续接）。
+    全量推送只跟踪前 depth 档。
+    """
+
+    def __init__(self, session_factory: Callable[[], Any], snapshot_interval: float = 60.0,
+                 flush_interval: float = 5.0, depth: int = 50):
+        self.session_factory = session_factory
+        self.snapshot_interval = snapshot_interval
+        self.flush_interval = flush_interval
+        self.depth = depth
+        self.books: Dict[Tuple[str, str], _BookState] = {}
+        self.stats: Dict[str, Any] = {"snapshots": 0, "chunks": 0, "deltas": 0, "delta_bytes": 0, "write_errors": 0}
+
+    def _state(self, exchange: str, symbol: str) -> _BookState:
+        key = (exchange, _norm_symbol(symbol))
+        st = self.books.get(key)
+        if st is None:
+            st = self.books.setdefault(key, _BookState())
+        return st
+
+    def on_snapshot(self, exchange: str, symbol: str, bids: Iterable[Any], asks: Iterable[Any],
+                    ts: Optional[datetime] = None) -> int:
+        """全量推送：与当前簿求差得到增量"""
+        st = self._state(exchange, symbol)
+        ms = _ms(ts or datetime.now())
+        new_bids, new_asks = _levels(bids), _levels(asks)
+        # 只跟踪前 depth 档，快照与增量描述同一本截断后的簿
+        if len(new_bids) > self.depth:
+            new_bids = {p: new_bids[p] for p in sorted(new_bids, reverse=True)[:self.depth]}
+        if len(new_asks) > self.depth:
+            new_asks = {p: new_asks[p] for p in sorted(new_asks)[:self.depth]}
+        deltas = diff_books(ms, st.bids, st.asks, new_bids, new_asks)
+        st.bids, st.asks = new_bids, new_asks
+        st.pending.extend(deltas)
+        st.last_ms = ms
+        return len(deltas)
+
+    def on_update(self, exchange: str, symbol: str, changes: Iterable[Tuple[int, float, float]],
+                  ts: Optional[datetime] = None) -> int:
+        """增量推送：changes 为 (side, price, qty)，qty 为 0 表示删除"""
+        st = self._state(exchange, symbol)
+        ms = _ms(ts or datetime.now())
+        deltas = [(ms, int(side), float(p), float(q)) for side, p, q in changes]
+        apply_deltas(st.bids, st.asks, deltas)
+        st.pending.extend(deltas)
+        st.last_ms = ms
+        return len(deltas)
+
+    def callback_for(self, exchange: str):
+        async def _on_book(book):
+            self.on_snapshot(exchange, book.symbol, book.bids, book.asks, getattr(book, "timestamp", None))
+        return _on_book
+
+    async def subscribe(self, mgr, symbols: Optional[List[str]] = None) -> List[str]:
+        subscribed = []
+        for name in mgr.get_exchange_names():
+            adapter = mgr.get_exchange(name)
+            sub = getattr(getattr(adapter, "exchange", None), "subscribe_order_book", None)
+            if sub is None:
+                continue
+            for sym in symbols or (adapter.config or {}).get("symbols", []):
+                try:
+                    await sub(str(sym).replace('_', '/'), self.callback_for(name))
+                    subscribed.append(f"{name}:{_norm_symbol(sym)}")
+                except Exception as e:
+                    logger.error(f"订阅订单簿失败 {name}:{sym}: {e}")
+        return subscribed
+
+    async def flush(self, now_ms: Optional[int] = None) -> Dict[str, int]:
+        now_ms = now_ms or int(time.time() * 1000)
+        written = {"chunks": 0, "snapshots": 0}
+        due = [(k, st) for k, st in self.books.items()
+               if st.pending or (st.last_ms and now_ms - st.last_snapshot_ms >= self.snapshot_interval * 1000)]
+        if not due:
+            return written
+        async with self.session_factory() as session:
+            for (ex, sym), st in due:
+                deltas, st.pending = st.pending, []
+                snap = bool(st.last_ms) and now_ms - st.last_snapshot_ms >= self.snapshot_interval * 1000
+                try:
+                    if deltas:
+                        blob = encode_deltas(deltas)
+                        await session.execute(text(
+                            """
+                            INSERT INTO orderbook_deltas (exchange, symbol, start_time, end_time, delta_count, payload)
+                            VALUES (:ex, :sym, :st, :et, :n, :p)
+                            """
+                        ), {"ex": ex, "sym": sym, "st": _dt(deltas[0][0]), "et": _dt(deltas[-1][0]), "n": len(deltas), "p": blob})
+                        written["chunks"] += 1
+                        self.stats["deltas"] += len(deltas)
+                        self.stats["delta_bytes"] += len(blob)
+                    if snap:
+                        # 快照保存完整的跟踪档位，回放时增量才能精确续接
+                        top = _top(st.bids, st.asks, len(st.bids) + len(st.asks))
+                        await session.execute(text(
+                            """
+                            INSERT INTO orderbook_snapshots (exchange, symbol, timestamp, bids, asks)
+                            VALUES (:ex, :sym, :ts, CAST(:b AS JSONB), CAST(:a AS JSONB))
+                            """
+                        ), {"ex": ex, "sym": sym, "ts": _dt(st.last_ms), "b": json.dumps(top["bids"]), "a": json.dumps(top["asks"])})
+                        st.last_snapshot_ms = now_ms
+                        written["snapshots"] += 1
+                    await session.commit()
+                except Exception as e:
+                    await session.rollback()
+                    st.pending = deltas + st.pending
+                    self.stats["write_errors"] += 1
+                    logger.error(f"订单簿写库失败 {ex}:{sym}: {e}")
+        self.stats["chunks"] += written["chunks"]
+        self.stats["snapshots"] += written["snapshots"]
+        return written
+
+    async def run(self, stop: Optional[asyncio.Event] = None) -> None:
+        stop = stop or asyncio.Event()
+        try:
+            while not stop.is_set():
+                try:
+                    await asyncio.wait_for(stop.wait(), timeout=self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+                await self.flush()
+        finally:
+            await self.flush()
+
+
+async def _load(session: AsyncSession, exchange: str, symbol: str, start: datetime, end: datetime):
+    sym = _norm_symbol(symbol)
+    snap = (await session.execute(text(
+        """
+        SELECT timestamp, bids, asks FROM orderbook_snapshots
+        WHERE exchange = :ex AND symbol = :sym AND timestamp <= :t
+        ORDER BY timestamp DESC LIMIT 1
+        """
+    ), {"ex": exchange, "sym": sym, "t": start})).first()
+    if snap is None:
+        return None, []
+    chunks = (await session.execute(text(
+        """
+        SELECT payload FROM orderbook_deltas
+        WHERE exchange = :ex AND symbol = :sym AND end_time >= :s AND start_time <= :e
+        ORDER BY start_time
+        """
+    ), {"ex": exchange, "sym": sym, "s": snap.timestamp, "e": end})).fetchall()
+    snap_ms = _ms(snap.timestamp)
+    end_ms = _ms(end)
+    deltas = [d for c in chunks for d in decode_deltas(bytes(c.payload)) if snap_ms < d[0] <= end_ms]
+    return snap, deltas
+
+
+def _snapshot_levels(raw) -> Levels:
+    if isinstance(raw, str):
+        raw = json.loads(raw)
+    return _levels(raw)
+
+
+async def reconstruct(session: AsyncSession, exchange: str, symbol: str, at: datetime, depth: int = 20) -> Optional[Dict[str, Any]]:
+    snap, deltas = await _load(session, exchange, symbol, at, at)
+    if snap is None:
+        return None
+    bids, asks = _snapshot_levels(snap.bids), _snapshot_levels(snap.asks)
+    apply_deltas(bids, asks, deltas)
+    book = _top(bids, asks, depth)
+    book.update({"timestamp": at.isoformat(), "snapshot_time": snap.timestamp.isoformat(), "deltas_applied": len(deltas)})
+    return book
+
+
+async def replay_frames(session: AsyncSession, exchange: str, symbol: str, start: datetime, end: datetime,
+                        step_ms: int, depth: int = 20, max_frames: int = 500) -> List[Dict[str, Any]]:
+    snap, deltas = await _load(session, exchange, symbol, start, end)
+    if snap is None:
+        return []
+    bids, asks = _snapshot_levels(snap.bids), _snapshot_levels(snap.asks)
+    frames = []
+    i = 0
+    t = _ms(start)
+    end_ms = _ms(end)
+    while t <= end_ms and len(frames) < max_frames:
+        j = i
+        while j < len(deltas) and deltas[j][0] <= t:
+            j += 1
+        apply_deltas(bids, asks, deltas[i:j])
+        i = j
+        frame = _top(bids, asks, depth)
+        frame["timestamp"] = _dt(t).isoformat()
+        frames.append(frame)
+        t += max(1, step_ms)
+    return frames
+
+
+async def prune_orderbook(session: AsyncSession, days: int) -> Dict[str, int]:
+    cutoff = datetime.now().timestamp() - days * 86400
+    cut = datetime.fromtimestamp(cutoff)
+    d = await session.execute(text("DELETE FROM orderbook_deltas WHERE end_time < :c"), {"c": cut})
+    s = await session.execute(text("DELETE FROM orderbook_snapshots WHERE timestamp < :c"), {"c": cut})
+    await session.commit()
+    return {"deltas": d.rowcount or 0, "snapshots": s.rowcount or 0}
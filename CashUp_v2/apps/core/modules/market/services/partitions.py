@@ -0,0 +1,256 @@
+"""
+kline_data / market_trades 分区维护与分层保留
+函数集注释：
+- RETENTION_GROUPS: 子分区后缀 -> 包含的时间框（与 create_kline_partitions 一致，四个子分区均为显式 LIST 分区，没有默认子分区）
+- DEFAULT_RETENTION_DAYS: 默认保留天数（None 表示永久）
+- DEFAULT_TRADE_RETENTION_DAYS: 逐笔成交默认保留天数
+- parse_retention_policy / load_retention_policy: 合并配置 market.retention.days 与默认保留天数
+- split_expired: 按保留策略拆出所在子分区已过期（或即将被归档删除）的K线，写入方直接丢弃而不是写进默认分区
+- expiry_cutoff: 某时间框在保留策略下的过期分界时刻（列式批次按 open_time 整列比较，split_expired 同一判定）
+- has_partition / split_unpartitioned: 拆出时间框不在任何 LIST 子分区内的K线（分区表写入会失败），写入方拒收
+- kline_partitioned: is_partitioned 的进程内缓存
+- ensure_row_partitions / ensure_span_partitions / ensure_month_partitions: 写入前为批次涉及、且尚未建分区的月份建分区
+  （超出预建窗口的历史回补不落入 kline_data_default）；分别按行、按列式批次的时间跨度、按月份集合
+- is_partitioned: 判断表是否为分区表（旧库未迁移时维护任务直接跳过）
+- ensure_future_partitions: 调用 create_kline_partitions 预建当月及未来月份分区，并为仍滞留在 kline_data_default 的月份补建分区
+- ensure_trade_partitions: 调用 create_trade_partitions 预建当天及未来若干天的逐笔成交分区，并为仍滞留在 market_trades_default 的日期补建分区
+- expired_partitions: 按保留策略计算到期的子分区（含上次归档失败遗留的已分离表）
+- expired_trade_partitions: 计算到期的逐笔成交日分区
+- archive_and_drop: 分离子分区 -> 以 gzip 压缩 CSV 归档到本地 -> 删除
+"""
+
+import gzip
+import os
+import re
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from services.config_cache import system_config_cache
+
+RETENTION_GROUPS = {
+    "1m": ("1m",),
+    "minute": ("3m", "5m", "15m", "30m"),
+    "hour": ("1h", "2h", "4h", "6h", "8h", "12h"),
+    "day": ("1d", "3d", "1w", "1M"),
+}
+DEFAULT_RETENTION_DAYS: Dict[str, Optional[int]] = {"1m": 90, "minute": 365, "hour": 730, "day": None}
+DEFAULT_TRADE_RETENTION_DAYS = 30
+
+_LEAF_RE = re.compile(r"^kline_data_y(\d{4})m(\d{2})_(1m|minute|hour|day)$")
+_TRADE_LEAF_RE = re.compile(r"^market_trades_p(\d{4})(\d{2})(\d{2})$")
+_GROUP_OF = {tf: group for group, tfs in RETENTION_GROUPS.items() for tf in tfs}
+
+# 进程内：kline_data 是否为分区表、已确认存在分区的月份
+_partitioned: Optional[bool] = None
+_ready_months: set = set()
+
+
+def _add_months(d: date, n: int) -> date:
+    y, m = divmod(d.month - 1 + n, 12)
+    return date(d.year + y, m + 1, 1)
+
+
+def parse_retention_policy(value: Any) -> Dict[str, Optional[int]]:
+    policy = dict(DEFAULT_RETENTION_DAYS)
+    if isinstance(value, dict):
+        for k, v in value.items():
+            policy[str(k)] = int(v) if v is not None else None
+    return policy
+
+
+async def load_retention_policy() -> Dict[str, Optional[int]]:
+    try:
+        return parse_retention_policy(await system_config_cache.get('market.retention.days'))
+    except Exception:
+        return dict(DEFAULT_RETENTION_DAYS)
+
+
+def expiry_cutoff(timeframe: str, policy: Dict[str, Optional[int]], today: Optional[date] = None) -> Optional[datetime]:
+    """与 expired_partitions 同一判定：早于返回时刻的K线所在月子分区已在保留期之外；永久保留或无对应子分区时为 None"""
+    group = _GROUP_OF.get(timeframe)
+    days = policy.get(group) if group is not None else None
+    if days is None:
+        return None
+    # 月分区 [m, m+1) 到期当且仅当 m+1 <= today - days，即 m 早于 today - days 所在月的月初
+    limit = (today or date.today()) - timedelta(days=int(days))
+    return datetime(limit.year, limit.month, 1)
+
+
+def split_expired(rows: List[Dict[str, Any]], policy: Dict[str, Optional[int]],
+                  today: Optional[date] = None) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    today = today or date.today()
+    cutoffs = {tf: expiry_cutoff(tf, policy, today) for tf in {r["tf"] for r in rows}}
+    kept, expired = [], []
+    for r in rows:
+        cutoff = cutoffs[r["tf"]]
+        (expired if cutoff is not None and r["ot"] < cutoff else kept).append(r)
+    return kept, expired
+
+
+def has_partition(timeframe: str) -> bool:
+    return timeframe in _GROUP_OF
+
+
+def split_unpartitioned(rows: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    kept, rejected = [], []
+    for r in rows:
+        (kept if has_partition(r["tf"]) else rejected).append(r)
+    return kept, rejected
+
+
+async def kline_partitioned(session: AsyncSession) -> bool:
+    """is_partitioned 的进程内缓存版本（写入路径使用）"""
+    global _partitioned
+    if _partitioned is None:
+        _partitioned = await is_partitioned(session)
+    return _partitioned
+
+
+async def ensure_row_partitions(session: AsyncSession, rows: List[Dict[str, Any]]) -> None:
+    """应在 split_expired 之后调用"""
+    await ensure_month_partitions(session, {date(r["ot"].year, r["ot"].month, 1) for r in rows})
+
+
+async def ensure_span_partitions(session: AsyncSession, spans: Iterable[Tuple[datetime, datetime]]) -> None:
+    """列式批次版本：spans 为各批次的 (最早, 最晚) open_time，区间内每个月都建分区"""
+    months = set()
+    for first, last in spans:
+        m, end = date(first.year, first.month, 1), date(last.year, last.month, 1)
+        while m <= end:
+            months.add(m)
+            m = _add_months(m, 1)
+    await ensure_month_partitions(session, months)
+
+
+async def ensure_month_partitions(session: AsyncSession, months: Set[date]) -> None:
+    """只为尚不存在的月分区调用 create_kline_partitions（已存在的月份不重建已归档的子分区）"""
+    if not months or not await kline_partitioned(session):
+        return
+    months = set(months) - _ready_months
+    if not months:
+        return
+    names = {f"kline_data_y{m.year:04d}m{m.month:02d}": m for m in months}
+    res = await session.execute(text("SELECT relname FROM pg_class WHERE relname = ANY(:n)"), {"n": list(names)})
+    existing = {row.relname for row in res.fetchall()}
+    missing = [m for name, m in names.items() if name not in existing]
+    for m in sorted(missing):
+        await session.execute(text("SELECT create_kline_partitions(:m)"), {"m": m})
+    if missing:
+        await session.commit()
+    _ready_months.update(months)
+
+
+async def is_partitioned(session: AsyncSession, table: str = "kline_data") -> bool:
+    res = await session.execute(text("SELECT relkind::text AS relkind FROM pg_class WHERE relname = :t"), {"t": table})
+    row = res.first()
+    return bool(row) and row.relkind == 'p'
+
+
+async def ensure_future_partitions(session: AsyncSession, months_ahead: int = 3) -> List[str]:
+    """预建当月及未来月份；另为仍滞留在 kline_data_default 的月份建分区（函数会把这些行移入新分区）"""
+    first = date.today().replace(day=1)
+    months = [_add_months(first, i) for i in range(months_ahead + 1)]
+    try:
+        res = await session.execute(text("SELECT DISTINCT date_trunc('month', open_time)::date AS m FROM kline_data_default"))
+        months += [row.m for row in res.fetchall() if row.m not in months]
+    except Exception:
+        await session.rollback()
+    created = []
+    for m in sorted(months):
+        await session.execute(text("SELECT create_kline_partitions(:m)"), {"m": m})
+        created.append(f"kline_data_y{m.year:04d}m{m.month:02d}")
+    await session.commit()
+    return created
+
+
+async def ensure_trade_partitions(session: AsyncSession, days_ahead: int = 7) -> List[str]:
+    """预建当天及未来若干天；另为仍滞留在 market_trades_default 的日期建分区（函数会把这些行移入新分区，过期的随后归档删除）"""
+    today = date.today()
+    days = [today + timedelta(days=i) for i in range(days_ahead + 1)]
+    try:
+        res = await session.execute(text("SELECT DISTINCT timestamp::date AS d FROM market_trades_default"))
+        days += [row.d for row in res.fetchall() if row.d not in days]
+    except Exception:
+        await session.rollback()
+    created = []
+    for d in sorted(days):
+        await session.execute(text("SELECT create_trade_partitions(:d)"), {"d": d})
+        created.append(f"market_trades_p{d:%Y%m%d}")
+    await session.commit()
+    return created
+
+
+async def expired_partitions(session: AsyncSession, policy: Dict[str, Optional[int]],
+                             today: Optional[date] = None) -> List[Dict[str, Any]]:
+    today = today or date.today()
+    res = await session.execute(text(
+        """
+        SELECT c.relname AS name, p.relname AS parent
+        FROM pg_class c
+        LEFT JOIN pg_inherits i ON i.inhrelid = c.oid
+        LEFT JOIN pg_class p ON p.oid = i.inhparent
+        WHERE c.relkind = 'r' AND c.relname LIKE 'kline\\_data\\_y%'
+        """
+    ))
+    out = []
+    for row in res.fetchall():
+        mt = _LEAF_RE.match(row.name)
+        if not mt:
+            continue
+        group = mt.group(3)
+        days = policy.get(group, DEFAULT_RETENTION_DAYS.get(group))
+        if days is None:
+            continue
+        month_end = _add_months(date(int(mt.group(1)), int(mt.group(2)), 1), 1)
+        if month_end <= today - timedelta(days=int(days)):
+            out.append({"name": row.name, "parent": row.parent, "group": group, "month_end": month_end.isoformat()})
+    return sorted(out, key=lambda x: x["name"])
+
+
+async def expired_trade_partitions(session: AsyncSession, days: Optional[int],
+                                   today: Optional[date] = None) -> List[Dict[str, Any]]:
+    if days is None:
+        return []
+    today = today or date.today()
+    res = await session.execute(text(
+        """
+        SELECT c.relname AS name, p.relname AS parent
+        FROM pg_class c
+        LEFT JOIN pg_inherits i ON i.inhrelid = c.oid
+        LEFT JOIN pg_class p ON p.oid = i.inhparent
+        WHERE c.relkind = 'r' AND c.relname LIKE 'market\\_trades\\_p%'
+        """
+    ))
+    out = []
+    for row in res.fetchall():
+        mt = _TRADE_LEAF_RE.match(row.name)
+        if not mt:
+            continue
+        day_end = date(int(mt.group(1)), int(mt.group(2)), int(mt.group(3))) + timedelta(days=1)
+        if day_end <= today - timedelta(days=int(days)):
+            out.append({"name": row.name, "parent": row.parent, "group": "trades", "day_end": day_end.isoformat()})
+    return sorted(out, key=lambda x: x["name"])
+
+
+async def archive_and_drop(session: AsyncSession, partition: Dict[str, Any], archive_dir: str) -> Dict[str, Any]:
+    """分离后归档再删除；归档失败时保留已分离的表，下次维护重试"""
+    name = partition["name"]
+    if partition.get("parent"):
+        await session.execute(text(f'ALTER TABLE "{partition["parent"]}" DETACH PARTITION "{name}"'))
+        await session.commit()
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir, f"{name}.csv.gz")
+    tmp = path + ".part"
+    conn = await session.connection()
+    raw = await conn.get_raw_connection()
+    with gzip.open(tmp, "wb", compresslevel=6) as f:
+        await raw.driver_connection.copy_from_table(name, output=f, format="csv", header=True)
+    os.replace(tmp, path)
+    res = await session.execute(text(f'SELECT COUNT(*) AS n FROM "{name}"'))
+    rows = int(res.first().n or 0)
+    await session.execute(text(f'DROP TABLE "{name}"'))
+    await session.commit()
+    return {"partition": name, "rows": rows, "archive": path, "bytes": os.path.getsize(path)}
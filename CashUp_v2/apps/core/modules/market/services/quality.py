@@ -0,0 +1,335 @@
+"""
+K线数据质量校验与隔离
+函数集注释：
+- check_series: 单序列向量化规则（NumPy），返回每根K线的原因位掩码：
+    价格非正/非有限、OHLC 不一致（high 低于 open/close/low 或 low 高于 open/close）、成交量为负或缺失、
+    零成交量却有价格波动、同批重复 open_time（保留最后到达的一根）、open_time 未对齐时间框、
+    相对滚动中位数的离群价（滚动 MAD，窗口含该序列库中此前的收盘价）
+- validate_rows: 按序列分组校验入库批次（ex/sym/tf/ot/o/h/l/c/v 字段），返回 (通过行, [(隔离行, 原因列表)], 统计)；
+    同批重复 open_time 中被取代的副本计入 dropped 并丢弃，不写入隔离表
+- validate_batches: 同一规则直接作用于列式批次（KlineBatch），返回通过校验的子批次，不逐行构造字典
+- load_history / load_series_history: 一次查询取本批各序列起点之前最近 MAD_WINDOW 根收盘价，作为离群检测的基准
+- quarantine_rows: 可疑K线写入 kline_quarantine（同一根重复出现时更新内容并累计次数）；缺口扫描把隔离表中的 open_time 视为已覆盖，
+    不再反复回补同一根坏K线
+- record_quality / quality_scores: 按交易所、按天在 Redis 累计 校验数/隔离数/丢弃的重复数/各原因计数，得分 = 1 - 隔离数/校验数
+- list_quarantine: 隔离记录查询
+由 ingest.upsert_klines 在写库前调用，采集、回补与核对写入均经过校验
+"""
+
+import math
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.redis import get_redis
+from modules.market.services.timeframes import timeframe_seconds
+
+REASONS = (
+    "non_positive_price",
+    "ohlc_inconsistent",
+    "invalid_volume",
+    "zero_volume_move",
+    "duplicate_open_time",
+    "misaligned_open_time",
+    "price_outlier",
+)
+_BIT = {name: 1 << i for i, name in enumerate(REASONS)}
+
+# 滚动 MAD：窗口根数、最少基准根数、稳健 z 分数阈值
+MAD_WINDOW = 30
+MAD_MIN_WINDOW = 10
+MAD_THRESHOLD = 20.0
+# 对数偏离下限：偏离滚动中位数不足 2 倍（或 1/2）的不判离群，避免行情剧烈时误伤真实K线
+MIN_LOG_DEVIATION = math.log(2.0)
+# 近乎不动的序列（稳定币）MAD 接近 0，尺度取下限
+MIN_LOG_SCALE = 0.005
+# 只对日线以下检查 open_time 对齐（日线及以上的日界因交易所时区而异）
+ALIGN_MAX_SECONDS = 43200
+
+QUALITY_DAYS_TTL = 8 * 86400
+
+Series = Tuple[str, str, str]
+
+
+def _ms(ts: datetime) -> int:
+    return int(ts.timestamp() * 1000)
+
+
+def _f(v) -> float:
+    return float("nan") if v is None else float(v)
+
+
+def reasons_of(mask: int) -> List[str]:
+    return [name for name in REASONS if mask & _BIT[name]]
+
+
+def _rolling_outliers(logc: np.ndarray, logh: np.ndarray, logl: np.ndarray, history: np.ndarray) -> np.ndarray:
+    """logc 等按 open_time 升序；history 为此前的对数收盘价（升序）；返回离群布尔数组"""
+    n = len(logc)
+    w = MAD_WINDOW
+    # 前补 NaN 使每根K线都有 w 长的尾随窗口（不含自身）
+    pad = max(0, w - len(history))
+    combined = np.concatenate([np.full(pad, np.nan), history[-w:], logc])
+    windows = sliding_window_view(combined, w)[:n]
+    valid = np.sum(~np.isnan(windows), axis=1) >= MAD_MIN_WINDOW
+    out = np.zeros(n, dtype=bool)
+    if not valid.any():
+        return out
+    win = windows[valid]
+    med = np.nanmedian(win, axis=1)
+    mad = np.nanmedian(np.abs(win - med[:, None]), axis=1)
+    scale = np.maximum(1.4826 * mad, MIN_LOG_SCALE)
+    dev = np.nanmax(np.abs(np.stack([logc[valid], logh[valid], logl[valid]]) - med), axis=0)
+    out[valid] = (dev > MIN_LOG_DEVIATION) & (dev / scale > MAD_THRESHOLD)
+    return out
+
+
+def check_series(ot_ms: np.ndarray, o: np.ndarray, h: np.ndarray, l: np.ndarray, c: np.ndarray, v: np.ndarray,
+                 step_seconds: Optional[int] = None, history: Optional[np.ndarray] = None) -> np.ndarray:
+    """输入为同一序列、按到达顺序排列的数组；history 为库中此前收盘价（升序，非对数）"""
+    n = len(ot_ms)
+    mask = np.zeros(n, dtype=np.int64)
+    if n == 0:
+        return mask
+    prices = np.stack([o, h, l, c])
+    bad_price = ~np.all(np.isfinite(prices) & (prices > 0), axis=0)
+    mask[bad_price] |= _BIT["non_positive_price"]
+    with np.errstate(invalid="ignore"):
+        incons = (h < np.maximum(np.maximum(o, c), l)) | (l > np.minimum(o, c))
+        mask[incons & ~bad_price] |= _BIT["ohlc_inconsistent"]
+        mask[~np.isfinite(v) | (v < 0)] |= _BIT["invalid_volume"]
+        mask[(v == 0) & (h > l)] |= _BIT["zero_volume_move"]
+    # 重复 open_time：反转后 np.unique 取首次出现，即原顺序中最后到达的一根
+    _, last_idx = np.unique(ot_ms[::-1], return_index=True)
+    keep = np.zeros(n, dtype=bool)
+    keep[n - 1 - last_idx] = True
+    mask[~keep] |= _BIT["duplicate_open_time"]
+    if step_seconds and step_seconds <= ALIGN_MAX_SECONDS:
+        mask[ot_ms % (step_seconds * 1000) != 0] |= _BIT["misaligned_open_time"]
+    # 离群检测只在其余规则通过的K线上按时间顺序进行
+    cand = np.flatnonzero(mask == 0)
+    if len(cand):
+        order = cand[np.argsort(ot_ms[cand], kind="stable")]
+        hist = np.log(history[np.isfinite(history) & (history > 0)]) if history is not None and len(history) else np.empty(0)
+        outl = _rolling_outliers(np.log(c[order]), np.log(h[order]), np.log(l[order]), hist)
+        mask[order[outl]] |= _BIT["price_outlier"]
+    return mask
+
+
+def _empty_stats() -> Dict[str, Any]:
+    return {"checked": {}, "quarantined": {}, "dropped": {}, "reasons": {}}
+
+
+def _tally(stats: Dict[str, Any], exchange: str, masks: np.ndarray, dup: np.ndarray) -> None:
+    stats["checked"][exchange] = stats["checked"].get(exchange, 0) + len(masks)
+    for bucket, sel in (("quarantined", (masks != 0) & ~dup), ("dropped", dup)):
+        n = int(np.count_nonzero(sel))
+        if n:
+            stats[bucket][exchange] = stats[bucket].get(exchange, 0) + n
+    for name in REASONS:
+        n = int(np.count_nonzero(masks & _BIT[name]))
+        if n:
+            k = (exchange, name)
+            stats["reasons"][k] = stats["reasons"].get(k, 0) + n
+
+
+def validate_rows(rows: List[Dict[str, Any]], history: Optional[Dict[Series, np.ndarray]] = None
+                  ) -> Tuple[List[Dict[str, Any]], List[Tuple[Dict[str, Any], List[str]]], Dict[str, Any]]:
+    groups: Dict[Series, List[int]] = {}
+    for i, r in enumerate(rows):
+        groups.setdefault((r["ex"], r["sym"], r["tf"]), []).append(i)
+    masks = np.zeros(len(rows), dtype=np.int64)
+    stats = _empty_stats()
+    for key, idx in groups.items():
+        sel = [rows[i] for i in idx]
+        masks[idx] = check_series(
+            np.array([_ms(r["ot"]) for r in sel], dtype=np.int64),
+            np.array([_f(r["o"]) for r in sel]), np.array([_f(r["h"]) for r in sel]),
+            np.array([_f(r["l"]) for r in sel]), np.array([_f(r["c"]) for r in sel]),
+            np.array([_f(r["v"]) for r in sel]),
+            timeframe_seconds(key[2]), (history or {}).get(key),
+        )
+        _tally(stats, key[0], masks[idx], (masks[idx] & _BIT["duplicate_open_time"]) != 0)
+    # 同批重复中被后到者取代的副本直接丢弃：同一键保留的那根会写入 kline_data（或自身被隔离），副本不再写入隔离表
+    dup = (masks & _BIT["duplicate_open_time"]) != 0
+    clean = [r for r, m in zip(rows, masks) if m == 0]
+    bad = [(r, reasons_of(int(m))) for r, m, d in zip(rows, masks, dup) if m != 0 and not d]
+    return clean, bad, stats
+
+
+def validate_batches(items: List[Tuple[str, str, str, Any]], history: Optional[Dict[Series, np.ndarray]] = None
+                     ) -> Tuple[List[Tuple[str, str, str, Any]], List[Tuple[Dict[str, Any], List[str]]], Dict[str, Any]]:
+    """列式版本：items 为 (交易所, 交易对, 时间框, KlineBatch)，每个序列一项；返回通过校验的子批次，只为隔离的K线构造行字典"""
+    clean, bad = [], []
+    stats = _empty_stats()
+    for ex, sym, tf, batch in items:
+        masks = check_series(batch.open_time, batch.open, batch.high, batch.low, batch.close, batch.volume,
+                             timeframe_seconds(tf), (history or {}).get((ex, sym, tf)))
+        dup = (masks & _BIT["duplicate_open_time"]) != 0
+        _tally(stats, ex, masks, dup)
+        ok = masks == 0
+        if ok.all():
+            clean.append((ex, sym, tf, batch))
+            continue
+        if ok.any():
+            clean.append((ex, sym, tf, batch.take(ok)))
+        idx = np.flatnonzero(~ok & ~dup)
+        bad.extend(zip(batch.take(idx).rows(ex, sym, tf), (reasons_of(int(m)) for m in masks[idx])))
+    return clean, bad, stats
+
+
+async def load_history(session: AsyncSession, rows: List[Dict[str, Any]], window: int = MAD_WINDOW) -> Dict[Series, np.ndarray]:
+    firsts: Dict[Series, datetime] = {}
+    for r in rows:
+        key = (r["ex"], r["sym"], r["tf"])
+        if key not in firsts or r["ot"] < firsts[key]:
+            firsts[key] = r["ot"]
+    return await load_series_history(session, firsts, window)
+
+
+async def load_series_history(session: AsyncSession, firsts: Dict[Series, datetime],
+                              window: int = MAD_WINDOW) -> Dict[Series, np.ndarray]:
+    """firsts: 序列 -> 本批最早 open_time"""
+    if not firsts:
+        return {}
+    keys = list(firsts)
+    res = await session.execute(text(
+        """
+        SELECT s.ex, s.sym, s.tf, k.close
+        FROM unnest(CAST(:exs AS VARCHAR[]), CAST(:syms AS VARCHAR[]), CAST(:tfs AS VARCHAR[]), CAST(:bs AS TIMESTAMP[]))
+             AS s(ex, sym, tf, before)
+        CROSS JOIN LATERAL (
+            SELECT close, open_time FROM kline_data
+            WHERE exchange = s.ex AND symbol = s.sym AND timeframe = s.tf AND open_time < s.before
+            ORDER BY open_time DESC LIMIT :w
+        ) k
+        ORDER BY s.ex, s.sym, s.tf, k.open_time
+        """
+    ), {"exs": [k[0] for k in keys], "syms": [k[1] for k in keys], "tfs": [k[2] for k in keys],
+        "bs": [firsts[k] for k in keys], "w": window})
+    out: Dict[Series, List[float]] = {}
+    for ex, sym, tf, close in res.fetchall():
+        out.setdefault((ex, sym, tf), []).append(_f(close))
+    return {k: np.array(v) for k, v in out.items()}
+
+
+def _dec(v):
+    # DECIMAL(20, 8) 放不下的异常值（正是要隔离的那类）截断为 NULL，原因中已记录
+    try:
+        f = float(v)
+        return v if math.isfinite(f) and abs(f) < 1e12 else None
+    except (TypeError, ValueError):
+        return None
+
+
+async def quarantine_rows(session: AsyncSession, items: List[Tuple[Dict[str, Any], List[str]]]) -> None:
+    """与调用方同一事务写入，由调用方提交"""
+    if not items:
+        return
+    # 同批内同一根K线只写一次（executemany 的 ON CONFLICT 不能在一条语句里两次更新同一行）
+    latest: Dict[Tuple[str, str, str, datetime], Tuple[Dict[str, Any], List[str]]] = {}
+    for r, reasons in items:
+        latest[(r["ex"], r["sym"], r["tf"], r["ot"])] = (r, reasons)
+    await session.execute(text(
+        """
+        INSERT INTO kline_quarantine (exchange, symbol, timeframe, open_time, open, high, low, close, volume, reasons)
+        VALUES (:ex, :sym, :tf, :ot, :o, :h, :l, :c, :v, :reasons)
+        ON CONFLICT (exchange, symbol, timeframe, open_time)
+        DO UPDATE SET open=:o, high=:h, low=:l, close=:c, volume=:v, reasons=:reasons,
+                      seen_count=kline_quarantine.seen_count + 1, last_seen=CURRENT_TIMESTAMP
+        """
+    ), [{"ex": r["ex"], "sym": r["sym"], "tf": r["tf"], "ot": r["ot"], "o": _dec(r["o"]), "h": _dec(r["h"]),
+         "l": _dec(r["l"]), "c": _dec(r["c"]), "v": _dec(r["v"]), "reasons": ",".join(reasons)}
+        for r, reasons in latest.values()])
+
+
+def _day_key(exchange: str, day: datetime) -> str:
+    return f"market:quality:{exchange}:{day.strftime('%Y%m%d')}"
+
+
+async def record_quality(stats: Dict[str, Any]) -> None:
+    try:
+        r = await get_redis()
+        today = datetime.now()
+        pipe = r.pipeline(transaction=False)
+        for ex, n in stats["checked"].items():
+            key = _day_key(ex, today)
+            pipe.sadd("market:quality:exchanges", ex)
+            pipe.hincrby(key, "checked", n)
+            pipe.hincrby(key, "quarantined", stats["quarantined"].get(ex, 0))
+            pipe.hincrby(key, "dropped", stats["dropped"].get(ex, 0))
+            pipe.expire(key, QUALITY_DAYS_TTL)
+        for (ex, name), n in stats["reasons"].items():
+            pipe.hincrby(_day_key(ex, today), f"reason:{name}", n)
+        await pipe.execute()
+    except Exception:
+        pass
+
+
+def _s(v) -> str:
+    return v.decode() if isinstance(v, (bytes, bytearray)) else str(v)
+
+
+async def quality_scores(days: int = 7) -> Dict[str, Dict[str, Any]]:
+    r = await get_redis()
+    exchanges = sorted(_s(e) for e in (await r.smembers("market:quality:exchanges") or []))
+    today = datetime.now()
+    out: Dict[str, Dict[str, Any]] = {}
+    for ex in exchanges:
+        checked = quarantined = dropped = 0
+        reasons: Dict[str, int] = {}
+        for d in range(days):
+            h = await r.hgetall(_day_key(ex, today - timedelta(days=d))) or {}
+            for k, v in h.items():
+                k, v = _s(k), int(_s(v))
+                if k == "checked":
+                    checked += v
+                elif k == "quarantined":
+                    quarantined += v
+                elif k == "dropped":
+                    dropped += v
+                elif k.startswith("reason:"):
+                    reasons[k[7:]] = reasons.get(k[7:], 0) + v
+        out[ex] = {
+            "checked": checked,
+            "quarantined": quarantined,
+            "dropped": dropped,
+            "score": round(1 - quarantined / checked, 6) if checked else None,
+            "reasons": reasons,
+        }
+    return out
+
+
+async def list_quarantine(session: AsyncSession, exchange: Optional[str] = None, symbol: Optional[str] = None,
+                          limit: int = 100) -> List[Dict[str, Any]]:
+    conds, params = [], {"limit": limit}
+    if exchange:
+        conds.append("exchange = :ex")
+        params["ex"] = exchange
+    if symbol:
+        conds.append("symbol = :sym")
+        params["sym"] = symbol
+    where = ("WHERE " + " AND ".join(conds)) if conds else ""
+    res = await session.execute(text(
+        f"""
+        SELECT exchange, symbol, timeframe, open_time, open, high, low, close, volume, reasons, seen_count, first_seen, last_seen
+        FROM kline_quarantine {where}
+        ORDER BY last_seen DESC LIMIT :limit
+        """
+    ), params)
+    return [{
+        "exchange": row.exchange, "symbol": row.symbol, "timeframe": row.timeframe,
+        "open_time": row.open_time.isoformat(),
+        "open": _num(row.open), "high": _num(row.high), "low": _num(row.low), "close": _num(row.close),
+        "volume": _num(row.volume), "reasons": row.reasons.split(","), "seen_count": row.seen_count,
+        "first_seen": row.first_seen.isoformat() if row.first_seen else None,
+        "last_seen": row.last_seen.isoformat() if row.last_seen else None,
+    } for row in res.fetchall()]
+
+
+def _num(v) -> Optional[float]:
+    return None if v is None else float(v)
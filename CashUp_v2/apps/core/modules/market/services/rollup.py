@@ -0,0 +1,110 @@
+"""
+1m K线聚合为更高时间框
+函数集注释：
+- ROLLUP_TARGETS: 可由 1m 派生的时间框
+- derived_timeframes: 根据采集配置决定哪些时间框改为本地聚合（需同时采集 1m）
+- rollup_range: 将 [since, until] 覆盖到的 1m K线按桶聚合（开=首、高=最大、低=最小、收=末、量=求和），写入 kline_data 且 source='rollup'
+- reconcile_series: 拉取交易所原生K线与已聚合的已收盘K线比对，不一致时以原生数据覆盖并记录差异
+"""
+
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from modules.market.services.ingest import upsert_klines
+from modules.market.services.timeframes import TIMEFRAME_SECONDS, floor_time
+
+ROLLUP_TARGETS = ('5m', '15m', '30m', '1h', '4h', '1d')
+
+# 桶按纪元起点对齐（与 timeframes.floor_time 一致）
+_ORIGIN = "TIMESTAMP '1970-01-01'"
+
+
+def derived_timeframes(timeframes: Iterable[str]) -> List[str]:
+    tfs = list(timeframes)
+    if '1m' not in tfs:
+        return []
+    return [tf for tf in tfs if tf in ROLLUP_TARGETS]
+
+
+async def rollup_range(session: AsyncSession, exchange: str, symbol: str, since: datetime, until: datetime,
+                       targets: Iterable[str] = ROLLUP_TARGETS) -> Dict[str, int]:
+    """增量聚合：只重算 [since, until] 所在的桶；交易所原生K线（source='exchange'）不被覆盖"""
+    written: Dict[str, int] = {}
+    for tf in targets:
+        secs = TIMEFRAME_SECONDS.get(tf)
+        if not secs:
+            continue
+        start = floor_time(since, tf)
+        end = floor_time(until, tf) + timedelta(seconds=secs)
+        res = await session.execute(text(
+            f"""
+            INSERT INTO kline_data (exchange, symbol, timeframe, open_time, open, high, low, close, volume, source)
+            SELECT exchange, symbol, :tf, bucket,
+                   (array_agg(open ORDER BY open_time ASC))[1],
+                   MAX(high), MIN(low),
+                   (array_agg(close ORDER BY open_time DESC))[1],
+                   SUM(volume), 'rollup'
+            FROM (
+                SELECT exchange, symbol, open_time, open, high, low, close, volume,
+                       {_ORIGIN} + FLOOR(EXTRACT(EPOCH FROM (open_time - {_ORIGIN})) / :secs) * :secs * INTERVAL '1 second' AS bucket
+                FROM kline_data
+                WHERE exchange=:ex AND symbol=:sym AND timeframe='1m' AND open_time >= :start AND open_time < :end
+            ) m
+            GROUP BY exchange, symbol, bucket
+            ON CONFLICT (exchange, symbol, timeframe, open_time)
+            DO UPDATE SET open=EXCLUDED.open, high=EXCLUDED.high, low=EXCLUDED.low, close=EXCLUDED.close, volume=EXCLUDED.volume
+            WHERE kline_data.source = 'rollup'
+            """
+        ), {"ex": exchange, "sym": symbol, "tf": tf, "secs": secs, "start": start, "end": end})
+        written[tf] = int(res.rowcount or 0)
+    await session.commit()
+    return written
+
+
+def _differs(a, b, tolerance: float) -> bool:
+    a = float(a or 0)
+    b = float(b or 0)
+    scale = max(abs(a), abs(b), 1e-12)
+    return abs(a - b) / scale > tolerance
+
+
+async def reconcile_series(session: AsyncSession, adapter, exchange: str, symbol: str, timeframe: str,
+                           limit: int = 48, tolerance: float = 1e-6,
+                           volume_tolerance: float = 1e-3) -> Dict[str, Any]:
+    """比对最近 limit 根已收盘的聚合K线与交易所原生K线"""
+    native = await adapter.get_klines(symbol=symbol, interval=timeframe, limit=limit)
+    # 最后一根可能尚未收盘，不参与比对
+    cutoff = floor_time(datetime.now(), timeframe)
+    native = {k.open_time: k for k in native if k.open_time < cutoff}
+    result: Dict[str, Any] = {"exchange": exchange, "symbol": symbol, "timeframe": timeframe,
+                              "compared": 0, "mismatched": 0, "mismatches": []}
+    if not native:
+        return result
+    res = await session.execute(text(
+        "SELECT open_time, open, high, low, close, volume FROM kline_data WHERE exchange=:ex AND symbol=:sym AND timeframe=:tf AND source='rollup' AND open_time >= :start AND open_time <= :end"
+    ), {"ex": exchange, "sym": symbol, "tf": timeframe, "start": min(native), "end": max(native)})
+    fixes = []
+    for row in res.fetchall():
+        k = native.get(row.open_time)
+        if k is None:
+            continue
+        result["compared"] += 1
+        fields = []
+        for name, ours, theirs in (("open", row.open, k.open_price), ("high", row.high, k.high_price),
+                                   ("low", row.low, k.low_price), ("close", row.close, k.close_price)):
+            if _differs(ours, theirs, tolerance):
+                fields.append(name)
+        if _differs(row.volume, k.volume, volume_tolerance):
+            fields.append("volume")
+        if fields:
+            result["mismatched"] += 1
+            result["mismatches"].append({"open_time": row.open_time.isoformat(), "fields": fields})
+            fixes.append({"ex": exchange, "sym": symbol, "tf": timeframe, "ot": k.open_time, "o": k.open_price,
+                          "h": k.high_price, "l": k.low_price, "c": k.close_price, "v": k.volume})
+    if fixes:
+        # 以交易所原生数据为准（写入后 source 变为 exchange，之后的聚合不再覆盖）
+        await upsert_klines(session, fixes)
+    return result
@@ -0,0 +1,29 @@
+"""
+时间框工具
+函数集注释：
+- TIMEFRAME_SECONDS: 固定长度时间框对应秒数（1M 月线长度不固定，不参与缺口与聚合计算）
+- timeframe_seconds: 查询时间框秒数，未知返回 None
+- floor_time: 将时间向下对齐到时间框边界（按纪元对齐；周线对齐到周一）
+"""
+
+from datetime import datetime, timedelta
+from typing import Optional
+
+TIMEFRAME_SECONDS = {
+    '1m': 60, '3m': 180, '5m': 300, '15m': 900, '30m': 1800,
+    '1h': 3600, '2h': 7200, '4h': 14400, '6h': 21600, '8h': 28800, '12h': 43200,
+    '1d': 86400, '3d': 259200, '1w': 604800,
+}
+
+
+def timeframe_seconds(timeframe: str) -> Optional[int]:
+    return TIMEFRAME_SECONDS.get(timeframe)
+
+
+def floor_time(ts: datetime, timeframe: str) -> datetime:
+    step = TIMEFRAME_SECONDS[timeframe]
+    epoch = datetime(1970, 1, 1, tzinfo=ts.tzinfo)
+    # 1970-01-01 为周四，周线向后偏移 4 天对齐到周一
+    offset = 345600 if timeframe == '1w' else 0
+    secs = int((ts - epoch).total_seconds()) - offset
+    return epoch + timedelta(seconds=secs - secs % step + offset)
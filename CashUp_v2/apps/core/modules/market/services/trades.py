@@ -0,0 +1,370 @@
+"""
+逐笔成交入库
+函数集注释：
+- CONTIGUOUS_TRADE_IDS: 成交ID按交易对连续递增的交易所，据ID跳变检测序列缺口。目前只有 binance（<symbol>@trade 的 t）；
+  gateio 的成交ID跨交易对全局递增，只做去重与乱序检测；bybit / kraken 适配器未实现成交推送，不订阅
+- TradeBuffer: 内存缓冲：按 交易所×交易对 去重（最近成交ID窗口）、序列缺口/乱序检测、成交速率统计
+- write_trades: 批量写入 market_trades（大批量 COPY 进 UNLOGGED 暂存表 trade_staging 再合并，暂存表由 init_database_v2.sql /
+  scripts/migrate_trades_partitioning.sql 创建），冲突即忽略
+- TradeIngestor: 订阅成交流（仅 supports_trade_stream 的适配器，其余记入 unsupported）-> 缓冲 -> 每秒批量写库，并经 RedisBatch 发布每交易对成交速率、缺口指标与实时 ticker 推送
+- recent_trades / trade_metrics: 查询接口使用的读取函数
+"""
+
+import asyncio
+import json
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, Callable, Deque, Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.redis import RedisBatch, get_redis
+from services.live import publish_live, ticker_topic
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+CONTIGUOUS_TRADE_IDS = {"binance"}
+
+# 超过该行数走 COPY 路径
+COPY_THRESHOLD_ROWS = 500
+
+STAGING_COLUMNS = ["batch_id", "exchange", "symbol", "trade_id", "price", "quantity", "side", "timestamp"]
+
+TPS_KEY = "market:trades:tps"
+METRICS_KEY = "market:trades:metrics:last"
+GAPS_KEY = "market:trades:gaps"
+
+# (exchange, symbol, trade_id, price, quantity, side, timestamp)
+TradeRow = Tuple[str, str, str, Any, Any, str, datetime]
+
+
+class _SeriesState:
+    __slots__ = ("seen", "recent", "last_id", "window", "total", "dupes", "gaps", "missing", "out_of_order", "last_ts",
+                 "last_price", "last_qty", "last_side")
+
+    def __init__(self):
+        self.seen: Set[str] = set()
+        self.recent: Deque[str] = deque()
+        self.last_id: Optional[int] = None
+        self.window = 0
+        self.total = 0
+        self.dupes = 0
+        self.gaps = 0
+        self.missing = 0
+        self.out_of_order = 0
+        self.last_ts: Optional[datetime] = None
+        self.last_price = None
+        self.last_qty = None
+        self.last_side = ""
+
+
+def _norm_symbol(symbol: str) -> str:
+    return str(symbol).replace('/', '_')
+
+
+def _trade_id(t) -> str:
+    tid = str(getattr(t, "id", "") or "")
+    if tid:
+        return tid
+    # 无成交ID时以 时间戳:价格:数量 合成，重复推送仍可去重
+    ts = getattr(t, "timestamp", None)
+    ms = int(ts.timestamp() * 1000) if isinstance(ts, datetime) else 0
+    return f"{ms}:{t.price}:{t.quantity}"
+
+
+class TradeBuffer:
+    """逐笔成交内存缓冲
+
+    只在事件循环线程内调用，无需加锁；去重窗口按序列保留最近 dedupe_window 个成交ID，
+    pending 超过 max_pending（写库持续失败）时丢弃最旧的行并计数。
+    """
+
+    def __init__(self, dedupe_window: int = 5000, max_pending: int = 200_000):
+        self.dedupe_window = dedupe_window
+        self.max_pending = max_pending
+        self.pending: Deque[TradeRow] = deque()
+        self.series: Dict[Tuple[str, str], _SeriesState] = {}
+        self.gap_events: List[Dict[str, Any]] = []
+        self.dropped = 0
+        self._window_started = time.monotonic()
+
+    def add(self, exchange: str, trades: Iterable[Any]) -> int:
+        accepted = 0
+        contiguous = exchange in CONTIGUOUS_TRADE_IDS
+        for t in trades:
+            symbol = _norm_symbol(t.symbol)
+            key = (exchange, symbol)
+            st = self.series.get(key)
+            if st is None:
+                st = self.series.setdefault(key, _SeriesState())
+            tid = _trade_id(t)
+            if tid in st.seen:
+                st.dupes += 1
+                continue
+            st.seen.add(tid)
+            st.recent.append(tid)
+            if len(st.recent) > self.dedupe_window:
+                st.seen.discard(st.recent.popleft())
+            try:
+                n = int(tid)
+            except ValueError:
+                n = None
+            if n is not None:
+                if st.last_id is not None:
+                    if n <= st.last_id:
+                        st.out_of_order += 1
+                    elif contiguous and n > st.last_id + 1:
+                        st.gaps += 1
+                        st.missing += n - st.last_id - 1
+                        self.gap_events.append({
+                            "exchange": exchange, "symbol": symbol,
+                            "from_id": st.last_id + 1, "to_id": n - 1, "missing": n - st.last_id - 1,
+                            "detected_at": int(time.time()),
+                        })
+                if st.last_id is None or n > st.last_id:
+                    st.last_id = n
+            side = getattr(t.side, "value", t.side)
+            self.pending.append((exchange, symbol, tid, t.price, t.quantity, str(side or ""), t.timestamp))
+            st.window += 1
+            st.total += 1
+            st.last_ts = t.timestamp
+            st.last_price, st.last_qty, st.last_side = t.price, t.quantity, str(side or "")
+            accepted += 1
+        while len(self.pending) > self.max_pending:
+            self.pending.popleft()
+            self.dropped += 1
+        return accepted
+
+    def drain(self) -> List[TradeRow]:
+        rows = list(self.pending)
+        self.pending.clear()
+        return rows
+
+    def requeue(self, rows: List[TradeRow]) -> None:
+        """写库失败的行放回队首，下一个周期重试"""
+        self.pending.extendleft(reversed(rows))
+        while len(self.pending) > self.max_pending:
+            self.pending.popleft()
+            self.dropped += 1
+
+    def take_gap_events(self) -> List[Dict[str, Any]]:
+        events, self.gap_events = self.gap_events, []
+        return events
+
+    def rates(self) -> Dict[str, Dict[str, Any]]:
+        """返回自上次调用以来各序列的成交速率（笔/秒）与累计计数，并开始新窗口"""
+        now = time.monotonic()
+        elapsed = max(now - self._window_started, 1e-6)
+        self._window_started = now
+        out = {}
+        for (ex, sym), st in self.series.items():
+            out[f"{ex}:{sym}"] = {
+                "tps": round(st.window / elapsed, 2),
+                "total": st.total,
+                "dupes": st.dupes,
+                "gaps": st.gaps,
+                "missing": st.missing,
+                "out_of_order": st.out_of_order,
+                "last_trade_at": st.last_ts.isoformat() if isinstance(st.last_ts, datetime) else None,
+                "last_price": float(st.last_price) if st.last_price is not None else None,
+                "last_quantity": float(st.last_qty) if st.last_qty is not None else None,
+                "last_side": st.last_side,
+            }
+            st.window = 0
+        return out
+
+
+def _num(v):
+    if v is None or isinstance(v, Decimal):
+        return v
+    return Decimal(str(v))
+
+
+async def write_trades(session: AsyncSession, rows: List[TradeRow],
+                       copy_threshold: int = COPY_THRESHOLD_ROWS) -> Dict[str, Any]:
+    """写入逐笔成交并提交；主键冲突（重复推送/重连重放）直接忽略"""
+    started = time.monotonic()
+    path = "copy" if len(rows) >= copy_threshold else "executemany"
+    if rows:
+        if path == "copy":
+            batch_id = uuid.uuid4()
+            records = [(batch_id, ex, sym, tid, _num(p), _num(q), side, ts) for ex, sym, tid, p, q, side, ts in rows]
+            conn = await session.connection()
+            raw = await conn.get_raw_connection()
+            await raw.driver_connection.copy_records_to_table("trade_staging", records=records, columns=STAGING_COLUMNS)
+            await session.execute(text(
+                """
+                INSERT INTO market_trades (exchange, symbol, trade_id, price, quantity, side, timestamp)
+                SELECT exchange, symbol, trade_id, price, quantity, side, timestamp
+                FROM trade_staging WHERE batch_id = :b
+                ON CONFLICT DO NOTHING
+                """
+            ), {"b": batch_id})
+            await session.execute(text("DELETE FROM trade_staging WHERE batch_id = :b"), {"b": batch_id})
+        else:
+            await session.execute(text(
+                """
+                INSERT INTO market_trades (exchange, symbol, trade_id, price, quantity, side, timestamp)
+                VALUES (:ex, :sym, :tid, :p, :q, :side, :ts)
+                ON CONFLICT DO NOTHING
+                """
+            ), [{"ex": ex, "sym": sym, "tid": tid, "p": _num(p), "q": _num(q), "side": side, "ts": ts}
+                for ex, sym, tid, p, q, side, ts in rows])
+        await session.commit()
+    seconds = time.monotonic() - started
+    return {
+        "path": path,
+        "rows": len(rows),
+        "seconds": round(seconds, 4),
+        "rows_per_sec": int(len(rows) / seconds) if seconds > 0 else 0,
+    }
+
+
+class TradeIngestor:
+    """成交流 -> 缓冲 -> 定时批量写库"""
+
+    def __init__(self, session_factory: Callable[[], Any], flush_interval: float = 1.0,
+                 buffer: Optional[TradeBuffer] = None):
+        self.session_factory = session_factory
+        self.flush_interval = flush_interval
+        self.buffer = buffer or TradeBuffer()
+        self.subscribed: List[str] = []
+        self.unsupported: List[str] = []
+        self.stats: Dict[str, Any] = {"flushes": 0, "rows_written": 0, "write_errors": 0, "last_flush": {}}
+
+    def callback_for(self, exchange: str):
+        async def _on_trades(trades):
+            if trades:
+                self.buffer.add(exchange, trades if isinstance(trades, list) else [trades])
+        return _on_trades
+
+    async def subscribe(self, mgr, symbols: Optional[List[str]] = None) -> List[str]:
+        """对支持成交推送的交易所逐交易对订阅；未指定 symbols 时使用交易所配置中的交易对"""
+        for name in mgr.get_exchange_names():
+            adapter = mgr.get_exchange(name)
+            client = getattr(adapter, "exchange", None)
+            sub = getattr(client, "subscribe_trades", None)
+            if sub is None or not getattr(client, "supports_trade_stream", False):
+                self.unsupported.append(name)
+                continue
+            local_symbols = symbols or (adapter.config or {}).get("symbols", [])
+            for sym in local_symbols:
+                try:
+                    await sub(str(sym).replace('_', '/'), self.callback_for(name))
+                    self.subscribed.append(f"{name}:{_norm_symbol(sym)}")
+                except Exception as e:
+                    logger.error(f"订阅成交流失败 {name}:{sym}: {e}")
+        return self.subscribed
+
+    async def flush(self) -> Dict[str, Any]:
+        rows = self.buffer.drain()
+        result: Dict[str, Any] = {"rows": 0}
+        if rows:
+            try:
+                async with self.session_factory() as session:
+                    result = await write_trades(session, rows)
+                self.stats["rows_written"] += len(rows)
+            except Exception as e:
+                self.buffer.requeue(rows)
+                self.stats["write_errors"] += 1
+                result = {"rows": 0, "error": str(e), "requeued": len(rows)}
+                logger.error(f"逐笔成交写库失败，{len(rows)} 行待重试: {e}")
+        self.stats["flushes"] += 1
+        self.stats["last_flush"] = result
+        await self._publish()
+        return result
+
+    async def _publish(self) -> None:
+        try:
+            r = await get_redis()
+        except Exception:
+            return
+        rates = self.buffer.rates()
+        batch = RedisBatch(r)
+        if rates:
+            batch.hset(TPS_KEY, mapping={k: str(v["tps"]) for k, v in rates.items()})
+        batch.set(METRICS_KEY, json.dumps({
+            "series": rates,
+            "pending": len(self.buffer.pending),
+            "dropped": self.buffer.dropped,
+            "subscribed": self.subscribed,
+            "unsupported": self.unsupported,
+            "updated_at": int(time.time()),
+            **self.stats,
+        }))
+        # 实时推送：本周期有新成交的序列推送最新成交价（网关对 ticker 主题做合并）
+        for sid, st in rates.items():
+            if st["tps"] > 0:
+                ex, sym = sid.split(":", 1)
+                await publish_live(ticker_topic(ex, sym), {
+                    "exchange": ex, "symbol": sym, "last_price": st["last_price"], "last_quantity": st["last_quantity"],
+                    "side": st["last_side"], "tps": st["tps"], "timestamp": st["last_trade_at"],
+                }, batch=batch)
+        events = self.buffer.take_gap_events()
+        if events:
+            batch.lpush(GAPS_KEY, *[json.dumps(e) for e in events])
+            batch.ltrim(GAPS_KEY, 0, 999)
+        try:
+            await batch.flush()
+        except Exception:
+            pass
+
+    async def run(self, stop: Optional[asyncio.Event] = None) -> None:
+        """按固定节拍写库（以单调时钟对齐，写库耗时不累积漂移）"""
+        stop = stop or asyncio.Event()
+        next_at = time.monotonic() + self.flush_interval
+        try:
+            while not stop.is_set():
+                delay = next_at - time.monotonic()
+                if delay > 0:
+                    try:
+                        await asyncio.wait_for(stop.wait(), timeout=delay)
+                    except asyncio.TimeoutError:
+                        pass
+                next_at = max(next_at + self.flush_interval, time.monotonic())
+                await self.flush()
+        finally:
+            await self.flush()
+
+
+async def recent_trades(session: AsyncSession, exchange: str, symbol: str, limit: int = 100, columnar: bool = False):
+    """最近 limit 笔成交（时间倒序）；columnar=True 时直接由查询结果构造列式数组"""
+    res = await session.execute(text(
+        """
+        SELECT trade_id, price, quantity, side, timestamp
+        FROM market_trades
+        WHERE exchange = :ex AND symbol = :sym
+        ORDER BY timestamp DESC
+        LIMIT :lim
+        """
+    ), {"ex": exchange, "sym": _norm_symbol(symbol), "lim": limit})
+    rows = res.fetchall()
+    if columnar:
+        return {
+            "trade_id": np.array([r.trade_id for r in rows], dtype=object),
+            "price": np.array([r.price for r in rows], dtype=np.float64),
+            "quantity": np.array([r.quantity for r in rows], dtype=np.float64),
+            "side": np.array([r.side for r in rows], dtype=object),
+            "timestamp": np.array([r.timestamp for r in rows], dtype="datetime64[ms]"),
+        }
+    return [
+        {"trade_id": r.trade_id, "price": float(r.price) if r.price is not None else None,
+         "quantity": float(r.quantity) if r.quantity is not None else None,
+         "side": r.side, "timestamp": r.timestamp.isoformat()}
+        for r in rows
+    ]
+
+
+async def trade_metrics(gap_limit: int = 50) -> Dict[str, Any]:
+    r = await get_redis()
+    raw = await r.get(METRICS_KEY)
+    data = json.loads(raw) if raw else {}
+    gaps = await r.lrange(GAPS_KEY, 0, gap_limit - 1)
+    data["recent_gaps"] = [json.loads(g) for g in gaps or []]
+    return data
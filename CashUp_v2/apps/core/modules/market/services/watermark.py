@@ -0,0 +1,94 @@
+"""
+K线序列水位（最后 open_time）服务
+函数集注释：
+- WatermarkService.load: 从 Redis 哈希 market:watermark 读取全部序列水位；冷启动时用一次分组查询从数据库重建
+- WatermarkService.rebuild: SELECT exchange, symbol, timeframe, MAX(open_time) ... GROUP BY 一次取回所有序列水位并回写 Redis
+- WatermarkService.get: 读取单个序列水位（内存）
+- WatermarkService.advance: 写库成功后推进水位（只前进不后退），同步更新 Redis 哈希（可并入调用方的 RedisBatch）
+"""
+
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.redis import get_redis
+
+WATERMARK_KEY = "market:watermark"
+WATERMARK_BUILT_KEY = "market:watermark:built"
+
+
+def series_field(exchange: str, symbol: str, timeframe: str) -> str:
+    return f"{exchange}:{symbol}:{timeframe}"
+
+
+def _decode(v) -> str:
+    return v.decode() if isinstance(v, (bytes, bytearray)) else str(v)
+
+
+class WatermarkService:
+    """序列水位：内存字典 + Redis 哈希，数据库为最终来源"""
+
+    def __init__(self):
+        self._marks: Dict[str, datetime] = {}
+
+    async def load(self, session: AsyncSession) -> Dict[str, datetime]:
+        built = None
+        raw = {}
+        try:
+            r = await get_redis()
+            built = await r.get(WATERMARK_BUILT_KEY)
+            if built is not None:
+                raw = await r.hgetall(WATERMARK_KEY) or {}
+        except Exception:
+            built = None
+        if built is None:
+            return await self.rebuild(session)
+        marks: Dict[str, datetime] = {}
+        for k, v in raw.items():
+            try:
+                marks[_decode(k)] = datetime.fromisoformat(_decode(v))
+            except Exception:
+                continue
+        self._marks = marks
+        return marks
+
+    async def rebuild(self, session: AsyncSession) -> Dict[str, datetime]:
+        res = await session.execute(text(
+            "SELECT exchange, symbol, timeframe, MAX(open_time) AS last_ot FROM kline_data GROUP BY exchange, symbol, timeframe"
+        ))
+        marks = {series_field(r.exchange, r.symbol, r.timeframe): r.last_ot for r in res.fetchall() if r.last_ot}
+        self._marks = marks
+        try:
+            r = await get_redis()
+            await r.delete(WATERMARK_KEY)
+            if marks:
+                await r.hset(WATERMARK_KEY, mapping={k: v.isoformat() for k, v in marks.items()})
+            await r.set(WATERMARK_BUILT_KEY, str(int(datetime.now().timestamp())))
+        except Exception:
+            pass
+        return marks
+
+    def get(self, exchange: str, symbol: str, timeframe: str) -> Optional[datetime]:
+        return self._marks.get(series_field(exchange, symbol, timeframe))
+
+    async def advance(self, updates: Iterable[Tuple[str, str, str, datetime]], batch=None) -> int:
+        changed: Dict[str, str] = {}
+        for exchange, symbol, timeframe, open_time in updates:
+            if open_time is None:
+                continue
+            field = series_field(exchange, symbol, timeframe)
+            cur = self._marks.get(field)
+            if cur is None or open_time > cur:
+                self._marks[field] = open_time
+                changed[field] = open_time.isoformat()
+        if changed and batch is not None:
+            batch.hset(WATERMARK_KEY, changed)
+        elif changed:
+            try:
+                r = await get_redis()
+                await r.hset(WATERMARK_KEY, mapping=changed)
+            except Exception:
+                pass
+        return len(changed)
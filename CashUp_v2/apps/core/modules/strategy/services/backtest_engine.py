@@ -1,23 +1,76 @@
-from typing import List, Dict, Any
+from datetime import datetime
+from typing import List, Dict, Any, Iterable
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import text
+from modules.market.services.derivatives import align_asof, sum_between
 from .manager import CompositeStrategy
 
-async def run_backtest(db: AsyncSession, composite: CompositeStrategy, exchange: str, symbol: str, timeframe: str, start: str, end: str) -> Dict[str, Any]:
+# 可附加到K线上的对齐序列
+EXTRA_SERIES = ("funding", "open_interest")
+
+def _to_dt(v):
+    if isinstance(v, str):
+        return datetime.fromisoformat(v.replace("Z", "+00:00")).replace(tzinfo=None)
+    return v
+
+async def load_backtest_data(db: AsyncSession, exchange: str, symbol: str, timeframe: str, start, end,
+                             series: Iterable[str] = ()) -> Dict[str, List[Any]]:
+    """加载回测K线；series 指定附加序列，按K线开盘时间对齐（取不晚于该时刻的最近值）
+
+    funding: funding_rate（最近一次结算费率）、funding_accrued（上一根K线之后至本根之间结算的费率之和）
+    open_interest: open_interest、mark_price、predicted_funding_rate
+    """
+    start, end = _to_dt(start), _to_dt(end)
     q = text("""
         SELECT open_time, close FROM kline_data
         WHERE exchange=:exchange AND symbol=:symbol AND timeframe=:tf AND open_time BETWEEN :start AND :end
         ORDER BY open_time ASC
     """)
     rows = (await db.execute(q, {"exchange": exchange, "symbol": symbol, "tf": timeframe, "start": start, "end": end})).all()
-    closes = [float(r.close) for r in rows]
+    data: Dict[str, List[Any]] = {"open_time": [r.open_time for r in rows], "close": [float(r.close) for r in rows]}
+    times = data["open_time"]
+    series = set(series or ())
+    if not times:
+        return data
+    sym = str(symbol).replace('/', '_')
+    if "funding" in series:
+        # 向前多取一段，保证第一根K线也能对齐到之前最近的结算
+        fr = (await db.execute(text("""
+            SELECT funding_time, funding_rate FROM funding_rates
+            WHERE exchange=:exchange AND symbol=:symbol AND funding_time <= :end
+              AND funding_time >= COALESCE((SELECT MAX(funding_time) FROM funding_rates WHERE exchange=:exchange AND symbol=:symbol AND funding_time <= :start), :start)
+            ORDER BY funding_time ASC
+        """), {"exchange": exchange, "symbol": sym, "start": times[0], "end": times[-1]})).all()
+        points = [(r.funding_time, float(r.funding_rate)) for r in fr]
+        data["funding_rate"] = align_asof(times, points)
+        data["funding_accrued"] = sum_between(times, [p for p in points if p[0] > times[0]])
+    if "open_interest" in series:
+        oi = (await db.execute(text("""
+            SELECT timestamp, open_interest, mark_price, predicted_funding_rate FROM open_interest
+            WHERE exchange=:exchange AND symbol=:symbol AND timestamp <= :end
+              AND timestamp >= COALESCE((SELECT MAX(timestamp) FROM open_interest WHERE exchange=:exchange AND symbol=:symbol AND timestamp <= :start), :start)
+            ORDER BY timestamp ASC
+        """), {"exchange": exchange, "symbol": sym, "start": times[0], "end": times[-1]})).all()
+        for col in ("open_interest", "mark_price", "predicted_funding_rate"):
+            data[col] = align_asof(times, [(r.timestamp, float(getattr(r, col)) if getattr(r, col) is not None else None) for r in oi])
+    return data
+
+async def run_backtest(db: AsyncSession, composite: CompositeStrategy, exchange: str, symbol: str, timeframe: str, start: str, end: str,
+                       include_funding: bool = False) -> Dict[str, Any]:
+    data = await load_backtest_data(db, exchange, symbol, timeframe, start, end, ("funding",) if include_funding else ())
+    closes = data["close"]
+    accrued = data.get("funding_accrued")
     balance = 10000.0
     position = 0.0
     trades = 0
+    funding_paid = 0.0
     for i in range(len(closes)):
         window = closes[:i+1]
-        sig = composite.generate(window)
         price = closes[i]
+        # 多头持仓按结算时的名义价值支付资金费率（费率为负时收取）
+        if accrued is not None and position > 0 and accrued[i]:
+            funding_paid += position * price * accrued[i]
+        sig = composite.generate(window)
         if sig["type"] == "buy" and position == 0:
             qty = balance / price
             position = qty
@@ -27,6 +80,9 @@ async def run_backtest(db: AsyncSession, composite: CompositeStrategy, exchange:
             balance = position * price
             position = 0.0
             trades += 1
-    final = balance + position * (closes[-1] if closes else 0.0)
+    final = balance + position * (closes[-1] if closes else 0.0) - funding_paid
     total_pnl = final - 10000.0
-    return {"initial_balance": 10000.0, "final_balance": final, "total_pnl": total_pnl, "total_trades": trades}
\ No newline at end of file
+    result = {"initial_balance": 10000.0, "final_balance": final, "total_pnl": total_pnl, "total_trades": trades}
+    if include_funding:
+        result["funding_paid"] = funding_paid
+    return result
@@ -1,11 +1,46 @@
 import asyncio
+import json
+import time
 from typing import List, Dict, Any
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import text
 
 from app.adapters.exchanges.base import ExchangeAdapter, OrderRequest, OrderSide, OrderType
+from database.redis import get_redis
+from services.live import publish_live, signal_topic
+from utils.latency import latency_registry
+from utils.logger import get_logger
 from ..factors.base import FactorBase
 
+logger = get_logger(__name__)
+
+# 收盘后稍等再取K线，给交易所落定刚收盘的K线留出时间
+BAR_CLOSE_DELAY_SECONDS = 2.0
+
+def _last_closed_bar_time(klines, now: float):
+    """返回最近一根已收盘K线的收盘时间（epoch 秒），无则返回 None"""
+    for k in reversed(klines or []):
+        try:
+            ct = k.close_time.timestamp()
+        except Exception:
+            continue
+        if ct <= now:
+            return ct
+    return None
+
+def _seconds_until_next_bar(last_close, interval: float, now: float) -> float:
+    """距下一根K线收盘（加少量延迟）的秒数；尚无已收盘K线时按 epoch 对齐到周期边界"""
+    next_close = last_close + interval if last_close is not None else (now // interval + 1) * interval
+    return max(next_close - now, 0.0) + BAR_CLOSE_DELAY_SECONDS
+
+async def _publish_latency_snapshot():
+    # 供 monitoring-service 读取的跨进程快照
+    try:
+        r = await get_redis()
+        await r.set("metrics:latency:snapshot", json.dumps(latency_registry.snapshot()))
+    except Exception as e:
+        logger.debug(f"延迟快照发布失败: {e}")
+
 class CompositeStrategy:
     def __init__(self, name: str, factors: List[FactorBase]):
         self.name = name
@@ -62,18 +97,39 @@ class StrategyLifecycle:
             take_profit = float(risk.get("take_profit", 0))
             position_qty = 0.0
             entry_price = 0.0
+            interval = adapter.exchange.get_interval_minutes(timeframe) * 60
+            last_bar = None
             while True:
                 klines = await adapter.get_klines(symbol, timeframe, limit=100)
+                # 延迟埋点：以最近一根已收盘K线的收盘时刻为起点
+                now = time.time()
+                bar_close = _last_closed_bar_time(klines, now)
+                if bar_close is not None and bar_close == last_bar:
+                    # 新K线尚未落定：已处理过的K线不重复出信号、不重复埋点，稍后重取
+                    await asyncio.sleep(_seconds_until_next_bar(bar_close, interval, now))
+                    continue
+                last_bar = bar_close
+                trace = latency_registry.trace(strategy_id, bar_close) if bar_close is not None else None
+                if trace:
+                    trace.stamp("bar_received")
                 closes = [k.close_price for k in klines] if klines else []
                 sig = composite.generate(closes)
+                if trace:
+                    trace.stamp("factors_evaluated")
                 price = closes[-1] if closes else 0.0
                 if db:
                     await db.execute(text("INSERT INTO strategy_signals (strategy_instance_id, signal_type, signal_data, price, executed, created_at) VALUES (:sid, :type, :data, :price, false, NOW())"), {"sid": strategy_id, "type": sig["type"], "data": {}, "price": price})
+                    if trace:
+                        trace.stamp("signal_persisted")
                 if sig["type"] == "buy" and position_qty == 0.0:
                     qty = max_pos if max_pos > 0 else 0.0
                     if qty > 0:
                         req = OrderRequest(symbol=symbol, side=OrderSide.BUY, type=OrderType.MARKET, quantity=qty)
+                        if trace:
+                            trace.stamp("order_submitted")
                         await adapter.place_order(req)
+                        if trace:
+                            trace.stamp("exchange_ack")
                         position_qty = qty
                         entry_price = price
                         if db:
@@ -81,7 +137,11 @@ class StrategyLifecycle:
                             await db.execute(text("INSERT INTO positions (user_id, strategy_instance_id, exchange, symbol, side, quantity, entry_price, mark_price, status, updated_at) VALUES (1, :sid, :exchange, :symbol, 'long', :qty, :price, :price, 'open', NOW()) ON CONFLICT DO NOTHING"), {"sid": strategy_id, "exchange": adapter.name, "symbol": symbol, "qty": qty, "price": price})
                 if sig["type"] == "sell" and position_qty > 0.0:
                     req = OrderRequest(symbol=symbol, side=OrderSide.SELL, type=OrderType.MARKET, quantity=position_qty)
+                    if trace:
+                        trace.stamp("order_submitted")
                     await adapter.place_order(req)
+                    if trace:
+                        trace.stamp("exchange_ack")
                     position_qty = 0.0
                     if db:
                         await db.execute(text("UPDATE strategy_signals SET executed=true, executed_at=NOW() WHERE strategy_instance_id=:sid AND price=:price AND executed=false"), {"sid": strategy_id, "price": price})
@@ -100,7 +160,16 @@ class StrategyLifecycle:
                         position_qty = 0.0
                         if db:
                             await db.execute(text("UPDATE positions SET status='closed', mark_price=:price, updated_at=NOW() WHERE strategy_instance_id=:sid AND symbol=:symbol AND status='open'"), {"sid": strategy_id, "symbol": symbol, "price": price})
-                await asyncio.sleep(adapter.exchange.get_interval_minutes(timeframe) * 60)
+                # 信号推送放在下单之后，不计入信号链路延迟
+                if sig["type"] != "none":
+                    await publish_live(signal_topic(strategy_id), {
+                        "strategy_id": strategy_id, "symbol": symbol, "timeframe": timeframe,
+                        "type": sig["type"], "strength": sig["strength"], "price": price, "at": int(time.time()),
+                    })
+                if trace:
+                    await _publish_latency_snapshot()
+                # 对齐到下一根K线收盘，而不是从本轮结束起整周期休眠
+                await asyncio.sleep(_seconds_until_next_bar(bar_close, interval, time.time()))
         except asyncio.CancelledError:
             return
 
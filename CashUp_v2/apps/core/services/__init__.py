@@ -3,5 +3,6 @@
 """
 
 from services.config import ConfigService
+from services.config_cache import SystemConfigCache, system_config_cache
 
-__all__ = ['ConfigService']
\ No newline at end of file
+__all__ = ['ConfigService', 'SystemConfigCache', 'system_config_cache']
\ No newline at end of file
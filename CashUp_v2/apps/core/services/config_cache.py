@@ -0,0 +1,231 @@
+"""
+system_configs 进程内缓存
+函数集注释：
+- SystemConfigCache: 进程内 键 -> 值 字典；首次读取（或启动时 load）整体加载，之后读取只是字典查找
+- SystemConfigCache.get / get_many: 读取单个/多个配置（值与直接查询 config_value 的结果一致）
+- SystemConfigCache.publish: 写入配置后调用：版本号 INCR，并在 Redis 频道广播 {key, version}
+- SystemConfigCache.start_listener / stop_listener: 订阅失效频道的后台协程；断线自动重连，重连后整体重载
+- system_config_cache: 进程级实例（API、Celery 任务运行时与常驻 worker 共用）
+失效规则：收到的版本号不大于本地版本时忽略（本进程自己的写入已生效）；版本号跳跃（漏消息）或 key 为 * 时整体重载。
+兜底：无订阅协程的事件循环中，每 version_check_interval 秒比对一次 Redis 版本号；距上次整体加载超过 max_age 秒时无条件重载。
+"""
+
+import asyncio
+import json
+import time
+import weakref
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from sqlalchemy import text
+
+from database.redis import get_redis
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+CHANNEL = "system_configs:invalidate"
+VERSION_KEY = "system_configs:version"
+
+
+def _decode(v) -> str:
+    return v.decode() if isinstance(v, (bytes, bytearray)) else str(v)
+
+
+class SystemConfigCache:
+    """system_configs 的进程内只读副本"""
+
+    def __init__(self, max_age: float = 300.0, version_check_interval: float = 5.0):
+        self.max_age = max_age
+        self.version_check_interval = version_check_interval
+        self._session_factory: Optional[Callable[[], Any]] = None
+        self._values: Dict[str, Any] = {}
+        self._loaded_at: Optional[float] = None
+        self._checked_at = 0.0
+        self.version = 0
+        self._locks: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Lock]" = weakref.WeakKeyDictionary()
+        self._listener: Optional[asyncio.Task] = None
+        self._listener_loop: Optional[asyncio.AbstractEventLoop] = None
+        self.stats_counters = {"loads": 0, "key_refreshes": 0, "messages": 0, "version_checks": 0}
+
+    def configure(self, session_factory: Callable[[], Any]) -> None:
+        self._session_factory = session_factory
+
+    def _factory(self) -> Callable[[], Any]:
+        if self._session_factory is None:
+            from database.connection import AsyncSessionLocal
+            if AsyncSessionLocal is None:
+                raise RuntimeError("未配置数据库会话工厂")
+            self._session_factory = AsyncSessionLocal
+        return self._session_factory
+
+    def _lock(self) -> asyncio.Lock:
+        loop = asyncio.get_running_loop()
+        lock = self._locks.get(loop)
+        if lock is None:
+            lock = self._locks[loop] = asyncio.Lock()
+        return lock
+
+    def _listening(self) -> bool:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return False
+        return self._listener is not None and not self._listener.done() and self._listener_loop is loop
+
+    # ---- 加载 ----
+    async def _remote_version(self) -> Optional[int]:
+        try:
+            r = await get_redis()
+            v = await r.get(VERSION_KEY)
+            return int(_decode(v)) if v is not None else 0
+        except Exception:
+            return None
+
+    async def load(self) -> Dict[str, Any]:
+        """整体重载；先读版本号再查表，查表期间发生的变更会由后续消息/版本比对补上"""
+        async with self._lock():
+            version = await self._remote_version()
+            async with self._factory()() as session:
+                res = await session.execute(text("SELECT config_key, config_value FROM system_configs"))
+                values = {r.config_key: r.config_value for r in res.fetchall()}
+            self._values = values
+            self._loaded_at = self._checked_at = time.monotonic()
+            if version is not None:
+                self.version = version
+            self.stats_counters["loads"] += 1
+            return values
+
+    async def _refresh_key(self, key: str) -> None:
+        async with self._factory()() as session:
+            res = await session.execute(text("SELECT config_value FROM system_configs WHERE config_key=:k"), {"k": key})
+            row = res.first()
+        if row is None:
+            self._values.pop(key, None)
+        else:
+            self._values[key] = row.config_value
+        self.stats_counters["key_refreshes"] += 1
+
+    async def _ensure_fresh(self) -> None:
+        now = time.monotonic()
+        if self._loaded_at is None or now - self._loaded_at >= self.max_age:
+            await self.load()
+            return
+        if self._listening() or now - self._checked_at < self.version_check_interval:
+            return
+        self._checked_at = now
+        self.stats_counters["version_checks"] += 1
+        version = await self._remote_version()
+        if version is not None and version != self.version:
+            await self.load()
+
+    # ---- 读取 ----
+    async def get(self, key: str, default: Any = None) -> Any:
+        await self._ensure_fresh()
+        return self._values.get(key, default)
+
+    async def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        """返回存在的键（与 WHERE config_key IN (...) 查询结果相同）"""
+        await self._ensure_fresh()
+        return {k: self._values[k] for k in keys if k in self._values}
+
+    async def get_matching(self, suffix: str) -> Dict[str, Any]:
+        await self._ensure_fresh()
+        return {k: v for k, v in self._values.items() if k.endswith(suffix)}
+
+    # ---- 失效 ----
+    async def publish(self, key: str = "*") -> Optional[int]:
+        """写入 system_configs 并提交后调用；本进程立即生效，其他进程经频道消息刷新"""
+        version = None
+        try:
+            r = await get_redis()
+            version = int(await r.incr(VERSION_KEY))
+            await r.publish(CHANNEL, json.dumps({"key": key, "version": version}))
+        except Exception as e:
+            logger.warning(f"配置失效广播失败 {key}: {e}")
+        try:
+            if key == "*" or self._loaded_at is None:
+                await self.load()
+            else:
+                await self._refresh_key(key)
+                # 只有版本连续时才前移本地版本，否则留给版本比对整体重载
+                if version is not None and version == self.version + 1:
+                    self.version = version
+        except Exception as e:
+            logger.warning(f"本地配置刷新失败 {key}: {e}")
+        return version
+
+    async def _on_message(self, data) -> None:
+        self.stats_counters["messages"] += 1
+        try:
+            msg = json.loads(_decode(data))
+            version = int(msg.get("version", 0))
+            key = str(msg.get("key", "*"))
+        except Exception:
+            return
+        if version <= self.version:
+            return
+        if key == "*" or version != self.version + 1 or self._loaded_at is None:
+            await self.load()
+            return
+        await self._refresh_key(key)
+        self.version = version
+
+    async def _listen(self) -> None:
+        backoff = 1.0
+        while True:
+            pubsub = None
+            try:
+                r = await get_redis()
+                if not hasattr(r, "pubsub"):
+                    logger.info("Redis 客户端不支持订阅，配置缓存仅依赖版本比对")
+                    return
+                pubsub = r.pubsub()
+                await pubsub.subscribe(CHANNEL)
+                # 订阅建立后整体重载一次，覆盖断线期间的变更
+                await self.load()
+                backoff = 1.0
+                async for msg in pubsub.listen():
+                    if msg.get("type") == "message":
+                        await self._on_message(msg.get("data"))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"配置失效订阅中断，{backoff:.0f} 秒后重连: {e}")
+            finally:
+                if pubsub is not None:
+                    try:
+                        await pubsub.aclose() if hasattr(pubsub, "aclose") else await pubsub.close()
+                    except Exception:
+                        pass
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 30.0)
+
+    def start_listener(self) -> None:
+        """在当前事件循环中启动订阅协程（重复调用无副作用）"""
+        if self._listening():
+            return
+        self._listener_loop = asyncio.get_running_loop()
+        self._listener = asyncio.create_task(self._listen(), name="system-config-listener")
+
+    async def stop_listener(self) -> None:
+        task, self._listener = self._listener, None
+        self._listener_loop = None
+        if task is not None and not task.done():
+            task.cancel()
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "keys": len(self._values),
+            "version": self.version,
+            "listening": self._listening(),
+            "age_seconds": round(time.monotonic() - self._loaded_at, 1) if self._loaded_at is not None else None,
+            **self.stats_counters,
+        }
+
+
+# 进程级实例
+system_config_cache = SystemConfigCache()
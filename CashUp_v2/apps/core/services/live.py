@@ -0,0 +1,300 @@
+"""
+实时推送：Redis 发布 -> API 进程内网关 -> WebSocket 客户端
+函数集注释：
+- 主题：kline:{交易所}:{交易对}:{时间框}、ticker:{交易所}:{交易对}、signal:{策略ID}、order:{交易所}
+- kline_topic / ticker_topic / signal_topic / order_topic: 主题名构造（交易对统一为 BTC_USDT 形式）
+- publish_live: 生产端（采集任务、成交流、策略循环、下单接口）发布一条更新，同时覆盖该主题的最新快照键；可并入调用方的 RedisBatch
+- LiveConnection: 单个连接的有界发送队列；ticker 主题只保留最新一条（合并），其余主题队列满时判定为慢客户端并断开
+- LiveHub: 每个 API 进程一个 PSUBSCRIBE live:* 订阅，按主题把消息分发给本进程内的订阅连接（消息体只编码一次）；
+  订阅时先下发快照（K线取序列缓存最近 N 根，其余主题取最近一次发布的内容）
+- live_hub: 进程级实例
+客户端协议（JSON 文本帧）：
+  -> {"op": "subscribe" | "unsubscribe", "topics": [...]}、{"op": "ping"}
+  <- {"type": "snapshot" | "update", "topic": ..., "data": ...}、{"type": "subscribed" | "unsubscribed", "topics": [...]}、
+     {"type": "pong"}、{"type": "error", "message": ...}
+"""
+
+import asyncio
+import json
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, Iterable, List, Optional, Set
+
+from database.redis import get_redis
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+CHANNEL_PREFIX = "live:"
+SNAPSHOT_PREFIX = "live:snap:"
+SNAPSHOT_TTL_SECONDS = 86400
+# 主题类型 -> 是否合并（只推送最新值）
+TOPIC_KINDS = {"kline": False, "ticker": True, "signal": False, "order": False}
+# K线快照根数
+KLINE_SNAPSHOT_BARS = 200
+
+
+def _sym(symbol: str) -> str:
+    return str(symbol).replace('/', '_')
+
+
+def kline_topic(exchange: str, symbol: str, timeframe: str) -> str:
+    return f"kline:{exchange}:{_sym(symbol)}:{timeframe}"
+
+
+def ticker_topic(exchange: str, symbol: str) -> str:
+    return f"ticker:{exchange}:{_sym(symbol)}"
+
+
+def signal_topic(strategy_id) -> str:
+    return f"signal:{strategy_id}"
+
+
+def order_topic(exchange: str) -> str:
+    return f"order:{exchange}"
+
+
+def _decode(v) -> str:
+    return v.decode() if isinstance(v, (bytes, bytearray)) else str(v)
+
+
+async def publish_live(topic: str, data: Any, batch=None) -> None:
+    """发布更新并覆盖快照；batch 为 RedisBatch 时只入队，由调用方统一 flush"""
+    payload = json.dumps(data, default=str)
+    if batch is not None:
+        batch.setex(SNAPSHOT_PREFIX + topic, SNAPSHOT_TTL_SECONDS, payload)
+        batch.publish(CHANNEL_PREFIX + topic, payload)
+        return
+    try:
+        r = await get_redis()
+        pipe = r.pipeline(transaction=False)
+        pipe.setex(SNAPSHOT_PREFIX + topic, SNAPSHOT_TTL_SECONDS, payload)
+        pipe.publish(CHANNEL_PREFIX + topic, payload)
+        await pipe.execute()
+    except Exception as e:
+        logger.debug(f"实时推送发布失败 {topic}: {e}")
+
+
+def _frame(kind: str, topic: str, payload: str) -> str:
+    # payload 已是 JSON 文本，直接拼接，避免逐连接重复编码
+    return '{"type":"%s","topic":%s,"data":%s}' % (kind, json.dumps(topic), payload)
+
+
+class LiveConnection:
+    """单个 WebSocket 连接的发送端"""
+
+    def __init__(self, websocket, max_queue: int = 1000, max_topics: int = 100):
+        self.ws = websocket
+        self.max_queue = max_queue
+        self.max_topics = max_topics
+        self.topics: Set[str] = set()
+        self._queue: Deque[str] = deque()
+        self._conflated: "OrderedDict[str, str]" = OrderedDict()
+        self._wake = asyncio.Event()
+        self.overflowed = False
+        self.sent = 0
+        self.conflated = 0
+
+    def put(self, frame: str, topic: Optional[str] = None, front: bool = False) -> bool:
+        """topic 非空表示可合并的更新；front 用于快照插到已排队的更新之前；返回 False 表示队列溢出（连接应被关闭）"""
+        if front:
+            self._queue.appendleft(frame)
+        elif topic is not None:
+            if topic in self._conflated:
+                self.conflated += 1
+            self._conflated[topic] = frame
+        else:
+            if len(self._queue) >= self.max_queue:
+                self.overflowed = True
+                self._wake.set()
+                return False
+            self._queue.append(frame)
+        self._wake.set()
+        return True
+
+    async def next_frame(self) -> Optional[str]:
+        while True:
+            if self.overflowed:
+                return None
+            if self._queue:
+                return self._queue.popleft()
+            if self._conflated:
+                return self._conflated.popitem(last=False)[1]
+            self._wake.clear()
+            await self._wake.wait()
+
+    async def send_loop(self) -> None:
+        while True:
+            frame = await self.next_frame()
+            if frame is None:
+                # 慢客户端：关闭连接，客户端重连后重新订阅即可拿到快照
+                await self.ws.close(code=1013)
+                return
+            await self.ws.send_text(frame)
+            self.sent += 1
+
+
+class LiveHub:
+    """进程内主题路由"""
+
+    def __init__(self):
+        self.subs: Dict[str, Set[LiveConnection]] = {}
+        self._listener: Optional[asyncio.Task] = None
+        self.stats = {"messages": 0, "delivered": 0, "dropped_connections": 0}
+
+    # ---- 订阅管理 ----
+    def _check_topic(self, topic: str) -> bool:
+        kind = topic.split(":", 1)[0]
+        return kind in TOPIC_KINDS and len(topic) <= 200
+
+    async def subscribe(self, conn: LiveConnection, topics: Iterable[str]) -> List[str]:
+        added = []
+        for topic in topics:
+            if topic in conn.topics or not self._check_topic(topic):
+                continue
+            if len(conn.topics) >= conn.max_topics:
+                break
+            conn.topics.add(topic)
+            self.subs.setdefault(topic, set()).add(conn)
+            added.append(topic)
+        # 先登记再取快照：期间到达的更新已在队列中，快照插到它们之前，客户端不会漏掉更新
+        for topic in added:
+            snap = await self.snapshot(topic)
+            if snap is not None:
+                conn.put(_frame("snapshot", topic, snap), front=True)
+        return added
+
+    def unsubscribe(self, conn: LiveConnection, topics: Optional[Iterable[str]] = None) -> List[str]:
+        removed = []
+        for topic in list(conn.topics if topics is None else topics):
+            if topic not in conn.topics:
+                continue
+            conn.topics.discard(topic)
+            conns = self.subs.get(topic)
+            if conns is not None:
+                conns.discard(conn)
+                if not conns:
+                    del self.subs[topic]
+            removed.append(topic)
+        return removed
+
+    # ---- 快照 ----
+    async def snapshot(self, topic: str) -> Optional[str]:
+        try:
+            if topic.startswith("kline:"):
+                return await self._kline_snapshot(topic)
+            r = await get_redis()
+            raw = await r.get(SNAPSHOT_PREFIX + topic)
+            return _decode(raw) if raw is not None else None
+        except Exception as e:
+            logger.debug(f"快照读取失败 {topic}: {e}")
+            return None
+
+    async def _kline_snapshot(self, topic: str) -> Optional[str]:
+        from database.connection import AsyncSessionLocal
+        from modules.market.services.kline_cache import KlineSeriesCache
+
+        _, exchange, symbol, timeframe = topic.split(":", 3)
+        if AsyncSessionLocal is None:
+            return None
+        r = await get_redis()
+        async with AsyncSessionLocal() as session:
+            bars = await KlineSeriesCache(r, exchange, symbol, timeframe).latest(session, KLINE_SNAPSHOT_BARS)
+        return json.dumps(bars, default=str)
+
+    # ---- 分发 ----
+    def dispatch(self, topic: str, payload: str) -> int:
+        conns = self.subs.get(topic)
+        self.stats["messages"] += 1
+        if not conns:
+            return 0
+        frame = _frame("update", topic, payload)
+        conflate = TOPIC_KINDS.get(topic.split(":", 1)[0], False)
+        n = 0
+        for conn in list(conns):
+            if conn.put(frame, topic if conflate else None):
+                n += 1
+            else:
+                self.stats["dropped_connections"] += 1
+                self.unsubscribe(conn)
+        self.stats["delivered"] += n
+        return n
+
+    async def _listen(self) -> None:
+        backoff = 1.0
+        while True:
+            pubsub = None
+            try:
+                r = await get_redis()
+                if not hasattr(r, "pubsub"):
+                    logger.info("Redis 客户端不支持订阅，实时推送未启用")
+                    return
+                pubsub = r.pubsub()
+                await pubsub.psubscribe(CHANNEL_PREFIX + "*")
+                backoff = 1.0
+                async for msg in pubsub.listen():
+                    if msg.get("type") != "pmessage":
+                        continue
+                    channel = _decode(msg.get("channel"))
+                    if channel.startswith(SNAPSHOT_PREFIX):
+                        continue
+                    self.dispatch(channel[len(CHANNEL_PREFIX):], _decode(msg.get("data")))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"实时推送订阅中断，{backoff:.0f} 秒后重连: {e}")
+            finally:
+                if pubsub is not None:
+                    try:
+                        await pubsub.aclose() if hasattr(pubsub, "aclose") else await pubsub.close()
+                    except Exception:
+                        pass
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 30.0)
+
+    def start(self) -> None:
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.create_task(self._listen(), name="live-hub-listener")
+
+    async def stop(self) -> None:
+        task, self._listener = self._listener, None
+        if task is not None and not task.done():
+            task.cancel()
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
+                pass
+
+    # ---- 连接处理 ----
+    async def serve(self, websocket, max_queue: int = 1000) -> None:
+        """已 accept 的连接：读取客户端指令，发送由独立协程完成"""
+        self.start()
+        conn = LiveConnection(websocket, max_queue=max_queue)
+        sender = asyncio.create_task(conn.send_loop())
+        try:
+            while not sender.done():
+                try:
+                    msg = json.loads(await websocket.receive_text())
+                    op = msg.get("op")
+                    topics = msg.get("topics") or []
+                except (ValueError, AttributeError):
+                    conn.put(json.dumps({"type": "error", "message": "invalid message"}))
+                    continue
+                if op == "subscribe":
+                    added = await self.subscribe(conn, [str(t) for t in topics])
+                    conn.put(json.dumps({"type": "subscribed", "topics": added}))
+                elif op == "unsubscribe":
+                    conn.put(json.dumps({"type": "unsubscribed", "topics": self.unsubscribe(conn, [str(t) for t in topics])}))
+                elif op == "ping":
+                    conn.put(json.dumps({"type": "pong"}))
+                else:
+                    conn.put(json.dumps({"type": "error", "message": f"unknown op: {op}"}))
+        finally:
+            self.unsubscribe(conn)
+            sender.cancel()
+
+    def connections(self) -> int:
+        return len({c for conns in self.subs.values() for c in conns})
+
+
+# 进程级实例
+live_hub = LiveHub()
@@ -2,24 +2,31 @@
 行情采集任务
 函数集注释：
 - collect_market: 按配置采集 K线数据，批量写库与缓存一致性，失败自动重试与限速
+- _collect_async: 并发采集流水线：按交易所信号量限流的抓取协程 -> 队列 -> 单一批量写库协程
+- _CollectRun: 单次运行上下文（统计、水位、Redis 批量写、频率限制时间戳）
+- _fetch_series: 单个 交易所×交易对×时间框 的抓取（频率限制、运行预算、按水位增量抓取）；K线以列式批次（KlineBatch）流转，不逐根构造对象
+- _writer: 聚合队列中的K线批次列式写库（upsert_batches，大批量自动走 COPY 路径）、由 1m 增量聚合高时间框并执行缓存策略
+- _publish_metrics: 记录单次运行指标（抓取序列数、写入根数、耗时、因预算跳过数）
+Redis 写操作全部经 RedisBatch 非事务管道合并发送，每次写库后发送一次（实时推送不等到运行结束），往返次数与写库批次数相当、与序列数无关
+数据库引擎与交易所会话由 tasks.runtime 常驻复用
 """
 import asyncio
+import json
+import time
 from datetime import datetime, timezone
-from typing import List
+from typing import Any, Dict, List
 
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from config.settings import settings
 from celery_app import celery_app
-import os
-import yaml
-from app.adapters.exchanges.base import ExchangeManager
-from database.redis import get_redis
-
-engine = create_async_engine(settings.DATABASE_URL)
-SessionLocal = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+from database.redis import RedisBatch, get_redis
+from modules.market.services.watermark import WatermarkService
+from modules.market.services.ingest import upsert_batches
+from modules.market.services.rollup import derived_timeframes, rollup_range
+from modules.market.services.kline_cache import invalidate_tail
+from services.config_cache import system_config_cache
+from services.live import kline_topic, publish_live
+from tasks.runtime import SessionLocal, run_task, runtime
 
 async def _get_collect_config(session: AsyncSession):
     symbols: List[str] = []
@@ -27,10 +34,10 @@ async def _get_collect_config(session: AsyncSession):
     strategy = "write_through"
     coverage = "upsert"
     window_hours = 24
+    budget_seconds = 600
+    rollup = True
     try:
-        res = await session.execute(text("SELECT config_key, config_value FROM system_configs WHERE config_key IN ('market.collect.symbols','market.collect.timeframes','market.cache.strategy','market.collect.strategy','market.collect.window_hours')"))
-        rows = res.fetchall()
-        m = {r.config_key: r.config_value for r in rows}
+        m = await system_config_cache.get_many(['market.collect.symbols','market.collect.timeframes','market.cache.strategy','market.collect.strategy','market.collect.window_hours','market.collect.budget_seconds','market.rollup.enabled'])
         if isinstance(m.get('market.collect.symbols'), list):
             symbols = [str(s) for s in m['market.collect.symbols']]
         if isinstance(m.get('market.collect.timeframes'), list):
@@ -44,156 +51,279 @@ async def _get_collect_config(session: AsyncSession):
                 window_hours = int(str(m['market.collect.window_hours']).strip('"'))
             except Exception:
                 window_hours = 24
+        if m.get('market.collect.budget_seconds'):
+            try:
+                budget_seconds = int(str(m['market.collect.budget_seconds']).strip('"'))
+            except Exception:
+                budget_seconds = 600
+        if m.get('market.rollup.enabled') is not None:
+            rollup = str(m['market.rollup.enabled']).strip('"').lower() in ('1', 'true', 'yes')
     except Exception:
         pass
-    return symbols, timeframes, strategy, coverage, window_hours
+    return symbols, timeframes, strategy, coverage, window_hours, budget_seconds, rollup
 
 @celery_app.task(name="tasks.market.collect", autoretry_for=(Exception,), retry_kwargs={"max_retries": 5}, retry_backoff=True, retry_jitter=True, rate_limit="20/m", acks_late=True, time_limit=900)
 def collect_market():
-    asyncio.run(_collect_async())
-
-def _load_exchanges_config() -> dict:
-    path = os.path.join(os.getcwd(), "configs", "exchanges.yaml")
-    with open(path, "r", encoding="utf-8") as f:
-        return yaml.safe_load(f)
-
-def _build_manager_from_config() -> ExchangeManager:
-    cfg = _load_exchanges_config()
-    mgr = ExchangeManager()
-    for ex_name, conf in (cfg or {}).items():
-        if ex_name in ("common", "risk_control", "monitoring"):
-            continue
-        base_conf = conf if isinstance(conf, dict) else {}
-        # 环境变量展开
-        for k, v in list(base_conf.items()):
-            if isinstance(v, str) and v.startswith("${") and v.endswith("}"):
-                env_key = v[2:-1]
-                base_conf[k] = os.getenv(env_key, "")
-        if bool(base_conf.get("enabled", False)):
-            base_conf["name"] = base_conf.get("name", ex_name)
-            base_conf["type"] = base_conf.get("type", ex_name)
-            mgr.add_exchange(ex_name, base_conf)
-    return mgr
+    run_task(_collect_async)
 
-async def _collect_async():
-    mgr = _build_manager_from_config()
-    async with SessionLocal() as session:
-        symbols, timeframes, strategy, coverage, window_hours = await _get_collect_config(session)
-        # 广播最近运行时间
+# 写库批大小与队列上限（队列满时抓取协程等待，形成背压）
+WRITE_BATCH_ROWS = 5000
+QUEUE_MAXSIZE = 256
+
+class _ExchangePacer:
+    """单交易所请求节流：并发上限 + 按 rate_limit（次/秒）均匀间隔发起请求"""
+
+    def __init__(self, rate_limit: int):
+        rate = max(1, int(rate_limit or 10))
+        self.semaphore = asyncio.Semaphore(rate)
+        self.interval = 1.0 / rate
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+def _new_stats() -> Dict[str, Any]:
+    return {
+        "series_total": 0,
+        "series_fetched": 0,
+        "bars_fetched": 0,
+        "bars_written": 0,
+        "bars_quarantined": 0,
+        "skipped_budget": 0,
+        "skipped_rate_limit": 0,
+        "errors": 0,
+        "write_batches": 0,
+        "copy_batches": 0,
+        "write_seconds": 0.0,
+        "rollup_bars": 0,
+    }
+
+def _rate_key(ex_name: str, sym: str, tf: str) -> str:
+    return f"market:collect:last:{ex_name}:{sym}:{tf}"
+
+class _CollectRun:
+    """单次采集运行的共享状态"""
+
+    def __init__(self, coverage: str, strategy: str, deadline: float, watermarks: WatermarkService,
+                 derived: List[str], batch: RedisBatch):
+        self.coverage = coverage
+        self.strategy = strategy
+        self.deadline = deadline
+        self.watermarks = watermarks
+        self.derived = derived
+        self.batch = batch
+        self.stats = _new_stats()
+        self.last_runs: Dict[str, Any] = {}
+
+    def record_error(self, ex_name: str, sym: str, tf: str):
+        ts = int(time.time())
+        self.batch.set("market:error:last", str(ts))
+        self.batch.lpush("market:error:history", f"{ex_name}:{sym}:{tf}:{ts}")
+        self.batch.ltrim("market:error:history", 0, 499)
+
+async def _fetch_series(adapter, pacer: _ExchangePacer, queue: asyncio.Queue, run: _CollectRun,
+                        ex_name: str, sym: str, tf: str):
+    stats = run.stats
+    async with pacer.semaphore:
+        # 运行预算：超出预算的序列留给下一轮
+        if time.monotonic() >= run.deadline:
+            stats["skipped_budget"] += 1
+            return
         try:
-            r = await get_redis()
-            import time
-            await r.set("sched:last:market.collect", str(int(time.time())))
-            await r.lpush("sched:history", f"market.collect:{int(time.time())}")
-            await r.ltrim("sched:history", 0, 499)
-            await r.set("market:collect:started", "1")
-            await r.set("market:collect:exchanges", str(len(mgr.get_exchange_names())))
+            # 频率限制（每交易所-交易对-时间框）：最短间隔 60 秒；上次时间戳已在运行开始时一次性 MGET
+            keylim = _rate_key(ex_name, sym, tf)
+            now = int(time.time())
+            try:
+                last = run.last_runs.get(keylim)
+                if last is not None and now - int(last) < 60:
+                    stats["skipped_rate_limit"] += 1
+                    return
+            except Exception:
+                pass
+            run.batch.set(keylim, str(now))
+            # 采样窗口（仅写新段）：从序列水位（最近 open_time）起采集
+            last_ot = run.watermarks.get(ex_name, sym, tf)
+            await pacer.wait()
+            if last_ot:
+                data = await adapter.get_kline_batch(symbol=sym, interval=tf, start_time=last_ot, limit=500)
+            else:
+                data = await adapter.get_kline_batch(symbol=sym, interval=tf, limit=200)
+            stats["series_fetched"] += 1
+            stats["bars_fetched"] += len(data)
+            run.batch.set(f"market:collect:data_count:{ex_name}:{sym}:{tf}", str(len(data)))
+            if data:
+                await queue.put((ex_name, sym, tf, data))
         except Exception:
-            pass
-        for ex_name in mgr.get_exchange_names():
-            adapter = mgr.get_exchange(ex_name)
-            if not adapter:
+            stats["errors"] += 1
+            run.record_error(ex_name, sym, tf)
+
+async def _flush(session: AsyncSession, pending: List[tuple], run: _CollectRun):
+    stats = run.stats
+    try:
+        # 列式批次直接入库：分区过滤、质量校验与 COPY 均在列上进行，不逐根构造行字典
+        ingest = await upsert_batches(session, pending, run.coverage)
+        stats["bars_written"] += ingest["rows"]
+        stats["bars_quarantined"] += ingest["quarantined"]
+        stats["write_batches"] += 1
+        stats["write_seconds"] += ingest["seconds"]
+        if ingest["path"] == "copy":
+            stats["copy_batches"] += 1
+    except Exception:
+        await session.rollback()
+        stats["errors"] += len(pending)
+        for ex_name, sym, tf, _ in pending:
+            run.record_error(ex_name, sym, tf)
+        return
+    try:
+        await run.watermarks.advance(
+            ((ex_name, sym, tf, data.last_open_time()) for ex_name, sym, tf, data in pending),
+            batch=run.batch,
+        )
+    except Exception:
+        pass
+    # 由刚写入的 1m K线增量聚合派生时间框
+    if run.derived:
+        for ex_name, sym, tf, data in pending:
+            if tf != '1m':
                 continue
-            # 如果未指定 symbols，则尝试从 YAML 配置中获取
-            local_symbols = symbols
             try:
-                cfg = adapter.config or {}
-                if not local_symbols:
-                    local_symbols = cfg.get('symbols', [])
+                written = await rollup_range(session, ex_name, sym, data.first_open_time(), data.last_open_time(), run.derived)
+                stats["rollup_bars"] += sum(written.values())
             except Exception:
-                pass
+                await session.rollback()
+                run.record_error(ex_name, sym, 'rollup')
+    # 缓存一致性策略：标记序列缓存尾部过期（下一次读取只重查最后一根及之后的K线），随批量管道写入
+    if run.strategy == "write_through":
+        for ex_name, sym, tf, data in pending:
+            invalidate_tail(run.batch, ex_name, sym, tf)
+            run.batch.set(f"market:collect:wrote:{ex_name}:{sym}:{tf}", str(len(data)))
+        for ex_name, sym in {(p[0], p[1]) for p in pending if p[2] == '1m'}:
+            for tf in run.derived:
+                invalidate_tail(run.batch, ex_name, sym, tf)
+    # 实时推送：每个序列推送本批最后一根K线（与序列缓存返回的字段一致），随批量管道在 _writer 中本批写库后发送
+    for ex_name, sym, tf, data in pending:
+        k = data.latest()
+        await publish_live(kline_topic(ex_name, sym, tf), {
+            "symbol": sym, "interval": tf, "open_time": k.open_time.isoformat(), "close_time": k.close_time.isoformat(),
+            "open_price": float(k.open_price), "high_price": float(k.high_price), "low_price": float(k.low_price),
+            "close_price": float(k.close_price), "volume": float(k.volume),
+        }, batch=run.batch)
+
+async def _writer(queue: asyncio.Queue, run: _CollectRun):
+    """单一写库协程：尽量合并队列中已就绪的序列，凑满批次或队列暂空时落库"""
+    async with SessionLocal() as session:
+        while True:
+            item = await queue.get()
+            if item is None:
+                queue.task_done()
+                return
+            pending = [item]
+            size = len(item[3])
+            done = False
+            while size < WRITE_BATCH_ROWS:
+                try:
+                    nxt = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    break
+                if nxt is None:
+                    done = True
+                    break
+                pending.append(nxt)
+                size += len(nxt[3])
+            await _flush(session, pending, run)
+            # 每次写库后立即发送：本批的实时推送与缓存失效不应等到运行结束
+            await run.batch.flush()
+            for _ in range(len(pending) + (1 if done else 0)):
+                queue.task_done()
+            if done:
+                return
+
+def _publish_metrics(batch: RedisBatch, stats: Dict[str, Any]):
+    payload = json.dumps(stats)
+    batch.set("market:collect:metrics:last", payload)
+    batch.lpush("market:collect:metrics:history", payload)
+    batch.ltrim("market:collect:metrics:history", 0, 99)
+
+async def _collect_async():
+    started = time.monotonic()
+    mgr = runtime.exchange_manager()
+    async with SessionLocal() as session:
+        symbols, timeframes, strategy, coverage, window_hours, budget_seconds, rollup = await _get_collect_config(session)
+        # 一次性加载全部序列水位（Redis 哈希；冷启动时单条分组查询重建）
+        watermarks = WatermarkService()
+        await watermarks.load(session)
+    r = None
+    try:
+        r = await get_redis()
+    except Exception:
+        pass
+    batch = RedisBatch(r)
+    # 广播最近运行时间
+    now = int(time.time())
+    batch.set("sched:last:market.collect", str(now))
+    batch.lpush("sched:history", f"market.collect:{now}")
+    batch.ltrim("sched:history", 0, 499)
+    batch.set("market:collect:started", "1")
+    batch.set("market:collect:exchanges", str(len(mgr.get_exchange_names())))
+    # 可由 1m 聚合得到的时间框不再单独向交易所请求
+    timeframes = timeframes or ["1h"]
+    derived = derived_timeframes(timeframes) if rollup else []
+    fetch_timeframes = [tf for tf in timeframes if tf not in derived]
+    run = _CollectRun(coverage, strategy, started + budget_seconds, watermarks, derived, batch)
+    run.stats["derived_timeframes"] = derived
+    series = []
+    for ex_name in mgr.get_exchange_names():
+        adapter = mgr.get_exchange(ex_name)
+        if not adapter:
+            continue
+        # 如果未指定 symbols，则尝试从 YAML 配置中获取
+        local_symbols = symbols
+        try:
+            cfg = adapter.config or {}
             if not local_symbols:
-                continue
-            for sym in local_symbols:
-                for tf in (timeframes or ["1h"]):
-                    try:
-                        # 频率限制（每交易所-交易对-时间框）：最短间隔 60 秒
-                        try:
-                            rlim = await get_redis()
-                            import time
-                            keylim = f"market:collect:last:{ex_name}:{sym.replace('/', '_')}:{tf}"
-                            last = await rlim.get(keylim)
-                            now = int(time.time())
-                            if last is not None and now - int(last) < 60:
-                                continue
-                            await rlim.set(keylim, str(now))
-                        except Exception:
-                            pass
-                        # 采样窗口（仅写新段）：从最近 open_time 起采集
-                        last_row = await session.execute(text("SELECT MAX(open_time) AS last_ot FROM kline_data WHERE exchange=:ex AND symbol=:sym AND timeframe=:tf"), {"ex": ex_name, "sym": sym.replace('/', '_'), "tf": tf})
-                        last_ot = last_row.first().last_ot if last_row.first() else None
-                        start_dt = None
-                        if last_ot:
-                            start_dt = last_ot
-                            data = await adapter.get_klines(symbol=sym.replace('/', '_'), interval=tf, start_time=start_dt, limit=500)
-                        else:
-                            data = await adapter.get_klines(symbol=sym.replace('/', '_'), interval=tf, limit=200)
-                        try:
-                            rdbg = await get_redis()
-                            await rdbg.set(f"market:collect:data_count:{ex_name}:{sym.replace('/', '_')}:{tf}", str(len(data)))
-                        except Exception:
-                            pass
-                        # 批量写入数据库（executemany）
-                        rows = [
-                            {
-                                "ex": ex_name,
-                                "sym": sym.replace('/', '_'),
-                                "tf": tf,
-                                "ot": k.open_time,
-                                "o": k.open_price,
-                                "h": k.high_price,
-                                "l": k.low_price,
-                                "c": k.close_price,
-                                "v": k.volume,
-                            }
-                            for k in data
-                        ]
-                        wrote = 0
-                        if rows:
-                            if coverage == "write_new":
-                                await session.execute(
-                                    text(
-                                        """
-                                        INSERT INTO kline_data (exchange, symbol, timeframe, open_time, open, high, low, close, volume)
-                                        VALUES (:ex, :sym, :tf, :ot, :o, :h, :l, :c, :v)
-                                        ON CONFLICT DO NOTHING
-                                        """
-                                    ),
-                                    rows,
-                                )
-                            else:
-                                await session.execute(
-                                    text(
-                                        """
-                                        INSERT INTO kline_data (exchange, symbol, timeframe, open_time, open, high, low, close, volume)
-                                        VALUES (:ex, :sym, :tf, :ot, :o, :h, :l, :c, :v)
-                                        ON CONFLICT (exchange, symbol, timeframe, open_time)
-                                        DO UPDATE SET open=:o, high=:h, low=:l, close=:c, volume=:v
-                                        """
-                                    ),
-                                    rows,
-                                )
-                            wrote = len(rows)
-                            await session.commit()
-                        # 缓存一致性策略
-                        if strategy == "write_through":
-                            try:
-                                r = await get_redis()
-                                import json
-                                payload = [k.__dict__ for k in data]
-                                ck = f"klines:{ex_name}:{sym.replace('/', '_')}:{tf}:100"
-                                await r.setex(ck, 30, json.dumps(payload[:100]))
-                                await r.set(f"market:collect:wrote:{ex_name}:{sym.replace('/', '_')}:{tf}", str(wrote))
-                            except Exception:
-                                pass
-                    except Exception:
-                        try:
-                            rerr = await get_redis()
-                            import time
-                            ts = int(time.time())
-                            await rerr.set("market:error:last", str(ts))
-                            await rerr.lpush("market:error:history", f"{ex_name}:{sym.replace('/', '_')}:{tf}:{ts}")
-                            await rerr.ltrim("market:error:history", 0, 499)
-                        except Exception:
-                            pass
-                        continue
\ No newline at end of file
+                local_symbols = cfg.get('symbols', [])
+        except Exception:
+            pass
+        if not local_symbols:
+            continue
+        pacer = _ExchangePacer(getattr(adapter.exchange, "rate_limit", 10))
+        for sym in local_symbols:
+            for tf in fetch_timeframes:
+                series.append((adapter, pacer, ex_name, sym.replace('/', '_'), tf))
+    run.stats["series_total"] = len(series)
+    # 频率限制时间戳一次性读取
+    reads = 0
+    if series and r is not None:
+        try:
+            keys = [_rate_key(ex_name, sym, tf) for _, _, ex_name, sym, tf in series]
+            reads += 1
+            run.last_runs = {k: v for k, v in zip(keys, await r.mget(keys)) if v is not None}
+        except Exception:
+            run.last_runs = {}
+    queue: asyncio.Queue = asyncio.Queue(maxsize=QUEUE_MAXSIZE)
+    writer = asyncio.create_task(_writer(queue, run))
+    try:
+        await asyncio.gather(*[
+            _fetch_series(adapter, pacer, queue, run, ex_name, sym, tf)
+            for adapter, pacer, ex_name, sym, tf in series
+        ])
+    finally:
+        if not writer.done():
+            await queue.put(None)
+        await writer
+        stats = run.stats
+        stats["duration_ms"] = int((time.monotonic() - started) * 1000)
+        stats["budget_seconds"] = budget_seconds
+        stats["write_seconds"] = round(stats["write_seconds"], 4)
+        stats["rows_per_sec"] = int(stats["bars_written"] / stats["write_seconds"]) if stats["write_seconds"] > 0 else 0
+        # 已发生的批量写 + 读取 + 最后一次批量写
+        stats["redis_round_trips"] = batch.round_trips + reads + 1
+        stats["finished_at"] = int(time.time())
+        _publish_metrics(batch, stats)
+        await batch.flush()
@@ -0,0 +1,94 @@
+"""
+永续合约资金费率 / 未平仓量采集任务
+函数集注释：
+- collect_derivatives: 按配置采集资金费率结算历史、未平仓量历史与当前快照（预测费率、标记/指数价格）
+- _get_derivatives_config: 读取交易对（默认沿用 market.collect.symbols）、未平仓量采样周期与首次回补天数
+- _collect_async: 一次分组查询加载水位，各交易所并发、交易所内按交易对串行拉取，全部结果合并为一次批量写库
+"""
+import asyncio
+import json
+import time
+from typing import Any, Dict, List
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from celery_app import celery_app
+from database.redis import get_redis
+from modules.market.services.derivatives import collect_symbol, load_watermarks, write_funding, write_open_interest
+from services.config_cache import system_config_cache
+from tasks.runtime import SessionLocal, run_task, runtime
+
+async def _get_derivatives_config(session: AsyncSession):
+    symbols: List[str] = []
+    period = "5m"
+    backfill_days = 30
+    try:
+        m = await system_config_cache.get_many(['market.derivatives.symbols','market.collect.symbols','market.derivatives.oi_period','market.derivatives.backfill_days'])
+        if isinstance(m.get('market.derivatives.symbols'), list):
+            symbols = [str(s) for s in m['market.derivatives.symbols']]
+        elif isinstance(m.get('market.collect.symbols'), list):
+            symbols = [str(s) for s in m['market.collect.symbols']]
+        if m.get('market.derivatives.oi_period'):
+            period = str(m['market.derivatives.oi_period']).strip('"')
+        if m.get('market.derivatives.backfill_days'):
+            backfill_days = int(str(m['market.derivatives.backfill_days']).strip('"'))
+    except Exception:
+        pass
+    return symbols, period, backfill_days
+
+@celery_app.task(name="tasks.market.derivatives_collect", autoretry_for=(Exception,), retry_kwargs={"max_retries": 3}, retry_backoff=True, acks_late=True, time_limit=900)
+def collect_derivatives():
+    return run_task(_collect_async)
+
+async def _collect_exchange(adapter, ex_name: str, symbols: List[str], marks, period: str, backfill_days: int):
+    funding, oi, counts = [], [], {"funding": 0, "open_interest": 0, "errors": 0}
+    for sym in symbols:
+        f_rows, o_rows, c = await collect_symbol(adapter, ex_name, sym.replace('_', '/'), marks, period, backfill_days)
+        funding.extend(f_rows)
+        oi.extend(o_rows)
+        for k in counts:
+            counts[k] += c[k]
+    return funding, oi, counts
+
+async def _collect_async():
+    started = time.monotonic()
+    mgr = runtime.exchange_manager()
+    stats: Dict[str, Any] = {"series": 0, "funding_rows": 0, "open_interest_rows": 0, "errors": 0}
+    async with SessionLocal() as session:
+        symbols, period, backfill_days = await _get_derivatives_config(session)
+        try:
+            marks = await load_watermarks(session)
+        except Exception:
+            await session.rollback()
+            marks = {}
+        jobs = []
+        for ex_name in mgr.get_exchange_names():
+            adapter = mgr.get_exchange(ex_name)
+            if not adapter:
+                continue
+            local_symbols = symbols or (adapter.config or {}).get('symbols', [])
+            if not local_symbols:
+                continue
+            stats["series"] += len(local_symbols)
+            jobs.append(_collect_exchange(adapter, ex_name, local_symbols, marks, period, backfill_days))
+        funding, oi = [], []
+        for f_rows, o_rows, c in await asyncio.gather(*jobs):
+            funding.extend(f_rows)
+            oi.extend(o_rows)
+            stats["errors"] += c["errors"]
+        try:
+            stats["funding_rows"] = await write_funding(session, funding)
+            stats["open_interest_rows"] = await write_open_interest(session, oi)
+            await session.commit()
+        except Exception as e:
+            await session.rollback()
+            stats["errors"] += 1
+            stats["write_error"] = str(e)
+    stats["duration_ms"] = int((time.monotonic() - started) * 1000)
+    stats["finished_at"] = int(time.time())
+    try:
+        r = await get_redis()
+        await r.set("market:derivatives:metrics:last", json.dumps(stats))
+    except Exception:
+        pass
+    return stats
@@ -0,0 +1,89 @@
+"""
+历史K线批量导出（命令行）
+函数集注释：
+- _export_db: 直接连库，服务端游标流式写出
+- _export_http: 通过 /api/v1/market/export 下载（--url 指向核心服务）
+- main: 参数解析；--resume 时以已有文件大小作为字节偏移续传并追加写入。
+  按字节续传要求两次导出逐字节一致，因此续传必须显式给出首次导出的 --end（未给 --end 时首次导出会打印实际使用的结束时间）
+示例：
+  python -m tasks.market_export --exchange gateio --symbols BTC/USDT,ETH/USDT --timeframe 1m \\
+      --start 2023-01-01 --end 2024-01-01 --format ndjson -o klines.ndjson.gz --resume
+"""
+import argparse
+import asyncio
+import os
+import time
+from datetime import datetime
+from typing import List
+
+from modules.market.services.export import EXPORT_FORMATS, available, export_stream
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+def _parse_time(v: str) -> datetime:
+    return datetime.fromtimestamp(int(v)) if v.isdigit() else datetime.fromisoformat(v)
+
+async def _export_db(args, symbols: List[str], offset: int, out) -> int:
+    from tasks.runtime import SessionLocal
+
+    written = 0
+    async with SessionLocal() as session:
+        async for chunk in export_stream(session, args.exchange, symbols, args.timeframe, args.start, args.end,
+                                         args.format, offset=offset, chunk_rows=args.chunk_rows):
+            out.write(chunk)
+            written += len(chunk)
+    return written
+
+async def _export_http(args, symbols: List[str], offset: int, out) -> int:
+    import httpx
+
+    params = {
+        "exchange": args.exchange, "symbols": ",".join(symbols), "timeframe": args.timeframe,
+        "start_time": int(args.start.timestamp()), "end_time": int(args.end.timestamp()),
+        "format": args.format, "offset": offset,
+    }
+    written = 0
+    async with httpx.AsyncClient(base_url=args.url, timeout=None) as client:
+        async with client.stream("GET", "/api/v1/market/export", params=params) as resp:
+            resp.raise_for_status()
+            if resp.headers.get("content-type", "").startswith("application/json"):
+                raise RuntimeError((await resp.aread()).decode())
+            async for chunk in resp.aiter_raw():
+                out.write(chunk)
+                written += len(chunk)
+    return written
+
+def main(argv=None) -> None:
+    p = argparse.ArgumentParser(description="流式导出历史K线（csv / ndjson.gz / parquet）")
+    p.add_argument("--exchange", required=True)
+    p.add_argument("--symbols", required=True, help="逗号分隔")
+    p.add_argument("--timeframe", required=True)
+    p.add_argument("--start", required=True, type=_parse_time, help="ISO 时间或秒级时间戳")
+    p.add_argument("--end", type=_parse_time, default=None)
+    p.add_argument("--format", choices=EXPORT_FORMATS, default="csv")
+    p.add_argument("-o", "--output", required=True)
+    p.add_argument("--resume", action="store_true", help="已有文件时从其末尾续传")
+    p.add_argument("--url", default=None, help="经由核心服务导出，如 http://localhost:8001")
+    p.add_argument("--chunk-rows", type=int, default=5000)
+    args = p.parse_args(argv)
+    if args.url is None and not available(args.format):
+        p.error(f"{args.format} 导出需要安装 pyarrow")
+    symbols = [s.strip() for s in args.symbols.split(",") if s.strip()]
+    offset = os.path.getsize(args.output) if args.resume and os.path.exists(args.output) else 0
+    if offset and (args.end is None or args.end > datetime.now()):
+        # 结束时间随时间推移会让多交易对导出中后续字节整体偏移，追加出错位的尾部
+        p.error("--resume 续传须给出首次导出使用的 --end（且不晚于当前时间）")
+    if args.end is None:
+        args.end = datetime.fromtimestamp(int(time.time()))
+        logger.info(f"未指定 --end，使用 {int(args.end.timestamp())}；中断后续传请加 --end {int(args.end.timestamp())}")
+    with open(args.output, "ab" if offset else "wb") as out:
+        run = _export_http if args.url else _export_db
+        written = asyncio.run(run(args, symbols, offset, out))
+    logger.info(f"导出完成 {args.output}: 续传偏移 {offset}，本次写入 {written} 字节")
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,68 @@
+"""
+K线缺口扫描与回补任务
+函数集注释：
+- scan_kline_gaps: 扫描近期K线缺口并按优先级写入回补队列
+- backfill_kline_gaps: 在每交易所请求预算内执行回补
+"""
+import json
+import time
+
+from celery_app import celery_app
+from database.redis import get_redis
+from modules.market.services.gaps import active_series, enqueue_gaps, run_backfill, scan_gaps
+from services.config_cache import system_config_cache
+from tasks.runtime import SessionLocal, run_task, runtime
+
+async def _get_int_config(key: str, default: int) -> int:
+    try:
+        value = await system_config_cache.get(key)
+        if value:
+            return int(str(value).strip('"'))
+    except Exception:
+        pass
+    return default
+
+@celery_app.task(name="tasks.market.gap_scan", acks_late=True, time_limit=900)
+def scan_kline_gaps():
+    run_task(_scan_async)
+
+@celery_app.task(name="tasks.market.backfill", acks_late=True, time_limit=900)
+def backfill_kline_gaps():
+    run_task(_backfill_async)
+
+async def _scan_async():
+    started = time.monotonic()
+    async with SessionLocal() as session:
+        lookback = await _get_int_config('market.gaps.lookback_days', 30)
+        gaps = await scan_gaps(session, lookback_days=lookback)
+        active = await active_series(session)
+    queued = 0
+    try:
+        queued = await enqueue_gaps(gaps, active)
+    except Exception:
+        pass
+    try:
+        r = await get_redis()
+        await r.set("market:gaps:last_scan", json.dumps({
+            "gaps": len(gaps),
+            "missing_bars": sum(g["missing"] for g in gaps),
+            "queued": queued,
+            "duration_ms": int((time.monotonic() - started) * 1000),
+            "finished_at": int(time.time()),
+        }))
+    except Exception:
+        pass
+
+async def _backfill_async():
+    started = time.monotonic()
+    mgr = runtime.exchange_manager()
+    async with SessionLocal() as session:
+        budget = await _get_int_config('market.backfill.budget_per_exchange', 20)
+        stats = await run_backfill(session, mgr, budget_per_exchange=budget)
+    stats["duration_ms"] = int((time.monotonic() - started) * 1000)
+    stats["finished_at"] = int(time.time())
+    try:
+        r = await get_redis()
+        await r.set("market:backfill:last", json.dumps(stats))
+    except Exception:
+        pass
@@ -0,0 +1,58 @@
+"""
+订单簿记录（常驻）
+函数集注释：
+- _get_orderbook_config: 读取是否启用、订阅交易对（默认沿用 market.collect.symbols）、快照间隔、增量写库间隔与跟踪档位
+- _record_async: 常驻协程：订阅订单簿推送，增量按块写入 orderbook_deltas，按间隔写全量快照
+与逐笔成交采集相同，由 tasks.runtime.serve 常驻 worker 一并启动，或单独运行 python -m tasks.market_orderbook
+"""
+import asyncio
+from typing import List
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from modules.market.services.orderbook_store import OrderBookRecorder
+from services.config_cache import system_config_cache
+from tasks.runtime import SessionLocal, runtime
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+async def _get_orderbook_config(session: AsyncSession):
+    enabled = False
+    symbols: List[str] = []
+    snapshot_interval = 60.0
+    flush_interval = 5.0
+    depth = 50
+    try:
+        m = await system_config_cache.get_many(['market.orderbook.enabled','market.orderbook.symbols','market.collect.symbols','market.orderbook.snapshot_interval','market.orderbook.flush_interval','market.orderbook.depth'])
+        if m.get('market.orderbook.enabled') is not None:
+            enabled = str(m['market.orderbook.enabled']).strip('"').lower() in ('1', 'true', 'yes')
+        if isinstance(m.get('market.orderbook.symbols'), list):
+            symbols = [str(s) for s in m['market.orderbook.symbols']]
+        elif isinstance(m.get('market.collect.symbols'), list):
+            symbols = [str(s) for s in m['market.collect.symbols']]
+        if m.get('market.orderbook.snapshot_interval'):
+            snapshot_interval = float(str(m['market.orderbook.snapshot_interval']).strip('"'))
+        if m.get('market.orderbook.flush_interval'):
+            flush_interval = float(str(m['market.orderbook.flush_interval']).strip('"'))
+        if m.get('market.orderbook.depth'):
+            depth = int(str(m['market.orderbook.depth']).strip('"'))
+    except Exception:
+        pass
+    return enabled, symbols, snapshot_interval, flush_interval, depth
+
+async def _record_async(force: bool = False):
+    async with SessionLocal() as session:
+        enabled, symbols, snapshot_interval, flush_interval, depth = await _get_orderbook_config(session)
+    if not (enabled or force):
+        return
+    recorder = OrderBookRecorder(SessionLocal, snapshot_interval=snapshot_interval, flush_interval=flush_interval, depth=depth)
+    subscribed = await recorder.subscribe(runtime.exchange_manager(), symbols or None)
+    logger.info(f"订单簿记录订阅: {subscribed}")
+    await recorder.run()
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(_record_async(force=True))
+    except KeyboardInterrupt:
+        pass
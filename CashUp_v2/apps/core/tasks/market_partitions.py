@@ -0,0 +1,102 @@
+"""
+K线分区维护任务
+函数集注释：
+- maintain_kline_partitions: 每日预建未来月份分区，并按各时间框保留策略分离、归档、删除过期子分区；
+  同时滚动预建逐笔成交日分区并清理超出保留期的成交分区，删除超出保留期的订单簿快照与增量
+"""
+import json
+import os
+import time
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from celery_app import celery_app
+from database.redis import get_redis
+from modules.market.services.partitions import (
+    DEFAULT_RETENTION_DAYS,
+    DEFAULT_TRADE_RETENTION_DAYS,
+    archive_and_drop,
+    ensure_future_partitions,
+    ensure_trade_partitions,
+    expired_partitions,
+    expired_trade_partitions,
+    is_partitioned,
+    parse_retention_policy,
+)
+from modules.market.services.orderbook_store import prune_orderbook
+from services.config_cache import system_config_cache
+from tasks.runtime import SessionLocal, run_task
+
+async def _get_retention_config(session: AsyncSession):
+    policy = dict(DEFAULT_RETENTION_DAYS)
+    archive_dir = os.path.join(os.getcwd(), "data", "archive", "kline")
+    months_ahead = 3
+    trade_days = DEFAULT_TRADE_RETENTION_DAYS
+    orderbook_days = 7
+    try:
+        m = await system_config_cache.get_many(['market.retention.days','market.retention.archive_dir','market.partitions.months_ahead','market.retention.trades_days','market.retention.orderbook_days'])
+        policy = parse_retention_policy(m.get('market.retention.days'))
+        if m.get('market.retention.archive_dir'):
+            archive_dir = str(m['market.retention.archive_dir']).strip('"')
+        if m.get('market.partitions.months_ahead'):
+            months_ahead = int(str(m['market.partitions.months_ahead']).strip('"'))
+        if 'market.retention.trades_days' in m:
+            v = m['market.retention.trades_days']
+            trade_days = int(str(v).strip('"')) if v is not None else None
+        if 'market.retention.orderbook_days' in m:
+            v = m['market.retention.orderbook_days']
+            orderbook_days = int(str(v).strip('"')) if v is not None else None
+    except Exception:
+        pass
+    return policy, archive_dir, months_ahead, trade_days, orderbook_days
+
+@celery_app.task(name="tasks.market.partition_maintenance", acks_late=True, time_limit=3600)
+def maintain_kline_partitions():
+    run_task(_maintain_async)
+
+async def _maintain_async():
+    started = time.monotonic()
+    result = {"partitioned": False, "created": [], "archived": [], "errors": []}
+    expired = []
+    async with SessionLocal() as session:
+        try:
+            result["partitioned"] = await is_partitioned(session)
+        except Exception as e:
+            result["errors"].append(str(e))
+        policy, archive_dir, months_ahead, trade_days, orderbook_days = await _get_retention_config(session)
+        if result["partitioned"]:
+            try:
+                result["created"] = await ensure_future_partitions(session, months_ahead)
+            except Exception as e:
+                await session.rollback()
+                result["errors"].append(f"create: {e}")
+            try:
+                expired += await expired_partitions(session, policy)
+            except Exception as e:
+                result["errors"].append(f"scan: {e}")
+        try:
+            if await is_partitioned(session, "market_trades"):
+                result["created"] += await ensure_trade_partitions(session)
+                expired += await expired_trade_partitions(session, trade_days)
+        except Exception as e:
+            await session.rollback()
+            result["errors"].append(f"trades: {e}")
+        for part in expired:
+            try:
+                result["archived"].append(await archive_and_drop(session, part, archive_dir))
+            except Exception as e:
+                await session.rollback()
+                result["errors"].append(f"{part['name']}: {e}")
+        if orderbook_days is not None:
+            try:
+                result["orderbook_pruned"] = await prune_orderbook(session, orderbook_days)
+            except Exception as e:
+                await session.rollback()
+                result["errors"].append(f"orderbook: {e}")
+    result["duration_ms"] = int((time.monotonic() - started) * 1000)
+    result["finished_at"] = int(time.time())
+    try:
+        r = await get_redis()
+        await r.set("market:partitions:last", json.dumps(result))
+    except Exception:
+        pass
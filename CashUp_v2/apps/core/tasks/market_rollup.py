@@ -0,0 +1,58 @@
+"""
+聚合K线对账任务
+函数集注释：
+- reconcile_rollups: 对近期存在聚合K线的序列，拉取交易所原生K线比对并修正差异
+"""
+import json
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+from celery_app import celery_app
+from database.redis import get_redis
+from modules.market.services.rollup import reconcile_series
+from tasks.runtime import SessionLocal, run_task, runtime
+
+@celery_app.task(name="tasks.market.rollup_reconcile", acks_late=True, time_limit=900)
+def reconcile_rollups():
+    run_task(_reconcile_async)
+
+async def _reconcile_async():
+    started = time.monotonic()
+    mgr = runtime.exchange_manager()
+    stats = {"series": 0, "compared": 0, "mismatched": 0, "errors": 0}
+    mismatches = []
+    async with SessionLocal() as session:
+        try:
+            res = await session.execute(text(
+                "SELECT DISTINCT exchange, symbol, timeframe FROM kline_data WHERE source='rollup' AND open_time >= :since"
+            ), {"since": datetime.now() - timedelta(days=2)})
+            series = res.fetchall()
+        except Exception:
+            series = []
+        for row in series:
+            adapter = mgr.get_exchange(row.exchange)
+            if adapter is None:
+                continue
+            stats["series"] += 1
+            try:
+                result = await reconcile_series(session, adapter, row.exchange, row.symbol, row.timeframe)
+            except Exception:
+                await session.rollback()
+                stats["errors"] += 1
+                continue
+            stats["compared"] += result["compared"]
+            stats["mismatched"] += result["mismatched"]
+            for m in result["mismatches"]:
+                mismatches.append(json.dumps({"exchange": row.exchange, "symbol": row.symbol, "timeframe": row.timeframe, **m}))
+    stats["duration_ms"] = int((time.monotonic() - started) * 1000)
+    stats["finished_at"] = int(time.time())
+    try:
+        r = await get_redis()
+        await r.set("market:rollup:reconcile:last", json.dumps(stats))
+        if mismatches:
+            await r.lpush("market:rollup:mismatches", *mismatches)
+            await r.ltrim("market:rollup:mismatches", 0, 499)
+    except Exception:
+        pass
@@ -0,0 +1,55 @@
+"""
+逐笔成交采集（常驻）
+函数集注释：
+- _get_trade_config: 读取是否启用、订阅交易对（默认沿用 market.collect.symbols）与写库间隔
+- _stream_async: 常驻协程：订阅成交流，按间隔批量写入 market_trades 并发布成交速率/缺口指标
+成交流需要长连接，不适合作为短周期 Celery 任务：由 tasks.runtime.serve 常驻 worker 一并启动，
+或单独运行 python -m tasks.market_trades
+"""
+import asyncio
+from typing import List
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from modules.market.services.trades import TradeIngestor
+from services.config_cache import system_config_cache
+from tasks.runtime import SessionLocal, runtime
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+async def _get_trade_config(session: AsyncSession):
+    enabled = False
+    symbols: List[str] = []
+    flush_interval = 1.0
+    try:
+        m = await system_config_cache.get_many(['market.trades.enabled','market.trades.symbols','market.collect.symbols','market.trades.flush_interval'])
+        if m.get('market.trades.enabled') is not None:
+            enabled = str(m['market.trades.enabled']).strip('"').lower() in ('1', 'true', 'yes')
+        if isinstance(m.get('market.trades.symbols'), list):
+            symbols = [str(s) for s in m['market.trades.symbols']]
+        elif isinstance(m.get('market.collect.symbols'), list):
+            symbols = [str(s) for s in m['market.collect.symbols']]
+        if m.get('market.trades.flush_interval'):
+            flush_interval = float(str(m['market.trades.flush_interval']).strip('"'))
+    except Exception:
+        pass
+    return enabled, symbols, flush_interval
+
+async def _stream_async(force: bool = False):
+    async with SessionLocal() as session:
+        enabled, symbols, flush_interval = await _get_trade_config(session)
+    if not (enabled or force):
+        return
+    ingestor = TradeIngestor(SessionLocal, flush_interval=flush_interval)
+    await ingestor.subscribe(runtime.exchange_manager(), symbols or None)
+    logger.info(f"逐笔成交订阅: {ingestor.subscribed}")
+    if ingestor.unsupported:
+        logger.warning(f"以下交易所适配器未实现成交推送，未订阅: {ingestor.unsupported}")
+    await ingestor.run()
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(_stream_async(force=True))
+    except KeyboardInterrupt:
+        pass
@@ -1,18 +1,12 @@
 from datetime import timedelta
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
-from sqlalchemy.orm import sessionmaker
 from sqlalchemy import text
 
-from config.settings import settings
 from celery_app import celery_app
-
-engine = create_async_engine(settings.DATABASE_URL)
-SessionLocal = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+from tasks.runtime import SessionLocal, run_task
 
 @celery_app.task(name="tasks.rss.compute_correlation")
 def compute_correlation():
-    import asyncio
-    asyncio.run(_compute_correlation_async())
+    run_task(_compute_correlation_async)
 
 async def _compute_correlation_async():
     async with SessionLocal() as session:
@@ -0,0 +1,306 @@
+"""
+任务常驻运行时
+函数集注释：
+- TaskRuntime: 每个 worker 进程一个常驻事件循环线程，跨次运行复用同一数据库引擎/连接池、交易所管理器、交易所 HTTP 会话池（按主机共享）、通用 HTTP 会话与 Redis 客户端
+- runtime: 进程级运行时实例（首次提交时启动线程，fork 后在子进程内重新启动）
+- SessionLocal: 所有任务共用的会话工厂（绑定共享引擎）
+- run_task: Celery 任务入口：常驻模式下把协程提交到运行时循环并同步等待结果；TASK_RUNTIME=oneshot 时回退 asyncio.run 并在结束时释放资源
+- build_exchange_manager: 按 configs/exchanges.yaml 构建交易所管理器
+- serve: 独立常驻 worker（python -m tasks.runtime）：同一循环内按系统配置间隔直接执行任务，不经 Celery 派发；
+  并启动常驻流式任务（STREAM_TARGETS：逐笔成交采集、订单簿记录，未启用时立即返回）
+"""
+import asyncio
+import importlib
+import os
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import aiohttp
+import yaml
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from config.settings import settings
+from app.adapters.exchanges.base import ExchangeManager
+from app.adapters.exchanges.http_sessions import http_sessions
+from database.redis import redis_manager
+from services.config_cache import system_config_cache
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# 共享引擎：连接在运行时循环内惰性建立，常驻模式下跨次运行保持温热
+engine = create_async_engine(
+    settings.DATABASE_URL,
+    pool_size=int(os.getenv("TASK_DB_POOL_SIZE", "5")),
+    max_overflow=int(os.getenv("TASK_DB_MAX_OVERFLOW", "5")),
+    pool_pre_ping=True,
+    pool_recycle=1800,
+)
+SessionLocal = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+# 任务进程内的配置读取走共享引擎；未运行订阅协程的循环按版本号比对刷新
+system_config_cache.configure(SessionLocal)
+
+def _exchanges_config_path() -> str:
+    return os.path.join(os.getcwd(), "configs", "exchanges.yaml")
+
+def _load_exchanges_config() -> dict:
+    with open(_exchanges_config_path(), "r", encoding="utf-8") as f:
+        return yaml.safe_load(f)
+
+def build_exchange_manager() -> ExchangeManager:
+    cfg = _load_exchanges_config()
+    mgr = ExchangeManager()
+    for ex_name, conf in (cfg or {}).items():
+        if ex_name in ("common", "risk_control", "monitoring"):
+            continue
+        base_conf = conf if isinstance(conf, dict) else {}
+        # 环境变量展开
+        for k, v in list(base_conf.items()):
+            if isinstance(v, str) and v.startswith("${") and v.endswith("}"):
+                env_key = v[2:-1]
+                base_conf[k] = os.getenv(env_key, "")
+        if bool(base_conf.get("enabled", False)):
+            base_conf["name"] = base_conf.get("name", ex_name)
+            base_conf["type"] = base_conf.get("type", ex_name)
+            mgr.add_exchange(ex_name, base_conf)
+    return mgr
+
+def _runtime_mode() -> str:
+    mode = str(os.getenv("TASK_RUNTIME", "persistent")).lower()
+    return "oneshot" if mode in ("oneshot", "asyncio.run", "off", "0", "false") else "persistent"
+
+class TaskRuntime:
+    """常驻事件循环运行时
+
+    循环运行在后台守护线程中；Celery 工作线程通过 run_coroutine_threadsafe 提交协程并阻塞等待，
+    因此引擎连接池、aiohttp 会话与 Redis 客户端始终绑定在同一个循环上，可以安全复用。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._manager: Optional[ExchangeManager] = None
+        self._manager_mtime: Optional[float] = None
+        self._http: Optional[aiohttp.ClientSession] = None
+        self.started_at: Optional[float] = None
+        self.runs = 0
+        self.failures = 0
+        self.manager_builds = 0
+
+    # ---- 循环线程 ----
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            # fork 出的子进程不继承线程：按 pid 判断并重建循环与进程内资源
+            if self._loop is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return self._loop
+            if self._pid is not None and self._pid != os.getpid():
+                self._reset_after_fork()
+            loop = asyncio.new_event_loop()
+            ready = threading.Event()
+
+            def _run():
+                asyncio.set_event_loop(loop)
+                loop.call_soon(ready.set)
+                loop.run_forever()
+
+            self._thread = threading.Thread(target=_run, name="task-runtime", daemon=True)
+            self._thread.start()
+            ready.wait()
+            self._loop = loop
+            self._pid = os.getpid()
+            self.started_at = time.time()
+            logger.info(f"任务运行时已启动 pid={self._pid}")
+            return loop
+
+    def _reset_after_fork(self) -> None:
+        self._loop = None
+        self._thread = None
+        self._manager = None
+        self._manager_mtime = None
+        self._http = None
+        http_sessions.reset()
+        redis_manager.redis_client = None
+        # 父进程的连接不可在子进程中复用，丢弃但不关闭
+        engine.sync_engine.dispose(close=False)
+
+    def submit(self, coro: Awaitable[Any]) -> Future:
+        loop = self._ensure_loop()
+        return asyncio.run_coroutine_threadsafe(self._track(coro), loop)
+
+    def run(self, coro_fn: Callable[..., Awaitable[Any]], *args, timeout: Optional[float] = None, **kwargs) -> Any:
+        return self.submit(coro_fn(*args, **kwargs)).result(timeout)
+
+    async def _track(self, coro: Awaitable[Any]) -> Any:
+        self.runs += 1
+        try:
+            return await coro
+        except Exception:
+            self.failures += 1
+            raise
+
+    # ---- 共享资源（需在运行时循环内调用）----
+    def exchange_manager(self) -> ExchangeManager:
+        """返回常驻交易所管理器；exchanges.yaml 变更后重建"""
+        try:
+            mtime = os.path.getmtime(_exchanges_config_path())
+        except OSError:
+            mtime = None
+        if self._manager is None or mtime != self._manager_mtime:
+            old = self._manager
+            self._manager = build_exchange_manager()
+            self._manager_mtime = mtime
+            self.manager_builds += 1
+            if old is not None:
+                asyncio.get_running_loop().create_task(old.close())
+        return self._manager
+
+    def http_session(self) -> aiohttp.ClientSession:
+        if self._http is None or self._http.closed:
+            self._http = aiohttp.ClientSession()
+        return self._http
+
+    async def release(self) -> None:
+        """关闭本循环持有的全部资源（oneshot 模式每次运行后、常驻模式进程退出时调用）"""
+        if self._manager is not None:
+            try:
+                await self._manager.close()
+            except Exception:
+                pass
+            self._manager = None
+            self._manager_mtime = None
+        if self._http is not None:
+            try:
+                await self._http.close()
+            except Exception:
+                pass
+            self._http = None
+        await http_sessions.close()
+        try:
+            await redis_manager.close()
+        except Exception:
+            redis_manager.redis_client = None
+        try:
+            await engine.dispose()
+        except Exception:
+            pass
+
+    def shutdown(self, timeout: float = 10.0) -> None:
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            if loop is None or self._pid != os.getpid():
+                return
+            self._loop = None
+        try:
+            asyncio.run_coroutine_threadsafe(self.release(), loop).result(timeout)
+        except Exception as e:
+            logger.error(f"任务运行时释放资源失败: {e}")
+        loop.call_soon_threadsafe(loop.stop)
+        if thread is not None:
+            thread.join(timeout)
+        logger.info("任务运行时已停止")
+
+    def stats(self) -> Dict[str, Any]:
+        pool = None
+        try:
+            pool = engine.pool.status()
+        except Exception:
+            pass
+        return {
+            "mode": _runtime_mode(),
+            "pid": self._pid,
+            "alive": bool(self._thread is not None and self._thread.is_alive()),
+            "uptime_seconds": int(time.time() - self.started_at) if self.started_at else 0,
+            "runs": self.runs,
+            "failures": self.failures,
+            "manager_builds": self.manager_builds,
+            "db_pool": pool,
+        }
+
+# 进程级运行时实例
+runtime = TaskRuntime()
+
+async def _oneshot(coro_fn: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+    try:
+        return await coro_fn(*args, **kwargs)
+    finally:
+        await runtime.release()
+
+def run_task(coro_fn: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+    """Celery 任务同步入口"""
+    if _runtime_mode() == "oneshot":
+        return asyncio.run(_oneshot(coro_fn, *args, **kwargs))
+    return runtime.run(coro_fn, *args, **kwargs)
+
+try:
+    from celery.signals import worker_process_shutdown
+
+    @worker_process_shutdown.connect
+    def _on_worker_process_shutdown(**_):
+        runtime.shutdown()
+except Exception:
+    pass
+
+# 任务名 -> 协程入口（serve 模式下直接在循环内执行）
+JOB_TARGETS = {
+    "tasks.rss.fetch_feeds": ("tasks.rss", "_fetch_feeds_async"),
+    "tasks.rss.analyze_sentiment": ("tasks.rss", "_analyze_sentiment_async"),
+    "tasks.rss.compute_correlation": ("tasks.news_correlation", "_compute_correlation_async"),
+    "tasks.trading.sync": ("tasks.sync", "_sync_async"),
+    "tasks.market.collect": ("tasks.market_collector", "_collect_async"),
+    "tasks.market.gap_scan": ("tasks.market_gaps", "_scan_async"),
+    "tasks.market.backfill": ("tasks.market_gaps", "_backfill_async"),
+    "tasks.market.rollup_reconcile": ("tasks.market_rollup", "_reconcile_async"),
+    "tasks.market.partition_maintenance": ("tasks.market_partitions", "_maintain_async"),
+    "tasks.market.derivatives_collect": ("tasks.market_derivatives", "_collect_async"),
+}
+
+# 常驻流式任务：serve 启动时一并运行，各自按系统配置决定是否启用
+STREAM_TARGETS = {
+    "tasks.market.trades_stream": ("tasks.market_trades", "_stream_async"),
+    "tasks.market.orderbook_recorder": ("tasks.market_orderbook", "_record_async"),
+}
+
+async def serve(heartbeat_seconds: float = 30.0) -> None:
+    """独立常驻 worker：复用调度心跳的间隔判定，任务以协程形式在本循环内执行（同名任务不重入）"""
+    from tasks.scheduler import _heartbeat_async
+
+    running: Dict[str, asyncio.Task] = {}
+    system_config_cache.start_listener()
+    for task_name, (module, func) in STREAM_TARGETS.items():
+        coro_fn = getattr(importlib.import_module(module), func)
+        running[task_name] = asyncio.create_task(runtime._track(coro_fn()), name=task_name)
+
+    def dispatch(task_name: str) -> None:
+        target = JOB_TARGETS.get(task_name)
+        if target is None:
+            logger.warning(f"未注册的任务: {task_name}")
+            return
+        current = running.get(task_name)
+        if current is not None and not current.done():
+            return
+        coro_fn = getattr(importlib.import_module(target[0]), target[1])
+        running[task_name] = asyncio.create_task(runtime._track(coro_fn()), name=task_name)
+
+    try:
+        while True:
+            try:
+                await _heartbeat_async(dispatch)
+            except Exception as e:
+                logger.error(f"常驻调度心跳异常: {e}")
+            await asyncio.sleep(heartbeat_seconds)
+    finally:
+        for t in running.values():
+            t.cancel()
+        await system_config_cache.stop_listener()
+        await runtime.release()
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
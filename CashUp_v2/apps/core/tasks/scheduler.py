@@ -1,14 +1,9 @@
-import asyncio
 import time
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy import text
-from config.settings import settings
+from sqlalchemy.ext.asyncio import AsyncSession
 from celery_app import celery_app
 from database.redis import get_redis
-
-engine = create_async_engine(settings.DATABASE_URL)
-SessionLocal = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+from services.config_cache import system_config_cache
+from tasks.runtime import SessionLocal, run_task
 
 def _to_int(v, d):
     try:
@@ -23,19 +18,29 @@ async def _get_intervals(session: AsyncSession):
         'rss.correlation.interval',
         'trading.sync.interval',
         'market.collect.interval',
+        'market.gaps.interval',
+        'market.backfill.interval',
+        'market.rollup.reconcile.interval',
+        'market.partitions.interval',
+        'market.derivatives.interval',
     ]
-    res = await session.execute(text("SELECT config_key, config_value FROM system_configs WHERE config_key = ANY(:arr)").bindparams(arr=keys))
-    rows = res.fetchall()
-    m = {r.config_key: r.config_value for r in rows}
+    m = await system_config_cache.get_many(keys)
     return {
         'rss.fetch': _to_int(m.get('rss.fetch.interval'), 300),
         'rss.analyze': _to_int(m.get('rss.analyze.interval'), 600),
         'rss.correlation': _to_int(m.get('rss.correlation.interval'), 900),
         'trading.sync': _to_int(m.get('trading.sync.interval'), 60),
         'market.collect': _to_int(m.get('market.collect.interval'), 300),
+        'market.gaps': _to_int(m.get('market.gaps.interval'), 3600),
+        'market.backfill': _to_int(m.get('market.backfill.interval'), 300),
+        'market.rollup.reconcile': _to_int(m.get('market.rollup.reconcile.interval'), 3600),
+        'market.partitions': _to_int(m.get('market.partitions.interval'), 86400),
+        'market.derivatives': _to_int(m.get('market.derivatives.interval'), 300),
     }
 
-async def _heartbeat_async():
+async def _heartbeat_async(dispatch=None):
+    # dispatch: 任务派发函数，默认经 Celery 投递；常驻 worker（tasks.runtime.serve）传入本地执行函数
+    dispatch = dispatch or celery_app.send_task
     async with SessionLocal() as session:
         intervals = await _get_intervals(session)
         r = None
@@ -56,7 +61,7 @@ async def _heartbeat_async():
                 return True
             return inner()
         async def enqueue(name, task):
-            celery_app.send_task(task)
+            dispatch(task)
             if r is not None:
                 await r.lpush('sched:history', f"{name}:{now}")
                 await r.ltrim('sched:history', 0, 199)
@@ -70,7 +75,17 @@ async def _heartbeat_async():
             await enqueue('trading.sync', 'tasks.trading.sync')
         if await should_run('market.collect', intervals['market.collect']):
             await enqueue('market.collect', 'tasks.market.collect')
+        if await should_run('market.gaps', intervals['market.gaps']):
+            await enqueue('market.gaps', 'tasks.market.gap_scan')
+        if await should_run('market.backfill', intervals['market.backfill']):
+            await enqueue('market.backfill', 'tasks.market.backfill')
+        if await should_run('market.rollup.reconcile', intervals['market.rollup.reconcile']):
+            await enqueue('market.rollup.reconcile', 'tasks.market.rollup_reconcile')
+        if await should_run('market.partitions', intervals['market.partitions']):
+            await enqueue('market.partitions', 'tasks.market.partition_maintenance')
+        if await should_run('market.derivatives', intervals['market.derivatives']):
+            await enqueue('market.derivatives', 'tasks.market.derivatives_collect')
 
 @celery_app.task(name="tasks.scheduler.heartbeat")
 def scheduler_heartbeat():
-    asyncio.run(_heartbeat_async())
\ No newline at end of file
+    run_task(_heartbeat_async)
\ No newline at end of file
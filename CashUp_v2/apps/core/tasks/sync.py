@@ -1,30 +1,24 @@
 import asyncio
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
-from sqlalchemy.orm import sessionmaker
 from sqlalchemy import text
-from config.settings import settings
 from celery_app import celery_app
 from database.redis import get_redis
-from api.deps import get_exchange_manager
-
-engine = create_async_engine(settings.DATABASE_URL)
-SessionLocal = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+from services.config_cache import system_config_cache
+from tasks.runtime import SessionLocal, run_task, runtime
 
 @celery_app.task(name="tasks.trading.sync")
 def sync_trading():
-    asyncio.run(_sync_async())
+    run_task(_sync_async)
 
 async def _sync_async():
-    mgr = get_exchange_manager()
+    mgr = runtime.exchange_manager()
     async with SessionLocal() as session:
         # 读取动态间隔
         interval_sec = 60
         try:
-            res = await session.execute(text("SELECT config_value FROM system_configs WHERE config_key='trading.sync.interval'"))
-            row = res.first()
-            if row and row.config_value:
+            value = await system_config_cache.get('trading.sync.interval')
+            if value:
                 try:
-                    interval_sec = int(str(row.config_value).strip('"'))
+                    interval_sec = int(str(value).strip('"'))
                 except Exception:
                     pass
         except Exception:
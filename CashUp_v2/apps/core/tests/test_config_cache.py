@@ -0,0 +1,82 @@
+import asyncio
+import json
+
+from apps.core.services.config_cache import SystemConfigCache
+
+
+class _Rows:
+    def __init__(self, rows):
+        self._rows = rows
+
+    def fetchall(self):
+        return self._rows
+
+    def first(self):
+        return self._rows[0] if self._rows else None
+
+
+class _Row:
+    def __init__(self, key, value):
+        self.config_key = key
+        self.config_value = value
+
+
+class _Session:
+    def __init__(self, table, log):
+        self.table = table
+        self.log = log
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, stmt, params=None):
+        self.log.append(params)
+        if params:
+            key = params["k"]
+            return _Rows([_Row(key, self.table[key])] if key in self.table else [])
+        return _Rows([_Row(k, v) for k, v in self.table.items()])
+
+
+def _cache(table, log):
+    cache = SystemConfigCache(max_age=3600, version_check_interval=3600)
+    cache.configure(lambda: _Session(table, log))
+    return cache
+
+
+def test_reads_are_served_from_memory_after_first_load():
+    table, log = {"market.cache.ttl": 15, "rss.fetch.interval": 300}, []
+    cache = _cache(table, log)
+
+    async def run():
+        assert await cache.get("market.cache.ttl") == 15
+        assert await cache.get_many(["rss.fetch.interval", "missing"]) == {"rss.fetch.interval": 300}
+        assert await cache.get_matching(".interval") == {"rss.fetch.interval": 300}
+
+    asyncio.run(run())
+    assert len(log) == 1
+
+
+def test_invalidation_messages_refresh_single_key_or_reload_on_gap():
+    table, log = {"market.cache.ttl": 15}, []
+    cache = _cache(table, log)
+
+    async def run():
+        await cache.load()
+        table["market.cache.ttl"] = 45
+        await cache._on_message(json.dumps({"key": "market.cache.ttl", "version": 1}).encode())
+        assert await cache.get("market.cache.ttl") == 45 and cache.version == 1
+        # 重复/过期的消息不再查询
+        await cache._on_message(json.dumps({"key": "market.cache.ttl", "version": 1}))
+        assert len(log) == 2
+        # 版本跳跃说明漏掉了消息：整体重载（键被删除也能反映出来）
+        del table["market.cache.ttl"]
+        table["trading.sync.interval"] = 30
+        await cache._on_message(json.dumps({"key": "trading.sync.interval", "version": 5}))
+        assert await cache.get("market.cache.ttl") is None
+        assert await cache.get("trading.sync.interval") == 30
+
+    asyncio.run(run())
+    assert cache.stats()["loads"] == 2
@@ -0,0 +1,19 @@
+from datetime import datetime, timedelta
+
+from apps.core.modules.market.services.derivatives import align_asof, sum_between
+
+
+def _h(n):
+    return datetime(2024, 1, 1) + timedelta(hours=n)
+
+
+def test_align_asof_uses_latest_point_not_after_bar():
+    bars = [_h(i) for i in range(5)]
+    points = [(_h(1), 0.1), (_h(2), None), (_h(3), 0.3)]
+    assert align_asof(bars, points) == [None, 0.1, 0.1, 0.3, 0.3]
+
+
+def test_sum_between_accrues_events_per_bar():
+    bars = [_h(0), _h(8), _h(16)]
+    events = [(_h(0), 1.0), (_h(4), 0.5), (_h(8), 0.25), (_h(20), 9.0)]
+    assert sum_between(bars, events) == [1.0, 0.75, 0.0]
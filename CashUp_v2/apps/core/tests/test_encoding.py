@@ -0,0 +1,54 @@
+from datetime import datetime
+
+import numpy as np
+import pytest
+from starlette.requests import Request
+
+from apps.core.api import encoding
+from apps.core.api.encoding import JSON, negotiate, rows_to_columns
+from apps.core.modules.market.services.kline_cache import bars_to_columns, pack_bar
+
+
+def _request(accept: str = "") -> Request:
+    return Request({"type": "http", "headers": [(b"accept", accept.encode())]})
+
+
+def test_negotiate_defaults_to_json_and_falls_back_when_codec_missing(monkeypatch):
+    assert negotiate(_request()) == JSON
+    assert negotiate(_request("application/json")) == JSON
+    monkeypatch.setattr(encoding, "msgpack", None)
+    assert negotiate(_request("application/msgpack")) == JSON
+    monkeypatch.setattr(encoding, "msgpack", object())
+    assert negotiate(_request("application/x-msgpack, application/json")) == "msgpack"
+    assert negotiate(_request("application/msgpack"), "json") == JSON
+
+
+def test_kline_members_convert_to_columns_without_rows():
+    bars = [(1700000000000 + i * 60000, 1.0 + i, 2.0, 0.5, 1.5, 10.0 * i) for i in range(3)]
+    cols = bars_to_columns([pack_bar(*b) for b in bars])
+    assert cols["open_time"].dtype == np.dtype("datetime64[ms]")
+    assert cols["open_time"][1].astype(np.int64) == bars[1][0]
+    assert cols["open_price"].tolist() == [1.0, 2.0, 3.0]
+    same = bars_to_columns(bars)
+    assert all(np.array_equal(cols[k], same[k]) for k in cols)
+
+
+def test_rows_to_columns_types():
+    rows = [
+        {"date": "2024-01-01T00:00:00", "equity": 1, "side": "buy", "at": datetime(2024, 1, 1)},
+        {"date": "2024-01-02T00:00:00", "equity": 2.5, "side": None, "at": None},
+    ]
+    cols = rows_to_columns(rows)
+    assert cols["date"].dtype == np.dtype("datetime64[ms]")
+    assert cols["equity"].dtype == np.float64
+    assert cols["side"].dtype == object
+    assert np.isnat(cols["at"][1])
+
+
+def test_msgpack_payload_roundtrip():
+    msgpack = pytest.importorskip("msgpack")
+    cols = {"t": np.array([1, 2], dtype="datetime64[ms]"), "p": np.array([1.5, 2.5]), "s": np.array(["a", "b"], dtype=object)}
+    payload = msgpack.unpackb(encoding.columnar_response(cols, "msgpack").body, raw=False)
+    assert payload["length"] == 2
+    assert np.frombuffer(payload["data"]["p"], dtype=payload["dtypes"]["p"]).tolist() == [1.5, 2.5]
+    assert payload["data"]["s"] == ["a", "b"]
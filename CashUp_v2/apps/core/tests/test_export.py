@@ -0,0 +1,31 @@
+import gzip
+import json
+import zlib
+
+from apps.core.modules.market.services.export import COLUMNS, CsvEncoder, NdjsonGzipEncoder
+
+
+def _rows(n, start=0):
+    return [("BTC/USDT", 1700000000000 + i * 60000, 1.0, 2.0, 0.5, float(i), 1.0, None, None) for i in range(start, start + n)]
+
+
+def test_csv_encoder_writes_header_once_and_blank_nulls():
+    enc = CsvEncoder()
+    body = (enc.header() + enc.write(_rows(2)) + enc.close()).decode().splitlines()
+    assert body[0] == ",".join(COLUMNS)
+    assert body[1] == "BTC/USDT,1700000000000,1.0,2.0,0.5,0.0,1.0,,"
+    assert len(body) == 3
+
+
+def test_ndjson_gzip_chunks_are_decodable_before_stream_ends():
+    enc = NdjsonGzipEncoder()
+    first = enc.header() + enc.write(_rows(100))
+    rest = enc.write(_rows(100, 100)) + enc.close()
+    # 中断的下载：只拿到第一块也能解出完整行
+    partial = zlib.decompressobj(31).decompress(first).decode().splitlines()
+    assert len(partial) == 100 and json.loads(partial[-1])["close"] == 99.0
+    lines = gzip.decompress(first + rest).decode().splitlines()
+    assert len(lines) == 200
+    # 输出可重复，字节偏移续传才成立
+    enc2 = NdjsonGzipEncoder()
+    assert enc2.header() + enc2.write(_rows(100)) == first
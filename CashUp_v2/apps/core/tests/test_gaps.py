@@ -0,0 +1,91 @@
+import asyncio
+import json
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+from apps.core.modules.market.services import gaps as gaps_module
+from apps.core.modules.market.services.gaps import BACKFILL_QUEUE_KEY, _member, gap_priority, run_backfill
+
+
+def test_gap_priority_prefers_recent_and_active():
+    now = datetime(2024, 6, 1)
+    recent = {"exchange": "gateio", "symbol": "BTC_USDT", "timeframe": "1h", "end": now - timedelta(hours=2), "missing": 3}
+    old = dict(recent, end=now - timedelta(days=20))
+    other = dict(recent, symbol="DOGE_USDT")
+    active = {("gateio", "BTC_USDT")}
+    assert gap_priority(recent, active, now) > gap_priority(old, active, now)
+    assert gap_priority(recent, active, now) > gap_priority(other, active, now)
+
+
+class _ZSetRedis:
+    def __init__(self, members):
+        self.z = dict(members)
+
+    async def zpopmax(self, key, count):
+        top = sorted(self.z.items(), key=lambda kv: kv[1], reverse=True)[:count]
+        for m, _ in top:
+            del self.z[m]
+        return top
+
+    async def zadd(self, key, mapping):
+        assert key == BACKFILL_QUEUE_KEY
+        self.z.update(mapping)
+
+
+class _Session:
+    def __init__(self):
+        self.rollbacks = 0
+
+    async def rollback(self):
+        self.rollbacks += 1
+
+
+class _Adapter:
+    async def get_klines(self, symbol, interval, start_time, end_time, limit):
+        out, t = [], start_time
+        while t <= end_time:
+            out.append(SimpleNamespace(open_time=t, open_price=1, high_price=1, low_price=1, close_price=1, volume=1))
+            t += timedelta(hours=1)
+        return out
+
+
+def _setup(monkeypatch, fail_symbols):
+    t0 = datetime(2024, 6, 1)
+    members = {_member("gateio", sym, "1h", t0, t0 + timedelta(hours=2)): float(i) for i, sym in enumerate(["A", "B", "C"])}
+    redis = _ZSetRedis(members)
+
+    async def fake_get_redis():
+        return redis
+
+    async def fake_upsert(session, rows):
+        if rows[0]["sym"] in fail_symbols:
+            raise RuntimeError("partition missing")
+        return {"rows": len(rows), "quarantined": 0}
+
+    monkeypatch.setattr(gaps_module, "get_redis", fake_get_redis)
+    monkeypatch.setattr(gaps_module, "upsert_klines", fake_upsert)
+    mgr = SimpleNamespace(get_exchange=lambda name: _Adapter())
+    return redis, members, mgr
+
+
+def test_backfill_write_failure_requeues_gap_and_continues(monkeypatch):
+    redis, members, mgr = _setup(monkeypatch, {"B"})
+    session = _Session()
+    stats = asyncio.run(run_backfill(session, mgr))
+    assert stats["completed"] == 2 and stats["failed"] == 1 and session.rollbacks == 1
+    # 失败的缺口以原区间与原优先级放回，其余已完成
+    assert redis.z == {m: s for m, s in members.items() if json.loads(m)["sym"] == "B"}
+
+
+def test_backfill_escaping_error_puts_unprocessed_gaps_back(monkeypatch):
+    redis, members, mgr = _setup(monkeypatch, set())
+
+    async def cancelled(session, rows):
+        raise asyncio.CancelledError()
+
+    monkeypatch.setattr(gaps_module, "upsert_klines", cancelled)
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(run_backfill(_Session(), mgr))
+    assert redis.z == members
@@ -0,0 +1,106 @@
+import asyncio
+import json
+
+import pytest
+
+from apps.core.app.adapters.exchanges import gateio_ws
+from apps.core.app.adapters.exchanges.gateio_ws import GateIOWSManager, _MuxConnection
+
+
+@pytest.fixture(autouse=True)
+def offline(monkeypatch):
+    """subscribe 走真实的分配与路由表逻辑，只是不启动连接协程"""
+    monkeypatch.setattr(_MuxConnection, "start", lambda self: None)
+
+
+def _attach(mgr, channel, symbol, callback):
+    asyncio.run(mgr.subscribe(channel, symbol, callback))
+    return mgr._owners[f"{channel}_{symbol}"]
+
+
+async def noop(_):
+    pass
+
+
+def test_pool_respects_per_connection_limit():
+    mgr = GateIOWSManager({"ws_max_subscriptions_per_connection": 2, "ws_max_connections": 2})
+    conns = [_attach(mgr, "ticker", s, noop) for s in ("BTC/USDT", "ETH/USDT", "SOL/USDT", "XRP/USDT")]
+    assert [c.index for c in conns] == [0, 0, 1, 1]
+    # 同一频道-交易对的第二个回调共用已有订阅
+    assert _attach(mgr, "ticker", "BTC/USDT", noop) is conns[0] and len(conns[0].channel_ids) == 2
+    with pytest.raises(RuntimeError):
+        _attach(mgr, "ticker", "DOGE/USDT", noop)
+
+
+class _FakeSocket:
+    def __init__(self, on_drain):
+        self.sent = []
+        self.on_drain = on_drain
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def send(self, data):
+        self.sent.append(json.loads(data))
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        self.on_drain()
+        raise StopAsyncIteration
+
+
+def test_reconnect_resends_every_subscription_on_the_connection(monkeypatch):
+    mgr = GateIOWSManager({})
+    conn = _attach(mgr, "ticker", "BTC/USDT", noop)
+    _attach(mgr, "kline", "ETH/USDT", noop)
+
+    def drop():
+        raise ConnectionError("dropped")
+
+    def stop():
+        mgr.is_running = False
+
+    sockets = [_FakeSocket(drop), _FakeSocket(stop)]
+    pending = list(sockets)
+    monkeypatch.setattr(gateio_ws.websockets, "connect", lambda url, **kwargs: pending.pop(0))
+    monkeypatch.setattr(gateio_ws, "RECONNECT_MAX_DELAY", 0)
+    asyncio.run(conn._run())
+    assert conn.reconnects == 1 and not pending
+    for ws in sockets:
+        assert sorted((m["channel"], m["payload"][-1]) for m in ws.sent) == [("spot.candlesticks", "ETH_USDT"),
+                                                                             ("spot.tickers", "BTC_USDT")]
+    assert conn.ws is None
+
+
+def test_messages_routed_by_channel_and_symbol():
+    mgr = GateIOWSManager({})
+    got = []
+
+    async def collect(item):
+        got.append(item)
+
+    conn = _attach(mgr, "ticker", "BTC/USDT", collect)
+    _attach(mgr, "ticker", "ETH/USDT", collect)
+    _attach(mgr, "kline", "ETH/USDT", collect)
+
+    async def run():
+        await mgr._route(conn, json.dumps({"channel": "spot.tickers", "event": "update",
+                                           "result": {"currency_pair": "ETH_USDT", "last": "3000"}}))
+        await mgr._route(conn, json.dumps({"channel": "spot.candlesticks", "event": "update",
+                                           "result": {"t": "1700000000", "o": "1", "h": "2", "l": "0.5", "c": "1.5",
+                                                      "v": "150", "a": "100", "n": "1m_ETH_USDT"}}))
+        await mgr._route(conn, json.dumps({"channel": "spot.tickers", "event": "update",
+                                           "result": {"currency_pair": "DOGE_USDT", "last": "0.1"}}))
+        await mgr._route(conn, json.dumps({"channel": "spot.tickers", "event": "subscribe",
+                                           "result": {"status": "success"}}))
+
+    asyncio.run(run())
+    assert [type(x).__name__ for x in got] == ["Ticker", "Kline"]
+    assert got[0].symbol == "ETH/USDT" and got[0].last_price == 3000.0
+    assert got[1].symbol == "ETH/USDT" and got[1].volume == 100.0 and got[1].quote_volume == 150.0
+    assert mgr.unrouted == 1
@@ -0,0 +1,24 @@
+import asyncio
+
+from apps.core.app.adapters.exchanges.http_sessions import HttpSessionRegistry
+
+
+def test_sessions_are_shared_per_host_and_closed_with_the_loop():
+    reg = HttpSessionRegistry()
+
+    async def run():
+        a = reg.get("https://api.gateio.ws/api/v4/spot/tickers")
+        b = reg.get("https://api.gateio.ws/api/v4/futures/usdt/contracts")
+        c = reg.get("https://fapi.binance.com/fapi/v1/klines")
+        assert a is b and a is not c
+        assert reg.stats()["sessions_open"] == 2
+        await reg.close()
+        assert a.closed and c.closed
+        assert reg.stats()["sessions_open"] == 0
+        # 关闭后再次取用会重建
+        d = reg.get("https://api.gateio.ws/x")
+        assert d is not a and not d.closed
+        await reg.close()
+
+    asyncio.run(run())
+    assert reg.sessions_created == 3
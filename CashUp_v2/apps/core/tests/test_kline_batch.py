@@ -0,0 +1,39 @@
+from datetime import datetime
+
+from apps.core.app.adapters.exchanges.base import Kline, KlineBatch, model_dict
+from apps.core.app.adapters.exchanges.fastjson import loads
+from apps.core.app.adapters.exchanges.gateio import _CANDLE_INDEX
+
+RAW = b'[["1700000060","12.5","101.5","102","100","100.5","1262.5","true"],["1700000000","3","100.5","101","99","100","301.5","true"]]'
+
+
+def test_gate_candles_parsed_into_columns():
+    batch = KlineBatch.from_rows("BTC/USDT", "1m", 60000, loads(RAW), _CANDLE_INDEX, time_unit_ms=1000)
+    assert len(batch) == 2
+    assert batch.open_time.tolist() == [1700000060000, 1700000000000]
+    assert batch.open.tolist() == [100.5, 100.0] and batch.close.tolist() == [101.5, 100.5]
+    assert batch.volume.tolist() == [12.5, 3.0] and batch.quote_volume.tolist() == [1262.5, 301.5]
+    assert batch.first_open_time() == datetime.fromtimestamp(1700000000)
+    assert batch.latest().open_time == datetime.fromtimestamp(1700000060)
+
+    k = batch.to_klines()[0]
+    assert isinstance(k, Kline) and not hasattr(k, "__dict__")
+    assert k.close_time == datetime.fromtimestamp(1700000120) and k.high_price == 102.0
+    assert model_dict(k)["quote_volume"] == 1262.5
+
+    row = batch.rows("gateio", "BTC/USDT", "1m")[1]
+    assert row == {"ex": "gateio", "sym": "BTC/USDT", "tf": "1m", "ot": datetime.fromtimestamp(1700000000),
+                   "o": 100.0, "h": 101.0, "l": 99.0, "c": 100.5, "v": 3.0}
+
+    again = KlineBatch.from_klines("BTC/USDT", "1m", 60000, batch.to_klines())
+    assert again.open_time.tolist() == batch.open_time.tolist() and again.low.tolist() == batch.low.tolist()
+    assert len(KlineBatch.from_rows("BTC/USDT", "1m", 60000, [], _CANDLE_INDEX)) == 0
+
+
+def test_batch_take_and_concat_keep_columns_aligned():
+    batch = KlineBatch.from_rows("BTC/USDT", "1m", 60000, loads(RAW), _CANDLE_INDEX, time_unit_ms=1000)
+    older = batch.take(batch.open_time < 1700000060000)
+    assert older.open_time.tolist() == [1700000000000] and older.close.tolist() == [100.5]
+    both = KlineBatch.concat([batch, older])
+    assert both.open_time.tolist() == [1700000060000, 1700000000000, 1700000000000]
+    assert both.quote_volume.tolist() == [1262.5, 301.5, 301.5] and both.interval_ms == 60000
@@ -0,0 +1,46 @@
+from datetime import datetime
+
+from apps.core.app.adapters.exchanges.base import KlineBatch, model_dict
+from apps.core.modules.market.services.kline_cache import (
+    _to_dict, answers_request, bar_span, bars_to_columns, merge_intervals, missing_intervals, pack_bar, unpack_bar,
+)
+
+
+def test_merge_intervals_joins_adjacent_and_overlapping():
+    assert merge_intervals([(10, 20), (0, 5), (6, 8), (15, 30)]) == [(0, 8), (10, 30)]
+
+
+def test_missing_intervals_only_reports_uncovered_segments():
+    covered = [(0, 99), (200, 299)]
+    assert missing_intervals(covered, 50, 350) == [(100, 199), (300, 350)]
+    assert missing_intervals(covered, 210, 250) == []
+    assert missing_intervals([], 1, 2) == [(1, 2)]
+
+
+def test_bar_member_roundtrip():
+    bar = (1700000000000, 1.5, 2.0, 1.0, 1.75, 123.0)
+    assert unpack_bar(pack_bar(*bar)) == bar
+
+
+def test_cached_bar_matches_exchange_payload_shape():
+    bar = (1700000000000, 1.5, 2.0, 1.0, 1.75, 123.0)
+    row = _to_dict("BTC/USDT", "15m", bar)
+    assert row["close_time"] == datetime.fromtimestamp(1700000900).isoformat()
+    kline = KlineBatch.from_rows("BTC/USDT", "15m", 900000, [bar], {"open_time": 0, "open": 1, "high": 2, "low": 3, "close": 4, "volume": 5}).kline(0)
+    assert list(row) == list(model_dict(kline))
+
+
+def test_stale_or_short_cache_results_do_not_answer_the_request():
+    hour = 3600 * 1000
+    now = 1700000000000
+    bars = [(now - i * hour, 1.0, 1.0, 1.0, 1.0, 1.0) for i in (3, 2, 1, 0)]
+    rows = [_to_dict("BTC/USDT", "1h", b) for b in bars]
+    assert bar_span(rows, False) == bar_span(bars_to_columns(bars), True) == (now - 3 * hour, now, 4)
+    assert answers_request(bar_span(rows, False), "1h", None, now + hour // 2, 100)
+    # 最新一根停在一天前：序列未被采集
+    assert not answers_request(bar_span(rows, False), "1h", None, now + 24 * hour, 100)
+    # 区间请求：取满 limit 根即可；未取满时首根须贴近起点
+    assert answers_request(bar_span(rows, False), "1h", now - 30 * hour, now, 4)
+    assert not answers_request(bar_span(rows, False), "1h", now - 30 * hour, now, 10)
+    assert answers_request(bar_span(rows, False), "1h", now - 3 * hour, now, 10)
+    assert not answers_request((0, 0, 0), "1h", None, now, 100)
@@ -0,0 +1,52 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from apps.core.app.adapters.exchanges.base import KlineBatch
+from apps.core.modules.market.services.quality import validate_batches, validate_rows
+
+BASE = datetime(2025, 3, 1)
+
+
+def _bar(i, o=100.0, h=101.0, l=99.0, c=100.5, v=5.0, sym="BTC/USDT", seconds=0):
+    return {"ex": "gateio", "sym": sym, "tf": "1m", "ot": BASE + timedelta(minutes=i, seconds=seconds),
+            "o": o, "h": h, "l": l, "c": c, "v": v}
+
+
+def test_rule_violations_are_quarantined_with_reasons():
+    rows = [_bar(i) for i in range(5)] + [
+        _bar(5, h=98.0),                  # high 低于 open/close
+        _bar(6, v=0.0),                   # 零成交量却有波动
+        _bar(7, seconds=13),              # 未对齐
+        _bar(8, c=101.0), _bar(8),        # 重复 open_time，保留后到的一根
+        _bar(9, o=-1.0),
+    ]
+    clean, bad, stats = validate_rows(rows)
+    reasons = {r["ot"].minute: rs for r, rs in bad}
+    assert reasons == {5: ["ohlc_inconsistent"], 6: ["zero_volume_move"], 7: ["misaligned_open_time"],
+                       9: ["non_positive_price"]}
+    # 被取代的重复副本丢弃而不隔离（隔离表与 kline_data 不会出现同一键）
+    assert [r for r in clean if r["ot"].minute == 8][0]["c"] == 100.5
+    assert stats["checked"]["gateio"] == len(rows) and stats["quarantined"]["gateio"] == 4
+    assert stats["dropped"]["gateio"] == 1
+
+
+def test_rolling_mad_flags_100x_outlier_but_not_a_real_crash():
+    history = {("gateio", "BTC/USDT", "1m"): np.linspace(100, 103, 30)}
+    rows = [_bar(0, o=103, h=104, l=102, c=103.5),
+            _bar(1, o=10300, h=10400, l=10200, c=10350),
+            _bar(2, o=103, h=103.5, l=85, c=88)]
+    clean, bad, _ = validate_rows(rows, history)
+    assert [(r["ot"].minute, rs) for r, rs in bad] == [(1, ["price_outlier"])]
+    assert len(clean) == 2
+
+
+def test_batches_validated_in_columns_match_row_validation():
+    rows = [_bar(i) for i in range(5)] + [_bar(5, h=98.0), _bar(6, seconds=13), _bar(7, c=101.0), _bar(7)]
+    raw = [(int(r["ot"].timestamp() * 1000), r["o"], r["h"], r["l"], r["c"], r["v"]) for r in rows]
+    index = {"open_time": 0, "open": 1, "high": 2, "low": 3, "close": 4, "volume": 5}
+    batch = KlineBatch.from_rows("BTC/USDT", "1m", 60000, raw, index)
+    clean_rows, bad_rows, row_stats = validate_rows(rows)
+    clean, bad, stats = validate_batches([("gateio", "BTC/USDT", "1m", batch)])
+    assert clean[0][3].rows("gateio", "BTC/USDT", "1m") == clean_rows
+    assert bad == bad_rows and stats == row_stats
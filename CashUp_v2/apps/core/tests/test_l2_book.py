@@ -0,0 +1,60 @@
+import asyncio
+
+from apps.core.modules.market.services.l2_book import (
+    APPLIED, CHECKSUM, GAP, STALE, L2Book, LocalOrderBookManager, interleaved_crc32,
+)
+
+
+def test_book_applies_deltas_in_sequence_and_detects_gaps():
+    book = L2Book("BTC_USDT")
+    book.apply_snapshot(100, [["100.0", "1"], ["99.5", "2"]], [["100.5", "1.5"], ["101", "3"]])
+    assert book.best_bid() == (100.0, 1.0) and book.best_ask() == (100.5, 1.5)
+    assert book.mid() == 100.25 and book.spread() == 0.5
+
+    assert book.apply_update(95, 100, [["100.0", "5"]], []) == STALE
+    assert book.apply_update(101, 102, [["100.0", "0"], ["100.2", "4"]], [["100.5", "0"]]) == APPLIED
+    assert book.top(2) == {"bids": [[100.2, 4.0], [99.5, 2.0]], "asks": [[101.0, 3.0]]}
+    assert book.imbalance(10) == (6.0 - 3.0) / 9.0
+
+    assert book.apply_update(105, 106, [], []) == GAP
+    assert not book.synced
+
+
+def test_checksum_mismatch_marks_book_unsynced():
+    book = L2Book("BTC_USDT", checksum_fn=interleaved_crc32)
+    book.apply_snapshot(1, [["10.0", "1"]], [["10.1", "2"]])
+    ok = interleaved_crc32(book)
+    assert book.apply_update(2, 2, [["9.9", "3"]], [], checksum=None) == APPLIED
+    assert book.apply_update(3, 3, [], [["10.2", "1"]], checksum=ok) == CHECKSUM
+    assert not book.synced
+
+
+def test_manager_resyncs_from_snapshot_and_replays_buffered_updates():
+    mgr = LocalOrderBookManager(depth=50, retry_delay=0)
+    snapshots = [{"id": 10, "bids": [["100", "1"]], "asks": [["101", "1"]]}]
+
+    async def fetch(symbol, limit):
+        return snapshots[0]
+
+    async def run():
+        mgr.add("gateio", "BTC/USDT", fetch)
+        # 快照到达前的增量先缓存：8..9 被快照覆盖，9..11 跨越快照 ID，12..12 顺接
+        mgr.on_update("gateio", "BTC/USDT", 8, 9, [["100", "9"]], [])
+        mgr.on_update("gateio", "BTC/USDT", 9, 11, [["100", "2"]], [])
+        mgr.on_update("gateio", "BTC/USDT", 12, 12, [], [["101", "0"], ["102", "5"]])
+        await mgr.feeds[("gateio", "BTC_USDT")].task
+        book = mgr.get("gateio", "BTC_USDT")
+        assert book is not None and book.last_id == 12
+        assert book.top(5) == {"bids": [[100.0, 2.0]], "asks": [[102.0, 5.0]]}
+
+        # 缺口触发重新同步
+        snapshots[0] = {"id": 20, "bids": [["99", "1"]], "asks": [["102", "5"]]}
+        assert mgr.on_update("gateio", "BTC/USDT", 15, 16, [], []) == GAP
+        assert mgr.get("gateio", "BTC_USDT") is None
+        mgr.on_update("gateio", "BTC/USDT", 21, 21, [["99.5", "1"]], [])
+        await mgr.feeds[("gateio", "BTC_USDT")].task
+        book = mgr.get("gateio", "BTC_USDT")
+        assert book.last_id == 21 and book.best_bid() == (99.5, 1.0)
+        assert mgr.stats["gaps"] == 1 and mgr.stats["resyncs"] == 2
+
+    asyncio.run(run())
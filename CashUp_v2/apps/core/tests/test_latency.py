@@ -0,0 +1,39 @@
+from apps.core.modules.strategy.services.manager import BAR_CLOSE_DELAY_SECONDS, _seconds_until_next_bar
+from apps.core.utils.latency import LatencyHistogram, LatencyRegistry
+
+
+def test_histogram_quantiles_within_precision():
+    h = LatencyHistogram()
+    for v in range(1, 100001):
+        h.record(v)
+    assert h.total == 100000
+    assert abs(h.quantile(0.5) - 50000) / 50000 < 0.02
+    assert abs(h.quantile(0.99) - 99000) / 99000 < 0.02
+    assert h.quantile(0.999) <= h.max_micros == 100000
+
+
+def test_registry_trace_and_prometheus():
+    reg = LatencyRegistry()
+    trace = reg.trace(7, 1000.0)
+    trace.stamp("bar_received", now=1000.25)
+    trace.stamp("exchange_ack", now=1001.0)
+    snap = reg.snapshot("7")
+    assert snap["7"]["bar_received"]["count"] == 1
+    assert 249 <= snap["7"]["bar_received"]["p50_ms"] <= 251
+    lines = "\n".join(reg.prometheus_lines())
+    assert 'stage="exchange_ack",quantile="0.999"' in lines
+
+
+def test_histogram_keeps_daily_bar_latencies_distinct():
+    h = LatencyHistogram()
+    h.record(2 * 3600 * 1_000_000)
+    h.record(20 * 3600 * 1_000_000)
+    assert abs(h.quantile(0.5) - 2 * 3600 * 1_000_000) / (2 * 3600 * 1_000_000) < 0.02
+    assert h.max_micros == 20 * 3600 * 1_000_000
+
+
+def test_strategy_loop_sleeps_until_next_bar_close():
+    assert _seconds_until_next_bar(3600.0, 3600, now=3610.0) == 3590.0 + BAR_CLOSE_DELAY_SECONDS
+    # 交易所尚未给出新K线：只等收盘延迟后重取
+    assert _seconds_until_next_bar(3600.0, 3600, now=7205.0) == BAR_CLOSE_DELAY_SECONDS
+    assert _seconds_until_next_bar(None, 60, now=125.0) == 55.0 + BAR_CLOSE_DELAY_SECONDS
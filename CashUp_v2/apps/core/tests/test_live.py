@@ -0,0 +1,69 @@
+import asyncio
+import json
+
+from apps.core.services.live import LiveConnection, LiveHub, kline_topic, ticker_topic
+
+
+class _WS:
+    def __init__(self):
+        self.sent = []
+        self.closed = None
+
+    async def send_text(self, text):
+        self.sent.append(json.loads(text))
+
+    async def close(self, code=1000):
+        self.closed = code
+
+
+def test_ticker_updates_are_conflated_and_other_topics_queued():
+    conn = LiveConnection(_WS(), max_queue=10)
+    hub = LiveHub()
+    t, k = ticker_topic("gateio", "BTC/USDT"), kline_topic("gateio", "BTC/USDT", "1m")
+    for topic in (t, k):
+        conn.topics.add(topic)
+        hub.subs.setdefault(topic, set()).add(conn)
+    for i in range(5):
+        hub.dispatch(t, json.dumps({"last_price": i}))
+    hub.dispatch(k, json.dumps({"close_price": 1}))
+    hub.dispatch(k, json.dumps({"close_price": 2}))
+
+    async def drain():
+        out = []
+        while conn._queue or conn._conflated:
+            out.append(json.loads(await conn.next_frame()))
+        return out
+
+    frames = asyncio.run(drain())
+    assert [f["data"] for f in frames if f["topic"] == t] == [{"last_price": 4}]
+    assert [f["data"]["close_price"] for f in frames if f["topic"] == k] == [1, 2]
+    assert conn.conflated == 4
+
+
+def test_slow_consumer_is_dropped_and_snapshot_precedes_updates():
+    hub = LiveHub()
+    ws = _WS()
+    conn = LiveConnection(ws, max_queue=2)
+    topic = "signal:7"
+
+    async def snapshot(_topic):
+        # 取快照期间到达一条更新
+        hub.dispatch(topic, json.dumps({"type": "sell"}))
+        return json.dumps({"type": "buy"})
+
+    hub.snapshot = snapshot
+
+    async def run():
+        assert await hub.subscribe(conn, [topic, "bogus:1"]) == [topic]
+        first = json.loads(await conn.next_frame())
+        second = json.loads(await conn.next_frame())
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert (first["type"], first["data"]) == ("snapshot", {"type": "buy"})
+    assert (second["type"], second["data"]) == ("update", {"type": "sell"})
+    for i in range(3):
+        hub.dispatch(topic, json.dumps({"i": i}))
+    assert conn.overflowed and topic not in hub.subs
+    asyncio.run(conn.send_loop())
+    assert ws.closed == 1013
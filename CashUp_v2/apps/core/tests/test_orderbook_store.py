@@ -0,0 +1,25 @@
+from apps.core.modules.market.services.orderbook_store import (
+    ASK,
+    BID,
+    apply_deltas,
+    decode_deltas,
+    diff_books,
+    encode_deltas,
+)
+
+
+def test_delta_codec_roundtrip():
+    deltas = [(1700000000000, BID, 100.5, 2.0), (1700000000250, ASK, 101.0, 0.0), (1700000001000, ASK, 101.5, 0.125)]
+    blob = encode_deltas(deltas)
+    assert blob[:4] == b"OBD1"
+    assert decode_deltas(blob) == deltas
+
+
+def test_diff_then_apply_reproduces_book():
+    old_bids, old_asks = {100.0: 1.0, 99.0: 2.0}, {101.0: 1.0, 102.0: 3.0}
+    new_bids, new_asks = {100.0: 1.5, 98.0: 4.0}, {101.0: 1.0, 103.0: 2.0}
+    deltas = diff_books(1, old_bids, old_asks, new_bids, new_asks)
+    assert len(deltas) == 5
+    bids, asks = dict(old_bids), dict(old_asks)
+    apply_deltas(bids, asks, decode_deltas(encode_deltas(deltas)))
+    assert bids == new_bids and asks == new_asks
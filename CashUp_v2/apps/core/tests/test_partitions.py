@@ -0,0 +1,24 @@
+from datetime import date, datetime
+
+from apps.core.modules.market.services.partitions import DEFAULT_RETENTION_DAYS, expiry_cutoff, split_expired, split_unpartitioned
+
+
+def test_rows_in_expired_subpartitions_are_split_off():
+    rows = [
+        {"tf": "1m", "ot": datetime(2024, 1, 31, 23, 59)},   # 1m 保留 90 天：一月分区已到期
+        {"tf": "1m", "ot": datetime(2024, 3, 1)},
+        {"tf": "1h", "ot": datetime(2024, 1, 5)},            # 小时级保留 730 天
+        {"tf": "1d", "ot": datetime(2001, 1, 1)},            # 日级永久保留
+    ]
+    kept, expired = split_expired(rows, DEFAULT_RETENTION_DAYS, today=date(2024, 5, 1))
+    assert expired == [rows[0]]
+    assert kept == rows[1:]
+    assert expiry_cutoff("1m", DEFAULT_RETENTION_DAYS, today=date(2024, 5, 1)) == datetime(2024, 2, 1)
+    assert expiry_cutoff("1d", DEFAULT_RETENTION_DAYS, today=date(2024, 5, 1)) is None
+
+
+def test_rows_without_a_list_subpartition_are_rejected():
+    rows = [{"tf": "1m"}, {"tf": "1M"}, {"tf": "2w"}, {"tf": "1s"}]
+    kept, rejected = split_unpartitioned(rows)
+    assert kept == rows[:2]
+    assert rejected == rows[2:]
@@ -0,0 +1,16 @@
+from datetime import datetime
+
+from apps.core.modules.market.services.rollup import derived_timeframes
+from apps.core.modules.market.services.timeframes import floor_time
+
+
+def test_derived_timeframes_require_1m():
+    assert derived_timeframes(["1m", "5m", "1h", "1d"]) == ["5m", "1h", "1d"]
+    assert derived_timeframes(["5m", "1h"]) == []
+
+
+def test_floor_time_buckets():
+    ts = datetime(2024, 5, 16, 13, 7, 30)
+    assert floor_time(ts, "15m") == datetime(2024, 5, 16, 13, 0)
+    assert floor_time(ts, "4h") == datetime(2024, 5, 16, 12, 0)
+    assert floor_time(ts, "1d") == datetime(2024, 5, 16)
@@ -0,0 +1,98 @@
+import asyncio
+import json
+import time
+
+from apps.core.utils import singleflight as sf_module
+from apps.core.utils.singleflight import SingleFlight
+
+
+class _DictRedis:
+    def __init__(self):
+        self.kv = {}
+
+    async def get(self, key):
+        return self.kv.get(key)
+
+    async def set(self, key, value, nx=False, px=None):
+        if nx and key in self.kv:
+            return None
+        self.kv[key] = value
+        return True
+
+    async def delete(self, key):
+        return 1 if self.kv.pop(key, None) is not None else 0
+
+    async def exists(self, key):
+        return int(key in self.kv)
+
+    async def eval(self, script, numkeys, key, token):
+        if self.kv.get(key) == token:
+            del self.kv[key]
+            return 1
+        return 0
+
+
+def test_concurrent_callers_share_one_computation():
+    sf = SingleFlight()
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"v": 1}
+
+    async def run():
+        return await asyncio.gather(*[sf.do("k", compute) for _ in range(20)])
+
+    results = asyncio.run(run())
+    assert calls == [1]
+    assert all(r == {"v": 1} for r in results)
+    assert sf.stats["shared"] == 19
+
+
+def test_cached_serves_stale_value_while_one_caller_revalidates(monkeypatch):
+    r = _DictRedis()
+
+    async def fake_get_redis():
+        return r
+
+    monkeypatch.setattr(sf_module, "get_redis", fake_get_redis)
+    sf = SingleFlight()
+    r.kv["rep"] = json.dumps({"v": "old", "exp": time.time() - 1})
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.02)
+        return "new"
+
+    async def run():
+        return await asyncio.gather(*[sf.cached("rep", compute, ttl=10) for _ in range(5)])
+
+    results = asyncio.run(run())
+    assert calls == [1]
+    assert results.count("new") == 1 and results.count("old") == 4
+    assert json.loads(r.kv["rep"])["v"] == "new"
+    assert "rep:sf:lock" not in r.kv
+
+
+def test_cached_does_not_store_missing_results(monkeypatch):
+    r = _DictRedis()
+
+    async def fake_get_redis():
+        return r
+
+    monkeypatch.setattr(sf_module, "get_redis", fake_get_redis)
+    sf = SingleFlight()
+    r.kv["perf"] = json.dumps({"v": {"pnl": 1}, "exp": time.time() - 1})
+    found = [None, None, {"pnl": 2}]
+
+    async def compute():
+        return found.pop(0)
+
+    async def run():
+        # 过期值重算为 None：删除旧值；之后每次都重新查询，记录出现后立即可见
+        return [await sf.cached("perf", compute, ttl=10) for _ in range(3)]
+
+    assert asyncio.run(run()) == [None, None, {"pnl": 2}]
+    assert json.loads(r.kv["perf"])["v"] == {"pnl": 2}
@@ -0,0 +1,37 @@
+import asyncio
+import threading
+
+import pytest
+
+from apps.core.tasks.runtime import TaskRuntime
+
+
+def test_runtime_reuses_one_loop_across_runs():
+    rt = TaskRuntime()
+
+    async def probe(x):
+        return x, id(asyncio.get_running_loop()), threading.current_thread().name
+
+    try:
+        first = rt.run(probe, 1, timeout=5)
+        second = rt.run(probe, 2, timeout=5)
+        assert first[0] == 1 and second[0] == 2
+        assert first[1] == second[1]
+        assert first[2] == "task-runtime"
+        assert rt.stats()["runs"] == 2
+    finally:
+        rt._loop.call_soon_threadsafe(rt._loop.stop)
+
+
+def test_runtime_propagates_errors():
+    rt = TaskRuntime()
+
+    async def boom():
+        raise ValueError("x")
+
+    try:
+        with pytest.raises(ValueError):
+            rt.run(boom, timeout=5)
+        assert rt.stats()["failures"] == 1
+    finally:
+        rt._loop.call_soon_threadsafe(rt._loop.stop)
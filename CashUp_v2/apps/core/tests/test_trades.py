@@ -0,0 +1,81 @@
+import asyncio
+import json
+from datetime import datetime
+
+from apps.core.app.adapters.exchanges.base import Trade
+from apps.core.app.adapters.exchanges.binance_ws import BinanceTradeStream
+from apps.core.modules.market.services.trades import TradeBuffer, TradeIngestor
+
+
+def _trade(i, symbol="BTC/USDT"):
+    return Trade(id=str(i), order_id="", symbol=symbol, side="buy", quantity=1.0, price=100.0,
+                 commission=0.0, commission_asset="", timestamp=datetime(2024, 1, 1), exchange="x")
+
+
+def test_buffer_dedupes_and_detects_gaps():
+    buf = TradeBuffer(dedupe_window=100)
+    assert buf.add("binance", [_trade(i) for i in range(1, 11)]) == 10
+    assert buf.add("binance", [_trade(i) for i in range(8, 11)]) == 0
+    assert buf.add("binance", [_trade(14), _trade(12)]) == 2
+    rows = buf.drain()
+    assert len(rows) == 12 and rows[0][1] == "BTC_USDT"
+    rates = buf.rates()["binance:BTC_USDT"]
+    assert rates["dupes"] == 3
+    assert rates["gaps"] == 1 and rates["missing"] == 3
+    assert rates["out_of_order"] == 1
+    assert buf.take_gap_events()[0]["from_id"] == 11
+
+
+def test_non_contiguous_exchange_skips_gap_detection():
+    buf = TradeBuffer()
+    buf.add("gateio", [_trade(1), _trade(50)])
+    assert buf.rates()["gateio:BTC_USDT"]["gaps"] == 0
+
+
+def test_requeue_is_bounded():
+    buf = TradeBuffer(max_pending=5)
+    buf.add("gateio", [_trade(i) for i in range(1, 5)])
+    rows = buf.drain()
+    buf.add("gateio", [_trade(i) for i in range(5, 8)])
+    buf.requeue(rows)
+    assert len(buf.pending) == 5 and buf.dropped == 2
+
+
+def test_binance_trade_events_feed_gap_detection_and_stubs_are_unsupported():
+    stream = BinanceTradeStream("wss://example.invalid")
+    buf = TradeBuffer()
+    stream.symbols["btcusdt@trade"] = "BTC/USDT"
+
+    async def on_trades(trades):
+        buf.add("binance", trades)
+
+    stream.callbacks["btcusdt@trade"] = [on_trades]
+
+    class _Stub:
+        async def subscribe_trades(self, symbol, callback):
+            pass
+
+    class _Adapter:
+        def __init__(self, client):
+            self.exchange, self.config = client, {"symbols": ["BTC/USDT"]}
+
+    class _Mgr:
+        adapters = {"kraken": _Adapter(_Stub())}
+
+        def get_exchange_names(self):
+            return list(self.adapters)
+
+        def get_exchange(self, name):
+            return self.adapters[name]
+
+    async def run():
+        for t in (100, 101, 104):
+            await stream._dispatch(json.dumps({"e": "trade", "s": "BTCUSDT", "t": t, "p": "50000.1", "q": "0.01",
+                                               "T": 1700000000000 + t, "m": t == 104}))
+        await stream._dispatch(json.dumps({"result": None, "id": 1}))
+        ingestor = TradeIngestor(lambda: None)
+        assert await ingestor.subscribe(_Mgr()) == [] and ingestor.unsupported == ["kraken"]
+
+    asyncio.run(run())
+    st = buf.rates()["binance:BTC_USDT"]
+    assert st["total"] == 3 and st["gaps"] == 1 and st["missing"] == 2 and st["last_side"] == "sell"
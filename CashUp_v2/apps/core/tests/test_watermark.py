@@ -0,0 +1,16 @@
+import asyncio
+from datetime import datetime
+
+from apps.core.modules.market.services.watermark import WatermarkService
+
+
+def test_watermark_advances_monotonically():
+    svc = WatermarkService()
+    t1 = datetime(2024, 1, 1, 0, 0)
+    t2 = datetime(2024, 1, 1, 1, 0)
+    changed = asyncio.run(svc.advance([("gateio", "BTC_USDT", "1h", t2), ("gateio", "ETH_USDT", "1h", t1)]))
+    assert changed == 2
+    changed = asyncio.run(svc.advance([("gateio", "BTC_USDT", "1h", t1)]))
+    assert changed == 0
+    assert svc.get("gateio", "BTC_USDT", "1h") == t2
+    assert svc.get("gateio", "BTC_USDT", "5m") is None
@@ -0,0 +1,172 @@
+"""
+信号链路端到端延迟埋点
+函数集注释：
+- STAGES: 埋点阶段（K线到达、因子计算、信号落库、下单提交、交易所回执）
+- LatencyHistogram: HDR 风格对数-线性分桶直方图，记录仅为整数自增，无锁
+- LatencyTrace: 单根K线从交易所收盘起各阶段的时间戳记录器
+- LatencyRegistry: 按 策略×阶段 聚合直方图，导出分位数快照与 Prometheus 文本
+- latency_registry: 全局注册表实例
+"""
+
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+STAGES = ("bar_received", "factors_evaluated", "signal_persisted", "order_submitted", "exchange_ack")
+QUANTILES = (("p50", 0.5), ("p99", 0.99), ("p999", 0.999))
+
+# 子桶位数决定精度：7 位 => 每个量级 64 个子桶，相对误差 < 1.6%
+_SUB_BUCKET_BITS = 7
+_SUB_BUCKET_COUNT = 1 << _SUB_BUCKET_BITS
+_SUB_BUCKET_HALF = _SUB_BUCKET_COUNT >> 1
+# 最大可记录 7 天（微秒，覆盖到周线收盘后的整个周期），超出部分截断到最大桶；
+# 桶数随量级对数增长，比 1 小时上限只多约 500 个桶
+_MAX_MICROS = 7 * 86400 * 1_000_000
+
+
+def _bucket_index(v: int) -> int:
+    if v < _SUB_BUCKET_COUNT:
+        return v
+    shift = v.bit_length() - _SUB_BUCKET_BITS
+    return (shift + 1) * _SUB_BUCKET_HALF + (v >> shift) - _SUB_BUCKET_HALF
+
+
+def _bucket_upper(i: int) -> int:
+    if i < _SUB_BUCKET_COUNT:
+        return i
+    shift = i // _SUB_BUCKET_HALF - 1
+    sub = i % _SUB_BUCKET_HALF + _SUB_BUCKET_HALF
+    return ((sub + 1) << shift) - 1
+
+
+class LatencyHistogram:
+    """延迟直方图（单位：微秒）
+
+    桶数组在创建时一次性分配，record 只做一次下标计算与整数自增，
+    调用方均在事件循环线程内记录，因此无需加锁；读取只遍历计数，不阻塞写入。
+    """
+
+    __slots__ = ("counts", "total", "sum_micros", "min_micros", "max_micros")
+
+    def __init__(self):
+        self.counts: List[int] = [0] * (_bucket_index(_MAX_MICROS) + 1)
+        self.total = 0
+        self.sum_micros = 0
+        self.min_micros = 0
+        self.max_micros = 0
+
+    def record(self, micros: int) -> None:
+        v = 0 if micros < 0 else (_MAX_MICROS if micros > _MAX_MICROS else int(micros))
+        self.counts[_bucket_index(v)] += 1
+        self.total += 1
+        self.sum_micros += v
+        if self.total == 1 or v < self.min_micros:
+            self.min_micros = v
+        if v > self.max_micros:
+            self.max_micros = v
+
+    def quantile(self, q: float) -> int:
+        """返回分位数（桶上界，微秒）"""
+        if self.total == 0:
+            return 0
+        target = max(1, int(q * self.total + 0.5))
+        seen = 0
+        for i, c in enumerate(self.counts):
+            if c:
+                seen += c
+                if seen >= target:
+                    return min(_bucket_upper(i), self.max_micros)
+        return self.max_micros
+
+    def snapshot(self) -> Dict[str, float]:
+        data = {
+            "count": self.total,
+            "min_ms": self.min_micros / 1000.0,
+            "max_ms": self.max_micros / 1000.0,
+            "mean_ms": (self.sum_micros / self.total / 1000.0) if self.total else 0.0,
+        }
+        for name, q in QUANTILES:
+            data[f"{name}_ms"] = self.quantile(q) / 1000.0
+        return data
+
+    def reset(self) -> None:
+        for i in range(len(self.counts)):
+            self.counts[i] = 0
+        self.total = 0
+        self.sum_micros = 0
+        self.min_micros = 0
+        self.max_micros = 0
+
+
+def _to_epoch(ts) -> float:
+    if isinstance(ts, datetime):
+        # 适配器返回的 naive 时间为本地时间（datetime.fromtimestamp），timestamp() 按本地时区换算
+        return ts.timestamp()
+    return float(ts)
+
+
+class LatencyTrace:
+    """单根K线的阶段埋点：所有阶段均以交易所收盘时刻为起点"""
+
+    __slots__ = ("_registry", "strategy", "origin")
+
+    def __init__(self, registry: "LatencyRegistry", strategy: str, origin: float):
+        self._registry = registry
+        self.strategy = strategy
+        self.origin = origin
+
+    def stamp(self, stage: str, now: Optional[float] = None) -> int:
+        micros = int(((now if now is not None else time.time()) - self.origin) * 1_000_000)
+        self._registry.record(self.strategy, stage, micros)
+        return micros
+
+
+class LatencyRegistry:
+    """策略×阶段 的直方图注册表"""
+
+    def __init__(self):
+        self.enabled = True
+        self._hists: Dict[Tuple[str, str], LatencyHistogram] = {}
+
+    def record(self, strategy: str, stage: str, micros: int) -> None:
+        if not self.enabled:
+            return
+        key = (strategy, stage)
+        h = self._hists.get(key)
+        if h is None:
+            h = self._hists.setdefault(key, LatencyHistogram())
+        h.record(micros)
+
+    def trace(self, strategy, bar_close) -> LatencyTrace:
+        """以K线收盘时间（datetime 或 epoch 秒）开始一次链路埋点"""
+        return LatencyTrace(self, str(strategy), _to_epoch(bar_close))
+
+    def snapshot(self, strategy: Optional[str] = None) -> Dict[str, Dict[str, Dict[str, float]]]:
+        data: Dict[str, Dict[str, Dict[str, float]]] = {}
+        for (sid, stage), h in list(self._hists.items()):
+            if strategy is not None and sid != str(strategy):
+                continue
+            data.setdefault(sid, {})[stage] = h.snapshot()
+        return data
+
+    def reset(self, strategy: Optional[str] = None) -> None:
+        for (sid, _), h in list(self._hists.items()):
+            if strategy is None or sid == str(strategy):
+                h.reset()
+
+    def prometheus_lines(self) -> List[str]:
+        lines = [
+            "# HELP cashup_signal_latency_seconds Latency from exchange bar close to each signal pipeline stage",
+            "# TYPE cashup_signal_latency_seconds summary",
+        ]
+        for (sid, stage), h in sorted(self._hists.items()):
+            labels = f"strategy=\"{sid}\",stage=\"{stage}\""
+            for _, q in QUANTILES:
+                lines.append(f"cashup_signal_latency_seconds{{{labels},quantile=\"{q}\"}} {h.quantile(q) / 1e6:.6f}")
+            lines.append(f"cashup_signal_latency_seconds_sum{{{labels}}} {h.sum_micros / 1e6:.6f}")
+            lines.append(f"cashup_signal_latency_seconds_count{{{labels}}} {h.total}")
+        return lines
+
+
+# 全局注册表实例
+latency_registry = LatencyRegistry()
@@ -0,0 +1,148 @@
+"""
+热点读接口的请求合并（single-flight）
+函数集注释：
+- SingleFlight.do: 进程内合并：同一 key 同时只有一个计算在执行，其余调用方等待同一个 Future（计算在独立任务中执行，发起者断开不影响等待者）
+- acquire_lock / release_lock: 跨进程互斥锁（SET NX PX + 令牌比对删除），拿不到锁时立即返回 None，不阻塞
+- cached: Redis 缓存 + 过期后的"先返回旧值再重算"：
+    新鲜期内直接返回；过期但仍在 stale 窗口内时，抢到锁的那一个调用方同步重算，其余调用方（含其他 worker）直接返回旧值；
+    完全缺失时进程内合并，跨进程由锁选出一个计算者，其余进程轮询等待结果，超时后自行计算
+- singleflight: 进程级实例
+值以 {"v": 值, "exp": 新鲜截止时间戳} 的 JSON 存储，调用方的计算函数须返回可 JSON 序列化的数据；Redis 不可用时退化为仅进程内合并
+计算结果为 None（查无记录）时不缓存并删除旧值：新建的记录下一次请求即可见
+"""
+
+import asyncio
+import json
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from database.redis import get_redis
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+_RELEASE_SCRIPT = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) else return 0 end"
+
+
+async def acquire_lock(r, key: str, ttl_ms: int) -> Optional[str]:
+    token = uuid.uuid4().hex
+    ok = await r.set(key, token, nx=True, px=ttl_ms)
+    return token if ok else None
+
+
+async def release_lock(r, key: str, token: Optional[str]) -> None:
+    if not token:
+        return
+    try:
+        await r.eval(_RELEASE_SCRIPT, 1, key, token)
+    except Exception:
+        pass
+
+
+class SingleFlight:
+    """进程内请求合并"""
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Task] = {}
+        self.stats: Dict[str, int] = {"calls": 0, "shared": 0, "hits": 0, "stale": 0, "misses": 0, "lock_waits": 0}
+
+    def in_flight(self, key: str) -> bool:
+        t = self._calls.get(key)
+        return t is not None and not t.done()
+
+    def _done(self, key: str, task: asyncio.Task) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # 无人等待时也标记异常已读取，避免"Task exception was never retrieved"
+        if not task.cancelled():
+            task.exception()
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._calls.get(key)
+        if task is not None and not task.done():
+            self.stats["shared"] += 1
+        else:
+            self.stats["calls"] += 1
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda t, k=key: self._done(k, t))
+        return await asyncio.shield(task)
+
+    async def _store(self, r, key: str, value: Any, ttl: float, stale_ttl: float) -> None:
+        try:
+            if value is None:
+                await r.delete(key)
+                return
+            env = json.dumps({"v": value, "exp": time.time() + ttl}, default=str)
+            await r.set(key, env, px=int((ttl + stale_ttl) * 1000))
+        except Exception as e:
+            logger.warning(f"缓存写入失败 {key}: {e}")
+
+    async def _fill(self, r, key: str, fn: Callable[[], Awaitable[Any]], ttl: float, stale_ttl: float, lock_ttl: float) -> Any:
+        lock_key = f"{key}:sf:lock"
+        try:
+            token = await acquire_lock(r, lock_key, int(lock_ttl * 1000))
+        except Exception:
+            return await fn()
+        if token is None:
+            # 其他 worker 正在计算：轮询结果，等不到再自行计算
+            self.stats["lock_waits"] += 1
+            deadline = time.monotonic() + lock_ttl
+            while time.monotonic() < deadline:
+                await asyncio.sleep(0.05)
+                raw = await r.get(key)
+                if raw is not None:
+                    return json.loads(raw)["v"]
+                if not await r.exists(lock_key):
+                    # 计算者已结束但未写缓存（结果为 None 或失败）：不再等待，自行计算
+                    break
+        try:
+            value = await fn()
+            await self._store(r, key, value, ttl, stale_ttl)
+            return value
+        finally:
+            await release_lock(r, lock_key, token)
+
+    async def cached(self, key: str, fn: Callable[[], Awaitable[Any]], ttl: float,
+                     stale_ttl: Optional[float] = None, lock_ttl: float = 10.0) -> Any:
+        """读取缓存，未命中/过期时按上述策略重算；stale_ttl 默认取 ttl 的 5 倍"""
+        stale_ttl = ttl * 5 if stale_ttl is None else stale_ttl
+        try:
+            r = await get_redis()
+            raw = await r.get(key)
+        except Exception:
+            return await self.do(key, fn)
+        if raw is not None:
+            env = json.loads(raw)
+            if env.get("exp", 0) > time.time():
+                self.stats["hits"] += 1
+                return env["v"]
+            self.stats["stale"] += 1
+            # 进程内已有重算，或其他 worker 持有锁：直接返回旧值
+            if self.in_flight(key):
+                return env["v"]
+            lock_key = f"{key}:sf:lock"
+            token = await acquire_lock(r, lock_key, int(lock_ttl * 1000))
+            if token is None:
+                return env["v"]
+
+            async def _revalidate():
+                try:
+                    value = await fn()
+                    await self._store(r, key, value, ttl, stale_ttl)
+                    return value
+                finally:
+                    await release_lock(r, lock_key, token)
+
+            try:
+                return await self.do(key, _revalidate)
+            except Exception as e:
+                logger.warning(f"缓存重算失败，返回旧值 {key}: {e}")
+                return env["v"]
+        self.stats["misses"] += 1
+        return await self.do(key, lambda: self._fill(r, key, fn, ttl, stale_ttl, lock_ttl))
+
+
+# 进程级实例
+singleflight = SingleFlight()
@@ -252,9 +252,11 @@ CREATE INDEX idx_risk_strategy ON risk_events(strategy_instance_id, created_at D
 -- 4. 行情数据模块
 -- ============================================================================
 
--- K线数据表
+-- K线数据表（按 open_time 月度范围分区，月分区内再按 timeframe 列表子分区）
+-- 分区命名：kline_data_y2024m05 / kline_data_y2024m05_{1m|minute|hour|day}
+-- 子分区对应保留策略分组：1m、分钟级(3m-30m)、小时级(1h-12h)、日级及以上(1d/3d/1w/1M)
 CREATE TABLE IF NOT EXISTS kline_data (
-    id BIGSERIAL PRIMARY KEY,
+    id BIGSERIAL,
     exchange VARCHAR(50) NOT NULL,
     symbol VARCHAR(20) NOT NULL,
     timeframe VARCHAR(10) NOT NULL,
@@ -268,12 +270,93 @@ CREATE TABLE IF NOT EXISTS kline_data (
     trade_count INTEGER,
     taker_buy_base DECIMAL(20, 8),
     taker_buy_quote DECIMAL(20, 8),
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    source VARCHAR(16) NOT NULL DEFAULT 'exchange',  -- exchange: 交易所原生; rollup: 由 1m 聚合
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (exchange, symbol, timeframe, open_time)
+) PARTITION BY RANGE (open_time);
+
+CREATE INDEX IF NOT EXISTS idx_kline_time ON kline_data(open_time DESC);
+
+-- 超出已建月分区范围的数据落入默认分区，保证写入不失败
+CREATE TABLE IF NOT EXISTS kline_data_default PARTITION OF kline_data DEFAULT;
+
+-- 创建指定月份的分区及其时间框子分区（幂等）
+CREATE OR REPLACE FUNCTION create_kline_partitions(p_month DATE)
+RETURNS VOID AS $$
+DECLARE
+    m_start DATE := date_trunc('month', p_month)::date;
+    m_end DATE := (date_trunc('month', p_month) + INTERVAL '1 month')::date;
+    parent TEXT := format('kline_data_y%sm%s', to_char(m_start, 'YYYY'), to_char(m_start, 'MM'));
+    moved BOOLEAN := FALSE;
+BEGIN
+    -- 月分区尚不存在时，先移出默认分区中该月的行（否则新建分区会与默认分区已有数据冲突而失败）
+    IF to_regclass(parent) IS NULL AND to_regclass('kline_data_default') IS NOT NULL THEN
+        CREATE TEMP TABLE kline_partition_move AS
+            SELECT * FROM kline_data_default WHERE open_time >= m_start AND open_time < m_end;
+        DELETE FROM kline_data_default WHERE open_time >= m_start AND open_time < m_end;
+        moved := TRUE;
+    END IF;
+    EXECUTE format('CREATE TABLE IF NOT EXISTS %I PARTITION OF kline_data FOR VALUES FROM (%L) TO (%L) PARTITION BY LIST (timeframe)', parent, m_start, m_end);
+    EXECUTE format('CREATE TABLE IF NOT EXISTS %I PARTITION OF %I FOR VALUES IN (''1m'')', parent || '_1m', parent);
+    EXECUTE format('CREATE TABLE IF NOT EXISTS %I PARTITION OF %I FOR VALUES IN (''3m'', ''5m'', ''15m'', ''30m'')', parent || '_minute', parent);
+    EXECUTE format('CREATE TABLE IF NOT EXISTS %I PARTITION OF %I FOR VALUES IN (''1h'', ''2h'', ''4h'', ''6h'', ''8h'', ''12h'')', parent || '_hour', parent);
+    -- 日级子分区为显式列表（不设默认子分区）：其它分组的子分区归档删除后，迟到的写入会被拒绝而不是落入永久保留的 _day
+    EXECUTE format('CREATE TABLE IF NOT EXISTS %I PARTITION OF %I FOR VALUES IN (''1d'', ''3d'', ''1w'', ''1M'')', parent || '_day', parent);
+    IF moved THEN
+        INSERT INTO kline_data SELECT * FROM kline_partition_move;
+        DROP TABLE kline_partition_move;
+    END IF;
+END;
+$$ language 'plpgsql';
+
+-- 预建过去 24 个月至未来 3 个月的分区；之后由每日维护任务滚动创建
+DO $$
+DECLARE
+    m DATE;
+BEGIN
+    FOR m IN SELECT generate_series(date_trunc('month', CURRENT_DATE) - INTERVAL '24 months',
+                                    date_trunc('month', CURRENT_DATE) + INTERVAL '3 months',
+                                    INTERVAL '1 month')::date LOOP
+        PERFORM create_kline_partitions(m);
+    END LOOP;
+END $$;
+
+-- K线批量导入暂存表（UNLOGGED，COPY 写入后按 batch_id 合并进 kline_data）
+CREATE UNLOGGED TABLE IF NOT EXISTS kline_staging (
+    batch_id UUID NOT NULL,
+    exchange VARCHAR(50) NOT NULL,
+    symbol VARCHAR(20) NOT NULL,
+    timeframe VARCHAR(10) NOT NULL,
+    open_time TIMESTAMP NOT NULL,
+    open DECIMAL(20, 8),
+    high DECIMAL(20, 8),
+    low DECIMAL(20, 8),
+    close DECIMAL(20, 8),
+    volume DECIMAL(20, 8)
 );
 
-CREATE UNIQUE INDEX idx_kline_unique ON kline_data(exchange, symbol, timeframe, open_time);
-CREATE INDEX idx_kline_query ON kline_data(exchange, symbol, timeframe, open_time DESC);
-CREATE INDEX idx_kline_time ON kline_data(open_time DESC);
+CREATE INDEX idx_kline_staging_batch ON kline_staging(batch_id);
+
+-- 未通过数据质量校验的K线（OHLC 不一致、未对齐 open_time、离群价等），不写入 kline_data；缺口扫描视其 open_time 为已覆盖
+CREATE TABLE IF NOT EXISTS kline_quarantine (
+    id BIGSERIAL PRIMARY KEY,
+    exchange VARCHAR(50) NOT NULL,
+    symbol VARCHAR(20) NOT NULL,
+    timeframe VARCHAR(10) NOT NULL,
+    open_time TIMESTAMP NOT NULL,
+    open DECIMAL(20, 8),
+    high DECIMAL(20, 8),
+    low DECIMAL(20, 8),
+    close DECIMAL(20, 8),
+    volume DECIMAL(20, 8),
+    reasons VARCHAR(200) NOT NULL,  -- 逗号分隔的原因
+    seen_count INTEGER NOT NULL DEFAULT 1,
+    first_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    last_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE (exchange, symbol, timeframe, open_time)
+);
+
+CREATE INDEX idx_kline_quarantine_seen ON kline_quarantine(exchange, last_seen DESC);
 
 -- 订单簿数据（快照）
 CREATE TABLE IF NOT EXISTS orderbook_snapshots (
@@ -290,22 +373,109 @@ CREATE TABLE IF NOT EXISTS orderbook_snapshots (
 CREATE INDEX idx_orderbook_query ON orderbook_snapshots(exchange, symbol, timestamp DESC);
 CREATE INDEX idx_orderbook_time ON orderbook_snapshots(timestamp DESC);
 
--- 最新成交价
-CREATE TABLE IF NOT EXISTS market_trades (
+-- 订单簿增量块（二进制：zlib 压缩的 毫秒偏移/方向/价格/数量 定长记录；回放时从最近快照起顺序应用）
+CREATE TABLE IF NOT EXISTS orderbook_deltas (
     id BIGSERIAL PRIMARY KEY,
     exchange VARCHAR(50) NOT NULL,
     symbol VARCHAR(20) NOT NULL,
-    trade_id VARCHAR(100),
+    start_time TIMESTAMP NOT NULL,
+    end_time TIMESTAMP NOT NULL,
+    delta_count INTEGER NOT NULL,
+    payload BYTEA NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX idx_orderbook_deltas_query ON orderbook_deltas(exchange, symbol, start_time);
+CREATE INDEX idx_orderbook_deltas_time ON orderbook_deltas(end_time);
+
+-- 逐笔成交（按成交时间每日范围分区；主键含分区键，按交易所成交ID去重）
+CREATE TABLE IF NOT EXISTS market_trades (
+    exchange VARCHAR(50) NOT NULL,
+    symbol VARCHAR(20) NOT NULL,
+    trade_id VARCHAR(100) NOT NULL,
     price DECIMAL(20, 8),
     quantity DECIMAL(20, 8),
     side VARCHAR(10),
     timestamp TIMESTAMP NOT NULL,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-);
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (exchange, symbol, trade_id, timestamp)
+) PARTITION BY RANGE (timestamp);
+
+CREATE TABLE IF NOT EXISTS market_trades_default PARTITION OF market_trades DEFAULT;
 
-CREATE UNIQUE INDEX idx_trades_unique ON market_trades(exchange, trade_id) WHERE trade_id IS NOT NULL;
 CREATE INDEX idx_trades_query ON market_trades(exchange, symbol, timestamp DESC);
-CREATE INDEX idx_trades_time ON market_trades(timestamp DESC);
+
+-- 创建指定日期的逐笔成交分区（幂等）
+CREATE OR REPLACE FUNCTION create_trade_partitions(p_day DATE)
+RETURNS VOID AS $$
+DECLARE
+    part TEXT := 'market_trades_p' || to_char(p_day, 'YYYYMMDD');
+    moved BOOLEAN := FALSE;
+BEGIN
+    -- 日分区尚不存在时，先移出默认分区中该日的行（否则新建分区会与默认分区已有数据冲突而失败）
+    IF to_regclass(part) IS NULL AND to_regclass('market_trades_default') IS NOT NULL THEN
+        CREATE TEMP TABLE trade_partition_move AS
+            SELECT * FROM market_trades_default WHERE timestamp >= p_day AND timestamp < p_day + 1;
+        DELETE FROM market_trades_default WHERE timestamp >= p_day AND timestamp < p_day + 1;
+        moved := TRUE;
+    END IF;
+    EXECUTE format('CREATE TABLE IF NOT EXISTS %I PARTITION OF market_trades FOR VALUES FROM (%L) TO (%L)', part, p_day, p_day + 1);
+    IF moved THEN
+        INSERT INTO market_trades SELECT * FROM trade_partition_move;
+        DROP TABLE trade_partition_move;
+    END IF;
+END;
+$$ language 'plpgsql';
+
+-- 预建前一天至未来 7 天的分区；之后由每日维护任务滚动创建
+DO $$
+DECLARE
+    d DATE;
+BEGIN
+    FOR d IN SELECT generate_series(CURRENT_DATE - 1, CURRENT_DATE + 7, INTERVAL '1 day')::date LOOP
+        PERFORM create_trade_partitions(d);
+    END LOOP;
+END $$;
+
+-- 逐笔成交批量导入暂存表（UNLOGGED，COPY 写入后按 batch_id 合并进 market_trades）
+CREATE UNLOGGED TABLE IF NOT EXISTS trade_staging (
+    batch_id UUID NOT NULL,
+    exchange VARCHAR(50) NOT NULL,
+    symbol VARCHAR(20) NOT NULL,
+    trade_id VARCHAR(100) NOT NULL,
+    price DECIMAL(20, 8),
+    quantity DECIMAL(20, 8),
+    side VARCHAR(10),
+    timestamp TIMESTAMP NOT NULL
+);
+
+CREATE INDEX idx_trade_staging_batch ON trade_staging(batch_id);
+
+-- 永续合约资金费率结算历史（每次结算一行）
+CREATE TABLE IF NOT EXISTS funding_rates (
+    exchange VARCHAR(50) NOT NULL,
+    symbol VARCHAR(20) NOT NULL,
+    funding_time TIMESTAMP NOT NULL,
+    funding_rate DECIMAL(18, 10) NOT NULL,
+    mark_price DECIMAL(20, 8),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (exchange, symbol, funding_time)
+);
+
+-- 永续合约未平仓量与价格采样（按采集周期一行；预测费率/指数价格仅在最新采样上有值）
+CREATE TABLE IF NOT EXISTS open_interest (
+    exchange VARCHAR(50) NOT NULL,
+    symbol VARCHAR(20) NOT NULL,
+    timestamp TIMESTAMP NOT NULL,
+    open_interest DECIMAL(30, 8),
+    open_interest_value DECIMAL(30, 8),
+    mark_price DECIMAL(20, 8),
+    index_price DECIMAL(20, 8),
+    predicted_funding_rate DECIMAL(18, 10),
+    next_funding_time TIMESTAMP,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (exchange, symbol, timestamp)
+);
 
 -- ============================================================================
 -- 5. RSS新闻模块（新增）
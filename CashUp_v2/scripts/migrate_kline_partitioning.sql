@@ -0,0 +1,88 @@
+-- ============================================================================
+-- 将已有的单表 kline_data 迁移为月度分区表
+-- 仅用于已部署的旧库；新库直接执行 init_database_v2.sql 即为分区表
+-- 用法：psql -d cashup -f scripts/migrate_kline_partitioning.sql（建议在停写窗口执行）
+-- ============================================================================
+
+BEGIN;
+
+ALTER TABLE kline_data RENAME TO kline_data_legacy;
+ALTER INDEX IF EXISTS idx_kline_unique RENAME TO idx_kline_legacy_unique;
+ALTER INDEX IF EXISTS idx_kline_query RENAME TO idx_kline_legacy_query;
+ALTER INDEX IF EXISTS idx_kline_time RENAME TO idx_kline_legacy_time;
+ALTER TABLE kline_data_legacy ADD COLUMN IF NOT EXISTS source VARCHAR(16) NOT NULL DEFAULT 'exchange';
+
+CREATE TABLE kline_data (
+    id BIGSERIAL,
+    exchange VARCHAR(50) NOT NULL,
+    symbol VARCHAR(20) NOT NULL,
+    timeframe VARCHAR(10) NOT NULL,
+    open_time TIMESTAMP NOT NULL,
+    open DECIMAL(20, 8),
+    high DECIMAL(20, 8),
+    low DECIMAL(20, 8),
+    close DECIMAL(20, 8),
+    volume DECIMAL(20, 8),
+    quote_volume DECIMAL(20, 8),
+    trade_count INTEGER,
+    taker_buy_base DECIMAL(20, 8),
+    taker_buy_quote DECIMAL(20, 8),
+    source VARCHAR(16) NOT NULL DEFAULT 'exchange',
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (exchange, symbol, timeframe, open_time)
+) PARTITION BY RANGE (open_time);
+
+CREATE INDEX idx_kline_time ON kline_data(open_time DESC);
+CREATE TABLE kline_data_default PARTITION OF kline_data DEFAULT;
+
+CREATE OR REPLACE FUNCTION create_kline_partitions(p_month DATE)
+RETURNS VOID AS $$
+DECLARE
+    m_start DATE := date_trunc('month', p_month)::date;
+    m_end DATE := (date_trunc('month', p_month) + INTERVAL '1 month')::date;
+    parent TEXT := format('kline_data_y%sm%s', to_char(m_start, 'YYYY'), to_char(m_start, 'MM'));
+    moved BOOLEAN := FALSE;
+BEGIN
+    -- 月分区尚不存在时，先移出默认分区中该月的行（否则新建分区会与默认分区已有数据冲突而失败）
+    IF to_regclass(parent) IS NULL AND to_regclass('kline_data_default') IS NOT NULL THEN
+        CREATE TEMP TABLE kline_partition_move AS
+            SELECT * FROM kline_data_default WHERE open_time >= m_start AND open_time < m_end;
+        DELETE FROM kline_data_default WHERE open_time >= m_start AND open_time < m_end;
+        moved := TRUE;
+    END IF;
+    EXECUTE format('CREATE TABLE IF NOT EXISTS %I PARTITION OF kline_data FOR VALUES FROM (%L) TO (%L) PARTITION BY LIST (timeframe)', parent, m_start, m_end);
+    EXECUTE format('CREATE TABLE IF NOT EXISTS %I PARTITION OF %I FOR VALUES IN (''1m'')', parent || '_1m', parent);
+    EXECUTE format('CREATE TABLE IF NOT EXISTS %I PARTITION OF %I FOR VALUES IN (''3m'', ''5m'', ''15m'', ''30m'')', parent || '_minute', parent);
+    EXECUTE format('CREATE TABLE IF NOT EXISTS %I PARTITION OF %I FOR VALUES IN (''1h'', ''2h'', ''4h'', ''6h'', ''8h'', ''12h'')', parent || '_hour', parent);
+    -- 日级子分区为显式列表（不设默认子分区）：其它分组的子分区归档删除后，迟到的写入会被拒绝而不是落入永久保留的 _day
+    EXECUTE format('CREATE TABLE IF NOT EXISTS %I PARTITION OF %I FOR VALUES IN (''1d'', ''3d'', ''1w'', ''1M'')', parent || '_day', parent);
+    IF moved THEN
+        INSERT INTO kline_data SELECT * FROM kline_partition_move;
+        DROP TABLE kline_partition_move;
+    END IF;
+END;
+$$ language 'plpgsql';
+
+-- 按历史数据实际覆盖的月份建分区
+DO $$
+DECLARE
+    m DATE;
+BEGIN
+    FOR m IN SELECT generate_series(
+                 COALESCE((SELECT date_trunc('month', MIN(open_time)) FROM kline_data_legacy), date_trunc('month', CURRENT_DATE)),
+                 date_trunc('month', CURRENT_DATE) + INTERVAL '3 months',
+                 INTERVAL '1 month')::date LOOP
+        PERFORM create_kline_partitions(m);
+    END LOOP;
+END $$;
+
+INSERT INTO kline_data (exchange, symbol, timeframe, open_time, open, high, low, close, volume,
+                        quote_volume, trade_count, taker_buy_base, taker_buy_quote, source, created_at)
+SELECT exchange, symbol, timeframe, open_time, open, high, low, close, volume,
+       quote_volume, trade_count, taker_buy_base, taker_buy_quote, source, created_at
+FROM kline_data_legacy
+ON CONFLICT DO NOTHING;
+
+COMMIT;
+
+-- 核对无误后手动删除旧表：DROP TABLE kline_data_legacy;
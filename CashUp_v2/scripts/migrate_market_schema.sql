@@ -0,0 +1,90 @@
+-- ============================================================================
+-- 为已部署的旧库补齐行情模块新增的列与表（幂等，可重复执行）
+-- 新库直接执行 init_database_v2.sql 即已包含；服务运行时不再执行 DDL，升级时先执行本脚本
+-- 用法：psql -d cashup -f scripts/migrate_market_schema.sql
+-- ============================================================================
+
+BEGIN;
+
+-- K线来源标记（exchange: 交易所原生; rollup: 由 1m 聚合）
+ALTER TABLE kline_data ADD COLUMN IF NOT EXISTS source VARCHAR(16) NOT NULL DEFAULT 'exchange';
+
+-- K线批量导入暂存表（UNLOGGED，COPY 写入后按 batch_id 合并进 kline_data）
+CREATE UNLOGGED TABLE IF NOT EXISTS kline_staging (
+    batch_id UUID NOT NULL,
+    exchange VARCHAR(50) NOT NULL,
+    symbol VARCHAR(20) NOT NULL,
+    timeframe VARCHAR(10) NOT NULL,
+    open_time TIMESTAMP NOT NULL,
+    open DECIMAL(20, 8),
+    high DECIMAL(20, 8),
+    low DECIMAL(20, 8),
+    close DECIMAL(20, 8),
+    volume DECIMAL(20, 8)
+);
+
+CREATE INDEX IF NOT EXISTS idx_kline_staging_batch ON kline_staging(batch_id);
+
+-- 订单簿增量块（二进制：zlib 压缩的 毫秒偏移/方向/价格/数量 定长记录；回放时从最近快照起顺序应用）
+CREATE TABLE IF NOT EXISTS orderbook_deltas (
+    id BIGSERIAL PRIMARY KEY,
+    exchange VARCHAR(50) NOT NULL,
+    symbol VARCHAR(20) NOT NULL,
+    start_time TIMESTAMP NOT NULL,
+    end_time TIMESTAMP NOT NULL,
+    delta_count INTEGER NOT NULL,
+    payload BYTEA NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_orderbook_deltas_query ON orderbook_deltas(exchange, symbol, start_time);
+CREATE INDEX IF NOT EXISTS idx_orderbook_deltas_time ON orderbook_deltas(end_time);
+
+-- 永续合约资金费率结算历史（每次结算一行）
+CREATE TABLE IF NOT EXISTS funding_rates (
+    exchange VARCHAR(50) NOT NULL,
+    symbol VARCHAR(20) NOT NULL,
+    funding_time TIMESTAMP NOT NULL,
+    funding_rate DECIMAL(18, 10) NOT NULL,
+    mark_price DECIMAL(20, 8),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (exchange, symbol, funding_time)
+);
+
+-- 永续合约未平仓量与价格采样（按采集周期一行；预测费率/指数价格仅在最新采样上有值）
+CREATE TABLE IF NOT EXISTS open_interest (
+    exchange VARCHAR(50) NOT NULL,
+    symbol VARCHAR(20) NOT NULL,
+    timestamp TIMESTAMP NOT NULL,
+    open_interest DECIMAL(30, 8),
+    open_interest_value DECIMAL(30, 8),
+    mark_price DECIMAL(20, 8),
+    index_price DECIMAL(20, 8),
+    predicted_funding_rate DECIMAL(18, 10),
+    next_funding_time TIMESTAMP,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (exchange, symbol, timestamp)
+);
+
+-- 未通过数据质量校验的K线（OHLC 不一致、未对齐 open_time、离群价等），不写入 kline_data；缺口扫描视其 open_time 为已覆盖
+CREATE TABLE IF NOT EXISTS kline_quarantine (
+    id BIGSERIAL PRIMARY KEY,
+    exchange VARCHAR(50) NOT NULL,
+    symbol VARCHAR(20) NOT NULL,
+    timeframe VARCHAR(10) NOT NULL,
+    open_time TIMESTAMP NOT NULL,
+    open DECIMAL(20, 8),
+    high DECIMAL(20, 8),
+    low DECIMAL(20, 8),
+    close DECIMAL(20, 8),
+    volume DECIMAL(20, 8),
+    reasons VARCHAR(200) NOT NULL,  -- 逗号分隔的原因
+    seen_count INTEGER NOT NULL DEFAULT 1,
+    first_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    last_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE (exchange, symbol, timeframe, open_time)
+);
+
+CREATE INDEX IF NOT EXISTS idx_kline_quarantine_seen ON kline_quarantine(exchange, last_seen DESC);
+
+COMMIT;
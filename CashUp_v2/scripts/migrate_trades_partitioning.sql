@@ -0,0 +1,86 @@
+-- ============================================================================
+-- 将已有的单表 market_trades 迁移为每日分区表
+-- 仅用于已部署的旧库；新库直接执行 init_database_v2.sql 即为分区表
+-- 用法：psql -d cashup -f scripts/migrate_trades_partitioning.sql
+-- ============================================================================
+
+BEGIN;
+
+ALTER TABLE market_trades RENAME TO market_trades_legacy;
+ALTER INDEX IF EXISTS idx_trades_unique RENAME TO idx_trades_legacy_unique;
+ALTER INDEX IF EXISTS idx_trades_query RENAME TO idx_trades_legacy_query;
+ALTER INDEX IF EXISTS idx_trades_time RENAME TO idx_trades_legacy_time;
+
+CREATE TABLE market_trades (
+    exchange VARCHAR(50) NOT NULL,
+    symbol VARCHAR(20) NOT NULL,
+    trade_id VARCHAR(100) NOT NULL,
+    price DECIMAL(20, 8),
+    quantity DECIMAL(20, 8),
+    side VARCHAR(10),
+    timestamp TIMESTAMP NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (exchange, symbol, trade_id, timestamp)
+) PARTITION BY RANGE (timestamp);
+
+CREATE TABLE market_trades_default PARTITION OF market_trades DEFAULT;
+
+CREATE INDEX idx_trades_query ON market_trades(exchange, symbol, timestamp DESC);
+
+CREATE OR REPLACE FUNCTION create_trade_partitions(p_day DATE)
+RETURNS VOID AS $$
+DECLARE
+    part TEXT := 'market_trades_p' || to_char(p_day, 'YYYYMMDD');
+    moved BOOLEAN := FALSE;
+BEGIN
+    -- 日分区尚不存在时，先移出默认分区中该日的行（否则新建分区会与默认分区已有数据冲突而失败）
+    IF to_regclass(part) IS NULL AND to_regclass('market_trades_default') IS NOT NULL THEN
+        CREATE TEMP TABLE trade_partition_move AS
+            SELECT * FROM market_trades_default WHERE timestamp >= p_day AND timestamp < p_day + 1;
+        DELETE FROM market_trades_default WHERE timestamp >= p_day AND timestamp < p_day + 1;
+        moved := TRUE;
+    END IF;
+    EXECUTE format('CREATE TABLE IF NOT EXISTS %I PARTITION OF market_trades FOR VALUES FROM (%L) TO (%L)', part, p_day, p_day + 1);
+    IF moved THEN
+        INSERT INTO market_trades SELECT * FROM trade_partition_move;
+        DROP TABLE trade_partition_move;
+    END IF;
+END;
+$$ language 'plpgsql';
+
+-- 覆盖旧数据所在日期至未来 7 天
+DO $$
+DECLARE
+    d DATE;
+    first_day DATE;
+BEGIN
+    SELECT COALESCE(MIN(timestamp)::date, CURRENT_DATE) INTO first_day FROM market_trades_legacy;
+    FOR d IN SELECT generate_series(LEAST(first_day, CURRENT_DATE - 1), CURRENT_DATE + 7, INTERVAL '1 day')::date LOOP
+        PERFORM create_trade_partitions(d);
+    END LOOP;
+END $$;
+
+-- 旧表无成交ID的行以 时间戳:价格:数量 生成合成ID
+INSERT INTO market_trades (exchange, symbol, trade_id, price, quantity, side, timestamp, created_at)
+SELECT exchange, symbol,
+       COALESCE(trade_id, (extract(epoch FROM timestamp) * 1000)::bigint || ':' || price || ':' || quantity),
+       price, quantity, side, timestamp, created_at
+FROM market_trades_legacy
+ON CONFLICT DO NOTHING;
+
+CREATE UNLOGGED TABLE IF NOT EXISTS trade_staging (
+    batch_id UUID NOT NULL,
+    exchange VARCHAR(50) NOT NULL,
+    symbol VARCHAR(20) NOT NULL,
+    trade_id VARCHAR(100) NOT NULL,
+    price DECIMAL(20, 8),
+    quantity DECIMAL(20, 8),
+    side VARCHAR(10),
+    timestamp TIMESTAMP NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_trade_staging_batch ON trade_staging(batch_id);
+
+COMMIT;
+
+-- 核对无误后手动删除旧表：DROP TABLE market_trades_legacy;
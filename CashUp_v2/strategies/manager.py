@@ -4,15 +4,15 @@
 
 import os
 import sys
-import importlib.util
-import inspect
 import json
 from typing import Dict, List, Optional, Type, Any
 from datetime import datetime
 import asyncio
 from pathlib import Path
 
-from strategies.base import StrategyBase, StrategyConfig, StrategySignal
+from strategies.base import StrategyBase, StrategyConfig, StrategySignal, TimeFrame
+from strategies.sandbox import SandboxPool, SandboxLimits, SandboxedStrategy, find_strategy_classes
+from strategies.module_cache import StrategyFileWatcher, module_cache
 from utils.logger import get_logger
 
 logger = get_logger(__name__)
@@ -20,12 +20,20 @@ logger = get_logger(__name__)
 class StrategyManager:
     """策略管理器"""
     
-    def __init__(self, strategies_dir: str = "./strategies"):
+    def __init__(self, strategies_dir: str = "./strategies", sandbox: bool = False,
+                 sandbox_limits: Optional[SandboxLimits] = None, max_sandbox_workers: int = 8):
         self.strategies_dir = Path(strategies_dir)
         self.loaded_strategies: Dict[str, StrategyBase] = {}
         self.strategy_classes: Dict[str, Type[StrategyBase]] = {}
         self.strategy_metadata: Dict[str, Dict[str, Any]] = {}
         self.running_strategies: Dict[str, asyncio.Task] = {}
+        # 沙箱模式：用户策略在受限子进程中运行，主进程不导入用户代码
+        self.sandbox = sandbox
+        self.sandbox_pool = SandboxPool(max_workers=max_sandbox_workers, limits=sandbox_limits) if sandbox else None
+        # 编译缓存（按内容哈希，跨实例共享）与热重载状态
+        self.module_cache = module_cache
+        self._pending_swaps: Dict[int, Type[StrategyBase]] = {}
+        self._watcher: Optional[StrategyFileWatcher] = None
         
         # 确保策略目录存在
         self.strategies_dir.mkdir(exist_ok=True)
@@ -44,32 +52,33 @@ class StrategyManager:
             if strategy_file.name.startswith("__"):
                 continue
                 
+            if self.sandbox:
+                strategies.extend(self._discover_static(strategy_file))
+                continue
+
             try:
-                # 加载策略模块
-                module_name = strategy_file.stem
-                spec = importlib.util.spec_from_file_location(module_name, strategy_file)
-                module = importlib.util.module_from_spec(spec)
-                spec.loader.exec_module(module)
+                # 按内容哈希取编译缓存，未变更的文件不再重复导入与校验
+                compiled = self.module_cache.get_file(strategy_file)
+                if not compiled.validation["valid"]:
+                    logger.error(f"加载策略文件 {strategy_file} 失败: {'; '.join(compiled.validation['errors'])}")
+                    continue
                 
-                # 查找策略类
-                for name, obj in inspect.getmembers(module):
-                    if (inspect.isclass(obj) and 
-                        issubclass(obj, StrategyBase) and 
-                        obj != StrategyBase):
-                        strategies.append(name)
-                        self.strategy_classes[name] = obj
-                        
-                        # 收集策略元数据
-                        self.strategy_metadata[name] = {
-                            "file_path": str(strategy_file),
-                            "module_name": module_name,
-                            "class_name": name,
-                            "description": obj.__doc__ or "",
-                            "version": getattr(obj, 'version', '1.0.0'),
-                            "author": getattr(obj, 'author', ''),
-                            "created_at": datetime.fromtimestamp(strategy_file.stat().st_ctime).isoformat(),
-                            "modified_at": datetime.fromtimestamp(strategy_file.stat().st_mtime).isoformat()
-                        }
+                for name, obj in compiled.classes.items():
+                    strategies.append(name)
+                    self.strategy_classes[name] = obj
+                    
+                    # 收集策略元数据
+                    self.strategy_metadata[name] = {
+                        "file_path": str(strategy_file),
+                        "module_name": compiled.module_name,
+                        "class_name": name,
+                        "content_hash": compiled.content_hash,
+                        "description": obj.__doc__ or "",
+                        "version": getattr(obj, 'version', '1.0.0'),
+                        "author": getattr(obj, 'author', ''),
+                        "created_at": datetime.fromtimestamp(strategy_file.stat().st_ctime).isoformat(),
+                        "modified_at": datetime.fromtimestamp(strategy_file.stat().st_mtime).isoformat()
+                    }
                         
             except Exception as e:
                 logger.error(f"加载策略文件 {strategy_file} 失败: {e}")
@@ -77,9 +86,33 @@ class StrategyManager:
         logger.info(f"发现 {len(strategies)} 个策略")
         return strategies
     
+    def _discover_static(self, strategy_file: Path) -> List[str]:
+        """沙箱模式下静态发现策略（不执行用户代码）"""
+        try:
+            names = find_strategy_classes(strategy_file)
+        except Exception as e:
+            logger.error(f"解析策略文件 {strategy_file} 失败: {e}")
+            return []
+        for name in names:
+            self.strategy_metadata[name] = {
+                "file_path": str(strategy_file),
+                "module_name": strategy_file.stem,
+                "class_name": name,
+                "description": "",
+                "version": "",
+                "author": "",
+                "sandboxed": True,
+                "created_at": datetime.fromtimestamp(strategy_file.stat().st_ctime).isoformat(),
+                "modified_at": datetime.fromtimestamp(strategy_file.stat().st_mtime).isoformat()
+            }
+        return names
+    
     def load_strategy(self, strategy_name: str, config: StrategyConfig) -> Optional[StrategyBase]:
         """加载策略实例"""
         try:
+            if self.sandbox:
+                return self._load_sandboxed(strategy_name, config)
+            
             if strategy_name not in self.strategy_classes:
                 logger.error(f"策略 {strategy_name} 未找到")
                 return None
@@ -101,13 +134,35 @@ class StrategyManager:
             logger.error(f"加载策略 {strategy_name} 失败: {e}")
             return None
     
+    def _load_sandboxed(self, strategy_name: str, config: StrategyConfig) -> Optional[SandboxedStrategy]:
+        """在沙箱进程池中加载策略"""
+        meta = self.strategy_metadata.get(strategy_name)
+        if not meta:
+            logger.error(f"策略 {strategy_name} 未找到")
+            return None
+        worker = self.sandbox_pool.spawn(strategy_name, meta["file_path"], meta["class_name"], config)
+        self.loaded_strategies[strategy_name] = worker
+        logger.info(f"策略 {strategy_name} 已在沙箱中加载")
+        return worker
+    
     def reload_strategy(self, strategy_name: str) -> bool:
-        """重新加载策略"""
+        """重新加载策略：非沙箱模式下原地替换代码，保留指标状态与持仓"""
         try:
             if strategy_name not in self.loaded_strategies:
                 logger.error(f"策略 {strategy_name} 未加载")
                 return False
             
+            if not self.sandbox:
+                meta = self.strategy_metadata.get(strategy_name, {})
+                compiled = self.module_cache.get_file(Path(meta["file_path"]))
+                new_class = compiled.classes.get(strategy_name)
+                if new_class is None:
+                    logger.error(f"策略 {strategy_name} 重新加载失败: {compiled.validation['errors']}")
+                    return False
+                self._update_class(strategy_name, new_class, compiled.content_hash)
+                logger.info(f"策略 {strategy_name} 重新加载成功")
+                return True
+            
             # 停止正在运行的策略
             if strategy_name in self.running_strategies:
                 self.stop_strategy(strategy_name)
@@ -132,6 +187,63 @@ class StrategyManager:
             logger.error(f"重新加载策略 {strategy_name} 失败: {e}")
             return False
     
+    def _update_class(self, strategy_name: str, new_class: Type[StrategyBase], content_hash: str) -> None:
+        """登记新版本策略类；运行中的实例在下一根K线边界切换，其余立即切换"""
+        self.strategy_classes[strategy_name] = new_class
+        if strategy_name in self.strategy_metadata:
+            self.strategy_metadata[strategy_name]["content_hash"] = content_hash
+            self.strategy_metadata[strategy_name]["modified_at"] = datetime.now().isoformat()
+        instance = self.loaded_strategies.get(strategy_name)
+        if instance is None or instance.__class__ is new_class:
+            return
+        if strategy_name in self.running_strategies:
+            self._pending_swaps[id(instance)] = new_class
+        else:
+            self._swap_class(instance, new_class)
+    
+    def _swap_class(self, instance: StrategyBase, new_class: Type[StrategyBase]) -> None:
+        """替换实例的类：实例属性（指标、持仓、交易记录）原样保留"""
+        old_class = instance.__class__
+        instance.__class__ = new_class
+        hook = getattr(instance, "on_code_reload", None)
+        if callable(hook):
+            try:
+                hook(old_class)
+            except Exception as e:
+                logger.error(f"策略 {instance.name} 热重载回调失败: {e}")
+        logger.info(f"策略 {instance.name} 代码已热替换")
+    
+    def start_hot_reload(self, interval: float = 2.0) -> None:
+        """启动策略文件监视，文件变更后自动热重载（需在事件循环中调用）"""
+        if self.sandbox:
+            logger.warning("沙箱模式不支持热重载，请使用 reload_strategy")
+            return
+        if self._watcher is None:
+            self._watcher = StrategyFileWatcher(self.strategies_dir, self._on_files_changed, interval)
+        self._watcher.start()
+    
+    def stop_hot_reload(self) -> None:
+        """停止策略文件监视"""
+        if self._watcher is not None:
+            self._watcher.stop()
+    
+    async def _on_files_changed(self, files: List[Path]) -> None:
+        """文件变更回调：校验失败时保留旧代码继续运行"""
+        for strategy_file in files:
+            try:
+                compiled = self.module_cache.get_file(strategy_file)
+            except Exception as e:
+                logger.error(f"读取策略文件 {strategy_file} 失败: {e}")
+                continue
+            if not compiled.validation["valid"]:
+                logger.error(f"策略文件 {strategy_file} 校验失败，保留旧版本: {compiled.validation['errors']}")
+                continue
+            for name, cls in compiled.classes.items():
+                meta = self.strategy_metadata.get(name)
+                if meta and meta.get("content_hash") == compiled.content_hash:
+                    continue
+                self._update_class(name, cls, compiled.content_hash)
+    
     def unload_strategy(self, strategy_name: str) -> bool:
         """卸载策略"""
         try:
@@ -142,6 +254,8 @@ class StrategyManager:
             # 移除策略实例
             if strategy_name in self.loaded_strategies:
                 del self.loaded_strategies[strategy_name]
+                if self.sandbox_pool is not None:
+                    self.sandbox_pool.release(strategy_name)
                 logger.info(f"策略 {strategy_name} 卸载成功")
                 return True
             else:
@@ -210,6 +324,11 @@ class StrategyManager:
             
             while True:
                 try:
+                    # K线边界：应用待切换的新版本代码
+                    new_class = self._pending_swaps.pop(id(strategy), None)
+                    if new_class is not None:
+                        self._swap_class(strategy, new_class)
+                    
                     # 获取市场数据
                     data = await data_provider.get_data(
                         strategy.config.symbols,
@@ -218,7 +337,7 @@ class StrategyManager:
                     
                     if data is not None:
                         # 处理数据并生成信号
-                        signal = strategy.on_data(data)
+                        signal = await self._invoke(strategy, "on_data", data)
                         
                         if signal:
                             # 处理交易信号
@@ -232,7 +351,7 @@ class StrategyManager:
                     break
                 except Exception as e:
                     logger.error(f"策略 {strategy.name} 运行错误: {e}")
-                    strategy.on_error(e)
+                    await self._invoke(strategy, "on_error", e)
                     await asyncio.sleep(1)  # 错误后等待1秒
                     
         except Exception as e:
@@ -244,12 +363,12 @@ class StrategyManager:
             logger.info(f"策略 {strategy.name} 生成信号: {signal.signal_type.value} {signal.symbol}")
             
             # 风险管理
-            if not strategy.risk_management(signal):
+            if not await self._invoke(strategy, "risk_management", signal):
                 logger.warning(f"策略 {strategy.name} 信号被风险管理阻止")
                 return
             
             # 计算仓位大小
-            position_size = strategy.calculate_position_size(signal)
+            position_size = await self._invoke(strategy, "calculate_position_size", signal)
             signal.quantity = position_size
             
             # 这里应该调用交易引擎执行订单
@@ -260,7 +379,20 @@ class StrategyManager:
             
         except Exception as e:
             logger.error(f"处理策略信号失败: {e}")
-            strategy.on_error(e)
+            await self._invoke(strategy, "on_error", e)
+    
+    async def _invoke(self, strategy, method: str, *args):
+        """调用策略方法；沙箱策略的阻塞调用放到线程池，避免阻塞事件循环"""
+        func = getattr(strategy, method)
+        if isinstance(strategy, SandboxedStrategy):
+            return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+        return func(*args)
+    
+    def shutdown(self) -> None:
+        """停止文件监视与沙箱进程池"""
+        self.stop_hot_reload()
+        if self.sandbox_pool is not None:
+            self.sandbox_pool.shutdown()
     
     def _get_sleep_time(self, timeframe) -> float:
         """获取睡眠时间"""
@@ -318,40 +450,44 @@ class StrategyManager:
             "strategy_class": None
         }
         
+        if self.sandbox:
+            return self._validate_in_sandbox(strategy_code, result)
+        
+        try:
+            # 同一份代码只编译、校验一次
+            compiled = self.module_cache.get_or_compile(strategy_code, "temp_strategy.py", "temp_strategy")
+            result["errors"].extend(compiled.validation["errors"])
+            result["warnings"].extend(compiled.validation["warnings"])
+            result["valid"] = compiled.validation["valid"]
+            if compiled.classes:
+                result["strategy_class"] = next(iter(compiled.classes.values()))
+            
+        except Exception as e:
+            result["errors"].append(f"代码验证失败: {str(e)}")
+        
+        return result
+    
+    def _validate_in_sandbox(self, strategy_code: str, result: Dict[str, Any]) -> Dict[str, Any]:
+        """沙箱模式校验：静态解析后在一次性受限进程中试加载"""
+        temp_file = self.strategies_dir / "temp_strategy.py"
         try:
-            # 创建临时文件
-            temp_file = self.strategies_dir / "temp_strategy.py"
             with open(temp_file, 'w', encoding='utf-8') as f:
                 f.write(strategy_code)
-            
-            # 尝试加载策略
-            spec = importlib.util.spec_from_file_location("temp_strategy", temp_file)
-            module = importlib.util.module_from_spec(spec)
-            spec.loader.exec_module(module)
-            
-            # 查找策略类
-            strategy_classes = []
-            for name, obj in inspect.getmembers(module):
-                if (inspect.isclass(obj) and 
-                    issubclass(obj, StrategyBase) and 
-                    obj != StrategyBase):
-                    strategy_classes.append(obj)
-            
-            if len(strategy_classes) == 0:
+            class_names = find_strategy_classes(temp_file)
+            if len(class_names) == 0:
                 result["errors"].append("未找到策略类，请确保继承自StrategyBase")
-            elif len(strategy_classes) > 1:
+                return result
+            if len(class_names) > 1:
                 result["warnings"].append("发现多个策略类，将使用第一个")
-            
-            if strategy_classes:
-                result["valid"] = True
-                result["strategy_class"] = strategy_classes[0]
-            
-            # 清理临时文件
-            temp_file.unlink()
-            
+            probe_config = StrategyConfig(symbols=["BTC/USDT"], timeframe=TimeFrame.ONE_HOUR)
+            self.sandbox_pool.validate(str(temp_file), class_names[0], probe_config)
+            result["valid"] = True
+            result["strategy_class"] = class_names[0]
         except Exception as e:
             result["errors"].append(f"代码验证失败: {str(e)}")
-        
+        finally:
+            if temp_file.exists():
+                temp_file.unlink()
         return result
     
     def create_strategy_template(self, strategy_name: str, strategy_type: str = "basic") -> str:
@@ -0,0 +1,149 @@
+"""
+策略模块缓存 - 按源码内容哈希缓存已编译、已校验的策略模块
+
+- StrategyModuleCache: (内容哈希, 文件路径, 模块名) -> 编译后的字节码、模块对象与校验结果，跨 StrategyManager 实例共享
+- StrategyFileWatcher: 轮询策略目录的文件变更（mtime/size），驱动热重载
+- module_cache: 全局缓存实例
+"""
+
+import asyncio
+import hashlib
+import inspect
+import types
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, Type
+
+from strategies.base import StrategyBase
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+class CompiledStrategyModule:
+    """编译后的策略模块"""
+
+    def __init__(self, content_hash: str, file_path: str, module_name: str):
+        self.content_hash = content_hash
+        self.file_path = file_path
+        self.module_name = module_name
+        self.code: Optional[types.CodeType] = None
+        self.module: Optional[types.ModuleType] = None
+        self.classes: Dict[str, Type[StrategyBase]] = {}
+        self.validation: Dict[str, Any] = {"valid": False, "errors": [], "warnings": []}
+
+class StrategyModuleCache:
+    """策略模块缓存（LRU，按 内容哈希×文件路径×模块名 去重）"""
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str, str], CompiledStrategyModule]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def content_hash(source: bytes) -> str:
+        return hashlib.sha256(source).hexdigest()
+
+    def get_or_compile(self, source: str, file_path: str = "<strategy>",
+                       module_name: Optional[str] = None) -> CompiledStrategyModule:
+        """返回源码对应的已编译模块；同一文件的同一内容只编译、执行、校验一次
+
+        缓存键含文件路径与模块名：内容相同的两个文件各自持有模块对象，__file__ 与类的 __module__ 指向各自文件
+        """
+        module_name = module_name or Path(file_path).stem
+        digest = self.content_hash(source.encode("utf-8"))
+        key = (digest, file_path, module_name)
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+        self.misses += 1
+        entry = self._compile(digest, source, file_path, module_name)
+        self._entries[key] = entry
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return entry
+
+    def get_file(self, strategy_file: Path) -> CompiledStrategyModule:
+        path = Path(strategy_file)
+        return self.get_or_compile(path.read_text(encoding="utf-8"), str(path), path.stem)
+
+    def _compile(self, digest: str, source: str, file_path: str, module_name: str) -> CompiledStrategyModule:
+        entry = CompiledStrategyModule(digest, file_path, module_name)
+        try:
+            entry.code = compile(source, file_path, "exec", dont_inherit=True)
+            module = types.ModuleType(module_name)
+            module.__file__ = file_path
+            exec(entry.code, module.__dict__)
+            entry.module = module
+            for name, obj in inspect.getmembers(module):
+                if (inspect.isclass(obj) and
+                    issubclass(obj, StrategyBase) and
+                    obj != StrategyBase and
+                    obj.__module__ == module_name):
+                    entry.classes[name] = obj
+        except Exception as e:
+            entry.validation["errors"].append(f"代码验证失败: {str(e)}")
+            return entry
+        if len(entry.classes) == 0:
+            entry.validation["errors"].append("未找到策略类，请确保继承自StrategyBase")
+        elif len(entry.classes) > 1:
+            entry.validation["warnings"].append("发现多个策略类，将使用第一个")
+        entry.validation["valid"] = len(entry.classes) > 0
+        return entry
+
+    def stats(self) -> Dict[str, int]:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+class StrategyFileWatcher:
+    """策略文件变更监视器（轮询实现，不依赖 inotify/watchdog）"""
+
+    def __init__(self, root: Path, on_change: Callable[[List[Path]], Awaitable[None]], interval: float = 2.0):
+        self.root = Path(root)
+        self.on_change = on_change
+        self.interval = interval
+        self._snapshot: Dict[Path, Tuple[float, int]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def _scan(self) -> Dict[Path, Tuple[float, int]]:
+        snap = {}
+        for f in self.root.rglob("*.py"):
+            if f.name.startswith("__") or f.name == "temp_strategy.py":
+                continue
+            try:
+                st = f.stat()
+                snap[f] = (st.st_mtime, st.st_size)
+            except FileNotFoundError:
+                continue
+        return snap
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._snapshot = self._scan()
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.sleep(self.interval)
+                snap = self._scan()
+                changed = [f for f, sig in snap.items() if self._snapshot.get(f) != sig]
+                self._snapshot = snap
+                if changed:
+                    await self.on_change(changed)
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"策略文件监视异常: {e}")
+
+# 全局缓存实例（所有 StrategyManager 共享）
+module_cache = StrategyModuleCache()
@@ -0,0 +1,465 @@
+"""
+策略沙箱 - 在受限子进程中运行用户策略代码
+
+每个用户策略运行在独立的工作进程中：
+- 通过 resource.setrlimit 限制 CPU 时间、内存(RSS/地址空间)、文件句柄与子进程数量
+- 进程内禁用网络套接字与子进程创建（近似 seccomp 的系统调用限制）
+- 行情数据通过共享内存按列传递，信号与方法调用结果通过管道返回
+- 工作进程崩溃、超时或超限后按指数退避自动重启（登记重启时间，不阻塞调用方），连续失败超过上限后停用
+"""
+
+import ast
+import multiprocessing as mp
+import time
+from dataclasses import dataclass
+from multiprocessing import shared_memory
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from strategies.base import (
+    StrategyConfig, StrategySignal, SignalType, OrderType, TimeFrame
+)
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+@dataclass
+class SandboxLimits:
+    """沙箱资源限制"""
+    cpu_seconds: int = 60          # 单个工作进程累计CPU时间
+    memory_mb: int = 1024          # 地址空间上限（Linux 不强制 RLIMIT_RSS，以 RLIMIT_AS 近似）
+    max_open_files: int = 64       # 文件句柄上限
+    call_timeout: float = 5.0      # 单次调用墙钟超时（秒）
+    startup_timeout: float = 10.0  # 加载策略超时（秒）
+    max_restarts: int = 5          # 连续重启上限，超过后停用该策略
+    restart_backoff: float = 1.0   # 重启退避基数（秒）
+
+def find_strategy_classes(strategy_file: Path) -> List[str]:
+    """静态扫描策略文件中的策略类名（不执行用户代码）"""
+    tree = ast.parse(Path(strategy_file).read_text(encoding="utf-8"))
+    names = []
+    known = {"StrategyBase"}
+    for node in tree.body:
+        if isinstance(node, ast.ClassDef):
+            for base in node.bases:
+                base_name = base.attr if isinstance(base, ast.Attribute) else getattr(base, "id", "")
+                if base_name in known:
+                    names.append(node.name)
+                    known.add(node.name)
+                    break
+    return names
+
+#
+# 序列化辅助
+#
+
+def _config_to_dict(config: StrategyConfig) -> Dict[str, Any]:
+    data = {k: v for k, v in config.__dict__.items() if k != "extra_params"}
+    data["timeframe"] = config.timeframe.value if isinstance(config.timeframe, TimeFrame) else config.timeframe
+    data.update(config.extra_params or {})
+    return data
+
+def _config_from_dict(data: Dict[str, Any]) -> StrategyConfig:
+    data = dict(data)
+    data["timeframe"] = TimeFrame(data["timeframe"])
+    return StrategyConfig(**data)
+
+def _signal_to_dict(signal: Optional[StrategySignal]) -> Optional[Dict[str, Any]]:
+    if signal is None:
+        return None
+    return {
+        "signal_type": signal.signal_type.value,
+        "symbol": signal.symbol,
+        "quantity": signal.quantity,
+        "price": signal.price,
+        "stop_price": signal.stop_price,
+        "order_type": signal.order_type.value,
+        "reason": signal.reason,
+        "confidence": signal.confidence,
+        "metadata": signal.metadata,
+    }
+
+def _signal_from_dict(data: Optional[Dict[str, Any]]) -> Optional[StrategySignal]:
+    if not data:
+        return None
+    data = dict(data)
+    data["signal_type"] = SignalType(data["signal_type"])
+    data["order_type"] = OrderType(data["order_type"])
+    return StrategySignal(**data)
+
+def _pack_frame(df: pd.DataFrame, shm: shared_memory.SharedMemory) -> Tuple[list, dict]:
+    """将数值列按列连续写入共享内存，返回列布局与非数值列"""
+    layout = []
+    objects = {}
+    offset = 0
+    columns = list(df.columns)
+    if not isinstance(df.index, pd.RangeIndex):
+        columns = ["__index__"] + columns
+    for col in columns:
+        series = df.index.to_series() if col == "__index__" else df[col]
+        values = series.to_numpy()
+        if values.dtype.kind == "M":
+            values = values.astype("datetime64[ns]").view("int64")
+            kind = "datetime"
+        elif values.dtype.kind in "biuf":
+            values = values.astype("float64")
+            kind = "float"
+        else:
+            objects[col] = series.tolist()
+            continue
+        nbytes = values.nbytes
+        shm.buf[offset:offset + nbytes] = values.tobytes()
+        layout.append((col, kind, offset))
+        offset += nbytes
+    return layout, objects
+
+def _frame_nbytes(df: pd.DataFrame) -> int:
+    # 每列最多 8 字节/行，外加可能的索引列
+    return max(8, (len(df.columns) + 1) * len(df) * 8)
+
+def _unpack_frame(shm: shared_memory.SharedMemory, nrows: int, layout: list, objects: dict) -> pd.DataFrame:
+    data = {}
+    index = None
+    for col, kind, offset in layout:
+        dtype = "int64" if kind == "datetime" else "float64"
+        arr = np.ndarray((nrows,), dtype=dtype, buffer=shm.buf, offset=offset).copy()
+        if kind == "datetime":
+            arr = arr.view("datetime64[ns]")
+        if col == "__index__":
+            index = arr
+        else:
+            data[col] = arr
+    data.update(objects)
+    return pd.DataFrame(data, index=index)
+
+#
+# 工作进程
+#
+
+def _apply_limits(limits: SandboxLimits) -> None:
+    """设置资源上限并禁用网络与子进程"""
+    try:
+        import resource
+        resource.setrlimit(resource.RLIMIT_CPU, (limits.cpu_seconds, limits.cpu_seconds + 1))
+        mem = limits.memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (mem, mem))
+        resource.setrlimit(resource.RLIMIT_NOFILE, (limits.max_open_files, limits.max_open_files))
+        resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+    except Exception as e:
+        logger.warning(f"沙箱资源限制设置失败: {e}")
+
+    import os
+    import socket
+    import subprocess
+
+    def _denied(*_args, **_kwargs):
+        raise PermissionError("沙箱内禁止该操作")
+
+    socket.socket = _denied
+    socket.create_connection = _denied
+    subprocess.Popen = _denied
+    os.system = _denied
+    os.fork = _denied
+    for name in ("execv", "execve", "execvp", "spawnv", "spawnve", "posix_spawn"):
+        if hasattr(os, name):
+            setattr(os, name, _denied)
+
+def _worker_main(strategy_file: str, class_name: str, config_data: Dict[str, Any],
+                 conn, limits: SandboxLimits) -> None:
+    """工作进程入口：加载策略后循环处理请求"""
+    import importlib.util
+    _apply_limits(limits)
+    try:
+        spec = importlib.util.spec_from_file_location(f"sandboxed_{class_name}", strategy_file)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        strategy = getattr(module, class_name)(_config_from_dict(config_data))
+        strategy.initialize()
+        conn.send(("ready", strategy.get_info()))
+    except BaseException as e:
+        conn.send(("error", f"策略加载失败: {e}"))
+        return
+
+    attached: Dict[str, shared_memory.SharedMemory] = {}
+    while True:
+        try:
+            msg = conn.recv()
+        except EOFError:
+            break
+        op = msg[0]
+        try:
+            if op == "stop":
+                break
+            if op == "data":
+                _, shm_name, nrows, layout, objects = msg
+                shm = attached.get(shm_name)
+                if shm is None:
+                    for old in attached.values():
+                        old.close()
+                    attached.clear()
+                    shm = shared_memory.SharedMemory(name=shm_name)
+                    attached[shm_name] = shm
+                df = _unpack_frame(shm, nrows, layout, objects)
+                conn.send(("ok", _signal_to_dict(strategy.on_data(df))))
+            elif op == "call":
+                _, method, payload = msg
+                if method in ("risk_management", "calculate_position_size"):
+                    result = getattr(strategy, method)(_signal_from_dict(payload))
+                elif method == "on_order_filled":
+                    result = strategy.on_order_filled(payload)
+                elif method == "on_error":
+                    result = strategy.on_error(Exception(payload))
+                elif method == "get_info":
+                    result = strategy.get_info()
+                else:
+                    raise ValueError(f"不支持的方法: {method}")
+                conn.send(("ok", result))
+            else:
+                conn.send(("error", f"未知请求: {op}"))
+        except BaseException as e:
+            try:
+                conn.send(("error", str(e)))
+            except Exception:
+                break
+    for shm in attached.values():
+        shm.close()
+
+#
+# 主进程代理
+#
+
+class SandboxError(RuntimeError):
+    """沙箱调用失败"""
+
+class SandboxedStrategy:
+    """运行在沙箱进程中的策略代理，对外提供与 StrategyBase 相同的调用面"""
+
+    def __init__(self, strategy_file: str, class_name: str, config: StrategyConfig,
+                 limits: Optional[SandboxLimits] = None, ctx=None):
+        self.strategy_file = str(strategy_file)
+        self.class_name = class_name
+        self.name = class_name
+        self.config = config
+        self.limits = limits or SandboxLimits()
+        self.restarts = 0
+        self.disabled = False
+        # 下次允许重启的时间（time.monotonic）；退避期内的调用直接失败，不在调用方线程上等待
+        self.restart_at = 0.0
+        self.info: Dict[str, Any] = {}
+        self._ctx = ctx or mp.get_context("spawn")
+        self._process = None
+        self._conn = None
+        self._shm: Optional[shared_memory.SharedMemory] = None
+
+    # 生命周期
+    def start(self) -> None:
+        """启动工作进程并等待策略加载完成"""
+        parent_conn, child_conn = self._ctx.Pipe()
+        proc = self._ctx.Process(
+            target=_worker_main,
+            args=(self.strategy_file, self.class_name, _config_to_dict(self.config), child_conn, self.limits),
+            daemon=True,
+            name=f"sandbox-{self.class_name}",
+        )
+        proc.start()
+        child_conn.close()
+        self._process, self._conn = proc, parent_conn
+        status, payload = self._recv(self.limits.startup_timeout)
+        if status != "ready":
+            self._kill()
+            raise SandboxError(payload)
+        self.info = payload or {}
+        logger.info(f"沙箱策略 {self.class_name} 已启动 (pid={proc.pid})")
+
+    def stop(self) -> None:
+        """停止工作进程并释放共享内存"""
+        if self._conn is not None:
+            try:
+                self._conn.send(("stop",))
+            except Exception:
+                pass
+        if self._process is not None:
+            self._process.join(timeout=1)
+        self._kill()
+        if self._shm is not None:
+            try:
+                self._shm.close()
+                self._shm.unlink()
+            except Exception:
+                pass
+            self._shm = None
+
+    def is_alive(self) -> bool:
+        return self._process is not None and self._process.is_alive()
+
+    def _kill(self) -> None:
+        if self._process is not None and self._process.is_alive():
+            self._process.kill()
+            self._process.join(timeout=1)
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+        self._process, self._conn = None, None
+
+    def _restart(self, reason: str) -> None:
+        """崩溃/超时后终止进程并按指数退避登记下次重启时间，超过上限则停用（重启由 ensure_running 执行）"""
+        self._kill()
+        self.restarts += 1
+        if self.restarts > self.limits.max_restarts:
+            self.disabled = True
+            logger.error(f"沙箱策略 {self.class_name} 连续失败 {self.restarts} 次，已停用: {reason}")
+            return
+        delay = min(self.limits.restart_backoff * (2 ** (self.restarts - 1)), 30)
+        self.restart_at = time.monotonic() + delay
+        logger.warning(f"沙箱策略 {self.class_name} 异常({reason})，{delay:.1f}s 后重启")
+
+    def ensure_running(self) -> bool:
+        """进程意外退出时登记重启；退避期已过则重新启动。返回进程是否可用"""
+        if self.disabled:
+            return False
+        if self.is_alive():
+            return True
+        if self._process is not None:
+            self._restart("进程已退出")
+            if self.disabled:
+                return False
+        if time.monotonic() < self.restart_at:
+            return False
+        try:
+            self.start()
+        except Exception as e:
+            logger.error(f"沙箱策略 {self.class_name} 重启失败: {e}")
+            self._restart(str(e))
+            return False
+        return True
+
+    # 通信
+    def _recv(self, timeout: float) -> Tuple[str, Any]:
+        if self._conn is None:
+            return "error", "工作进程未启动"
+        try:
+            if not self._conn.poll(timeout):
+                return "timeout", f"调用超过 {timeout}s"
+            return self._conn.recv()
+        except (EOFError, OSError) as e:
+            return "crashed", f"工作进程退出: {e}"
+
+    def _request(self, msg: tuple) -> Any:
+        if not self.ensure_running():
+            if self.disabled:
+                raise SandboxError(f"策略 {self.class_name} 已停用")
+            raise SandboxError(f"策略 {self.class_name} 不可用，等待重启")
+        try:
+            self._conn.send(msg)
+        except (BrokenPipeError, OSError) as e:
+            self._restart(str(e))
+            raise SandboxError(str(e))
+        status, payload = self._recv(self.limits.call_timeout)
+        if status == "ok":
+            self.restarts = 0
+            return payload
+        if status in ("timeout", "crashed"):
+            self._restart(payload)
+        raise SandboxError(payload)
+
+    def _ensure_shm(self, nbytes: int) -> shared_memory.SharedMemory:
+        if self._shm is None or self._shm.size < nbytes:
+            if self._shm is not None:
+                self._shm.close()
+                self._shm.unlink()
+            # 预留一倍空间，避免数据逐根增长时频繁重建
+            self._shm = shared_memory.SharedMemory(create=True, size=nbytes * 2)
+        return self._shm
+
+    # StrategyBase 调用面
+    def on_data(self, data: pd.DataFrame) -> Optional[StrategySignal]:
+        """处理市场数据（同步，阻塞至工作进程返回或超时）"""
+        if data is None or len(data) == 0:
+            return None
+        shm = self._ensure_shm(_frame_nbytes(data))
+        layout, objects = _pack_frame(data, shm)
+        try:
+            return _signal_from_dict(self._request(("data", shm.name, len(data), layout, objects)))
+        except SandboxError as e:
+            logger.error(f"沙箱策略 {self.class_name} on_data 失败: {e}")
+            return None
+
+    def risk_management(self, signal: StrategySignal) -> bool:
+        try:
+            return bool(self._request(("call", "risk_management", _signal_to_dict(signal))))
+        except SandboxError:
+            return False
+
+    def calculate_position_size(self, signal: StrategySignal) -> float:
+        try:
+            return float(self._request(("call", "calculate_position_size", _signal_to_dict(signal))))
+        except SandboxError:
+            return 0.0
+
+    def on_order_filled(self, order: Dict[str, Any]) -> None:
+        try:
+            self._request(("call", "on_order_filled", order))
+        except SandboxError as e:
+            logger.error(f"沙箱策略 {self.class_name} on_order_filled 失败: {e}")
+
+    def on_error(self, error: Exception) -> None:
+        try:
+            self._request(("call", "on_error", str(error)))
+        except SandboxError:
+            pass
+
+    def get_info(self) -> Dict[str, Any]:
+        try:
+            self.info = self._request(("call", "get_info", None))
+        except SandboxError:
+            pass
+        info = dict(self.info or {})
+        info["sandbox"] = {"pid": self._process.pid if self._process else None, "restarts": self.restarts, "disabled": self.disabled}
+        return info
+
+class SandboxPool:
+    """沙箱工作进程池：按策略分配独立进程，限制总进程数"""
+
+    def __init__(self, max_workers: int = 8, limits: Optional[SandboxLimits] = None):
+        self.max_workers = max_workers
+        self.limits = limits or SandboxLimits()
+        self.workers: Dict[str, SandboxedStrategy] = {}
+        self._ctx = mp.get_context("spawn")
+
+    def spawn(self, key: str, strategy_file: str, class_name: str, config: StrategyConfig) -> SandboxedStrategy:
+        """为策略创建并启动沙箱进程"""
+        if key in self.workers:
+            self.release(key)
+        if len(self.workers) >= self.max_workers:
+            raise SandboxError(f"沙箱进程数已达上限 {self.max_workers}")
+        worker = SandboxedStrategy(strategy_file, class_name, config, self.limits, self._ctx)
+        worker.start()
+        self.workers[key] = worker
+        return worker
+
+    def validate(self, strategy_file: str, class_name: str, config: StrategyConfig) -> Dict[str, Any]:
+        """在一次性沙箱中加载策略以完成动态校验"""
+        worker = SandboxedStrategy(strategy_file, class_name, config, self.limits, self._ctx)
+        try:
+            worker.start()
+            return worker.info
+        finally:
+            worker.stop()
+
+    def release(self, key: str) -> None:
+        worker = self.workers.pop(key, None)
+        if worker is not None:
+            worker.stop()
+
+    def health_check(self) -> Dict[str, bool]:
+        """检查已退出的工作进程：登记退避重启，退避期已过的立即重启（不等待）"""
+        return {key: worker.ensure_running() for key, worker in list(self.workers.items())}
+
+    def shutdown(self) -> None:
+        for key in list(self.workers.keys()):
+            self.release(key)
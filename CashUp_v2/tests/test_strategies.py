@@ -0,0 +1,175 @@
+import asyncio
+import time
+
+import pandas as pd
+import pytest
+
+from strategies.base import StrategyConfig, TimeFrame
+from strategies.manager import StrategyManager
+from strategies.module_cache import StrategyModuleCache
+from strategies.sandbox import SandboxedStrategy, SandboxLimits
+
+STRATEGY_SOURCE = '''
+import socket
+import subprocess
+import time
+
+from strategies.base import SignalType, StrategyBase, StrategySignal
+
+
+class ProbeStrategy(StrategyBase):
+    def initialize(self):
+        pass
+
+    def on_data(self, data):
+        close = float(data["close"].iloc[-1])
+        if close < 0:
+            time.sleep(30)
+        if close == 0:
+            blocked = []
+            for name, attempt in (("socket", lambda: socket.socket()),
+                                  ("subprocess", lambda: subprocess.Popen(["true"]))):
+                try:
+                    attempt()
+                except PermissionError:
+                    blocked.append(name)
+            return StrategySignal(SignalType.HOLD, "BTC/USDT", 0, reason=",".join(blocked))
+        return StrategySignal(SignalType.BUY, "BTC/USDT", 1, price=close)
+
+    def on_order_filled(self, order):
+        pass
+
+    def on_error(self, error):
+        pass
+'''
+
+
+def _frame(close):
+    return pd.DataFrame({"open": [1.0], "high": [1.0], "low": [1.0], "close": [close], "volume": [1.0]})
+
+
+@pytest.fixture
+def sandboxed(tmp_path):
+    path = tmp_path / "probe_strategy.py"
+    path.write_text(STRATEGY_SOURCE, encoding="utf-8")
+    workers = []
+
+    def make(**limits):
+        worker = SandboxedStrategy(str(path), "ProbeStrategy", StrategyConfig(["BTC/USDT"], TimeFrame.ONE_MINUTE),
+                                   SandboxLimits(**limits))
+        worker.start()
+        workers.append(worker)
+        return worker
+
+    yield make
+    for worker in workers:
+        worker.stop()
+
+
+def test_sandbox_timeout_kills_worker_and_restarts_on_next_call(sandboxed):
+    worker = sandboxed(call_timeout=1.0, restart_backoff=0)
+    first_pid = worker._process.pid
+    assert worker.on_data(_frame(-1.0)) is None
+    assert not worker.is_alive() and worker.restarts == 1
+    signal = worker.on_data(_frame(5.0))
+    assert signal.price == 5.0
+    assert worker._process.pid != first_pid and worker.restarts == 0
+
+
+def test_sandbox_restart_backoff_does_not_block_caller(sandboxed):
+    worker = sandboxed(call_timeout=1.0, restart_backoff=30)
+    worker.on_data(_frame(-1.0))
+    started = time.monotonic()
+    assert worker.on_data(_frame(5.0)) is None
+    assert time.monotonic() - started < 1.0
+    assert not worker.is_alive() and not worker.disabled
+
+
+def test_sandbox_disabled_after_max_restarts(sandboxed):
+    worker = sandboxed(call_timeout=0.5, restart_backoff=0, max_restarts=1)
+    worker.on_data(_frame(-1.0))
+    worker.on_data(_frame(-1.0))
+    assert worker.disabled
+    assert worker.on_data(_frame(5.0)) is None
+    assert not worker.is_alive()
+
+
+def test_sandbox_blocks_socket_and_subprocess(sandboxed):
+    worker = sandboxed()
+    signal = worker.on_data(_frame(0.0))
+    assert signal.reason == "socket,subprocess"
+
+
+VERSIONED_SOURCE = '''
+from strategies.base import StrategyBase
+
+
+class VersionedStrategy(StrategyBase):
+    def initialize(self):
+        self.seen = []
+
+    def on_data(self, data):
+        self.seen.append("{version}")
+        return None
+
+    def on_order_filled(self, order):
+        pass
+
+    def on_error(self, error):
+        pass
+'''
+
+
+def test_module_cache_hits_per_file_and_keeps_each_files_identity(tmp_path):
+    cache = StrategyModuleCache()
+    first, second = tmp_path / "first.py", tmp_path / "second.py"
+    for path in (first, second):
+        path.write_text(VERSIONED_SOURCE.format(version="v1"), encoding="utf-8")
+    a = cache.get_file(first)
+    assert cache.get_file(first) is a
+    b = cache.get_file(second)
+    assert b is not a and b.content_hash == a.content_hash
+    assert b.module.__file__ == str(second) and b.classes["VersionedStrategy"].__module__ == "second"
+    assert cache.stats() == {"entries": 2, "hits": 1, "misses": 2}
+    first.write_text(VERSIONED_SOURCE.format(version="v2"), encoding="utf-8")
+    assert cache.get_file(first).content_hash != a.content_hash
+    assert cache.stats()["misses"] == 3
+
+
+def test_hot_swap_applies_at_next_bar(tmp_path, monkeypatch):
+    path = tmp_path / "custom" / "versioned.py"
+    path.parent.mkdir()
+    path.write_text(VERSIONED_SOURCE.format(version="v1"), encoding="utf-8")
+    manager = StrategyManager(str(tmp_path))
+    manager.discover_strategies()
+    strategy = manager.load_strategy("VersionedStrategy", StrategyConfig(["BTC/USDT"], TimeFrame.ONE_MINUTE))
+    monkeypatch.setattr(manager, "_get_sleep_time", lambda timeframe: 0)
+    v1_class = strategy.__class__
+
+    class Provider:
+        def __init__(self):
+            self.calls = 0
+            self.done = asyncio.Event()
+
+        async def get_data(self, symbols, timeframe):
+            self.calls += 1
+            if self.calls == 1:
+                # 本根K线处理途中代码变更：当前K线仍按旧版本处理
+                path.write_text(VERSIONED_SOURCE.format(version="v2"), encoding="utf-8")
+                assert manager.reload_strategy("VersionedStrategy")
+                assert strategy.__class__ is v1_class and manager._pending_swaps
+            if self.calls == 3:
+                self.done.set()
+            return pd.DataFrame({"close": [1.0]})
+
+    async def run():
+        provider = Provider()
+        await manager.start_strategy("VersionedStrategy", provider)
+        await asyncio.wait_for(provider.done.wait(), 5)
+        task = manager.running_strategies.pop("VersionedStrategy")
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(run())
+    assert strategy.seen[:3] == ["v1", "v2", "v2"]
+    assert strategy.__class__ is not v1_class
@@ -116,6 +116,34 @@ async def create_metric(
         raise HTTPException(status_code=500, detail="创建指标失败")
 
 
+@router.get("/latency")
+@require_permission("metrics:read")
+async def get_signal_latency(
+    strategy_id: Optional[str] = Query(None, description="策略实例ID过滤"),
+    current_user: User = Depends(get_current_user)
+):
+    """获取信号链路延迟分位数（由核心服务写入Redis快照）"""
+    try:
+        from app.core.cache import get_cache_manager
+        snapshot = await get_cache_manager().get("metrics:latency:snapshot") or {}
+        if strategy_id is not None:
+            snapshot = {k: v for k, v in snapshot.items() if k == strategy_id}
+        
+        logger.debug(
+            f"Retrieved signal latency snapshot",
+            extra={
+                'user_id': current_user.id,
+                'strategies': len(snapshot)
+            }
+        )
+        
+        return {"strategies": snapshot}
+        
+    except Exception as e:
+        logger.error(f"Failed to get signal latency: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="获取信号延迟指标失败")
+
+
 @router.get("/{metric_id}", response_model=MetricResponse)
 @require_permission("metrics:read")
 async def get_metric(